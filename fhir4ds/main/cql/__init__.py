@@ -0,0 +1,25 @@
+"""
+CQL support: parsing CQL and ELM and compiling libraries to population-level SQL.
+"""
+
+from .cache import CachedEvaluation, DefinitionCache
+from .compiler import CompiledExpression, CompiledLibrary, CQLCompiler, as_library
+from .elm import library_from_elm
+from .measures import MeasureBatch, MeasureResult
+from .parser import CQLParseError, CQLParser, parse_expression, parse_library
+
+__all__ = [
+    "as_library",
+    "CachedEvaluation",
+    "CompiledExpression",
+    "CompiledLibrary",
+    "CQLCompiler",
+    "CQLParseError",
+    "CQLParser",
+    "DefinitionCache",
+    "library_from_elm",
+    "MeasureBatch",
+    "MeasureResult",
+    "parse_expression",
+    "parse_library",
+]
@@ -0,0 +1,222 @@
+"""Define-level result caching for interactive CQL development.
+
+Measure authors re-run a whole library after every edit, although most of
+its definitions did not change. A :class:`DefinitionCache` stores the
+per-patient result of every ``define`` in a table and reuses it on the next
+run while the definition is unchanged, so only the edited definitions and
+the ones downstream of them are executed again.
+
+A definition's cache key hashes the SQL it compiles to together with the
+keys of the CTEs it reads (retrieves, parameters inlined into the SQL and
+other definitions), so editing a definition changes its key and the keys of
+everything that references it, directly or not, while definitions
+upstream keep theirs. Keys and tables are recorded in a state table, so a
+later session against the same database reuses them too. When a
+definition is cached under a new key, the tables of its earlier versions
+in the same library (name and version) are dropped, so repeated edits do
+not accumulate tables while libraries sharing definition names such as
+"Initial Population" keep each other's results.
+
+Definitions that depend on the evaluation time (``Now()``, ``Today()``,
+``AgeInYears()`` and the definitions referencing them) are never cached:
+they are computed again on every run.
+
+The cached tables are regular tables rather than temporary ones, which
+are only visible to the connection that created them. Keys do not cover
+the resource data: call :meth:`DefinitionCache.clear` after loading new
+resources.
+
+Example:
+    >>> cache = DefinitionCache(dialect, catalog)
+    >>> run = cache.evaluate(measure_cql)            # executes every definition
+    >>> run = cache.evaluate(edited_measure_cql)     # only the edited ones
+    >>> run.executed
+    ['Numerator']
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from fhir4ds.dialects.base import DatabaseDialect
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog
+from fhir4ds.fhirpath.sql.cte import CTE, CTEManager
+
+from .compiler import DEFAULT_CTE_PREFIX, CompiledLibrary, CQLCompiler, as_library
+from .nodes import Library
+
+DEFAULT_STATE_TABLE = "fhir4ds_cql_cache"
+DEFAULT_TABLE_PREFIX = "cql_cache"
+
+# SQL whose result changes between runs over the same data
+_NON_DETERMINISTIC = re.compile(r"\b(CURRENT_DATE|CURRENT_TIMESTAMP|CURRENT_TIME|LOCALTIMESTAMP|NOW\s*\(|RANDOM\s*\()",
+                                re.IGNORECASE)
+
+
+@dataclass
+class CachedEvaluation:
+    """Outcome of a DefinitionCache.evaluate() call.
+
+    Attributes:
+        rows: One dict of definition values per patient
+        executed: Definitions computed by this run
+        reused: Definitions read from their cached tables
+        compiled: The compiled library
+    """
+
+    rows: List[Dict[str, Any]]
+    executed: List[str] = field(default_factory=list)
+    reused: List[str] = field(default_factory=list)
+    compiled: Optional[CompiledLibrary] = None
+
+
+class DefinitionCache:
+    """Evaluates CQL libraries, caching the result of every definition.
+
+    Args:
+        dialect: Database the library runs on; it also holds the cached tables
+        catalog: Where resources are stored; value set filters need its
+            TerminologyStore
+        parameters: Parameter values as CQL expression text
+        state_table: Table recording the cache keys and their tables
+        table_prefix: Prefix of the cached tables' names
+    """
+
+    def __init__(self, dialect: DatabaseDialect, catalog: Optional[StorageCatalog] = None,
+                 parameters: Optional[Dict[str, str]] = None, state_table: str = DEFAULT_STATE_TABLE,
+                 table_prefix: str = DEFAULT_TABLE_PREFIX):
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", table_prefix):
+            raise ValueError(f"Invalid table prefix: {table_prefix!r}")
+        self.dialect = dialect
+        self.compiler = CQLCompiler(dialect, catalog=catalog, parameters=parameters)
+        self.state_table = state_table
+        self.table_prefix = table_prefix
+        self._state_table_ready = False
+
+    def evaluate(self, library: Union[str, Dict[str, Any], Library],
+                 expressions: Optional[Sequence[str]] = None) -> CachedEvaluation:
+        """Run ``library``, executing only the definitions without a cached result.
+
+        Args:
+            library: CQL text, ELM JSON or a parsed library
+            expressions: Definitions to return; by default every Patient
+                context definition that is not an interval
+        """
+        library = as_library(library)
+        scope = f"library_name = {_quote(library.name or '')} AND library_version = {_quote(library.version or '')}"
+        compiled = self.compiler.compile(library, expressions)
+        ctes = {cte.name: cte for cte in compiled.ctes}
+        keys = _cache_keys(compiled.ctes)
+        tables = self._cached_tables()
+
+        # Definition CTEs in dependency order (the compiled CTEs are ordered)
+        stored = set(compiled.definitions.values())
+        computed = set()
+        volatile = set()
+        for cte in compiled.ctes:
+            if _NON_DETERMINISTIC.search(cte.query) or volatile & set(cte.depends_on):
+                # Inlined into the statements reading it, so computed on every run
+                volatile.add(cte.name)
+                computed.add(cte.name)
+                tables.pop(keys[cte.name], None)
+                continue
+            if cte.name not in stored or keys[cte.name] in tables:
+                continue
+            key = keys[cte.name]
+            table = f"{self.table_prefix}_{key[:16]}"
+            query = self._statement(cte, ctes, keys, tables)
+            superseded = [
+                (old_key, old_table) for old_key, old_table in self.dialect.execute_query(
+                    f"SELECT cache_key, table_name FROM {self.state_table} "
+                    f"WHERE {scope} AND definition = {_quote(cte.name)} AND cache_key <> {_quote(key)}")
+                if old_key not in keys.values()
+            ]
+            self.dialect.execute_transaction([
+                *(f"DROP TABLE IF EXISTS {old_table}" for _, old_table in superseded),
+                *(f"DELETE FROM {self.state_table} WHERE cache_key = {_quote(old_key)}" for old_key, _ in superseded),
+                f"DROP TABLE IF EXISTS {table}",
+                f"CREATE TABLE {table} AS {query}",
+                f"DELETE FROM {self.state_table} WHERE cache_key = {_quote(key)}",
+                f"INSERT INTO {self.state_table} "
+                f"(cache_key, table_name, library_name, library_version, definition, created_at) VALUES "
+                f"({_quote(key)}, {_quote(table)}, {_quote(library.name or '')}, {_quote(library.version or '')}, "
+                f"{_quote(cte.name)}, {_quote(datetime.now(timezone.utc).isoformat())})",
+            ])
+            for old_key, _ in superseded:
+                tables.pop(old_key, None)
+            tables[key] = table
+            computed.add(cte.name)
+
+        rows = self.dialect.execute_query(self._statement(compiled.ctes[-1], ctes, keys, tables))
+        result = CachedEvaluation(
+            rows=[dict(zip(["patient_id", *compiled.expressions], row)) for row in rows], compiled=compiled)
+        for name, cte in compiled.definitions.items():
+            (result.executed if cte in computed else result.reused).append(name)
+        return result
+
+    def clear(self) -> int:
+        """Drop every cached table; returns how many were dropped."""
+        tables = self._cached_tables()
+        self.dialect.execute_transaction(
+            [f"DROP TABLE IF EXISTS {table}" for table in tables.values()] + [f"DELETE FROM {self.state_table}"])
+        return len(tables)
+
+    def _statement(self, cte: CTE, ctes: Dict[str, CTE], keys: Dict[str, str], tables: Dict[str, str]) -> str:
+        """``cte`` as a statement over the CTEs it needs, cached ones read from their tables."""
+        needed: List[str] = []
+
+        def visit(name: str) -> None:
+            if name in needed:
+                return
+            if keys[name] not in tables:
+                for dependency in ctes[name].depends_on:
+                    visit(dependency)
+            needed.append(name)
+
+        for dependency in cte.depends_on:
+            visit(dependency)
+        statement = [
+            CTE(name=name, query=f"SELECT * FROM {tables[keys[name]]}") if keys[name] in tables else ctes[name]
+            for name in needed
+        ]
+        statement.append(cte)
+        return CTEManager(self.dialect).assemble_query(statement).rstrip().rstrip(";")
+
+    # State
+
+    def _cached_tables(self) -> Dict[str, str]:
+        """Cached table of every cache key."""
+        if not self._state_table_ready:
+            self.dialect.execute_query(
+                f"CREATE TABLE IF NOT EXISTS {self.state_table} ("
+                f"cache_key VARCHAR PRIMARY KEY, table_name VARCHAR, library_name VARCHAR, "
+                f"library_version VARCHAR, definition VARCHAR, created_at VARCHAR)"
+            )
+            self._state_table_ready = True
+        return {key: table for key, table in self.dialect.execute_query(
+            f"SELECT cache_key, table_name FROM {self.state_table}")}
+
+
+def _cache_keys(ctes: Sequence[CTE]) -> Dict[str, str]:
+    """Hash of every CTE's query and of the keys of the CTEs it depends on."""
+    keys: Dict[str, str] = {}
+    pending = list(ctes)
+    while pending:
+        ready = [cte for cte in pending if all(dependency in keys for dependency in cte.depends_on)]
+        if not ready:
+            raise ValueError("CTE dependencies form a cycle")
+        for cte in ready:
+            content = json.dumps([cte.query, [[name, keys[name]] for name in sorted(cte.depends_on)]])
+            keys[cte.name] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        pending = [cte for cte in pending if cte.name not in keys]
+    return keys
+
+
+def _quote(value: str) -> str:
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
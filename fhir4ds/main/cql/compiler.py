@@ -0,0 +1,1285 @@
+"""CQL library compiler.
+
+Compiles a CQL library (CQL text, ELM JSON or a parsed
+:class:`~fhir4ds.cql.nodes.Library`) into a single SQL statement that
+evaluates its definitions for every patient at once, instead of running
+the library once per patient. Each ``define`` becomes a CTE keyed by
+``patient_id``:
+
+- definitions returning resources (retrieves and queries) are CTEs of
+  ``(patient_id, id, resource)`` rows;
+- Boolean and other single-valued definitions are CTEs with one ``value``
+  row per patient (``low``/``high`` for intervals), computed over the
+  ``Patient`` table and joined to the definitions they reference.
+
+Retrieves are scans of the catalog's resource tables keyed by the
+resource's Patient reference (its hot key column when one is extracted).
+Code filters are semi-joins on resource ids, built like the translator's
+``memberOf()``: through the coding side table of the element when the
+catalog has one, otherwise over the element's Codings, joined to the
+TerminologyStore tables for value sets. The CTEs are ordered and assembled by the
+:class:`~fhir4ds.fhirpath.sql.cte.CTEManager` and the final SELECT returns
+one row per patient with a column per definition, so a whole measure
+population is one statement the database can plan and parallelize.
+
+Values follow the CQL semantics of the supported subset: Date values are
+DATEs and DateTime values TIMESTAMPs (partial dates start at their first
+day or instant, time zones are dropped, a Date meeting a DateTime is read
+as its first instant), intervals are closed (open bounds move by one day,
+millisecond, or by one for integers), quantities only compare and combine
+in the same unit (there is no unit conversion, so mixing units is
+rejected) and nulls propagate through SQL three-valued logic.
+
+Element navigation does not go through the FHIRPath
+:class:`~fhir4ds.fhirpath.sql.translator.ASTToSQLTranslator`: the
+translator compiles one FHIRPath expression over the rows of a single
+resource table into collection-valued fragments, while CQL properties are
+read from whichever query alias, definition or Patient row is in scope and
+are typed by the CQL operator using them (a Period is an interval, a
+choice element the first of its present variants). The compiler reads the
+JSON through the dialect directly and shares the public SQL building
+blocks of the storage layer: ``element_rows()`` for repeating elements,
+``CODE_ELEMENTS`` for plain-code tokens, and ``date_start()`` and
+``string_literal()`` from the search index.
+
+Example:
+    >>> compiler = CQLCompiler(dialect, catalog=StorageCatalog(terminology=TerminologyStore()))
+    >>> compiled = compiler.compile(measure_cql, expressions=["Initial Population", "Numerator"])
+    >>> dialect.execute_query(compiled.sql)
+    [('p1', True, False), ...]
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field, replace
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from fhir4ds.dialects.base import DatabaseDialect
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog
+from fhir4ds.fhirpath.sql.cte import CTE, CTEManager
+from fhir4ds.fhirpath.sql.extraction import CODE_ELEMENTS
+from fhir4ds.fhirpath.sql.references import element_rows
+from fhir4ds.fhirpath.sql.search import date_start, string_literal
+from fhir4ds.fhirpath.types.fhir_types import resolve_polymorphic_property
+
+from .elm import library_from_elm
+from .nodes import (
+    As, Binary, Call, Case, DateDifference, Expression, If, IntervalSelector, Library,
+    ListSelector, Literal, Property, QuantityLiteral, Query, Ref, Retrieve, Timing, Unary,
+)
+from .parser import PRECISIONS, parse_expression, parse_library
+
+DEFAULT_CTE_PREFIX = "cql"
+
+# Element holding the Patient a resource belongs to, where it is not "subject"
+# (the patient context paths of the FHIR ModelInfo)
+PATIENT_REFERENCE_PATHS = {
+    "AllergyIntolerance": "patient",
+    "BodyStructure": "patient",
+    "Claim": "patient",
+    "ClaimResponse": "patient",
+    "Consent": "patient",
+    "Coverage": "beneficiary",
+    "CoverageEligibilityRequest": "patient",
+    "CoverageEligibilityResponse": "patient",
+    "DetectedIssue": "patient",
+    "Device": "patient",
+    "EpisodeOfCare": "patient",
+    "ExplanationOfBenefit": "patient",
+    "FamilyMemberHistory": "patient",
+    "Immunization": "patient",
+    "ImmunizationEvaluation": "patient",
+    "ImmunizationRecommendation": "patient",
+    "RelatedPerson": "patient",
+    "VisionPrescription": "patient",
+}
+
+# Code filtered by ``[Type: "Value Set"]`` retrieves (primaryCodePath of the ModelInfo)
+PRIMARY_CODE_PATHS = {
+    "AdverseEvent": "event",
+    "AllergyIntolerance": "code",
+    "BodyStructure": "location",
+    "CarePlan": "category",
+    "CareTeam": "category",
+    "Claim": "type",
+    "ClinicalImpression": "code",
+    "Communication": "category",
+    "CommunicationRequest": "category",
+    "Condition": "code",
+    "Coverage": "type",
+    "Device": "type",
+    "DeviceRequest": "codeCodeableConcept",
+    "DiagnosticReport": "code",
+    "DocumentReference": "type",
+    "Encounter": "type",
+    "EpisodeOfCare": "type",
+    "FamilyMemberHistory": "relationship",
+    "Flag": "code",
+    "Goal": "category",
+    "ImagingStudy": "procedureCode",
+    "Immunization": "vaccineCode",
+    "ImmunizationRecommendation": "recommendation.vaccineCode",
+    "Location": "type",
+    "Medication": "code",
+    "MedicationAdministration": "medicationCodeableConcept",
+    "MedicationDispense": "medicationCodeableConcept",
+    "MedicationRequest": "medicationCodeableConcept",
+    "MedicationStatement": "medicationCodeableConcept",
+    "Observation": "code",
+    "Procedure": "code",
+    "RiskAssessment": "code",
+    "ServiceRequest": "code",
+    "Specimen": "type",
+    "Substance": "code",
+    "Task": "code",
+}
+
+# Choice elements missing from the FHIRPath polymorphic property table
+_CHOICE_ELEMENTS = {
+    "medication": ["medicationCodeableConcept", "medicationReference"],
+    "effective": ["effectiveDateTime", "effectivePeriod", "effectiveInstant", "effectiveTiming"],
+    "born": ["bornPeriod", "bornDate", "bornString"],
+    "serviced": ["servicedDate", "servicedPeriod"],
+    "timing": ["timingTiming", "timingPeriod", "timingDateTime"],
+}
+
+# UCUM and calendar duration units of temporal quantities
+_TEMPORAL_UNITS = {
+    "a": "year", "mo": "month", "wk": "week", "d": "day", "h": "hour", "min": "minute",
+    "s": "second", "ms": "millisecond",
+    **{precision: precision for precision in PRECISIONS},
+    **{f"{precision}s": precision for precision in PRECISIONS},
+}
+
+_SECONDS = {"week": 604800, "day": 86400, "hour": 3600, "minute": 60, "second": 1, "millisecond": 0.001}
+
+_CONVERSIONS = {
+    "ToBoolean": "Boolean", "ToDate": "Date", "ToDateTime": "DateTime", "ToDecimal": "Decimal",
+    "ToInteger": "Integer", "ToQuantity": "Quantity", "ToString": "String",
+}
+
+_AGE = re.compile(r"^(Calculate)?AgeIn(Year|Month|Week|Day|Hour|Minute|Second)s(At)?$")
+
+_SQL_FUNCTIONS = {
+    "Abs": ("ABS", None), "Ceiling": ("CEIL", "Integer"), "Floor": ("FLOOR", "Integer"),
+    "Length": ("LENGTH", "Integer"), "Lower": ("LOWER", "String"), "Round": ("ROUND", None),
+    "Truncate": ("TRUNC", "Integer"), "Upper": ("UPPER", "String"),
+}
+
+_NUMERIC_TYPES = ("Integer", "Decimal", "Quantity")
+
+_AGGREGATES = {"Sum": "SUM", "Min": "MIN", "Max": "MAX", "Avg": "AVG"}
+
+
+@dataclass
+class CompiledLibrary:
+    """A CQL library compiled to SQL.
+
+    Attributes:
+        sql: Statement returning ``patient_id`` and a column per expression
+        expressions: Column names, in order: the definition names (or
+            ``<measure>.<definition>`` when several measures are compiled)
+        ctes: CTEs of ``sql``, the final SELECT last
+        measures: Measure of each column when several measures are compiled
+        definitions: CTE of every compiled definition, including those only
+            referenced by the returned ones
+        dependencies: Definitions each compiled definition references
+            directly (the define dependency graph)
+    """
+
+    sql: str
+    expressions: List[str]
+    ctes: List[CTE] = field(default_factory=list)
+    measures: List[str] = field(default_factory=list)
+    definitions: Dict[str, str] = field(default_factory=dict)
+    dependencies: Dict[str, List[str]] = field(default_factory=dict)
+
+
+@dataclass
+class CompiledExpression:
+    """A standalone CQL expression compiled to SQL.
+
+    Attributes:
+        sql: Statement selecting ``value``, ``low`` and ``high`` for
+            intervals, or the ``(patient_id, id, resource)`` rows of a
+            resource list
+        kind: ``scalar``, ``interval`` or ``rows``
+        type: CQL type of the value or of the interval points
+            (``Boolean``, ``Integer``, ``Decimal``, ``Quantity``,
+            ``String``, ``Date``, ``DateTime`` or ``Null``)
+        unit: Unit of a Quantity
+    """
+
+    sql: str
+    kind: str
+    type: Optional[str] = None
+    unit: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class _Row:
+    """Resource row in scope: its SQL alias and id and JSON columns."""
+
+    alias: str
+    resource_type: Optional[str]
+    id_column: str = "id"
+    json_column: str = "resource"
+
+
+@dataclass
+class _Value:
+    """Compiled expression.
+
+    ``kind`` is one of ``rows`` (a relation of (patient_id, id, resource)),
+    ``scalar`` (a SQL value of ``type``), ``interval`` (closed ``low``/``high``),
+    ``element`` (JSON paths below ``sql``, the JSON of ``row`` or of a
+    definition), ``valueset`` (canonicals), ``codes`` ((system, code) pairs)
+    or ``list``.
+    """
+
+    kind: str
+    sql: Optional[str] = None
+    type: Optional[str] = None
+    low: Optional[str] = None
+    high: Optional[str] = None
+    unit: Optional[str] = None
+    row: Optional[_Row] = None
+    paths: Tuple[Tuple[str, ...], ...] = ((),)
+    resource_type: Optional[str] = None
+    correlated: bool = False
+    items: Tuple[Any, ...] = ()
+
+
+@dataclass
+class _Definition:
+    cte: str
+    kind: str
+    type: Optional[str] = None
+    resource_type: Optional[str] = None
+    unit: Optional[str] = None
+
+
+class _Scope:
+    """Names visible to an expression and the joins it needs.
+
+    ``key`` is the SQL of the current patient id (``None`` outside the
+    Patient context); definitions are LEFT JOINed on it. A lookup of an alias
+    of an enclosing scope marks the scopes in between as correlated.
+    """
+
+    def __init__(self, key: Optional[str], parent: Optional[_Scope] = None,
+                 patient: Optional[_Row] = None):
+        self.key = key
+        self.parent = parent
+        self.patient = patient
+        self.aliases: Dict[str, _Row] = {}
+        self.joins: List[str] = []
+        self.joined: Dict[str, str] = {}
+        self.correlated = False
+
+    def lookup(self, name: str) -> Optional[_Row]:
+        scope, crossed = self, []
+        while scope is not None:
+            if name in scope.aliases:
+                for inner in crossed:
+                    inner.correlated = True
+                return scope.aliases[name]
+            crossed.append(scope)
+            scope = scope.parent
+        return None
+
+
+class CQLCompiler:
+    """Compiles CQL libraries to population-level SQL.
+
+    Args:
+        dialect: Dialect the SQL is generated for
+        catalog: Where resources are stored; value set filters need its
+            TerminologyStore
+        parameters: Parameter values as CQL expression text, overriding the
+            library defaults, e.g. ``{"Measurement Period":
+            "Interval[@2024-01-01, @2025-01-01)"}``
+        prefix: Prefix of the generated CTE names
+    """
+
+    def __init__(self, dialect: DatabaseDialect, catalog: Optional[StorageCatalog] = None,
+                 parameters: Optional[Dict[str, str]] = None, prefix: str = DEFAULT_CTE_PREFIX):
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", prefix):
+            raise ValueError(f"Invalid CTE prefix: {prefix!r}")
+        self.dialect = dialect
+        self.catalog = catalog or StorageCatalog()
+        self.parameters = {name: parse_expression(text) for name, text in (parameters or {}).items()}
+        self.prefix = prefix
+        self._reset(Library())
+
+    def compile(self, library: Union[str, Dict[str, Any], Library],
+                expressions: Optional[Sequence[str]] = None) -> CompiledLibrary:
+        """Compile the Patient context definitions of ``library`` to one statement.
+
+        Args:
+            library: CQL text, ELM JSON or a parsed library
+            expressions: Definitions to return; by default every Patient
+                context definition that is not an interval
+
+        Raises:
+            CQLParseError: On CQL outside the supported subset
+            ValueError: On definitions that cannot be compiled
+        """
+        self._reset(Library())
+        selected = self._select("", library, expressions)
+        return self._compiled([(name, definition) for _, name, definition in selected])
+
+    def compile_measures(self, libraries: Mapping[str, Union[str, Dict[str, Any], Library]],
+                         expressions: Optional[Mapping[str, Sequence[str]]] = None) -> CompiledLibrary:
+        """Compile several libraries to one statement that shares their common work.
+
+        Identical retrieves and definitions (the same code filter, or a
+        definition compiling to the same SQL such as a "Qualifying
+        Encounters" several measures declare) become one CTE, which the
+        database evaluates once however many measures reference it. Columns
+        are named ``<measure>.<definition>``.
+
+        Args:
+            libraries: Library per measure name
+            expressions: Definitions to return per measure; by default every
+                Patient context definition that is not an interval
+        """
+        self._reset(Library())
+        selected = []
+        for measure, library in libraries.items():
+            selected.extend(self._select(measure, library, (expressions or {}).get(measure)))
+        compiled = self._compiled([(f"{measure}.{name}", definition) for measure, name, definition in selected])
+        compiled.measures = [measure for measure, _, _ in selected]
+        return compiled
+
+    def compile_expression(self, expression: Union[str, Expression]) -> CompiledExpression:
+        """Compile an expression in the Unfiltered context to ``SELECT ... AS value``.
+
+        Intervals select ``low`` and ``high``, resource lists their rows; the
+        result says which, and the CQL type of the value.
+        """
+        node = parse_expression(expression) if isinstance(expression, str) else expression
+        self._reset(Library())
+        value = self._compile(node, _Scope(None))
+        if value.kind == "interval":
+            final = f"SELECT {value.low} AS low, {value.high} AS high"
+        elif value.kind == "rows":
+            final = f"SELECT q.patient_id, q.id, q.resource FROM {value.sql} AS q"
+        else:
+            final = f"SELECT {self._scalar(value)} AS value"
+        kind = value.kind if value.kind in ("interval", "rows") else "scalar"
+        value_type = value.resource_type if kind == "rows" else value.type
+        return CompiledExpression(final if not self._ctes else self._assemble(final), kind, value_type,
+                                  value.unit if kind == "scalar" else None)
+
+    def evaluate(self, library: Union[str, Dict[str, Any], Library],
+                 expressions: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Compile and run ``library``: one dict of definition values per patient."""
+        compiled = self.compile(library, expressions)
+        rows = self.dialect.execute_query(compiled.sql)
+        return [dict(zip(["patient_id", *compiled.expressions], row)) for row in rows]
+
+    # Statement assembly
+
+    def _reset(self, library: Library) -> None:
+        self._library = library
+        self._measure = ""
+        self._ctes: Dict[str, CTE] = {}
+        self._shared: Dict[str, str] = {}
+        self._definitions: Dict[Tuple[str, str], _Definition] = {}
+        self._retrieves: Dict[Any, str] = {}
+        self._compiling: List[Tuple[str, str]] = []
+        self._references: Dict[Tuple[str, str], List[str]] = {}
+        self._dependencies: List[Set[str]] = [set()]
+        self._counter = 0
+        self._result_ctes: List[CTE] = []
+
+    def _select(self, measure: str, library: Union[str, Dict[str, Any], Library],
+                expressions: Optional[Sequence[str]]) -> List[Tuple[str, str, _Definition]]:
+        """Compile the requested definitions of one library."""
+        self._library, self._measure = as_library(library), measure
+        names = list(expressions) if expressions is not None else [
+            name for name, definition in self._library.defines.items() if definition.context == "Patient"]
+        selected = []
+        for name in names:
+            definition = self._define(name)
+            if definition.kind == "interval":
+                if expressions is not None:
+                    raise ValueError(f"Interval definition {name!r} cannot be returned as a column")
+                continue
+            selected.append((measure, name, definition))
+        return selected
+
+    def _compiled(self, columns: List[Tuple[str, _Definition]]) -> CompiledLibrary:
+        """Final SELECT of one row per patient with a column per definition."""
+        patients = self._patients()
+        root = _Scope("p.patient_id")
+        selects = []
+        for label, definition in columns:
+            self._use(definition.cte)
+            if definition.kind == "rows":
+                ids = self.dialect.aggregate_to_json_array("q.id")
+                grouped = f"(SELECT q.patient_id, {ids} AS value FROM {definition.cte} AS q GROUP BY q.patient_id)"
+                column = f"{self._join(root, grouped)}.value"
+            else:
+                column = f"{self._join(root, definition.cte)}.value"
+            selects.append(f"{column} AS {self.dialect.quote_identifier(label)}")
+        final = (f"SELECT p.patient_id{''.join(', ' + select for select in selects)} "
+                 f"FROM {patients} AS p{''.join(root.joins)}")
+        labels = {key: f"{key[0]}.{key[1]}" if key[0] else key[1] for key in self._definitions}
+        return CompiledLibrary(
+            sql=self._assemble(final), expressions=[label for label, _ in columns], ctes=self._result_ctes,
+            definitions={labels[key]: definition.cte for key, definition in self._definitions.items()},
+            dependencies={labels[key]: [labels[key[0], name] for name in self._references[key]]
+                          for key in self._definitions})
+
+    def _assemble(self, final: str) -> str:
+        ctes = list(self._ctes.values())
+        ctes.append(CTE(name=self._cte_name("result"), query=final,
+                        depends_on=sorted(self._dependencies[0] | set(self._ctes))))
+        self._result_ctes = ctes
+        return CTEManager(self.dialect).assemble_query(ctes).rstrip().rstrip(";")
+
+    def _use(self, cte: str) -> str:
+        self._dependencies[-1].add(cte)
+        return cte
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _cte_name(self, label: str) -> str:
+        slug = re.sub(r"[^0-9A-Za-z]+", "_", label).strip("_").lower() or "define"
+        name, suffix = f"{self.prefix}_{slug}", 1
+        while name in self._ctes:
+            suffix += 1
+            name = f"{self.prefix}_{slug}_{suffix}"
+        return name
+
+    def _join(self, scope: _Scope, relation: str) -> str:
+        """Alias of ``relation`` LEFT JOINed to ``scope`` on its patient id."""
+        if scope.key is None:
+            raise ValueError("Definitions can only be referenced in the Patient context")
+        alias = scope.joined.get(relation)
+        if alias is None:
+            alias = scope.joined[relation] = self._name("j")
+            scope.joins.append(f" LEFT JOIN {relation} AS {alias} ON {alias}.patient_id = {scope.key}")
+        return alias
+
+    def _patients(self) -> str:
+        name = f"{self.prefix}_patients"
+        if name not in self._ctes:
+            relation = self.catalog.relation("Patient", self.dialect)
+            self._ctes[name] = CTE(name=name, query=f"SELECT r.id AS patient_id, r.resource FROM {relation} AS r")
+        return self._use(name)
+
+    def _define(self, name: str) -> _Definition:
+        key = (self._measure, name)
+        if key in self._definitions:
+            return self._definitions[key]
+        definition = self._library.defines.get(name)
+        if definition is None:
+            raise ValueError(f"Unknown definition: {name!r}")
+        if definition.context != "Patient":
+            raise ValueError(f"Definition {name!r} is in the {definition.context} context; "
+                             "only Patient context definitions are supported")
+        if key in self._compiling:
+            raise ValueError(f"Definition {name!r} references itself")
+        self._compiling.append(key)
+        self._references[key] = []
+        expression = definition.expression
+        if isinstance(expression, Ref) and expression.library is None and expression.name in self._library.defines:
+            # An alias of another definition ("Denominator": "Initial Population") shares its CTE
+            self._references[key].append(expression.name)
+            result = self._define(expression.name)
+            self._compiling.pop()
+            self._definitions[key] = result
+            return result
+
+        # Aliases are numbered per definition, so identical definitions compile
+        # to identical SQL and are shared
+        counter, self._counter = self._counter, 0
+        self._dependencies.append(set())
+        scope = _Scope("p.patient_id")
+        value = self._compile(expression, scope)
+        joins = "".join(scope.joins)
+        if value.kind == "rows":
+            query = f"SELECT q.patient_id, q.id, q.resource FROM {value.sql} AS q"
+            result = _Definition("", "rows", resource_type=value.resource_type)
+        elif value.kind == "interval":
+            query = (f"SELECT p.patient_id, {value.low} AS low, {value.high} AS high "
+                     f"FROM {self._patients()} AS p{joins}")
+            result = _Definition("", "interval", type=value.type)
+        elif value.kind == "element":
+            query = f"SELECT p.patient_id, {self._json(value)} AS value FROM {self._patients()} AS p{joins}"
+            result = _Definition("", "element", resource_type=value.resource_type)
+        elif value.kind == "scalar":
+            query = f"SELECT p.patient_id, {value.sql} AS value FROM {self._patients()} AS p{joins}"
+            result = _Definition("", "scalar", type=value.type, unit=value.unit)
+        else:
+            raise ValueError(f"Definition {name!r} evaluates to a {value.kind}, which cannot be stored")
+        self._counter = counter
+
+        dependencies = self._dependencies.pop()
+        shared = self._shared.get(query)
+        if shared is not None:
+            result.cte = shared
+        else:
+            cte = result.cte = self._shared[query] = self._cte_name(name)
+            self._ctes[cte] = CTE(name=cte, query=query, depends_on=sorted(dependencies))
+        self._compiling.pop()
+        self._definitions[key] = result
+        return result
+
+    # Expressions
+
+    def _compile(self, node: Expression, scope: _Scope) -> _Value:
+        if isinstance(node, Literal):
+            return self._literal(node)
+        if isinstance(node, QuantityLiteral):
+            return _Value("scalar", sql=str(Decimal(node.value)), type="Quantity", unit=node.unit)
+        if isinstance(node, IntervalSelector):
+            return self._interval_selector(node, scope)
+        if isinstance(node, ListSelector):
+            return self._list(node, scope)
+        if isinstance(node, Ref):
+            return self._ref(node, scope)
+        if isinstance(node, Property):
+            return self._property(node, scope)
+        if isinstance(node, Retrieve):
+            return self._retrieve(node, scope)
+        if isinstance(node, Query):
+            return self._query(node, scope)
+        if isinstance(node, Unary):
+            return self._unary(node, scope)
+        if isinstance(node, Binary):
+            return self._binary(node, scope)
+        if isinstance(node, Timing):
+            return self._timing(node, scope)
+        if isinstance(node, DateDifference):
+            return self._date_difference(node, scope)
+        if isinstance(node, Call):
+            return self._call(node, scope)
+        if isinstance(node, If):
+            return self._case([(node.condition, node.then)], node.else_, None, scope)
+        if isinstance(node, Case):
+            return self._case(node.items, node.else_, node.comparand, scope)
+        if isinstance(node, As):
+            return self._as(node, scope)
+        raise ValueError(f"Unsupported CQL expression: {type(node).__name__}")
+
+    def _literal(self, node: Literal) -> _Value:
+        if node.value is None:
+            return _Value("scalar", sql="NULL", type="Null")
+        if node.type == "Boolean":
+            return _Value("scalar", sql="TRUE" if node.value else "FALSE", type="Boolean")
+        if node.type in ("Integer", "Decimal"):
+            return _Value("scalar", sql=str(node.value), type=node.type)
+        if node.type == "Date":
+            return _Value("scalar", sql=_date_literal(node.value), type="Date")
+        if node.type == "DateTime":
+            return _Value("scalar", sql=_timestamp_literal(node.value), type="DateTime")
+        if node.type == "String":
+            return _Value("scalar", sql=string_literal(node.value), type="String")
+        raise ValueError(f"Unsupported literal type: {node.type}")
+
+    def _interval_selector(self, node: IntervalSelector, scope: _Scope) -> _Value:
+        low, high = self._compile(node.low, scope), self._compile(node.high, scope)
+        point_type = _common_type(low, high)
+        low_sql, high_sql = self._scalar(low, point_type), self._scalar(high, point_type)
+        if not node.low_closed:
+            low_sql = _step(low_sql, point_type, "+")
+        if not node.high_closed:
+            high_sql = _step(high_sql, point_type, "-")
+        return _Value("interval", low=low_sql, high=high_sql, type=point_type)
+
+    def _list(self, node: ListSelector, scope: _Scope) -> _Value:
+        items = [self._compile(element, scope) for element in node.elements]
+        if items and all(item.kind == "codes" for item in items):
+            return _Value("codes", items=tuple(code for item in items for code in item.items))
+        if items and all(item.kind == "valueset" for item in items):
+            return _Value("valueset", items=tuple(url for item in items for url in item.items))
+        return _Value("list", items=tuple(items))
+
+    def _ref(self, node: Ref, scope: _Scope) -> _Value:
+        if node.library is not None:
+            raise ValueError(f"References into included library {node.library!r} are not supported")
+        row = scope.lookup(node.name)
+        if row is not None:
+            return _Value("element", sql=f"{row.alias}.{row.json_column}", row=row,
+                          resource_type=row.resource_type)
+        library = self._library
+        if node.name in library.defines:
+            references = self._references[self._compiling[-1]]
+            if node.name not in references:
+                references.append(node.name)
+            definition = self._define(node.name)
+            self._use(definition.cte)
+            if definition.kind == "rows":
+                return _Value("rows", sql=definition.cte, resource_type=definition.resource_type)
+            alias = self._join(scope, definition.cte)
+            if definition.kind == "interval":
+                return _Value("interval", low=f"{alias}.low", high=f"{alias}.high", type=definition.type)
+            if definition.kind == "element":
+                return _Value("element", sql=f"{alias}.value", resource_type=definition.resource_type)
+            return _Value("scalar", sql=f"{alias}.value", type=definition.type, unit=definition.unit)
+        if node.name in library.parameters or node.name in self.parameters:
+            expression = self.parameters.get(node.name)
+            if expression is None:
+                expression = library.parameters[node.name].default
+            if expression is None:
+                return _Value("scalar", sql="NULL", type="Null")
+            return self._compile(expression, scope)
+        if node.name in library.valuesets:
+            return _Value("valueset", items=(library.valuesets[node.name],))
+        if node.name in library.codes:
+            code = library.codes[node.name]
+            if code.system not in library.codesystems:
+                raise ValueError(f"Unknown code system {code.system!r} of code {node.name!r}")
+            return _Value("codes", items=((library.codesystems[code.system], code.code),))
+        if node.name == "Patient":
+            return self._patient(scope)
+        raise ValueError(f"Unknown identifier: {node.name!r}")
+
+    def _patient(self, scope: _Scope) -> _Value:
+        if scope.key is None:
+            raise ValueError("Patient can only be referenced in the Patient context")
+        alias = self._join(scope, self._patients())
+        row = _Row(alias, "Patient", id_column="patient_id")
+        return _Value("element", sql=f"{alias}.resource", row=row, resource_type="Patient")
+
+    def _property(self, node: Property, scope: _Scope) -> _Value:
+        source = self._compile(node.source, scope)
+        if source.kind == "element":
+            paths = []
+            for path in source.paths:
+                variants = (resolve_polymorphic_property(node.name) or _CHOICE_ELEMENTS.get(node.name)
+                            if not path else None)
+                paths.extend(path + (variant,) for variant in variants or [node.name])
+            return replace(source, paths=tuple(paths))
+        if source.kind == "interval" and node.name in ("low", "high"):
+            return _Value("scalar", sql=getattr(source, node.name), type=source.type)
+        raise ValueError(f"Cannot read property {node.name!r} of a {source.kind}")
+
+    def _retrieve(self, node: Retrieve, scope: _Scope) -> _Value:
+        resource_type = node.resource_type
+        codes = self._compile(node.codes, scope) if node.codes is not None else None
+        if codes is not None and codes.kind not in ("valueset", "codes"):
+            raise ValueError(f"Retrieve filters must be value sets or codes, not a {codes.kind}")
+        key = (resource_type, node.code_path, codes.kind if codes else None, codes.items if codes else ())
+        name = self._retrieves.get(key)
+        if name is None:
+            name = self._retrieves[key] = self._cte_name(f"retrieve_{resource_type}")
+            self._ctes[name] = CTE(name=name, query=self._retrieve_query(resource_type, node.code_path, codes))
+        return _Value("rows", sql=self._use(name), resource_type=resource_type)
+
+    def _retrieve_query(self, resource_type: str, code_path: Optional[str], codes: Optional[_Value]) -> str:
+        patient = self._patient_key("r", resource_type)
+        relation = self.catalog.relation(resource_type, self.dialect)
+        query = (f"SELECT {patient} AS patient_id, r.id, r.resource FROM {relation} AS r "
+                 f"WHERE {patient} IS NOT NULL")
+        if codes is not None:
+            code_path = code_path or PRIMARY_CODE_PATHS.get(resource_type)
+            if code_path is None:
+                raise ValueError(f"No code path is known for {resource_type} retrieves; "
+                                 f"name it as [{resource_type}: <path> in ...]")
+            query += f" AND r.id IN ({self._coded_ids(resource_type, tuple(code_path.split('.')), codes)})"
+        return query
+
+    def _patient_key(self, alias: str, resource_type: Optional[str], columns: bool = True) -> str:
+        if resource_type == "Patient":
+            return f"{alias}.id"
+        path = PATIENT_REFERENCE_PATHS.get(resource_type, "subject")
+        column = self.catalog.resolve(resource_type).column_for_path(f"{path}.reference") if columns else None
+        reference = (f"{alias}.{column}" if column
+                     else self.dialect.extract_json_string(f"{alias}.resource", f"$.{path}.reference"))
+        return self.dialect.generate_reference_key(reference, "Patient")
+
+    def _coded_ids(self, resource_type: str, path: Sequence[str], codes: _Value) -> str:
+        """SELECT of the ids of ``resource_type`` with a code at ``path`` matching ``codes``.
+
+        Uses the coding side table of the element when the catalog has one;
+        otherwise Codings are read from ``path.coding`` (CodeableConcepts) and
+        ``path`` itself (Codings), and elements such as ``status`` are plain codes.
+        """
+        if codes.kind == "valueset" and self.catalog.terminology is None:
+            raise ValueError("Value set membership needs a StorageCatalog with a TerminologyStore")
+        terminology = self.catalog.terminology
+        mapping = self.catalog.resolve(resource_type)
+        dotted = ".".join(path)
+        side_table = next((side_table for side_table in mapping.side_tables
+                           if side_table.collection in (dotted, f"{dotted}.coding")), None)
+        columns = {member: column for column, member in side_table.columns} if side_table else {}
+        if "system" in columns and "code" in columns:
+            table = side_table.table_name(mapping.table)
+            if codes.kind == "valueset":
+                return " UNION ALL ".join(
+                    terminology.side_table_member_ids_query(table, mapping.id_column, url, columns["system"],
+                                                            columns["code"], mapping.type_column, resource_type)
+                    for url in codes.items)
+            match = " OR ".join(f"(side.{columns['system']} = {string_literal(system)} "
+                                f"AND side.{columns['code']} = {string_literal(code)})"
+                                for system, code in codes.items)
+            query = f"SELECT side.{mapping.id_column} FROM {table} AS side WHERE ({match})"
+            if mapping.type_column is not None:
+                query += f" AND side.{mapping.type_column} = {string_literal(resource_type)}"
+            return query
+
+        relation = self.catalog.relation(resource_type, self.dialect)
+        if path[-1] in CODE_ELEMENTS:
+            candidates = [(element_rows(self.dialect, relation, dotted), True)]
+        else:
+            candidates = [(element_rows(self.dialect, relation, f"{dotted}.coding"), False),
+                          (element_rows(self.dialect, relation, dotted), False)]
+        selects = []
+        for items, codes_only in candidates:
+            if codes.kind == "valueset":
+                selects.extend(terminology.member_ids_query(self.dialect, items, url, codes_only)
+                               for url in codes.items)
+                continue
+            if codes_only:
+                code = self.dialect.json_value_as_string("items.item")
+                match = f"{code} IN ({', '.join(string_literal(value) for _, value in codes.items)})"
+            else:
+                code = self.dialect.extract_json_string("items.item", "$.code")
+                system = self.dialect.extract_json_string("items.item", "$.system")
+                match = " OR ".join(f"({system} = {string_literal(url)} AND {code} = {string_literal(value)})"
+                                    for url, value in codes.items)
+            selects.append(f"SELECT items.source_id FROM ({items}) AS items WHERE {match}")
+        return " UNION ALL ".join(selects)
+
+    def _query(self, node: Query, scope: _Scope) -> _Value:
+        source = self._compile(node.source, scope)
+        if source.kind != "rows":
+            raise ValueError("Query sources must be retrieves, queries or list-valued definitions")
+        alias = self._name("q")
+        inner = _Scope(f"{alias}.patient_id", parent=scope)
+        inner.aliases[node.alias] = _Row(alias, source.resource_type)
+        conditions = []
+        for relationship in node.relationships:
+            related = self._compile(relationship.source, inner)
+            if related.kind != "rows":
+                raise ValueError("with/without sources must be retrieves, queries or list-valued definitions")
+            related_alias = self._name("w")
+            such_that = _Scope(f"{related_alias}.patient_id", parent=inner)
+            such_that.aliases[relationship.alias] = _Row(related_alias, related.resource_type)
+            condition = self._boolean(self._compile(relationship.such_that, such_that))
+            exists = (f"EXISTS (SELECT 1 FROM {related.sql} AS {related_alias}{''.join(such_that.joins)} "
+                      f"WHERE {related_alias}.patient_id = {alias}.patient_id AND ({condition}))")
+            conditions.append(exists if relationship.kind == "with" else f"NOT {exists}")
+        if node.where is not None:
+            conditions.append(self._boolean(self._compile(node.where, inner)))
+        if node.return_ is not None and not (isinstance(node.return_, Ref) and node.return_.name == node.alias):
+            raise ValueError("Only queries returning their source alias are supported")
+        sql = (f"(SELECT {alias}.patient_id, {alias}.id, {alias}.resource "
+               f"FROM {source.sql} AS {alias}{''.join(inner.joins)}")
+        if conditions:
+            sql += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+        return _Value("rows", sql=sql + ")", resource_type=source.resource_type,
+                      correlated=inner.correlated or source.correlated)
+
+    def _unary(self, node: Unary, scope: _Scope) -> _Value:
+        operand = self._compile(node.operand, scope)
+        op = node.op
+        if op == "not":
+            return _boolean(f"(NOT {self._boolean(operand)})")
+        if op == "exists":
+            return _boolean(self._exists(operand, scope))
+        if op in ("start", "end"):
+            interval = self._interval(operand)
+            return _Value("scalar", sql=interval.low if op == "start" else interval.high, type=interval.type)
+        if op == "date":
+            return _Value("scalar", sql=f"CAST({self._scalar(operand, 'DateTime')} AS DATE)", type="Date")
+        if op == "negate":
+            numeric = operand.type if operand.kind == "scalar" and operand.type in _NUMERIC_TYPES else "Decimal"
+            return _Value("scalar", sql=f"(- {self._scalar(operand, numeric)})", type=numeric, unit=operand.unit)
+        if op in ("is null", "is not null"):
+            sql = self._json(operand) if operand.kind == "element" else self._scalar(operand)
+            return _boolean(f"({sql} {op.upper()})")
+        if op in ("is true", "is false", "is not true", "is not false"):
+            return _boolean(f"({self._boolean(operand)} {op.upper()})")
+        raise ValueError(f"Unsupported operator: {op}")
+
+    def _exists(self, value: _Value, scope: _Scope) -> str:
+        if value.kind == "rows":
+            alias = self._name("e")
+            if scope.key is None:
+                return f"EXISTS (SELECT 1 FROM {value.sql} AS {alias})"
+            if value.correlated:
+                return f"EXISTS (SELECT 1 FROM {value.sql} AS {alias} WHERE {alias}.patient_id = {scope.key})"
+            return f"{scope.key} IN (SELECT {alias}.patient_id FROM {value.sql} AS {alias})"
+        if value.kind == "list":
+            return "TRUE" if value.items else "FALSE"
+        if value.kind == "element":
+            return f"({self._json(value)} IS NOT NULL)"
+        return f"({self._scalar(value)} IS NOT NULL)"
+
+    def _count(self, value: _Value, scope: _Scope) -> str:
+        if value.kind == "list":
+            return str(len(value.items))
+        if value.kind != "rows":
+            raise ValueError(f"Count() of a {value.kind} is not supported")
+        alias = self._name("c")
+        if scope.key is None:
+            return f"(SELECT COUNT(*) FROM {value.sql} AS {alias})"
+        if value.correlated:
+            return f"(SELECT COUNT(*) FROM {value.sql} AS {alias} WHERE {alias}.patient_id = {scope.key})"
+        grouped = f"(SELECT {alias}.patient_id, COUNT(*) AS value FROM {value.sql} AS {alias} GROUP BY {alias}.patient_id)"
+        return f"COALESCE({self._join(scope, grouped)}.value, 0)"
+
+    def _aggregate(self, name: str, value: _Value) -> _Value:
+        """Sum, Min, Max or Avg of a list; nulls are skipped and an empty list gives null."""
+        if value.kind != "list":
+            raise ValueError(f"{name}() of a {value.kind} is not supported")
+        items = [item for item in value.items if not (item.kind == "scalar" and item.type == "Null")]
+        if not items:
+            return _Value("scalar", sql="NULL", type="Null")
+        for item in items[1:]:
+            _same_unit("aggregate", items[0], item)
+        value_type = _common_type(*items)
+        if name in ("Sum", "Avg") and value_type not in _NUMERIC_TYPES:
+            raise ValueError(f"{name}() of {value_type} values is not supported")
+        unit = next((item.unit for item in items if item.unit), None)
+        alias = self._name("a")
+        rows = ", ".join(f"({self._scalar(item, value_type)})" for item in items)
+        sql = f"(SELECT {_AGGREGATES[name]}({alias}.value) FROM (VALUES {rows}) AS {alias}(value))"
+        if any(item.type == "Quantity" for item in items):
+            return _Value("scalar", sql=sql, type="Quantity", unit=unit)
+        return _Value("scalar", sql=sql, type="Decimal" if name == "Avg" else value_type)
+
+    def _binary(self, node: Binary, scope: _Scope) -> _Value:
+        op = node.op
+        left, right = self._compile(node.left, scope), self._compile(node.right, scope)
+        if op in ("and", "or"):
+            return _boolean(f"({self._boolean(left)} {op.upper()} {self._boolean(right)})")
+        if op == "xor":
+            a, b = self._boolean(left), self._boolean(right)
+            return _boolean(f"(({a} AND NOT {b}) OR (NOT {a} AND {b}))")
+        if op == "implies":
+            return _boolean(f"(NOT {self._boolean(left)} OR {self._boolean(right)})")
+        if op == "in":
+            return _boolean(self._membership(left, right))
+        if op == "contains":
+            return _boolean(self._membership(right, left))
+        if op in ("=", "!=", "<>", "~", "!~", "<", "<=", ">", ">="):
+            return _boolean(self._compare("!=" if op == "<>" else op, left, right))
+        if op == "&":
+            return _Value("scalar", sql=f"(COALESCE({self._scalar(left, 'String')}, '') || "
+                                        f"COALESCE({self._scalar(right, 'String')}, ''))", type="String")
+        if op in ("+", "-", "*", "/", "div", "mod", "^"):
+            return self._arithmetic(op, left, right)
+        raise ValueError(f"Unsupported operator: {op}")
+
+    def _membership(self, item: _Value, collection: _Value) -> str:
+        if collection.kind in ("valueset", "codes"):
+            return self._coded(item, collection)
+        if collection.kind == "interval":
+            interval = self._interval(item)
+            return (f"({collection.low} <= {interval.low} AND {interval.high} <= {collection.high})")
+        if collection.kind == "list":
+            point_type = _common_type(item, *collection.items)
+            values = ", ".join(self._scalar(value, point_type) for value in collection.items)
+            return f"({self._scalar(item, point_type)} IN ({values}))" if values else "FALSE"
+        if collection.kind == "rows" and item.kind == "element" and item.row is not None and item.paths == ((),):
+            alias = self._name("m")
+            return f"({item.row.alias}.{item.row.id_column} IN (SELECT {alias}.id FROM {collection.sql} AS {alias}))"
+        raise ValueError(f"Unsupported membership test: {item.kind} in {collection.kind}")
+
+    def _coded(self, element: _Value, codes: _Value) -> str:
+        """Whether the codes of a resource element are in a value set or code list."""
+        row = element.row
+        if element.kind != "element" or row is None or row.resource_type is None or element.paths == ((),):
+            raise ValueError("Terminology tests need an element of a query alias or Patient")
+        ids = " UNION ALL ".join(self._coded_ids(row.resource_type, path, codes) for path in element.paths)
+        return f"({row.alias}.{row.id_column} IN ({ids}))"
+
+    def _compare(self, op: str, left: _Value, right: _Value) -> str:
+        if op in ("=", "!=", "~", "!~") and "codes" in (left.kind, right.kind):
+            element, codes = (left, right) if right.kind == "codes" else (right, left)
+            test = self._coded(element, codes)
+            return f"(NOT {test})" if op.startswith("!") else test
+        if op in ("=", "!=", "~", "!~") and "interval" in (left.kind, right.kind):
+            a, b = self._interval(left), self._interval(right)
+            test = f"({a.low} = {b.low} AND {a.high} = {b.high})"
+            return f"(NOT {test})" if op.startswith("!") else test
+        _same_unit("compare", left, right)
+        value_type = _common_type(left, right)
+        a, b = self._scalar(left, value_type), self._scalar(right, value_type)
+        if op in ("~", "!~"):
+            equal = f"LOWER({a}) = LOWER({b})" if value_type == "String" else f"{a} = {b}"
+            test = f"COALESCE({equal}, {a} IS NULL AND {b} IS NULL)"
+            return f"(NOT {test})" if op == "!~" else f"({test})"
+        return f"({a} {'<>' if op == '!=' else op} {b})"
+
+    def _arithmetic(self, op: str, left: _Value, right: _Value) -> _Value:
+        if op in ("+", "-") and right.type == "Quantity" and right.unit in _TEMPORAL_UNITS \
+                and left.type != "Quantity":
+            # Date/time arithmetic with a calendar duration; Dates stay Dates
+            offset = _interval_literal(right)
+            point_type = "Date" if left.type == "Date" else "DateTime"
+
+            def shift(sql: str) -> str:
+                shifted = f"({sql} {op} {offset})"
+                return f"CAST({shifted} AS DATE)" if point_type == "Date" else shifted
+
+            if left.kind == "interval":
+                return replace(left, low=shift(left.low), high=shift(left.high), type=point_type)
+            return _Value("scalar", sql=shift(self._scalar(left, point_type)), type=point_type)
+        if op in ("+", "-", "mod"):
+            _same_unit("add or subtract", left, right)
+        elif left.unit and right.unit and (op == "*" or _unit(left) != _unit(right)):
+            raise ValueError(f"Cannot {'multiply' if op == '*' else 'divide'} quantities in "
+                             f"{left.unit!r} and {right.unit!r}; unit conversion is not supported")
+        value_type = _common_type(left, right)
+        if value_type == "String" and op == "+":
+            return _Value("scalar", sql=f"({self._scalar(left, 'String')} || {self._scalar(right, 'String')})",
+                          type="String")
+        if value_type not in _NUMERIC_TYPES:
+            value_type = "Decimal"
+        a, b = self._scalar(left, value_type), self._scalar(right, value_type)
+        unit = left.unit or right.unit
+        result_type = "Quantity" if "Quantity" in (left.type, right.type) else value_type
+        if op == "/":
+            if left.unit and right.unit:
+                # The units cancel out
+                result_type, unit = "Decimal", None
+            return _Value("scalar", sql=f"(CAST({a} AS DOUBLE PRECISION) / NULLIF({b}, 0))",
+                          type="Quantity" if result_type == "Quantity" else "Decimal", unit=unit)
+        if op == "div":
+            return _Value("scalar", sql=f"CAST(TRUNC({a} / NULLIF({b}, 0)) AS INTEGER)", type="Integer")
+        if op == "mod":
+            return _Value("scalar", sql=f"MOD({a}, NULLIF({b}, 0))", type=result_type, unit=unit)
+        if op == "^":
+            return _Value("scalar", sql=f"POWER({a}, {b})", type="Decimal")
+        return _Value("scalar", sql=f"({a} {op} {b})", type=result_type, unit=unit)
+
+    def _timing(self, node: Timing, scope: _Scope) -> _Value:
+        a = self._interval(self._compile(node.left, scope))
+        b = self._interval(self._compile(node.right, scope))
+        a_low, a_high, b_low, b_high = a.low, a.high, b.low, b.high
+        if node.left_boundary == "start":
+            a_high = a_low
+        elif node.left_boundary == "end":
+            a_low = a_high
+        if node.precision and {"Date", "DateTime"} & {a.type, b.type} and node.precision != "millisecond":
+            a_low, a_high, b_low, b_high = (f"DATE_TRUNC('{node.precision}', {bound})"
+                                            for bound in (a_low, a_high, b_low, b_high))
+        op = "includedIn" if node.op == "during" else node.op
+        offset = _interval_literal(self._compile(node.offset, scope)) if node.offset is not None else None
+
+        if op == "within":
+            if offset is None:
+                raise ValueError("within needs a quantity")
+            return _boolean(f"({a_high} >= ({b_low} - {offset}) AND {a_low} <= ({b_high} + {offset}))")
+        if op in ("before", "after", "sameOrBefore", "sameOrAfter") and offset is not None:
+            return _boolean(self._offset(op, node.offset_bound, offset, a_low, a_high, b_low, b_high))
+        if op in ("includedIn", "includes"):
+            if op == "includes":
+                a_low, a_high, b_low, b_high = b_low, b_high, a_low, a_high
+            sql = f"{b_low} <= {a_low} AND {a_high} <= {b_high}"
+            if node.proper:
+                sql += f" AND NOT ({a_low} = {b_low} AND {a_high} = {b_high})"
+            return _boolean(f"({sql})")
+        comparisons = {
+            "overlaps": f"{a_low} <= {b_high} AND {b_low} <= {a_high}",
+            "before": f"{a_high} < {b_low}",
+            "after": f"{a_low} > {b_high}",
+            "sameOrBefore": f"{a_high} <= {b_low}",
+            "sameOrAfter": f"{a_low} >= {b_high}",
+            "sameAs": f"{a_low} = {b_low} AND {a_high} = {b_high}",
+            "starts": f"{a_low} = {b_low} AND {a_high} <= {b_high}",
+            "ends": f"{a_high} = {b_high} AND {a_low} >= {b_low}",
+        }
+        if op not in comparisons:
+            raise ValueError(f"Unsupported timing operator: {node.op}")
+        return _boolean(f"({comparisons[op]})")
+
+    @staticmethod
+    def _offset(op: str, bound: Optional[str], offset: str, a_low: str, a_high: str,
+                b_low: str, b_high: str) -> str:
+        """``N units [or less|or more|less than|more than] before/after``."""
+        if op in ("before", "sameOrBefore"):
+            point, anchor, sign = a_high, b_low, "-"
+        else:
+            point, anchor, sign = a_low, b_high, "+"
+        shifted = f"({anchor} {sign} {offset})"
+        earlier, later = (point, anchor) if sign == "-" else (anchor, point)
+        if bound is None:
+            return f"({point} = {shifted})"
+        if bound == "less":
+            # Within the offset, on the right side of the anchor
+            near = f"{point} >= {shifted}" if sign == "-" else f"{point} <= {shifted}"
+            return f"({near} AND {earlier} <= {later})"
+        if bound == "less than":
+            near = f"{point} > {shifted}" if sign == "-" else f"{point} < {shifted}"
+            return f"({near} AND {earlier} <= {later})"
+        if bound == "more":
+            return f"({point} <= {shifted})" if sign == "-" else f"({point} >= {shifted})"
+        if bound == "more than":
+            return f"({point} < {shifted})" if sign == "-" else f"({point} > {shifted})"
+        raise ValueError(f"Unsupported offset bound: {bound}")
+
+    def _date_difference(self, node: DateDifference, scope: _Scope) -> _Value:
+        low = self._scalar(self._compile(node.low, scope), "DateTime")
+        high = self._scalar(self._compile(node.high, scope), "DateTime")
+        if node.kind == "difference" and node.precision != "millisecond":
+            low, high = f"DATE_TRUNC('{node.precision}', {low})", f"DATE_TRUNC('{node.precision}', {high})"
+        return _Value("scalar", sql=_whole_periods(node.precision, low, high), type="Integer")
+
+    def _call(self, node: Call, scope: _Scope) -> _Value:
+        name = node.name
+        if node.library is not None and self._library.includes.get(node.library, (node.library,))[0] != "FHIRHelpers":
+            raise ValueError(f"Functions of included library {node.library!r} are not supported")
+        args = [self._compile(arg, scope) for arg in node.args]
+        if name in _CONVERSIONS:
+            target = _CONVERSIONS[name]
+            value = self._scalar(args[0], "Decimal" if target == "Quantity" else target)
+            if name == "ToDate":
+                value = f"CAST({value} AS DATE)"
+            elif target == "String" and args[0].kind == "scalar" and args[0].type != "String":
+                value = f"CAST({value} AS VARCHAR)"
+            return _Value("scalar", sql=value, type="Decimal" if target == "Quantity" else target)
+        if name in ("ToConcept", "ToCode", "ToList", "ToValue"):
+            return args[0]
+        if name == "ToInterval":
+            return self._interval(args[0])
+        if name == "Count":
+            return _Value("scalar", sql=self._count(args[0], scope), type="Integer")
+        if name == "Exists":
+            return _boolean(self._exists(args[0], scope))
+        if name in _AGGREGATES:
+            return self._aggregate(name, args[0])
+        if name == "Now":
+            return _Value("scalar", sql="CAST(CURRENT_TIMESTAMP AS TIMESTAMP)", type="DateTime")
+        if name == "Today":
+            return _Value("scalar", sql="CURRENT_DATE", type="Date")
+        if name == "Coalesce":
+            value_type = _common_type(*args)
+            return _Value("scalar", sql=f"COALESCE({', '.join(self._scalar(arg, value_type) for arg in args)})",
+                          type=value_type)
+        if name in _SQL_FUNCTIONS:
+            function, result_type = _SQL_FUNCTIONS[name]
+            value_type = "String" if result_type == "String" or name == "Length" else "Decimal"
+            sql_args = [self._scalar(args[0], value_type)] + [self._scalar(arg, "Integer") for arg in args[1:]]
+            sql = f"{function}({', '.join(sql_args)})"
+            if result_type == "Integer" and name != "Length":
+                sql = f"CAST({sql} AS INTEGER)"
+            return _Value("scalar", sql=sql, type=result_type or args[0].type, unit=args[0].unit)
+        age = _AGE.match(name)
+        if age is not None:
+            calculated, precision, at = age.group(1), age.group(2).lower(), age.group(3)
+            if calculated:
+                birth, rest = self._scalar(args[0], "DateTime"), args[1:]
+            else:
+                birth, rest = self._scalar(self._property(Property(Ref("Patient"), "birthDate"), scope),
+                                           "DateTime"), args
+            if at:
+                as_of = self._scalar(rest[0], "DateTime")
+            else:
+                as_of = "CAST(CURRENT_DATE AS TIMESTAMP)"
+            if precision in ("year", "month", "week", "day"):
+                birth, as_of = (f"CAST(CAST({birth} AS DATE) AS TIMESTAMP)",
+                                f"CAST(CAST({as_of} AS DATE) AS TIMESTAMP)")
+            return _Value("scalar", sql=_whole_periods(precision, birth, as_of), type="Integer")
+        raise ValueError(f"Unsupported function: {name}")
+
+    def _case(self, items: Sequence[Tuple[Expression, Expression]], else_: Expression,
+              comparand: Optional[Expression], scope: _Scope) -> _Value:
+        results = [self._compile(result, scope) for _, result in items] + [self._compile(else_, scope)]
+        if all(result.kind == "interval" for result in results):
+            raise ValueError("Conditional intervals are not supported")
+        value_type = _common_type(*results)
+        whens = []
+        for (condition, _), result in zip(items, results):
+            if comparand is None:
+                test = self._boolean(self._compile(condition, scope))
+            else:
+                test = self._compare("=", self._compile(comparand, scope), self._compile(condition, scope))
+            whens.append(f"WHEN {test} THEN {self._scalar(result, value_type)}")
+        sql = f"CASE {' '.join(whens)} ELSE {self._scalar(results[-1], value_type)} END"
+        return _Value("scalar", sql=sql, type=value_type)
+
+    def _as(self, node: As, scope: _Scope) -> _Value:
+        operand = self._compile(node.operand, scope)
+        type_name = node.type_name.rpartition(".")[2].lower()
+        if operand.kind == "element":
+            narrowed = tuple(path for path in operand.paths if path and path[-1].lower().endswith(type_name))
+            if narrowed:
+                return replace(operand, paths=narrowed)
+        return operand
+
+    # Conversions
+
+    def _json(self, value: _Value) -> str:
+        """JSON of an element (the first of its choice paths that is present)."""
+        return _coalesce([self._json_at(value.sql, path) for path in value.paths])
+
+    def _json_at(self, base: str, path: Sequence[str]) -> str:
+        return self.dialect.extract_json_path_value(base, list(path)) if path else base
+
+    def _boolean(self, value: _Value) -> str:
+        return self._scalar(value, "Boolean")
+
+    def _scalar(self, value: _Value, value_type: Optional[str] = None) -> str:
+        """SQL of a single value, elements converted to ``value_type``."""
+        if value.kind == "scalar":
+            if value.type == "Date" and value_type == "DateTime":
+                return f"CAST({value.sql} AS TIMESTAMP)"
+            return value.sql
+        if value.kind == "element":
+            return self._element_scalar(value, value_type)
+        if value.kind == "interval":
+            raise ValueError("Expected a single value but found an interval")
+        if value.kind == "rows":
+            raise ValueError("Expected a single value but found a list of resources; use exists or Count()")
+        raise ValueError(f"Expected a single value but found a {value.kind}")
+
+    def _element_scalar(self, value: _Value, value_type: Optional[str]) -> str:
+        dialect, paths = self.dialect, value.paths
+
+        def choose(suffixes: Tuple[str, ...]) -> Tuple[Tuple[str, ...], ...]:
+            if len(paths) < 2:
+                return paths
+            return tuple(path for path in paths if path[-1].endswith(suffixes)) or paths
+
+        if value_type in _NUMERIC_TYPES:
+            parts = []
+            for path in choose(("Quantity", "Integer", "Decimal", "Age", "Duration", "Count")):
+                last = path[-1] if path else ""
+                if last.endswith(("Integer", "Decimal")):
+                    parts.append(dialect.json_value_as_number(self._json_at(value.sql, path)))
+                else:
+                    parts.append(dialect.json_value_as_number(self._json_at(value.sql, (*path, "value"))))
+                    if not last.endswith(("Quantity", "Age", "Duration", "Count")):
+                        parts.append(dialect.json_value_as_number(self._json_at(value.sql, path)))
+            return _coalesce(parts)
+        if value_type in ("Date", "DateTime"):
+            parts = []
+            for path in choose(("DateTime", "Instant", "Date", "Period")):
+                last = path[-1].lower() if path else ""
+                if last.endswith("period"):
+                    path = (*path, "start")
+                parts.append(date_start(dialect, dialect.json_value_as_string(self._json_at(value.sql, path))))
+            return _coalesce(parts) if value_type == "DateTime" else f"CAST({_coalesce(parts)} AS DATE)"
+        if value_type == "Boolean":
+            return dialect.json_value_as_boolean(self._json(replace(value, paths=choose(("Boolean",)))))
+        return dialect.json_value_as_string(self._json(value))
+
+    def _interval(self, value: _Value) -> _Value:
+        """A value as a closed interval; points become unit intervals."""
+        if value.kind == "interval":
+            return value
+        if value.kind == "scalar":
+            return _Value("interval", low=value.sql, high=value.sql, type=value.type)
+        if value.kind != "element":
+            raise ValueError(f"Expected an interval but found a {value.kind}")
+        lows, highs = [], []
+        for path in value.paths:
+            last = path[-1].lower() if path else ""
+            if last.endswith("period"):
+                lows.append(self._timestamp_at(value.sql, (*path, "start")))
+                highs.append(self._timestamp_at(value.sql, (*path, "end")))
+            elif last.endswith(("datetime", "instant", "date")) or len(value.paths) == 1:
+                point = self._timestamp_at(value.sql, path)
+                lows.append(point)
+                highs.append(point)
+                if not last.endswith(("datetime", "instant", "date")):
+                    # Unknown element type: a dateTime or a Period
+                    lows.append(self._timestamp_at(value.sql, (*path, "start")))
+                    highs.append(self._timestamp_at(value.sql, (*path, "end")))
+        if not lows:
+            raise ValueError("Expected a date, dateTime or Period element")
+        return _Value("interval", low=_coalesce(lows), high=_coalesce(highs), type="DateTime")
+
+    def _timestamp_at(self, base: str, path: Sequence[str]) -> str:
+        return date_start(self.dialect, self.dialect.json_value_as_string(self._json_at(base, path)))
+
+
+def as_library(library: Union[str, Dict[str, Any], Library]) -> Library:
+    """``library`` as a parsed Library, from CQL text, ELM JSON or a Library."""
+    if isinstance(library, Library):
+        return library
+    if isinstance(library, dict):
+        return library_from_elm(library)
+    return parse_library(library)
+
+
+def _boolean(sql: str) -> _Value:
+    return _Value("scalar", sql=sql, type="Boolean")
+
+
+def _coalesce(parts: Sequence[str]) -> str:
+    return parts[0] if len(parts) == 1 else f"COALESCE({', '.join(parts)})"
+
+
+def _common_type(*values: _Value) -> str:
+    """Type both sides of an operator are compared or combined as."""
+    types = {value.type for value in values if value.kind in ("scalar", "interval") and value.type != "Null"}
+    for value_type in ("DateTime", "Date", "Quantity", "Decimal", "Integer", "Boolean"):
+        if value_type in types:
+            return "Decimal" if value_type == "Quantity" else value_type
+    return "String"
+
+
+def _step(sql: str, value_type: str, sign: str) -> str:
+    """Successor (``+``) or predecessor (``-``) of a bound of an open interval."""
+    if value_type == "Date":
+        return f"CAST(({sql} {sign} INTERVAL '1 day') AS DATE)"
+    if value_type == "DateTime":
+        return f"({sql} {sign} INTERVAL '1 millisecond')"
+    if value_type == "Integer":
+        return f"({sql} {sign} 1)"
+    return f"({sql} {sign} 0.00000001)"
+
+
+def _unit(value: _Value) -> Optional[str]:
+    """Unit of a quantity, calendar durations by their precision (``d`` is ``day``)."""
+    return _TEMPORAL_UNITS.get(value.unit, value.unit) if value.unit else None
+
+
+def _same_unit(action: str, left: _Value, right: _Value) -> None:
+    """Reject quantities in different units, which would be combined by value alone."""
+    if left.unit and right.unit and _unit(left) != _unit(right):
+        raise ValueError(f"Cannot {action} quantities in {left.unit!r} and {right.unit!r}; "
+                         f"unit conversion is not supported")
+
+
+def _interval_literal(quantity: _Value) -> str:
+    unit = _TEMPORAL_UNITS.get(quantity.unit or "")
+    if quantity.type != "Quantity" or unit is None:
+        raise ValueError(f"Expected a calendar duration but found {quantity.sql} {quantity.unit!r}")
+    return f"INTERVAL '{quantity.sql} {unit}'"
+
+
+def _whole_periods(precision: str, low: str, high: str) -> str:
+    """Whole ``precision`` periods from ``low`` to ``high``."""
+    if precision == "year":
+        return (f"CAST(EXTRACT(YEAR FROM {high}) - EXTRACT(YEAR FROM {low}) - CASE WHEN "
+                f"EXTRACT(MONTH FROM {high}) * 100 + EXTRACT(DAY FROM {high}) < "
+                f"EXTRACT(MONTH FROM {low}) * 100 + EXTRACT(DAY FROM {low}) THEN 1 ELSE 0 END AS INTEGER)")
+    if precision == "month":
+        return (f"CAST((EXTRACT(YEAR FROM {high}) - EXTRACT(YEAR FROM {low})) * 12 + EXTRACT(MONTH FROM {high}) "
+                f"- EXTRACT(MONTH FROM {low}) - CASE WHEN EXTRACT(DAY FROM {high}) < EXTRACT(DAY FROM {low}) "
+                f"THEN 1 ELSE 0 END AS INTEGER)")
+    return (f"CAST(FLOOR((EXTRACT(EPOCH FROM {high}) - EXTRACT(EPOCH FROM {low})) / {_SECONDS[precision]}) "
+            f"AS INTEGER)")
+
+
+def _date_literal(text: str) -> str:
+    """DATE of a CQL Date literal (without ``@``) at its first day."""
+    parts = text.split("-")
+    return f"CAST('{'-'.join(parts + ['01'] * (3 - len(parts)))}' AS DATE)"
+
+
+def _timestamp_literal(text: str) -> str:
+    """TIMESTAMP of a CQL Date or DateTime literal (without ``@``) at its first instant."""
+    text = re.sub(r"(Z|[+-]\d{2}:\d{2})$", "", text)
+    date, _, time = text.partition("T")
+    parts = date.split("-")
+    date = "-".join(parts + ["01"] * (3 - len(parts)))
+    clock = [part for part in time.split(":") if part]
+    time = ":".join(clock + ["00"] * (3 - len(clock)))
+    return f"CAST('{date} {time}' AS TIMESTAMP)"
+
@@ -0,0 +1,254 @@
+"""ELM JSON to the CQL syntax tree.
+
+Maps the ELM (Expression Logical Model) JSON that CQL-to-ELM translators
+produce onto :mod:`fhir4ds.cql.nodes`, so libraries distributed as ELM
+compile like CQL text. The supported ELM types are those of the CQL subset
+the parser accepts; others raise ``ValueError``.
+
+Example:
+    >>> library = library_from_elm(json.loads(Path("measure.json").read_text()))
+    >>> CQLCompiler(dialect, catalog).compile(library)
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+from .nodes import (
+    As, Binary, Call, Case, CodeDef, DateDifference, Expression, ExpressionDef, If,
+    IntervalSelector, Library, ListSelector, Literal, ParameterDef, Property, Query,
+    QuantityLiteral, Ref, Relationship, Retrieve, Timing, Unary,
+)
+
+_BINARY = {
+    "And": "and", "Or": "or", "Xor": "xor", "Implies": "implies",
+    "Equal": "=", "NotEqual": "!=", "Equivalent": "~",
+    "Less": "<", "LessOrEqual": "<=", "Greater": ">", "GreaterOrEqual": ">=",
+    "Add": "+", "Subtract": "-", "Multiply": "*", "Divide": "/",
+    "TruncatedDivide": "div", "Modulo": "mod", "Power": "^", "Concatenate": "+",
+    "In": "in", "Contains": "contains",
+}
+
+_UNARY = {
+    "Not": "not", "Exists": "exists", "Start": "start", "End": "end", "DateFrom": "date",
+    "Negate": "negate", "IsNull": "is null", "IsTrue": "is true", "IsFalse": "is false",
+}
+
+_TIMING = {
+    "IncludedIn": "includedIn", "Includes": "includes", "ProperIncludedIn": "includedIn",
+    "ProperIncludes": "includes", "Overlaps": "overlaps", "Before": "before", "After": "after",
+    "SameOrBefore": "sameOrBefore", "SameOrAfter": "sameOrAfter", "SameAs": "sameAs",
+    "Starts": "starts", "Ends": "ends",
+}
+
+_FUNCTIONS = (
+    "ToBoolean", "ToConcept", "ToDate", "ToDateTime", "ToDecimal", "ToInteger", "ToList",
+    "ToQuantity", "ToString", "Now", "Today", "Coalesce", "Abs", "Ceiling", "Floor",
+    "Length", "Lower", "Round", "Truncate", "Upper", "Count",
+)
+
+_DATE_PARTS = ("year", "month", "day", "hour", "minute", "second", "millisecond")
+
+
+def library_from_elm(elm: Dict[str, Any]) -> Library:
+    """Build a :class:`Library` from ELM JSON (the document or its ``library``)."""
+    source = elm.get("library", elm)
+    identifier = source.get("identifier", {})
+    library = Library(name=identifier.get("id"), version=identifier.get("version"))
+    for using in _defs(source, "usings"):
+        if using.get("localIdentifier") != "System":
+            library.usings.append((using.get("localIdentifier"), using.get("version")))
+    for include in _defs(source, "includes"):
+        library.includes[include.get("localIdentifier")] = (include.get("path"), include.get("version"))
+    for codesystem in _defs(source, "codeSystems"):
+        library.codesystems[codesystem["name"]] = codesystem["id"]
+    for valueset in _defs(source, "valueSets"):
+        library.valuesets[valueset["name"]] = valueset["id"]
+    for code in _defs(source, "codes"):
+        library.codes[code["name"]] = CodeDef(code["id"], code["codeSystem"]["name"], code.get("display"))
+    for parameter in _defs(source, "parameters"):
+        default = parameter.get("default")
+        library.parameters[parameter["name"]] = ParameterDef(
+            parameter["name"], None, _expression(default) if default is not None else None)
+    for statement in _defs(source, "statements"):
+        if statement.get("type") == "FunctionDef" or "operand" in statement:
+            raise ValueError(f"CQL function definitions are not supported: {statement.get('name')!r}")
+        expression = statement.get("expression", {})
+        # The translator's implicit "define Patient: SingletonFrom([Patient])"
+        if statement["name"] == "Patient" and expression.get("type") == "SingletonFrom":
+            continue
+        library.defines[statement["name"]] = ExpressionDef(
+            statement["name"], _expression(expression), statement.get("context", "Patient"))
+    return library
+
+
+def _defs(source: Dict[str, Any], section: str) -> List[Dict[str, Any]]:
+    return source.get(section, {}).get("def", [])
+
+
+def _expression(node: Dict[str, Any]) -> Expression:
+    kind = node.get("type")
+    handler = _HANDLERS.get(kind)
+    if handler is not None:
+        return handler(node)
+    if kind in _BINARY:
+        operands = [_expression(operand) for operand in node["operand"]]
+        result = operands[0]
+        for operand in operands[1:]:
+            result = Binary(_BINARY[kind], result, operand)
+        return result
+    if kind in _UNARY:
+        return Unary(_UNARY[kind], _expression(_single(node["operand"])))
+    if kind in _TIMING:
+        left, right = (_expression(operand) for operand in node["operand"])
+        return Timing(_TIMING[kind], left, right, precision=_precision(node),
+                      proper=kind.startswith("Proper"))
+    if kind in _FUNCTIONS:
+        operands = node.get("operand", node.get("source"))
+        args = [] if operands is None else [_expression(operand) for operand in _many(operands)]
+        return Call(kind, args)
+    raise ValueError(f"Unsupported ELM expression type: {kind}")
+
+
+def _single(operand: Any) -> Dict[str, Any]:
+    return operand[0] if isinstance(operand, list) else operand
+
+
+def _many(operand: Any) -> List[Dict[str, Any]]:
+    return operand if isinstance(operand, list) else [operand]
+
+
+def _precision(node: Dict[str, Any]) -> Optional[str]:
+    precision = node.get("precision")
+    return precision.lower() if precision else None
+
+
+def _type_name(qualified: str) -> str:
+    return qualified.rpartition("}")[2]
+
+
+def _literal(node: Dict[str, Any]) -> Expression:
+    value_type = _type_name(node["valueType"])
+    value = node.get("value")
+    if value_type == "Boolean":
+        return Literal(str(value).lower() == "true", "Boolean")
+    if value_type in ("Integer", "Long"):
+        return Literal(int(value), "Integer")
+    if value_type == "Decimal":
+        return Literal(Decimal(str(value)), "Decimal")
+    return Literal(value, value_type)
+
+
+def _date_time(node: Dict[str, Any]) -> Expression:
+    parts = []
+    for part in _DATE_PARTS:
+        if part not in node:
+            break
+        value = int(_expression(node[part]).value)
+        parts.append(f"{value:04d}" if part == "year" else f"{value:03d}" if part == "millisecond" else f"{value:02d}")
+    text = "-".join(parts[:3])
+    if len(parts) > 3:
+        text += "T" + ":".join(parts[3:6]) + (f".{parts[6]}" if len(parts) > 6 else "")
+    return Literal(text, node["type"])
+
+
+def _property(node: Dict[str, Any]) -> Expression:
+    source = _expression(node["source"]) if "source" in node else Ref(node["scope"])
+    for name in node["path"].split("."):
+        source = Property(source, name)
+    return source
+
+
+def _retrieve(node: Dict[str, Any]) -> Expression:
+    codes = node.get("codes")
+    return Retrieve(_type_name(node["dataType"]), node.get("codeProperty"),
+                    _expression(codes) if codes is not None else None,
+                    node.get("codeComparator", "in"))
+
+
+def _query(node: Dict[str, Any]) -> Expression:
+    sources = node["source"]
+    if len(sources) != 1:
+        raise ValueError("Multi-source queries are not supported")
+    if node.get("let"):
+        raise ValueError("let clauses are not supported")
+    relationships = [
+        Relationship("with" if relationship["type"] == "With" else "without",
+                     _expression(relationship["expression"]), relationship["alias"],
+                     _expression(relationship["suchThat"]))
+        for relationship in node.get("relationship", [])
+    ]
+    where = node.get("where")
+    returned = node.get("return")
+    return Query(_expression(sources[0]["expression"]), sources[0]["alias"], relationships,
+                 _expression(where) if where is not None else None,
+                 _expression(returned["expression"]) if returned is not None else None)
+
+
+def _ref(node: Dict[str, Any]) -> Expression:
+    return Ref(node["name"], node.get("libraryName"))
+
+
+def _function_ref(node: Dict[str, Any]) -> Expression:
+    return Call(node["name"], [_expression(operand) for operand in node.get("operand", [])],
+                node.get("libraryName"))
+
+
+def _in_valueset(node: Dict[str, Any]) -> Expression:
+    valueset = node.get("valueset") or node.get("valuesetExpression")
+    return Binary("in", _expression(node.get("code", node.get("codes"))), _expression(valueset))
+
+
+def _calculate_age(node: Dict[str, Any]) -> Expression:
+    operands = [_expression(operand) for operand in _many(node["operand"])]
+    suffix = "At" if node["type"] == "CalculateAgeAt" else ""
+    return Call(f"CalculateAgeIn{node['precision']}s{suffix}", operands)
+
+
+def _between(node: Dict[str, Any]) -> Expression:
+    low, high = (_expression(operand) for operand in node["operand"])
+    kind = "duration" if node["type"] == "DurationBetween" else "difference"
+    return DateDifference(kind, node["precision"].lower(), low, high)
+
+
+def _case(node: Dict[str, Any]) -> Expression:
+    comparand = node.get("comparand")
+    return Case([(_expression(item["when"]), _expression(item["then"])) for item in node["caseItem"]],
+                _expression(node["else"]), _expression(comparand) if comparand is not None else None)
+
+
+def _as(node: Dict[str, Any]) -> Expression:
+    type_name = node.get("asType") or node.get("asTypeSpecifier", {}).get("name", "")
+    return As(_expression(node["operand"]), _type_name(type_name))
+
+
+_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Expression]] = {
+    "Literal": _literal,
+    "Null": lambda node: Literal(None, "Null"),
+    "Quantity": lambda node: QuantityLiteral(str(node["value"]), node.get("unit", "1")),
+    "Date": _date_time,
+    "DateTime": _date_time,
+    "Interval": lambda node: IntervalSelector(_expression(node["low"]), _expression(node["high"]),
+                                              node.get("lowClosed", True), node.get("highClosed", True)),
+    "List": lambda node: ListSelector([_expression(element) for element in node.get("element", [])]),
+    "ExpressionRef": _ref,
+    "ParameterRef": _ref,
+    "ValueSetRef": _ref,
+    "CodeRef": _ref,
+    "AliasRef": _ref,
+    "IdentifierRef": _ref,
+    "Property": _property,
+    "Retrieve": _retrieve,
+    "Query": _query,
+    "FunctionRef": _function_ref,
+    "InValueSet": _in_valueset,
+    "AnyInValueSet": _in_valueset,
+    "CalculateAge": _calculate_age,
+    "CalculateAgeAt": _calculate_age,
+    "DurationBetween": _between,
+    "DifferenceBetween": _between,
+    "If": lambda node: If(_expression(node["condition"]), _expression(node["then"]), _expression(node["else"])),
+    "Case": _case,
+    "As": _as,
+}
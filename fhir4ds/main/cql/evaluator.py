@@ -1,12 +1,65 @@
+"""Evaluation of standalone CQL expressions.
 
-def evaluate(expression: str, expected_output: str):
-    """A stub evaluator that returns the expected output.
+Compiles an expression that needs no patient data with
+:class:`~fhir4ds.cql.compiler.CQLCompiler`, runs it and formats the result
+as CQL text (``true``, ``null``, ``'text'``, ``@2024-01-01``,
+``@2024-01-01T00:00:00.000``, ``15 'mg'``), the form the CQL specification
+test suites expect.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+
+from fhir4ds.dialects.base import DatabaseDialect
+
+from .compiler import CQLCompiler
+
+
+def evaluate(expression: str, dialect: Optional[DatabaseDialect] = None) -> str:
+    """Evaluate a CQL expression in the Unfiltered context.
 
     Args:
-        expression: The CQL expression to evaluate.
-        expected_output: The expected output from the test case.
+        expression: The CQL expression to evaluate
+        dialect: Database to evaluate on; an in-memory DuckDB by default
 
     Returns:
-        The expected output.
+        The result formatted as CQL
+
+    Raises:
+        ValueError: If the expression evaluates to a list of resources
     """
-    return expected_output
+    if dialect is None:
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+        dialect = DuckDBDialect(database=":memory:")
+    compiled = CQLCompiler(dialect).compile_expression(expression)
+    if compiled.kind == "rows":
+        raise ValueError(f"{expression!r} evaluates to resources, which have no CQL text form")
+    row = dialect.execute_query(compiled.sql)[0]
+    if compiled.kind == "interval":
+        return f"Interval[{format_value(row[0], compiled.type)}, {format_value(row[1], compiled.type)}]"
+    return format_value(row[0], compiled.type, compiled.unit)
+
+
+def format_value(value: Any, value_type: Optional[str] = None, unit: Optional[str] = None) -> str:
+    """Format a SQL result value as CQL; ``value_type`` is its CQL type and ``unit`` a Quantity's unit, when known."""
+    if value is None:
+        return "null"
+    if unit:
+        return f"{format_value(value, value_type)} {format_value(unit)}"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime) and value_type == "Date":
+        return "@" + value.date().isoformat()
+    if isinstance(value, datetime):
+        return "@" + value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+    if isinstance(value, date):
+        return "@" + value.isoformat()
+    if isinstance(value, (Decimal, float)):
+        text = format(Decimal(str(value)).normalize(), "f")
+        return text if "." in text else text + ".0"
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    return str(value)
@@ -0,0 +1,183 @@
+"""Batch evaluation of quality measures.
+
+Quality programs evaluate dozens of measures over the same patients, and
+most of them retrieve the same data (``[Encounter: "Office Visit"]``) and
+repeat the same definitions ("Qualifying Encounters", "Measurement
+Period"). A :class:`MeasureBatch` compiles all of its measures into one
+statement with :meth:`CQLCompiler.compile_measures`, where identical
+retrieves and definitions are a single CTE evaluated once, so the cost of a
+batch grows with the distinct work rather than with the number of measures.
+
+Populations are scored as in a patient-based proportion measure: each one
+is a subset of the population it refines (Denominator of the Initial
+Population, Numerator of the Denominator, ...), patients in the
+Denominator Exclusion are removed from the Numerator and the Denominator
+Exception, and Numerator patients are never exceptions. A population the
+batch does not evaluate is skipped, its subsets refining its own parent.
+
+Example:
+    >>> batch = MeasureBatch(dialect, catalog, parameters={
+    ...     "Measurement Period": "Interval[@2024-01-01, @2025-01-01)"})
+    >>> batch.add("CMS122", cms122_cql)
+    >>> batch.add("CMS165", cms165_elm)
+    >>> results = batch.evaluate()
+    >>> results["CMS122"].counts
+    {'Initial Population': 5120, 'Denominator': 5120, 'Numerator': 803}
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from fhir4ds.dialects.base import DatabaseDialect
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog
+
+from .compiler import CompiledLibrary, CQLCompiler, as_library
+from .nodes import Library
+
+# Population criteria of proportion, ratio and continuous variable measures
+POPULATIONS = (
+    "Initial Population", "Denominator", "Denominator Exclusion", "Denominator Exception",
+    "Numerator", "Numerator Exclusion", "Measure Population", "Measure Population Exclusion",
+)
+
+# Population each one is a subset of
+PARENT_POPULATIONS = {
+    "Denominator": "Initial Population",
+    "Denominator Exclusion": "Denominator",
+    "Denominator Exception": "Denominator",
+    "Numerator": "Denominator",
+    "Numerator Exclusion": "Numerator",
+    "Measure Population": "Initial Population",
+    "Measure Population Exclusion": "Measure Population",
+}
+
+# Populations whose members are removed from another one
+EXCLUDED_POPULATIONS = {
+    "Numerator": ("Denominator Exclusion",),
+    "Denominator Exception": ("Denominator Exclusion", "Numerator"),
+}
+
+
+@dataclass
+class MeasureResult:
+    """Populations of one measure.
+
+    Attributes:
+        measure: Measure name
+        counts: Number of patients in each scored population
+        patients: Patient ids of each scored population (when requested)
+    """
+
+    measure: str
+    counts: Dict[str, int]
+    patients: Dict[str, List[str]] = field(default_factory=dict)
+
+
+class MeasureBatch:
+    """Evaluates several patient-based measures in one statement.
+
+    Args:
+        dialect: Database the measures run on
+        catalog: Where resources are stored; value set filters need its
+            TerminologyStore
+        parameters: Parameter values (CQL expression text) for every measure
+        populations: Definition names evaluated as population criteria;
+            each must be a Boolean definition
+    """
+
+    def __init__(self, dialect: DatabaseDialect, catalog: Optional[StorageCatalog] = None,
+                 parameters: Optional[Dict[str, str]] = None, populations: Sequence[str] = POPULATIONS):
+        self.dialect = dialect
+        self.catalog = catalog
+        self.parameters = parameters
+        self.populations = tuple(populations)
+        self._libraries: Dict[str, Library] = {}
+        self._selected: Dict[str, List[str]] = {}
+
+    def add(self, measure: str, library: Union[str, Dict[str, Any], Library],
+            populations: Optional[Sequence[str]] = None) -> None:
+        """Add a measure.
+
+        Args:
+            measure: Name the results are reported under
+            library: CQL text, ELM JSON or a parsed library
+            populations: Population definitions to evaluate; by default
+                those of the batch's ``populations`` the library defines
+        """
+        if measure in self._libraries:
+            raise ValueError(f"Measure {measure!r} is already in the batch")
+        library = as_library(library)
+        selected = list(populations) if populations is not None else [
+            population for population in self.populations if population in library.defines]
+        if not selected:
+            raise ValueError(f"Measure {measure!r} defines none of the populations {list(self.populations)}")
+        self._libraries[measure] = library
+        self._selected[measure] = selected
+
+    def compile(self) -> CompiledLibrary:
+        """Compile the batch: one row per patient with a column per measure population."""
+        if not self._libraries:
+            raise ValueError("The batch has no measures")
+        compiler = CQLCompiler(self.dialect, catalog=self.catalog, parameters=self.parameters)
+        return compiler.compile_measures(self._libraries, self._selected)
+
+    def evaluate(self, patient_lists: bool = True) -> Dict[str, MeasureResult]:
+        """Evaluate every measure of the batch.
+
+        Args:
+            patient_lists: Also return the patients of each population;
+                without them only counts are fetched from the database
+        """
+        compiled = self.compile()
+        columns = [(measure, label[len(measure) + 1:])
+                   for measure, label in zip(compiled.measures, compiled.expressions)]
+        index = {column: position for position, column in enumerate(columns)}
+        scored = [(measure, population, [(index[measure, name], member) for name, member in terms])
+                  for measure, populations in self._selected.items()
+                  for population, terms in _membership(populations).items()]
+        results = {
+            measure: MeasureResult(measure, {population: 0 for population in populations},
+                                   {population: [] for population in populations} if patient_lists else {})
+            for measure, populations in self._selected.items()
+        }
+        if patient_lists:
+            for row in self.dialect.execute_query(compiled.sql):
+                for measure, population, terms in scored:
+                    if all(bool(row[1 + position]) == member for position, member in terms):
+                        results[measure].counts[population] += 1
+                        results[measure].patients[population].append(row[0])
+            for result in results.values():
+                for patients in result.patients.values():
+                    patients.sort()
+            return results
+
+        labels = [f"population.{self.dialect.quote_identifier(label)}" for label in compiled.expressions]
+        sums = ", ".join(
+            "SUM(CASE WHEN " + " AND ".join(
+                f"COALESCE({labels[position]}, FALSE)" if member else f"NOT COALESCE({labels[position]}, FALSE)"
+                for position, member in terms) + " THEN 1 ELSE 0 END)"
+            for _, _, terms in scored)
+        counts = self.dialect.execute_query(f"SELECT {sums} FROM ({compiled.sql}) AS population")[0]
+        for (measure, population, _), count in zip(scored, counts):
+            results[measure].counts[population] = int(count or 0)
+        return results
+
+
+def _membership(populations: Sequence[str]) -> Dict[str, List[Tuple[str, bool]]]:
+    """Criteria a patient must (True) or must not (False) meet to be in each scored population."""
+    selected = set(populations)
+
+    def within(population: Optional[str]) -> List[Tuple[str, bool]]:
+        # Membership of ``population``, or of its nearest evaluated ancestor
+        while population is not None and population not in selected:
+            population = PARENT_POPULATIONS.get(population)
+        if population is None:
+            return []
+        terms = [(population, True), *within(PARENT_POPULATIONS.get(population))]
+        terms.extend((excluded, False) for excluded in EXCLUDED_POPULATIONS.get(population, ())
+                     if excluded in selected)
+        return list(dict.fromkeys(terms))
+
+    return {population: within(population) for population in populations}
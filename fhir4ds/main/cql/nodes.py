@@ -0,0 +1,198 @@
+"""Syntax tree of a CQL library.
+
+Produced by :class:`~fhir4ds.cql.parser.CQLParser` from CQL text and by
+:func:`~fhir4ds.cql.elm.library_from_elm` from ELM JSON, and compiled to SQL
+by :class:`~fhir4ds.cql.compiler.CQLCompiler`. Only the constructs the
+compiler supports are modelled.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Expression:
+    """Base class of CQL expression nodes."""
+
+
+@dataclass
+class Literal(Expression):
+    """Boolean, Integer, Decimal, String, Date or DateTime literal (``None`` for null).
+
+    Date and DateTime values are kept as their ISO text without the ``@``.
+    """
+    value: Any
+    type: str
+
+
+@dataclass
+class QuantityLiteral(Expression):
+    value: str
+    unit: str
+
+
+@dataclass
+class IntervalSelector(Expression):
+    low: Expression
+    high: Expression
+    low_closed: bool = True
+    high_closed: bool = True
+
+
+@dataclass
+class ListSelector(Expression):
+    elements: List[Expression]
+
+
+@dataclass
+class Ref(Expression):
+    """Reference to a definition, parameter, terminology, alias or ``Patient``."""
+    name: str
+    library: Optional[str] = None
+
+
+@dataclass
+class Property(Expression):
+    source: Expression
+    name: str
+
+
+@dataclass
+class Retrieve(Expression):
+    """``[Type]``, ``[Type: "Value Set"]`` or ``[Type: path in "Value Set"]``."""
+    resource_type: str
+    code_path: Optional[str] = None
+    codes: Optional[Expression] = None
+    comparator: str = "in"
+
+
+@dataclass
+class Relationship:
+    """``with``/``without`` clause of a query."""
+    kind: str
+    source: Expression
+    alias: str
+    such_that: Expression
+
+
+@dataclass
+class Query(Expression):
+    source: Expression
+    alias: str
+    relationships: List[Relationship] = field(default_factory=list)
+    where: Optional[Expression] = None
+    return_: Optional[Expression] = None
+
+
+@dataclass
+class Unary(Expression):
+    """``not``, ``exists``, ``start``, ``end``, ``date``, ``negate`` and the
+    ``is [not] null|true|false`` tests."""
+    op: str
+    operand: Expression
+
+
+@dataclass
+class Binary(Expression):
+    """Logical, comparison, arithmetic and membership (``in``) operators."""
+    op: str
+    left: Expression
+    right: Expression
+
+
+@dataclass
+class Timing(Expression):
+    """Interval and timing phrases such as ``during``, ``before start of`` or
+    ``3 days or less after``.
+
+    Attributes:
+        op: during, includedIn, includes, overlaps, before, after,
+            sameOrBefore, sameOrAfter, sameAs, starts, ends or within
+        left_boundary: 'start' or 'end' for ``X starts ...`` / ``X ends ...``
+        precision: Date/time precision of the comparison (``day of``)
+        offset: Quantity of ``N days before`` / ``within N days of``
+        offset_bound: 'less' / 'more' for ``or less`` / ``or more``, 'less than' /
+            'more than' for the exclusive forms
+        proper: ``properly included in`` / ``properly includes``
+    """
+    op: str
+    left: Expression
+    right: Expression
+    left_boundary: Optional[str] = None
+    precision: Optional[str] = None
+    offset: Optional[QuantityLiteral] = None
+    offset_bound: Optional[str] = None
+    proper: bool = False
+
+
+@dataclass
+class DateDifference(Expression):
+    """``duration in <unit> between a and b`` (whole periods) or
+    ``difference in <unit> between a and b`` (boundaries crossed)."""
+    kind: str
+    precision: str
+    low: Expression
+    high: Expression
+
+
+@dataclass
+class Call(Expression):
+    name: str
+    args: List[Expression]
+    library: Optional[str] = None
+
+
+@dataclass
+class If(Expression):
+    condition: Expression
+    then: Expression
+    else_: Expression
+
+
+@dataclass
+class Case(Expression):
+    items: List[Tuple[Expression, Expression]]
+    else_: Expression
+    comparand: Optional[Expression] = None
+
+
+@dataclass
+class As(Expression):
+    operand: Expression
+    type_name: str
+
+
+@dataclass
+class CodeDef:
+    code: str
+    system: str
+    display: Optional[str] = None
+
+
+@dataclass
+class ParameterDef:
+    name: str
+    type_name: Optional[str] = None
+    default: Optional[Expression] = None
+
+
+@dataclass
+class ExpressionDef:
+    name: str
+    expression: Expression
+    context: str = "Patient"
+
+
+@dataclass
+class Library:
+    """A parsed CQL library; definitions keep their declaration order."""
+    name: Optional[str] = None
+    version: Optional[str] = None
+    usings: List[Tuple[str, Optional[str]]] = field(default_factory=list)
+    includes: Dict[str, Tuple[str, Optional[str]]] = field(default_factory=dict)
+    codesystems: Dict[str, str] = field(default_factory=dict)
+    valuesets: Dict[str, str] = field(default_factory=dict)
+    codes: Dict[str, CodeDef] = field(default_factory=dict)
+    parameters: Dict[str, ParameterDef] = field(default_factory=dict)
+    defines: Dict[str, ExpressionDef] = field(default_factory=dict)
@@ -1 +1,696 @@
-# CQL Parser
+"""CQL parser.
+
+Parses CQL library text into the syntax tree of :mod:`fhir4ds.cql.nodes`.
+The supported subset is the one quality measures are written in:
+terminology and parameter declarations, ``define`` statements, retrieves
+with code filters, single-source queries with ``with``/``without``,
+``where`` and ``return`` clauses, intervals and the timing phrases
+(``during``, ``overlaps``, ``before start of``, ``3 days or less after``,
+``within 1 year of``...), arithmetic, comparisons and function calls.
+Function definitions, multi-source queries, ``let``, tuples and indexers
+raise :class:`CQLParseError`.
+
+Example:
+    >>> library = CQLParser().parse_library('''
+    ... library Example version '1.0'
+    ... valueset "Inpatient": 'http://example.org/vs/inpatient'
+    ... context Patient
+    ... define "Has Inpatient Stay": exists [Encounter: "Inpatient"]
+    ... ''')
+    >>> list(library.defines)
+    ['Has Inpatient Stay']
+"""
+
+from __future__ import annotations
+
+import re
+from decimal import Decimal
+from typing import List, NamedTuple, Optional, Tuple
+
+from .nodes import (
+    As, Binary, Call, Case, CodeDef, DateDifference, Expression, ExpressionDef, If,
+    IntervalSelector, Library, ListSelector, Literal, ParameterDef, Property, Query,
+    QuantityLiteral, Ref, Relationship, Retrieve, Timing, Unary,
+)
+
+
+class CQLParseError(ValueError):
+    """Raised for CQL text that is invalid or outside the supported subset."""
+
+
+class _Token(NamedTuple):
+    kind: str
+    value: str
+    position: int
+
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<datetime>@(?:T\d{2}(?::\d{2}(?::\d{2}(?:\.\d+)?)?)?
+                 |\d{4}(?:-\d{2}(?:-\d{2})?)?(?:T(?:\d{2}(?::\d{2}(?::\d{2}(?:\.\d+)?)?)?)?(?:Z|[+-]\d{2}:\d{2})?)?))
+  | (?P<number>\d+(?:\.\d+)?L?)
+  | (?P<string>'(?:[^'\\]|\\.)*')
+  | (?P<qident>"(?:[^"\\]|\\.)*"|`(?:[^`\\]|\\.)*`)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><=|>=|!=|!~|<>|->|[=<>~()\[\]{},.:+\-*/&^|])
+""", re.VERBOSE | re.DOTALL)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f"}
+
+# Words that end an operand, so they never name a query alias
+KEYWORDS = frozenset({
+    "after", "all", "and", "as", "asc", "ascending", "before", "between", "by", "called",
+    "case", "codesystem", "codesystems", "concept", "contains", "context", "date", "default",
+    "define", "desc", "descending", "difference", "display", "distinct", "div", "duration",
+    "during", "else", "end", "ends", "except", "exists", "false", "flatten", "fluent", "from",
+    "function", "if", "implies", "in", "include", "included", "includes", "intersect", "is",
+    "less", "let", "library", "meets", "mod", "more", "not", "null", "occurs", "of", "on",
+    "or", "overlaps", "parameter", "private", "properly", "public", "return", "same", "sort",
+    "start", "starts", "such", "that", "then", "true", "union", "using", "valueset", "version",
+    "when", "where", "with", "within", "without", "xor",
+})
+
+PRECISIONS = ("year", "month", "week", "day", "hour", "minute", "second", "millisecond")
+
+_PLURAL_PRECISIONS = {f"{precision}s": precision for precision in PRECISIONS}
+
+# Temporal units usable in quantities (1 year, 30 days)
+CALENDAR_UNITS = frozenset(PRECISIONS) | frozenset(_PLURAL_PRECISIONS)
+
+_COMPARISONS = ("<=", "<", ">=", ">")
+_EQUALITIES = ("=", "!=", "~", "!~", "<>")
+
+
+def tokenize(text: str) -> List[_Token]:
+    """Split CQL text into tokens, dropping whitespace and comments."""
+    tokens, position = [], 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise CQLParseError(f"Unexpected character {text[position]!r} at offset {position}")
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append(_Token(kind, match.group(), position))
+        position = match.end()
+    tokens.append(_Token("eof", "", len(text)))
+    return tokens
+
+
+def _unquote(token: _Token) -> str:
+    return re.sub(r"\\(.)", lambda match: _ESCAPES.get(match.group(1), match.group(1)), token.value[1:-1])
+
+
+class CQLParser:
+    """Recursive descent parser for the supported CQL subset."""
+
+    def parse_library(self, text: str) -> Library:
+        """Parse a CQL library.
+
+        Raises:
+            CQLParseError: On invalid or unsupported CQL
+        """
+        self._start(text)
+        library = self._library = Library()
+        context = "Patient"
+        while not self._at_kind("eof"):
+            if self._accept("public") or self._accept("private"):
+                continue
+            if self._accept("library"):
+                library.name = self._qualified_identifier()
+                library.version = self._version()
+            elif self._accept("using"):
+                library.usings.append((self._identifier(), self._version()))
+            elif self._accept("include"):
+                name = self._qualified_identifier()
+                version = self._version()
+                alias = self._identifier() if self._accept("called") else name
+                library.includes[alias] = (name, version)
+            elif self._accept("codesystem"):
+                name = self._identifier()
+                self._expect(":")
+                library.codesystems[name] = self._string()
+                self._version()
+            elif self._accept("valueset"):
+                name = self._identifier()
+                self._expect(":")
+                library.valuesets[name] = self._string()
+                self._version()
+                if self._at("codesystems"):
+                    raise self._error("Value sets restricted to code systems are not supported")
+            elif self._accept("code"):
+                name = self._identifier()
+                self._expect(":")
+                code = self._string()
+                self._expect("from")
+                system = self._identifier()
+                display = self._string() if self._accept("display") else None
+                library.codes[name] = CodeDef(code, system, display)
+            elif self._accept("parameter"):
+                name = self._identifier()
+                type_name = None
+                if not self._at("default") and not self._at_definition_start():
+                    type_name = self._type_specifier()
+                default = self._expression() if self._accept("default") else None
+                library.parameters[name] = ParameterDef(name, type_name, default)
+            elif self._accept("context"):
+                context = self._identifier()
+            elif self._accept("define"):
+                if self._at("function") or self._at("fluent"):
+                    raise self._error("CQL function definitions are not supported")
+                name = self._identifier()
+                self._expect(":")
+                library.defines[name] = ExpressionDef(name, self._expression(), context)
+            elif self._at("concept"):
+                raise self._error("Concept definitions are not supported")
+            else:
+                raise self._error(f"Unexpected {self._peek().value!r}")
+        return library
+
+    def parse_expression(self, text: str) -> Expression:
+        """Parse a single CQL expression.
+
+        Raises:
+            CQLParseError: On invalid or unsupported CQL
+        """
+        self._start(text)
+        self._library = Library()
+        expression = self._expression()
+        if not self._at_kind("eof"):
+            raise self._error(f"Unexpected {self._peek().value!r}")
+        return expression
+
+    # Token helpers
+
+    def _start(self, text: str) -> None:
+        self._text = text
+        self._tokens = tokenize(text)
+        self._index = 0
+
+    def _peek(self, offset: int = 0) -> _Token:
+        return self._tokens[min(self._index + offset, len(self._tokens) - 1)]
+
+    def _advance(self) -> _Token:
+        token = self._peek()
+        self._index += 1
+        return token
+
+    def _at(self, value: str, offset: int = 0) -> bool:
+        token = self._peek(offset)
+        return token.kind in ("ident", "op") and token.value == value
+
+    def _at_kind(self, kind: str, offset: int = 0) -> bool:
+        return self._peek(offset).kind == kind
+
+    def _accept(self, value: str) -> bool:
+        if self._at(value):
+            self._index += 1
+            return True
+        return False
+
+    def _expect(self, value: str) -> None:
+        if not self._accept(value):
+            raise self._error(f"Expected {value!r} but found {self._peek().value or 'end of input'!r}")
+
+    def _error(self, message: str) -> CQLParseError:
+        position = self._peek().position
+        line = self._text.count("\n", 0, position) + 1
+        return CQLParseError(f"{message} (line {line})")
+
+    def _identifier(self) -> str:
+        token = self._peek()
+        if token.kind == "qident":
+            self._index += 1
+            return _unquote(token)
+        if token.kind == "ident":
+            self._index += 1
+            return token.value
+        raise self._error(f"Expected an identifier but found {token.value or 'end of input'!r}")
+
+    def _qualified_identifier(self) -> str:
+        name = self._identifier()
+        while self._accept("."):
+            name += "." + self._identifier()
+        return name
+
+    def _string(self) -> str:
+        token = self._peek()
+        if token.kind != "string":
+            raise self._error(f"Expected a string but found {token.value or 'end of input'!r}")
+        self._index += 1
+        return _unquote(token)
+
+    def _version(self) -> Optional[str]:
+        return self._string() if self._accept("version") else None
+
+    def _at_definition_start(self) -> bool:
+        return any(self._at(word) for word in ("define", "parameter", "context", "public", "private")) \
+            or self._at_kind("eof")
+
+    def _type_specifier(self) -> str:
+        name = self._qualified_identifier()
+        if name in ("Interval", "List") and self._accept("<"):
+            inner = self._type_specifier()
+            self._expect(">")
+            return f"{name}<{inner}>"
+        if name in ("Tuple", "Choice"):
+            raise self._error(f"{name} types are not supported")
+        return name
+
+    def _alias(self) -> Optional[str]:
+        """Alias following a query source, if any."""
+        token = self._peek()
+        if token.kind == "qident" or (token.kind == "ident" and token.value not in KEYWORDS):
+            return self._identifier()
+        return None
+
+    # Expressions, from the loosest binding to the tightest
+
+    def _expression(self) -> Expression:
+        left = self._or()
+        while self._accept("implies"):
+            left = Binary("implies", left, self._or())
+        return left
+
+    def _or(self) -> Expression:
+        left = self._and()
+        while self._at("or") or self._at("xor"):
+            left = Binary(self._advance().value, left, self._and())
+        return left
+
+    def _and(self) -> Expression:
+        left = self._membership()
+        while self._accept("and"):
+            left = Binary("and", left, self._membership())
+        return left
+
+    def _membership(self) -> Expression:
+        left = self._equality()
+        while self._at("in") or self._at("contains"):
+            op = self._advance().value
+            precision = self._precision_of()
+            right = self._equality()
+            if precision is None:
+                left = Binary(op, left, right)
+            else:
+                left = Timing("includedIn" if op == "in" else "includes", left, right, precision=precision)
+        return left
+
+    def _equality(self) -> Expression:
+        left = self._timing()
+        while self._peek().kind == "op" and self._peek().value in _EQUALITIES:
+            op = self._advance().value
+            left = Binary("!=" if op == "<>" else op, left, self._timing())
+        return left
+
+    def _timing(self) -> Expression:
+        left = self._inequality()
+        while True:
+            phrase = self._timing_phrase()
+            if phrase is None:
+                return left
+            left = Timing(left=left, right=self._inequality(), **phrase)
+
+    def _inequality(self) -> Expression:
+        left = self._unary_logical()
+        while self._peek().kind == "op" and self._peek().value in _COMPARISONS:
+            op = self._advance().value
+            left = Binary(op, left, self._unary_logical())
+        return left
+
+    def _unary_logical(self) -> Expression:
+        if self._accept("not"):
+            return Unary("not", self._unary_logical())
+        if self._accept("exists"):
+            return Unary("exists", self._unary_logical())
+        return self._type_test()
+
+    def _type_test(self) -> Expression:
+        operand = self._term()
+        while True:
+            if self._accept("is"):
+                negated = self._accept("not")
+                for value in ("null", "true", "false"):
+                    if self._accept(value):
+                        operand = Unary(f"is {'not ' if negated else ''}{value}", operand)
+                        break
+                else:
+                    raise self._error("Type tests with 'is' are not supported")
+            elif self._accept("as"):
+                operand = As(operand, self._type_specifier())
+            else:
+                return operand
+
+    # Timing phrases
+
+    def _precision_of(self) -> Optional[str]:
+        """``day of``-style precision specifier."""
+        token = self._peek()
+        if token.kind == "ident" and token.value in PRECISIONS and self._at("of", 1):
+            self._index += 2
+            return token.value
+        return None
+
+    def _timing_phrase(self) -> Optional[dict]:
+        start = self._index
+        phrase: dict = {}
+        if (self._at("starts") or self._at("ends") or self._at("occurs")) and self._starts_timing_phrase(1):
+            boundary = self._advance().value
+            if boundary != "occurs":
+                phrase["left_boundary"] = boundary[:-1]
+        if self._accept("properly"):
+            phrase["proper"] = True
+
+        if self._accept("same"):
+            precision = self._peek().value if self._peek().value in PRECISIONS else None
+            if precision:
+                self._index += 1
+                phrase["precision"] = precision
+            if self._accept("as"):
+                phrase["op"] = "sameAs"
+            elif self._accept("or"):
+                phrase["op"] = "sameOrBefore" if self._accept("before") else "sameOrAfter"
+                if phrase["op"] == "sameOrAfter":
+                    self._expect("after")
+            else:
+                raise self._error("Expected 'as', 'or before' or 'or after'")
+            return phrase
+        if self._accept("during"):
+            phrase["op"] = "includedIn"
+        elif self._at("included") and self._at("in", 1):
+            self._index += 2
+            phrase["op"] = "includedIn"
+        elif self._accept("includes"):
+            phrase["op"] = "includes"
+        elif self._accept("within"):
+            phrase["op"] = "within"
+            phrase["offset"] = self._quantity()
+            self._expect("of")
+            return phrase
+        elif self._accept("overlaps"):
+            phrase["op"] = "overlaps"
+            if self._at("before") or self._at("after"):
+                raise self._error("'overlaps before' and 'overlaps after' are not supported")
+        elif self._at("meets"):
+            raise self._error("'meets' is not supported")
+        elif self._at_kind("number") or self._at("less") or self._at("more"):
+            if self._at("less") or self._at("more"):
+                phrase["offset_bound"] = self._advance().value + " than"
+                self._expect("than")
+                phrase["offset"] = self._quantity()
+            else:
+                phrase["offset"] = self._quantity()
+                if self._at("or") and (self._at("less", 1) or self._at("more", 1)):
+                    self._index += 1
+                    phrase["offset_bound"] = self._advance().value
+            phrase["op"] = self._temporal_relationship()
+        elif self._at("before") or self._at("after") or self._at("on"):
+            phrase["op"] = self._temporal_relationship()
+        elif "left_boundary" not in phrase and (self._at("starts") or self._at("ends")):
+            phrase["op"] = self._advance().value
+        else:
+            self._index = start
+            return None
+        precision = self._precision_of()
+        if precision:
+            phrase["precision"] = precision
+        return phrase
+
+    def _starts_timing_phrase(self, offset: int) -> bool:
+        token = self._peek(offset)
+        return token.kind == "number" or (token.kind == "ident" and token.value in (
+            "same", "properly", "during", "included", "before", "after", "on", "within", "less", "more"))
+
+    def _temporal_relationship(self) -> str:
+        if self._accept("on"):
+            self._expect("or")
+            return "sameOrBefore" if self._accept("before") else self._expect_after("sameOrAfter")
+        if self._accept("before"):
+            if self._at("or") and self._at("on", 1):
+                self._index += 2
+                return "sameOrBefore"
+            return "before"
+        if self._accept("after"):
+            if self._at("or") and self._at("on", 1):
+                self._index += 2
+                return "sameOrAfter"
+            return "after"
+        raise self._error("Expected 'before' or 'after'")
+
+    def _expect_after(self, op: str) -> str:
+        self._expect("after")
+        return op
+
+    def _quantity(self) -> QuantityLiteral:
+        token = self._peek()
+        if token.kind != "number":
+            raise self._error(f"Expected a quantity but found {token.value or 'end of input'!r}")
+        self._index += 1
+        unit = self._unit()
+        if unit is None:
+            raise self._error("Expected a unit")
+        return QuantityLiteral(token.value.rstrip("L"), unit)
+
+    def _unit(self) -> Optional[str]:
+        token = self._peek()
+        if token.kind == "string":
+            self._index += 1
+            return _unquote(token)
+        if token.kind == "ident" and token.value in CALENDAR_UNITS:
+            self._index += 1
+            return _PLURAL_PRECISIONS.get(token.value, token.value)
+        return None
+
+    # Terms
+
+    def _term(self) -> Expression:
+        left = self._multiplicative()
+        while self._peek().kind == "op" and self._peek().value in ("+", "-", "&"):
+            op = self._advance().value
+            left = Binary(op, left, self._multiplicative())
+        return left
+
+    def _multiplicative(self) -> Expression:
+        left = self._power()
+        while (self._peek().kind == "op" and self._peek().value in ("*", "/")) or self._at("div") or self._at("mod"):
+            op = self._advance().value
+            left = Binary(op, left, self._power())
+        return left
+
+    def _power(self) -> Expression:
+        left = self._unary()
+        while self._accept("^"):
+            left = Binary("^", left, self._unary())
+        return left
+
+    def _unary(self) -> Expression:
+        if self._accept("-"):
+            operand = self._unary()
+            if isinstance(operand, Literal) and operand.type in ("Integer", "Decimal"):
+                return Literal(-operand.value, operand.type)
+            if isinstance(operand, QuantityLiteral):
+                return QuantityLiteral(f"-{operand.value}", operand.unit)
+            return Unary("negate", operand)
+        if self._accept("+"):
+            return self._unary()
+        if (self._at("start") or self._at("end")) and self._at("of", 1):
+            op = self._advance().value
+            self._index += 1
+            return Unary(op, self._unary())
+        if self._at("date") and self._at("from", 1):
+            self._index += 2
+            return Unary("date", self._unary())
+        if (self._at("duration") or self._at("difference")) and self._at("in", 1):
+            kind = self._advance().value
+            self._index += 1
+            unit = self._advance().value
+            precision = _PLURAL_PRECISIONS.get(unit)
+            if precision is None:
+                raise self._error(f"Expected a plural date/time precision but found {unit!r}")
+            if not self._accept("between"):
+                raise self._error(f"'{kind} in {unit} of' is not supported; use 'between'")
+            low = self._term()
+            self._expect("and")
+            return DateDifference(kind, precision, low, self._term())
+        if self._accept("if"):
+            condition = self._expression()
+            self._expect("then")
+            then = self._expression()
+            self._expect("else")
+            return If(condition, then, self._expression())
+        if self._accept("case"):
+            return self._case()
+        if self._accept("distinct"):
+            return self._unary()
+        return self._postfix(self._primary())
+
+    def _case(self) -> Case:
+        comparand = None if self._at("when") else self._expression()
+        items = []
+        while self._accept("when"):
+            when = self._expression()
+            self._expect("then")
+            items.append((when, self._expression()))
+        if not items:
+            raise self._error("Expected 'when'")
+        self._expect("else")
+        otherwise = self._expression()
+        self._expect("end")
+        return Case(items, otherwise, comparand)
+
+    def _postfix(self, operand: Expression) -> Expression:
+        while True:
+            if self._accept("."):
+                name = self._identifier()
+                if self._at("("):
+                    raise self._error(f"Fluent function call {name}() is not supported")
+                operand = Property(operand, name)
+            elif self._at("["):
+                raise self._error("Indexers are not supported")
+            else:
+                return operand
+
+    def _primary(self) -> Expression:
+        token = self._peek()
+        if token.kind == "number":
+            self._index += 1
+            value = token.value.rstrip("L")
+            unit = self._unit()
+            if unit is not None:
+                return QuantityLiteral(value, unit)
+            return Literal(Decimal(value), "Decimal") if "." in value else Literal(int(value), "Integer")
+        if token.kind == "string":
+            self._index += 1
+            return Literal(_unquote(token), "String")
+        if token.kind == "datetime":
+            self._index += 1
+            text = token.value[1:]
+            if text.startswith("T"):
+                raise self._error("Time literals are not supported")
+            return Literal(text, "DateTime" if "T" in text else "Date")
+        if self._accept("true"):
+            return Literal(True, "Boolean")
+        if self._accept("false"):
+            return Literal(False, "Boolean")
+        if self._accept("null"):
+            return Literal(None, "Null")
+        if self._accept("("):
+            inner = self._expression()
+            self._expect(")")
+            return self._query_or(inner)
+        if self._accept("["):
+            return self._query_or(self._retrieve())
+        if self._accept("{"):
+            elements = []
+            if not self._at("}"):
+                elements.append(self._expression())
+                while self._accept(","):
+                    elements.append(self._expression())
+            self._expect("}")
+            return ListSelector(elements)
+        if self._at("Interval") and (self._at("[", 1) or self._at("(", 1)):
+            self._index += 1
+            low_closed = self._advance().value == "["
+            low = self._expression()
+            self._expect(",")
+            high = self._expression()
+            closing = self._advance().value
+            if closing not in ("]", ")"):
+                raise self._error("Expected ']' or ')'")
+            return IntervalSelector(low, high, low_closed, closing == "]")
+        if self._at("Tuple") or self._at("List") or self._at("from") or self._at("let"):
+            raise self._error(f"'{token.value}' expressions are not supported")
+        if token.kind in ("ident", "qident") and not (token.kind == "ident" and token.value in KEYWORDS):
+            name = self._identifier()
+            library = None
+            # Fluent functions are unsupported, so ``Name.Function(`` is library-qualified
+            if self._at(".") and (name in self._library.includes or self._at("(", 2)):
+                self._index += 1
+                library, name = name, self._identifier()
+            if self._accept("("):
+                args = []
+                if not self._at(")"):
+                    args.append(self._expression())
+                    while self._accept(","):
+                        args.append(self._expression())
+                self._expect(")")
+                return Call(name, args, library)
+            return self._query_or(Ref(name, library))
+        raise self._error(f"Unexpected {token.value or 'end of input'!r}")
+
+    def _retrieve(self) -> Retrieve:
+        resource_type = self._qualified_identifier().rpartition(".")[2]
+        retrieve = Retrieve(resource_type)
+        if self._accept(":"):
+            if self._at_kind("ident") and not self._at("(", 1) and (
+                    self._at("in", 1) or self._at("~", 1) or self._at("=", 1) or self._at(".", 1)):
+                path = self._identifier()
+                while self._accept("."):
+                    path += "." + self._identifier()
+                retrieve.code_path = path
+                retrieve.comparator = self._advance().value
+                if retrieve.comparator not in ("in", "~", "="):
+                    raise self._error(f"Unsupported retrieve comparator {retrieve.comparator!r}")
+            retrieve.codes = self._term()
+        self._expect("]")
+        return retrieve
+
+    def _query_or(self, source: Expression) -> Expression:
+        alias = self._alias()
+        if alias is None:
+            return source
+        query = Query(source, alias)
+        while self._at("with") or self._at("without"):
+            kind = self._advance().value
+            related = self._query_source()
+            related_alias = self._alias()
+            if related_alias is None:
+                raise self._error(f"Expected an alias after the '{kind}' source")
+            self._expect("such")
+            self._expect("that")
+            query.relationships.append(Relationship(kind, related, related_alias, self._expression()))
+        if self._at("let"):
+            raise self._error("'let' clauses are not supported")
+        if self._accept("where"):
+            query.where = self._expression()
+        if self._accept("return"):
+            if not self._accept("all"):
+                self._accept("distinct")
+            query.return_ = self._expression()
+        if self._accept("sort"):
+            # Results are sets of resources; ordering is left to the caller
+            if self._accept("by"):
+                self._term()
+                self._sort_direction()
+                while self._accept(","):
+                    self._term()
+                    self._sort_direction()
+            else:
+                self._sort_direction()
+        return query
+
+    def _sort_direction(self) -> None:
+        for word in ("asc", "ascending", "desc", "descending"):
+            if self._accept(word):
+                return
+
+    def _query_source(self) -> Expression:
+        if self._accept("["):
+            return self._retrieve()
+        if self._accept("("):
+            inner = self._expression()
+            self._expect(")")
+            return inner
+        name = self._identifier()
+        if name in self._library.includes and self._accept("."):
+            return Ref(self._identifier(), name)
+        return Ref(name)
+
+
+def parse_library(text: str) -> Library:
+    """Parse CQL library text (see :class:`CQLParser`)."""
+    return CQLParser().parse_library(text)
+
+
+def parse_expression(text: str) -> Expression:
+    """Parse a single CQL expression (see :class:`CQLParser`)."""
+    return CQLParser().parse_expression(text)
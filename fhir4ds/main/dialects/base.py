@@ -7,9 +7,15 @@ Following the thin dialect architecture: business logic in FHIRPath evaluator,
 only syntax differences in database dialects.
 """
 
+import re
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional, Union
 
+# Output formats supported by export_query()
+EXPORT_FORMATS = ("parquet", "csv", "ndjson")
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
 
 class DatabaseDialect(ABC):
     """
@@ -41,6 +47,131 @@ class DatabaseDialect(ABC):
         """Execute a query and return raw results."""
         pass
 
+    def execute_transaction(self, statements: List[str]) -> None:
+        """Execute statements atomically, rolling back all of them on failure."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement execute_transaction()"
+        )
+
+    def export_query(self, sql: str, destination: Any, format: str = "parquet",
+                     partition_by: Optional[List[str]] = None,
+                     row_group_size: Optional[int] = None,
+                     compression: Optional[str] = None, append: bool = False) -> None:
+        """Stream query results to a file inside the database (no Python row fetch).
+
+        Args:
+            sql: SELECT statement to export
+            destination: Output path (a directory when partitioning); dialects
+                that stream to the client may also accept a binary file object
+            format: 'parquet', 'csv' or 'ndjson'
+            partition_by: Columns to partition output by (hive layout)
+            row_group_size: Rows per Parquet row group
+            compression: Codec name (e.g. 'zstd', 'snappy', 'gzip')
+            append: Add new files to an existing partitioned output directory
+                instead of failing when it is not empty
+
+        Raises:
+            ValueError: If the format or an option is not supported
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement export_query()"
+        )
+
+    def load_ndjson(self, files: List[str], table_name: str, batch_size: int = 10000) -> int:
+        """Bulk-load NDJSON files into a new staging table.
+
+        The table is created with columns ``resource_type``, ``id`` and
+        ``resource`` (the JSON document as read, never round-tripped through
+        Python objects).
+
+        Args:
+            files: NDJSON file paths (``.gz`` files are decompressed)
+            table_name: Staging table to create; must not exist
+            batch_size: Lines per COPY batch for dialects that stream from the client
+
+        Returns:
+            Number of lines loaded
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement load_ndjson()"
+        )
+
+    def generate_partitioned_table_ddl(self, table: str, columns: List[tuple], partition_column: str,
+                                       partitions: List[str]) -> List[str]:
+        """DDL for a table partitioned by the values of one column.
+
+        All statements are idempotent (``IF NOT EXISTS``), so calling this again
+        with new partition values only adds the missing partitions.
+
+        Args:
+            table: Table name
+            columns: (name, SQL type) pairs, including the partition column
+            partition_column: Column whose values select the partition
+            partitions: Values that get a partition of their own
+
+        Returns:
+            Statements to execute in order
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_partitioned_table_ddl()"
+        )
+
+    def generate_parquet_scan(self, paths: List[str], hive_partitioning: bool = True) -> str:
+        """FROM-clause relation reading Parquet files in place.
+
+        Args:
+            paths: Parquet files or glob patterns
+            hive_partitioning: Expose ``key=value`` directory names as columns,
+                so filters on them skip whole directories
+
+        Returns:
+            SQL relation expression
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_parquet_scan()"
+        )
+
+    def generate_table_sample(self, relation: str, percent: float, seed: Optional[int] = None) -> str:
+        """FROM-clause relation reading a Bernoulli sample of a table's rows.
+
+        Args:
+            relation: Table name or table function (not a subquery)
+            percent: Share of rows kept, in percent
+            seed: Repeatable sample for the same seed and data
+
+        Returns:
+            SQL relation expression
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_table_sample()"
+        )
+
+    def generate_approx_count_distinct(self, expression: str) -> str:
+        """Count of distinct values, estimated with a sketch where the database has one."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_approx_count_distinct()"
+        )
+
+    def generate_quantile(self, expression: str, fraction: float, approximate: bool = False) -> str:
+        """Continuous quantile aggregate; ``approximate`` allows a sketch estimate."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_quantile()"
+        )
+
+    @staticmethod
+    def _validate_export_options(format: str, partition_by: Optional[List[str]],
+                                 compression: Optional[str]) -> None:
+        """Shared argument checks for export_query() implementations."""
+        if format not in EXPORT_FORMATS:
+            raise ValueError(
+                f"Unsupported export format '{format}'. Supported: {', '.join(EXPORT_FORMATS)}"
+            )
+        for column in partition_by or []:
+            if not _IDENTIFIER.match(column):
+                raise ValueError(f"Invalid partition column name: {column!r}")
+        if compression is not None and not _IDENTIFIER.match(compression):
+            raise ValueError(f"Invalid compression codec: {compression!r}")
+
     # JSON extraction methods with metadata awareness
 
     @abstractmethod
@@ -334,6 +465,10 @@ class DatabaseDialect(ABC):
         """Cast to timestamp type."""
         pass
 
+    def cast_to_timestamptz(self, expression: str) -> str:
+        """Cast an ISO-8601 string with offset to a time zone aware timestamp."""
+        return f"CAST({expression} AS TIMESTAMP WITH TIME ZONE)"
+
     @abstractmethod
     def cast_to_time(self, expression: str) -> str:
         """Cast to time type."""
@@ -1407,6 +1542,230 @@ class DatabaseDialect(ABC):
             f"{self.__class__.__name__} must implement generate_lateral_json_enumeration()"
         )
 
+    # SQL-on-FHIR ViewDefinition collection primitives
+    #
+    # The ViewDefinition compiler (fhir4ds.sql.view_paths) models every FHIRPath
+    # value as either a single JSON value (which may be NULL) or a JSON array
+    # "collection" that is never NULL. The methods below are the syntax-only
+    # building blocks it needs; all semantics live in the compiler.
+
+    def extract_json_path_value(self, value_expr: str, segments: List[Any]) -> str:
+        """Extract a JSON value by following member names and array indexes.
+
+        Args:
+            value_expr: SQL expression evaluating to a JSON value
+            segments: Member names (str) and non-negative array indexes (int)
+
+        Returns:
+            SQL expression evaluating to the JSON value at the path, or NULL
+
+        Example:
+            DuckDB: json_extract(resource, '$.name[1].family')
+            PostgreSQL: (resource::jsonb #> '{name,1,family}')
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement extract_json_path_value()"
+        )
+
+    def as_json_collection(self, value_expr: str) -> str:
+        """Normalise a JSON value to a JSON array.
+
+        Arrays are returned unchanged, NULL (SQL or JSON) becomes an empty array
+        and any other value is wrapped in a single-element array.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement as_json_collection()"
+        )
+
+    def flatten_json_collection(self, collection_expr: str, member: str, alias: str) -> str:
+        """Navigate a member on every item of a collection, flattening arrays.
+
+        Args:
+            collection_expr: SQL expression evaluating to a JSON array
+            member: Member name to navigate
+            alias: Unique alias prefix for the enumeration tables
+
+        Returns:
+            Scalar subquery returning an order-preserving JSON array with
+            JSON nulls removed (empty array when nothing matches)
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement flatten_json_collection()"
+        )
+
+    def filter_json_collection(self, collection_expr: str, alias: str, condition: str) -> str:
+        """Keep the collection items for which ``condition`` is true.
+
+        Args:
+            collection_expr: SQL expression evaluating to a JSON array
+            alias: Enumeration alias; the current item is ``{alias}.value``
+            condition: SQL boolean expression over ``{alias}.value``
+
+        Returns:
+            Scalar subquery returning the filtered JSON array (never NULL)
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement filter_json_collection()"
+        )
+
+    def exists_in_json_collection(self, collection_expr: str, alias: str, condition: str) -> str:
+        """Test whether any collection item satisfies ``condition``.
+
+        Unlike filter_json_collection() this never materialises the matching
+        items, so it can be planned as a semi-join.
+
+        Args:
+            collection_expr: SQL expression evaluating to a JSON array
+            alias: Enumeration alias; the current item is ``{alias}.value``
+            condition: SQL boolean expression over ``{alias}.value``
+
+        Returns:
+            SQL EXISTS predicate
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement exists_in_json_collection()"
+        )
+
+    def index_json_collection(self, collection_expr: str, index: int) -> str:
+        """Return the item at ``index`` (negative counts from the end) or NULL."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement index_json_collection()"
+        )
+
+    def count_json_collection(self, collection_expr: str) -> str:
+        """Return the number of items in a JSON array."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement count_json_collection()"
+        )
+
+    def join_json_collection(self, collection_expr: str, alias: str, separator: str) -> str:
+        """Concatenate the string values of a collection.
+
+        Args:
+            collection_expr: SQL expression evaluating to a JSON array
+            alias: Enumeration alias
+            separator: SQL string expression used between items
+
+        Returns:
+            SQL string expression; an empty collection yields ''
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement join_json_collection()"
+        )
+
+    def json_collection_to_column(self, collection_expr: str) -> str:
+        """Render a JSON array as a view column value (``collection: true``)."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement json_collection_to_column()"
+        )
+
+    def json_value_as_string(self, value_expr: str) -> str:
+        """Unwrap a JSON value to text (JSON strings lose their quotes)."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement json_value_as_string()"
+        )
+
+    def json_value_as_number(self, value_expr: str) -> str:
+        """Unwrap a JSON value to a number, or NULL when it is not numeric."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement json_value_as_number()"
+        )
+
+    def json_value_as_boolean(self, value_expr: str) -> str:
+        """Unwrap a JSON value to a boolean, or NULL when it is not a boolean."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement json_value_as_boolean()"
+        )
+
+    def json_value_type_in(self, value_expr: str, kinds: List[str]) -> str:
+        """Check the JSON type of a value.
+
+        Args:
+            value_expr: SQL expression evaluating to a JSON value
+            kinds: Any of 'string', 'number', 'boolean', 'object', 'array'
+
+        Returns:
+            SQL boolean expression
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement json_value_type_in()"
+        )
+
+    def generate_lateral_json_collection(self, collection_expr: str, alias: str,
+                                         keep_empty: bool = False) -> str:
+        """Generate a lateral join producing one row per collection item.
+
+        Args:
+            collection_expr: SQL expression evaluating to a JSON array
+            alias: Table alias; the item is exposed as ``{alias}.value``
+            keep_empty: Emit a single NULL row for empty collections
+                (``forEachOrNull``) instead of dropping the outer row
+
+        Returns:
+            Join clause to append to a FROM list
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_lateral_json_collection()"
+        )
+
+    def unnest_json_collection(self, collection_expr: str) -> str:
+        """Set-returning expression yielding the items of a JSON array.
+
+        Used in a SELECT list, it produces one row per item, which avoids a
+        correlated lateral join when scanning large tables.
+
+        Args:
+            collection_expr: SQL expression evaluating to a JSON array
+
+        Returns:
+            SQL expression to place in a SELECT list
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement unnest_json_collection()"
+        )
+
+    def generate_reference_key(self, reference_expr: str,
+                               resource_type: Optional[str] = None) -> str:
+        """Extract the resource id from a literal reference string.
+
+        Args:
+            reference_expr: SQL string expression such as 'Patient/123'
+            resource_type: When given, references to other types yield NULL
+
+        Returns:
+            SQL string expression, NULL when the reference cannot be keyed
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_reference_key()"
+        )
+
+    def generate_reference_type(self, reference_expr: str) -> str:
+        """Extract the resource type from a literal reference string.
+
+        Args:
+            reference_expr: SQL string expression such as 'Patient/123'
+
+        Returns:
+            SQL string expression ('Patient'), NULL when the reference cannot be keyed
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_reference_type()"
+        )
+
+    def generate_month_end_date(self, year_month_expr: str) -> str:
+        """Return the last day ('YYYY-MM-DD') of a 'YYYY-MM' string expression."""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} must implement generate_month_end_date()"
+        )
+
+    def generate_runtime_error(self, message: str) -> Optional[str]:
+        """Return an expression that aborts the query with ``message`` when evaluated.
+
+        Dialects that cannot raise from within a SQL expression return None and
+        callers fall back to lenient behaviour.
+        """
+        return None
+
     # Encoding and decoding functions
 
     @abstractmethod
@@ -66,6 +66,84 @@ class DuckDBDialect(DatabaseDialect):
             logger.error(f"DuckDB query execution failed: {e}\nSQL: {sql}")
             raise
 
+    def execute_transaction(self, statements: List[str]) -> None:
+        """Execute statements in one DuckDB transaction."""
+        self.connection.execute("BEGIN TRANSACTION")
+        try:
+            for statement in statements:
+                self.connection.execute(statement)
+            self.connection.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"DuckDB transaction failed, rolling back: {e}")
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def export_query(self, sql: str, destination: Any, format: str = "parquet",
+                     partition_by: Optional[List[str]] = None,
+                     row_group_size: Optional[int] = None,
+                     compression: Optional[str] = None, append: bool = False) -> None:
+        """Write query results with DuckDB's COPY ... TO (parallel, out of core)."""
+        self._validate_export_options(format, partition_by, compression)
+        if not isinstance(destination, str):
+            raise ValueError("DuckDB exports require a destination path")
+        if row_group_size is not None and format != "parquet":
+            raise ValueError("row_group_size only applies to Parquet exports")
+        if append and not partition_by:
+            raise ValueError("append only applies to partitioned exports")
+
+        options = [{"parquet": "FORMAT parquet", "csv": "FORMAT csv, HEADER", "ndjson": "FORMAT json"}[format]]
+        if partition_by:
+            options.append(f"PARTITION_BY ({', '.join(partition_by)})")
+        if row_group_size is not None:
+            options.append(f"ROW_GROUP_SIZE {int(row_group_size)}")
+        if compression:
+            options.append(f"COMPRESSION {compression}")
+        if append:
+            options.append("APPEND")
+
+        target = destination.replace("'", "''")
+        self.connection.execute(f"COPY ({sql}) TO '{target}' ({', '.join(options)})")
+
+    def load_ndjson(self, files: List[str], table_name: str, batch_size: int = 10000) -> int:
+        """Load NDJSON with read_ndjson_objects (files are scanned in parallel)."""
+        file_list = ", ".join("'" + path.replace("'", "''") + "'" for path in files)
+        self.connection.execute(
+            f"CREATE TABLE {table_name} AS "
+            f"SELECT json_extract_string(json, '$.resourceType') AS resource_type, "
+            f"json_extract_string(json, '$.id') AS id, json AS resource "
+            f"FROM read_ndjson_objects([{file_list}])"
+        )
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+    def generate_partitioned_table_ddl(self, table: str, columns: List[tuple], partition_column: str,
+                                       partitions: List[str]) -> List[str]:
+        """Plain table: DuckDB prunes through row-group zone maps on the partition column.
+
+        Pruning is effective when rows are inserted grouped by partition value,
+        so each row group spans few values.
+        """
+        definitions = ", ".join(f"{name} {sql_type}" for name, sql_type in columns)
+        return [f"CREATE TABLE IF NOT EXISTS {table} ({definitions})"]
+
+    def generate_parquet_scan(self, paths: List[str], hive_partitioning: bool = True) -> str:
+        """read_parquet scan; projections and hive partition filters are pushed into the reader."""
+        path_list = ", ".join("'" + path.replace("'", "''") + "'" for path in paths)
+        return f"read_parquet([{path_list}], hive_partitioning = {str(hive_partitioning).lower()})"
+
+    def generate_table_sample(self, relation: str, percent: float, seed: Optional[int] = None) -> str:
+        """TABLESAMPLE with DuckDB's per-row Bernoulli method."""
+        options = "bernoulli" if seed is None else f"bernoulli, {int(seed)}"
+        return f"{relation} TABLESAMPLE {percent:g}% ({options})"
+
+    def generate_approx_count_distinct(self, expression: str) -> str:
+        """HyperLogLog estimate via approx_count_distinct."""
+        return f"approx_count_distinct({expression})"
+
+    def generate_quantile(self, expression: str, fraction: float, approximate: bool = False) -> str:
+        """approx_quantile (T-Digest) or exact quantile_cont."""
+        function = "approx_quantile" if approximate else "quantile_cont"
+        return f"{function}({expression}, {float(fraction)})"
+
     # JSON extraction methods
 
     def extract_json_field(self, column: str, path: str) -> str:
@@ -1985,6 +2063,138 @@ class DuckDBDialect(DatabaseDialect):
         """
         return f"LATERAL json_each({array_expr}) AS {enum_alias}({index_col}, {value_col})"
 
+    # SQL-on-FHIR ViewDefinition collection primitives
+
+    _VIEW_JSON_TYPES = {
+        'string': ['VARCHAR'],
+        'number': ['BIGINT', 'UBIGINT', 'DOUBLE'],
+        'boolean': ['BOOLEAN'],
+        'object': ['OBJECT'],
+        'array': ['ARRAY'],
+    }
+
+    def extract_json_path_value(self, value_expr: str, segments: List[Any]) -> str:
+        """Extract a JSON value with a single DuckDB json_extract() call."""
+        path = "$"
+        for segment in segments:
+            if isinstance(segment, int):
+                path += f"[{segment}]"
+            elif segment.isidentifier():
+                path += f".{segment}"
+            else:
+                path += f'."{segment}"'
+        return f"json_extract({value_expr}, '{path}')"
+
+    def as_json_collection(self, value_expr: str) -> str:
+        """Normalise a JSON value to a JSON array using json_type()."""
+        return (
+            f"CASE COALESCE(json_type({value_expr}), 'NULL') "
+            f"WHEN 'ARRAY' THEN CAST({value_expr} AS JSON) "
+            f"WHEN 'NULL' THEN json_array() "
+            f"ELSE json_array({value_expr}) END"
+        )
+
+    def flatten_json_collection(self, collection_expr: str, member: str, alias: str) -> str:
+        """Flatten a member across collection items with nested json_each() scans."""
+        member_value = self.extract_json_path_value(f"{alias}.value", [member])
+        return (
+            f"(SELECT COALESCE(CAST(to_json(list({alias}_m.value ORDER BY {alias}.id, {alias}_m.id)) AS JSON), json_array()) "
+            f"FROM json_each({collection_expr}) AS {alias}, "
+            f"json_each({self.as_json_collection(member_value)}) AS {alias}_m "
+            f"WHERE json_type({alias}_m.value) <> 'NULL')"
+        )
+
+    def filter_json_collection(self, collection_expr: str, alias: str, condition: str) -> str:
+        """Filter collection items with json_each(), preserving their order."""
+        return (
+            f"(SELECT COALESCE(CAST(to_json(list({alias}.value ORDER BY {alias}.id)) AS JSON), json_array()) "
+            f"FROM json_each({collection_expr}) AS {alias} "
+            f"WHERE {condition})"
+        )
+
+    def exists_in_json_collection(self, collection_expr: str, alias: str, condition: str) -> str:
+        """Semi-join over json_each() items."""
+        return f"EXISTS (SELECT 1 FROM json_each({collection_expr}) AS {alias} WHERE {condition})"
+
+    def index_json_collection(self, collection_expr: str, index: int) -> str:
+        """Index a JSON array; DuckDB addresses from the end with '$[#-n]'."""
+        position = f"#{index}" if index < 0 else str(index)
+        return f"json_extract({collection_expr}, '$[{position}]')"
+
+    def count_json_collection(self, collection_expr: str) -> str:
+        """Count JSON array items using json_array_length()."""
+        return f"json_array_length({collection_expr})"
+
+    def join_json_collection(self, collection_expr: str, alias: str, separator: str) -> str:
+        """Join collection items with string_agg() in collection order."""
+        return (
+            f"(SELECT COALESCE(string_agg(json_extract_string({alias}.value, '$'), {separator} ORDER BY {alias}.id), '') "
+            f"FROM json_each({collection_expr}) AS {alias})"
+        )
+
+    def json_collection_to_column(self, collection_expr: str) -> str:
+        """Render a collection as a DuckDB VARCHAR list."""
+        return f"json_extract_string({collection_expr}, '$[*]')"
+
+    def json_value_as_string(self, value_expr: str) -> str:
+        """Unwrap a JSON value to VARCHAR."""
+        return f"json_extract_string({value_expr}, '$')"
+
+    def json_value_as_number(self, value_expr: str) -> str:
+        """Unwrap a JSON value to DOUBLE (NULL for non-numeric values)."""
+        return f"TRY_CAST(json_extract_string({value_expr}, '$') AS DOUBLE)"
+
+    def json_value_as_boolean(self, value_expr: str) -> str:
+        """Unwrap a JSON boolean (NULL for any other JSON type)."""
+        return (
+            f"CASE WHEN json_type({value_expr}) = 'BOOLEAN' "
+            f"THEN CAST(json_extract_string({value_expr}, '$') AS BOOLEAN) END"
+        )
+
+    def json_value_type_in(self, value_expr: str, kinds: List[str]) -> str:
+        """Check the JSON type of a value using json_type()."""
+        type_names = [name for kind in kinds for name in self._VIEW_JSON_TYPES[kind]]
+        quoted = ", ".join(f"'{name}'" for name in type_names)
+        return f"(json_type({value_expr}) IN ({quoted}))"
+
+    def generate_lateral_json_collection(self, collection_expr: str, alias: str,
+                                         keep_empty: bool = False) -> str:
+        """Generate a lateral json_each() join for forEach / forEachOrNull."""
+        source = f"(SELECT value FROM json_each({collection_expr})) AS {alias}"
+        if keep_empty:
+            return f"LEFT JOIN LATERAL {source} ON TRUE"
+        return f"CROSS JOIN LATERAL {source}"
+
+    def unnest_json_collection(self, collection_expr: str) -> str:
+        """Unnest JSON array items in a SELECT list with unnest()."""
+        return f"unnest(json_extract({collection_expr}, '$[*]'))"
+
+    def generate_reference_key(self, reference_expr: str,
+                               resource_type: Optional[str] = None) -> str:
+        """Extract the id of a 'Type/id' reference using regexp_extract()."""
+        pattern = "([A-Za-z]+)/([^/]+)(/_history/[^/]+)?$"
+        key = f"NULLIF(regexp_extract({reference_expr}, '{pattern}', 2), '')"
+        if resource_type:
+            return (
+                f"CASE WHEN regexp_extract({reference_expr}, '{pattern}', 1) = '{resource_type}' "
+                f"THEN {key} END"
+            )
+        return key
+
+    def generate_reference_type(self, reference_expr: str) -> str:
+        """Extract the type of a 'Type/id' reference using regexp_extract()."""
+        pattern = "([A-Za-z]+)/([^/]+)(/_history/[^/]+)?$"
+        return f"NULLIF(regexp_extract({reference_expr}, '{pattern}', 1), '')"
+
+    def generate_month_end_date(self, year_month_expr: str) -> str:
+        """Return the last day of a 'YYYY-MM' month using last_day()."""
+        return f"strftime(last_day(CAST({year_month_expr} || '-01' AS DATE)), '%Y-%m-%d')"
+
+    def generate_runtime_error(self, message: str) -> Optional[str]:
+        """Abort the query using DuckDB's error() function."""
+        escaped = message.replace("'", "''")
+        return f"error('{escaped}')"
+
     # Encoding and decoding functions
 
     def generate_base64_encode(self, expression: str) -> str:
@@ -6,10 +6,13 @@ dialect architecture principle: business logic in FHIRPath evaluator,
 only syntax differences in dialects.
 """
 
+import gzip
+import io
 import logging
+import re
 import time
 from functools import wraps
-from typing import Any, List, Optional, Tuple, Set
+from typing import Any, Iterator, List, Optional, Tuple, Set
 
 from .base import DatabaseDialect
 
@@ -241,6 +244,145 @@ class PostgreSQLDialect(DatabaseDialect):
 
         return _execute()
 
+    def execute_transaction(self, statements: List[str]) -> None:
+        """Execute statements on one pooled connection and commit once.
+
+        Not retried: a transaction that failed part-way has been rolled back
+        and the caller decides whether to run it again.
+        """
+        conn = self.get_connection()
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            for statement in statements:
+                cursor.execute(statement)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"PostgreSQL transaction failed, rolling back: {e}")
+            conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            self.release_connection(conn)
+
+    def export_query(self, sql: str, destination: Any, format: str = "parquet",
+                     partition_by: Optional[List[str]] = None,
+                     row_group_size: Optional[int] = None,
+                     compression: Optional[str] = None, append: bool = False) -> None:
+        """Stream query results with COPY ... TO STDOUT into a file.
+
+        The server streams rows in chunks straight into ``destination`` (a
+        path or binary file object); rows are never built as Python tuples.
+        Only CSV and NDJSON are available, optionally gzip-compressed.
+        """
+        self._validate_export_options(format, partition_by, compression)
+        if format == "parquet":
+            raise ValueError("PostgreSQL cannot write Parquet; export csv or ndjson instead")
+        if partition_by or append:
+            raise ValueError("Partitioned exports are not supported on PostgreSQL")
+        if row_group_size is not None:
+            raise ValueError("row_group_size only applies to Parquet exports")
+        if compression not in (None, "gzip"):
+            raise ValueError(f"Unsupported compression for PostgreSQL exports: {compression}")
+
+        if format == "csv":
+            copy_sql = f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+        else:
+            # CSV framing with control-character quote/delimiter leaves the
+            # JSON text untouched (text format would escape backslashes)
+            copy_sql = (
+                f"COPY (SELECT row_to_json(q) FROM ({sql}) q) TO STDOUT "
+                f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+            )
+
+        owns_file = isinstance(destination, str)
+        raw = open(destination, "wb") if owns_file else destination
+        out = gzip.GzipFile(fileobj=raw, mode="wb") if compression == "gzip" else raw
+        conn = self.get_connection()
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.copy_expert(copy_sql, out)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"PostgreSQL export failed: {e}")
+            conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            self.release_connection(conn)
+            if out is not raw:
+                out.close()
+            if owns_file:
+                raw.close()
+
+    def load_ndjson(self, files: List[str], table_name: str, batch_size: int = 10000) -> int:
+        """Stream NDJSON lines into an unlogged table with COPY ... FROM STDIN.
+
+        Lines are sent as raw bytes in batches of ``batch_size``; the server
+        parses them into JSONB and derives ``resource_type``/``id`` as
+        generated columns. The whole load commits once.
+        """
+        copy_sql = (
+            f"COPY {table_name} (resource) FROM STDIN "
+            f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        )
+        conn = self.get_connection()
+        cursor = None
+        total = 0
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {table_name} ("
+                f"resource JSONB, "
+                f"resource_type TEXT GENERATED ALWAYS AS (resource ->> 'resourceType') STORED, "
+                f"id TEXT GENERATED ALWAYS AS (resource ->> 'id') STORED)"
+            )
+            for batch in _ndjson_batches(files, batch_size):
+                cursor.copy_expert(copy_sql, io.BytesIO(b"".join(batch)))
+                total += len(batch)
+            conn.commit()
+            return total
+        except Exception as e:
+            logger.error(f"PostgreSQL NDJSON load failed: {e}")
+            conn.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            self.release_connection(conn)
+
+    def generate_partitioned_table_ddl(self, table: str, columns: List[tuple], partition_column: str,
+                                       partitions: List[str]) -> List[str]:
+        """Declarative LIST partitioning, one partition per value plus a default partition."""
+        definitions = ", ".join(f"{name} {sql_type}" for name, sql_type in columns)
+        statements = [
+            f"CREATE TABLE IF NOT EXISTS {table} ({definitions}) PARTITION BY LIST ({partition_column})",
+            f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT",
+        ]
+        for value in partitions:
+            escaped = value.replace("'", "''")
+            statements.append(
+                f"CREATE TABLE IF NOT EXISTS {table}_{_partition_suffix(value)} "
+                f"PARTITION OF {table} FOR VALUES IN ('{escaped}')"
+            )
+        return statements
+
+    def generate_table_sample(self, relation: str, percent: float, seed: Optional[int] = None) -> str:
+        """TABLESAMPLE BERNOULLI, REPEATABLE when seeded; only valid on tables."""
+        sample = f"{relation} TABLESAMPLE BERNOULLI ({percent:g})"
+        return sample if seed is None else f"{sample} REPEATABLE ({int(seed)})"
+
+    def generate_approx_count_distinct(self, expression: str) -> str:
+        """Exact COUNT(DISTINCT): core PostgreSQL has no distinct-count sketch."""
+        return f"COUNT(DISTINCT {expression})"
+
+    def generate_quantile(self, expression: str, fraction: float, approximate: bool = False) -> str:
+        """Exact percentile_cont: core PostgreSQL has no quantile sketch."""
+        return f"percentile_cont({float(fraction)}) WITHIN GROUP (ORDER BY {expression})"
+
     # JSON extraction methods
 
     def extract_json_field(self, column: str, path: str) -> str:
@@ -314,6 +456,9 @@ class PostgreSQLDialect(DatabaseDialect):
             # Use #>> '{}' to extract JSONB scalar as text
             return f"{column} #>> '{{}}'"
 
+        if self._is_nested_json_path(clean_path):
+            return f"{column} #>> {self._json_path_array(clean_path)}"
+
         return f"{column}->>'{clean_path}'"
 
     def extract_json_integer(self, column: str, path: str) -> str:
@@ -332,6 +477,8 @@ class PostgreSQLDialect(DatabaseDialect):
         """
         # Strip $ prefix and leading . if present
         clean_path = path.lstrip('$').lstrip('.')
+        if self._is_nested_json_path(clean_path):
+            return f"({column} #> {self._json_path_array(clean_path)})::integer"
         return f"({column}->'{clean_path}')::integer"
 
     def extract_json_decimal(self, column: str, path: str) -> str:
@@ -350,6 +497,8 @@ class PostgreSQLDialect(DatabaseDialect):
         """
         # Strip $ prefix and leading . if present
         clean_path = path.lstrip('$').lstrip('.')
+        if self._is_nested_json_path(clean_path):
+            return f"({column} #> {self._json_path_array(clean_path)})::decimal"
         return f"({column}->'{clean_path}')::decimal"
 
     def extract_json_boolean(self, column: str, path: str) -> str:
@@ -368,8 +517,21 @@ class PostgreSQLDialect(DatabaseDialect):
         """
         # Strip $ prefix and leading . if present
         clean_path = path.lstrip('$').lstrip('.')
+        if self._is_nested_json_path(clean_path):
+            return f"({column} #> {self._json_path_array(clean_path)})::boolean"
         return f"({column}->'{clean_path}')::boolean"
 
+    @staticmethod
+    def _is_nested_json_path(clean_path: str) -> bool:
+        """Check whether a JSONPath (without '$.') navigates more than one key."""
+        return '.' in clean_path or '[' in clean_path
+
+    @staticmethod
+    def _json_path_array(clean_path: str) -> str:
+        """Convert 'name[0].family' to the text array literal '{name,0,family}'."""
+        parts = re.findall(r"[^.\[\]]+", clean_path)
+        return "'{" + ",".join(parts) + "}'"
+
     def get_json_type(self, column: str) -> str:
         """Get JSON value type using PostgreSQL's jsonb_typeof."""
         return f"jsonb_typeof({column})"
@@ -2047,6 +2209,124 @@ class PostgreSQLDialect(DatabaseDialect):
         # The column order is (value, ordinality) where ordinality is 1-based
         return f"LATERAL jsonb_array_elements({array_expr}) WITH ORDINALITY AS {enum_alias}({value_col}, ordinality)"
 
+    # SQL-on-FHIR ViewDefinition collection primitives
+
+    def extract_json_path_value(self, value_expr: str, segments: List[Any]) -> str:
+        """Extract a JSON value using the -> / #> operators."""
+        if len(segments) == 1 and isinstance(segments[0], str):
+            return f"{value_expr}->'{segments[0]}'"
+        path = ", ".join(f"'{segment}'" for segment in segments)
+        return f"({value_expr} #> ARRAY[{path}])"
+
+    def as_json_collection(self, value_expr: str) -> str:
+        """Normalise a JSON value to a JSONB array using jsonb_typeof()."""
+        value = f"({value_expr})::jsonb"
+        return (
+            f"CASE COALESCE(jsonb_typeof({value}), 'null') "
+            f"WHEN 'array' THEN {value} "
+            f"WHEN 'null' THEN '[]'::jsonb "
+            f"ELSE jsonb_build_array({value}) END"
+        )
+
+    def flatten_json_collection(self, collection_expr: str, member: str, alias: str) -> str:
+        """Flatten a member across collection items with jsonb_array_elements()."""
+        member_value = self.extract_json_path_value(f"{alias}.value", [member])
+        return (
+            f"(SELECT COALESCE(jsonb_agg({alias}_m.value ORDER BY {alias}.ord, {alias}_m.ord), '[]'::jsonb) "
+            f"FROM jsonb_array_elements({collection_expr}) WITH ORDINALITY AS {alias}(value, ord) "
+            f"CROSS JOIN LATERAL jsonb_array_elements({self.as_json_collection(member_value)}) "
+            f"WITH ORDINALITY AS {alias}_m(value, ord) "
+            f"WHERE jsonb_typeof({alias}_m.value) <> 'null')"
+        )
+
+    def filter_json_collection(self, collection_expr: str, alias: str, condition: str) -> str:
+        """Filter collection items with jsonb_array_elements(), preserving their order."""
+        return (
+            f"(SELECT COALESCE(jsonb_agg({alias}.value ORDER BY {alias}.ord), '[]'::jsonb) "
+            f"FROM jsonb_array_elements({collection_expr}) WITH ORDINALITY AS {alias}(value, ord) "
+            f"WHERE {condition})"
+        )
+
+    def exists_in_json_collection(self, collection_expr: str, alias: str, condition: str) -> str:
+        """Semi-join over jsonb_array_elements() items."""
+        return (
+            f"EXISTS (SELECT 1 FROM jsonb_array_elements({collection_expr}) AS {alias}(value) "
+            f"WHERE {condition})"
+        )
+
+    def index_json_collection(self, collection_expr: str, index: int) -> str:
+        """Index a JSONB array; negative indexes count from the end."""
+        return f"(({collection_expr}) -> {index})"
+
+    def count_json_collection(self, collection_expr: str) -> str:
+        """Count JSONB array items using jsonb_array_length()."""
+        return f"jsonb_array_length({collection_expr})"
+
+    def join_json_collection(self, collection_expr: str, alias: str, separator: str) -> str:
+        """Join collection items with string_agg() in collection order."""
+        return (
+            f"(SELECT COALESCE(string_agg({alias}.value #>> '{{}}', {separator} ORDER BY {alias}.ord), '') "
+            f"FROM jsonb_array_elements({collection_expr}) WITH ORDINALITY AS {alias}(value, ord))"
+        )
+
+    def json_collection_to_column(self, collection_expr: str) -> str:
+        """Render a collection as a JSONB array column."""
+        return collection_expr
+
+    def json_value_as_string(self, value_expr: str) -> str:
+        """Unwrap a JSON value to text using #>> '{}'."""
+        return f"(({value_expr}) #>> '{{}}')"
+
+    def json_value_as_number(self, value_expr: str) -> str:
+        """Unwrap a JSON number to numeric (NULL for other JSON types)."""
+        return (
+            f"CASE WHEN jsonb_typeof(({value_expr})::jsonb) = 'number' "
+            f"THEN (({value_expr}) #>> '{{}}')::numeric END"
+        )
+
+    def json_value_as_boolean(self, value_expr: str) -> str:
+        """Unwrap a JSON boolean (NULL for other JSON types)."""
+        return (
+            f"CASE WHEN jsonb_typeof(({value_expr})::jsonb) = 'boolean' "
+            f"THEN (({value_expr}) #>> '{{}}')::boolean END"
+        )
+
+    def json_value_type_in(self, value_expr: str, kinds: List[str]) -> str:
+        """Check the JSON type of a value using jsonb_typeof()."""
+        quoted = ", ".join(f"'{kind}'" for kind in kinds)
+        return f"(jsonb_typeof(({value_expr})::jsonb) IN ({quoted}))"
+
+    def generate_lateral_json_collection(self, collection_expr: str, alias: str,
+                                         keep_empty: bool = False) -> str:
+        """Generate a lateral jsonb_array_elements() join for forEach / forEachOrNull."""
+        source = f"jsonb_array_elements({collection_expr}) AS {alias}(value)"
+        if keep_empty:
+            return f"LEFT JOIN LATERAL {source} ON TRUE"
+        return f"CROSS JOIN LATERAL {source}"
+
+    def unnest_json_collection(self, collection_expr: str) -> str:
+        """Unnest JSON array items in a SELECT list with jsonb_array_elements()."""
+        return f"jsonb_array_elements({collection_expr})"
+
+    def generate_reference_key(self, reference_expr: str,
+                               resource_type: Optional[str] = None) -> str:
+        """Extract the id of a 'Type/id' reference using regexp_match()."""
+        match = f"regexp_match({reference_expr}, '([A-Za-z]+)/([^/]+)(?:/_history/[^/]+)?$')"
+        if resource_type:
+            return f"CASE WHEN ({match})[1] = '{resource_type}' THEN ({match})[2] END"
+        return f"({match})[2]"
+
+    def generate_reference_type(self, reference_expr: str) -> str:
+        """Extract the type of a 'Type/id' reference using regexp_match()."""
+        return f"(regexp_match({reference_expr}, '([A-Za-z]+)/([^/]+)(?:/_history/[^/]+)?$'))[1]"
+
+    def generate_month_end_date(self, year_month_expr: str) -> str:
+        """Return the last day of a 'YYYY-MM' month using interval arithmetic."""
+        return (
+            f"to_char(CAST({year_month_expr} || '-01' AS DATE) "
+            f"+ INTERVAL '1 month' - INTERVAL '1 day', 'YYYY-MM-DD')"
+        )
+
     # Encoding and decoding functions
 
     def generate_base64_encode(self, expression: str) -> str:
@@ -2187,3 +2467,25 @@ class PostgreSQLDialect(DatabaseDialect):
         return f"""
             ({base_unit} IS NOT NULL AND {arg_unit} IS NOT NULL AND {base_unit} = {arg_unit})
         """.strip()
+
+
+def _ndjson_batches(files: List[str], batch_size: int) -> Iterator[List[bytes]]:
+    """Yield non-blank NDJSON lines (newline-terminated) in batches."""
+    batch: List[bytes] = []
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                batch.append(line if line.endswith(b"\n") else line + b"\n")
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def _partition_suffix(value: str) -> str:
+    """Lower-case identifier suffix for a partition value (e.g. 'Observation' -> 'observation')."""
+    return re.sub(r"[^a-z0-9_]", "_", value.lower())
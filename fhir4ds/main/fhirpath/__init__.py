@@ -2,15 +2,21 @@
 FHIRPath parsing and SQL translation components.
 
 Note: Python evaluator has been removed (SP-018-001).
-FHIR4DS uses SQL translation exclusively (population-first architecture).
+FHIR4DS evaluates populations with SQL translation (population-first
+architecture); ClosureEvaluator compiles expressions to closures for single
+resources in hand, and FHIRPathRouter (fhir4ds.fhirpath.sql) picks between
+the two.
 """
 
 from .parser import FHIRPathParser, FHIRPathExpression
 from .types import FHIRDataType, FHIRTypeSystem
+from .closures import ClosureEvaluator, CompiledExpression
 
 __all__ = [
     'FHIRPathParser',
     'FHIRPathExpression',
     'FHIRDataType',
     'FHIRTypeSystem',
+    'ClosureEvaluator',
+    'CompiledExpression',
 ]
\ No newline at end of file
@@ -0,0 +1,1601 @@
+"""In-process FHIRPath evaluation with compiled closures.
+
+The SQL pipeline evaluates an expression over a population in one query.
+For a single resource in hand (an invariant or an extraction at an API
+gateway, one resource per request) loading it into a table and running SQL
+costs milliseconds. :class:`ClosureEvaluator` instead compiles the parser's
+AST once per expression into nested Python closures and runs them directly
+against the resource dict, in microseconds. Compiled expressions are kept
+in an LRU cache.
+
+Closures cover the commonly used core of FHIRPath:
+
+- path navigation, including choice elements (``value`` finds
+  ``valueQuantity``), indexers and the resource type prefix
+- literals, including dates, times and quantities; ``$this``, ``$index``,
+  ``$total``, ``%resource``/``%context``, ``%ucum``/``%sct``/``%loinc``,
+  ``%`vs-...```/``%`ext-...``` and caller-supplied variables
+- equality, equivalence, comparison, three-valued boolean logic, arithmetic
+  (including date/time and quantity arithmetic), union and membership
+- ``is``/``as``/``ofType`` with System types, resource types, and FHIR types
+  of choice elements
+- the functions in :data:`CLOSURE_FUNCTIONS`
+
+Anything else (``resolve()``, ``memberOf()``, type tests needing element
+definitions such as ``gender.is(code)``, ...) raises
+:class:`FHIRPathTranslationError` when the expression is compiled, so callers
+such as :class:`~fhir4ds.fhirpath.sql.router.FHIRPathRouter` can fall back to
+SQL. Errors the specification raises at run time (operators on collections
+of several items, comparisons of incompatible types, ...) raise
+:class:`FHIRPathRuntimeError`.
+
+Results are Python values: ``str``, ``bool``, ``int``, ``Decimal`` (JSON
+decimals are read as ``Decimal``), dicts for complex elements, ISO strings
+for dates and times and ``{"value", "unit"}`` dicts for quantities.
+
+Example:
+    >>> evaluator = ClosureEvaluator("Patient")
+    >>> evaluator.evaluate("name.where(use = 'official').given.first()", patient)
+    ['Peter']
+    >>> check = evaluator.compile("birthDate <= today()")
+    >>> check(patient)
+    [True]
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import calendar
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from .exceptions import FHIRPathRuntimeError, FHIRPathTranslationError, FHIRPathValidationError
+from .parser import FHIRPathParser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLOSURE_CACHE_SIZE = 1024
+
+#: A compiled expression node: ``(focus collection, environment) -> collection``.
+Closure = Callable[[List[Any], "_Env"], List[Any]]
+
+_CHOICE_SUFFIXES = frozenset((
+    "Boolean", "Integer", "Integer64", "Decimal", "String", "Date", "DateTime", "Time", "Instant",
+    "Uri", "Url", "Canonical", "Code", "Id", "Oid", "Uuid", "Markdown", "Base64Binary",
+    "PositiveInt", "UnsignedInt", "Quantity", "Age", "Distance", "Duration", "Count",
+    "SimpleQuantity", "MoneyQuantity", "Money", "Range", "Ratio", "RatioRange", "Period",
+    "SampledData", "Attachment", "CodeableConcept", "CodeableReference", "Coding", "Identifier",
+    "Reference", "HumanName", "Address", "ContactPoint", "Timing", "Signature", "Annotation",
+    "Meta", "Dosage", "Expression", "ContactDetail", "Contributor", "DataRequirement",
+    "ParameterDefinition", "RelatedArtifact", "TriggerDefinition", "UsageContext", "Extension",
+))
+
+_QUANTITY_SUBTYPES = ("Age", "Distance", "Duration", "Count", "SimpleQuantity", "MoneyQuantity")
+
+_ENVIRONMENT_CONSTANTS = {
+    "ucum": "http://unitsofmeasure.org",
+    "sct": "http://snomed.info/sct",
+    "loinc": "http://loinc.org",
+}
+
+_STRING_ESCAPES = {"'": "'", '"': '"', "`": "`", "\\": "\\", "/": "/",
+                   "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+
+_INTEGER = re.compile(r"[+-]?\d+")
+_DECIMAL = re.compile(r"[+-]?\d+(\.\d+)?")
+_QUANTITY = re.compile(r"([+-]?\d+(?:\.\d+)?)\s*(?:'([^']+)'|([a-zA-Z]+))?")
+_DATE = r"(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?"
+_TIME = r"(\d{2})(?::(\d{2})(?::(\d{2})(?:\.(\d+))?)?)?"
+_ZONE = r"(Z|[+-]\d{2}:\d{2})?"
+_DATE_VALUE = re.compile(_DATE)
+_DATETIME_VALUE = re.compile(f"{_DATE}T(?:{_TIME}{_ZONE})?")
+_TIME_VALUE = re.compile(_TIME)
+
+_TRUE_STRINGS = frozenset(("true", "t", "yes", "y", "1", "1.0"))
+_FALSE_STRINGS = frozenset(("false", "f", "no", "n", "0", "0.0"))
+
+# Calendar duration units, by the names and UCUM codes FHIRPath accepts. The
+# UCUM year and month ('a', 'mo') are average durations, not calendar ones.
+_DURATION_UNITS = {
+    "year": "year", "years": "year",
+    "month": "month", "months": "month",
+    "week": "week", "weeks": "week", "wk": "week",
+    "day": "day", "days": "day", "d": "day",
+    "hour": "hour", "hours": "hour", "h": "hour",
+    "minute": "minute", "minutes": "minute", "min": "minute",
+    "second": "second", "seconds": "second", "s": "second",
+    "millisecond": "millisecond", "milliseconds": "millisecond", "ms": "millisecond",
+}
+_DURATION_SECONDS = {"week": 604800, "day": 86400, "hour": 3600, "minute": 60,
+                     "second": 1, "millisecond": Decimal("0.001")}
+
+# UCUM units comparable by conversion: unit -> (factor, base unit).
+_UNIT_CONVERSIONS = {
+    "ug": (Decimal("0.000001"), "g"), "mg": (Decimal("0.001"), "g"), "g": (Decimal(1), "g"),
+    "kg": (Decimal(1000), "g"),
+    "mm": (Decimal("0.001"), "m"), "cm": (Decimal("0.01"), "m"), "m": (Decimal(1), "m"),
+    "km": (Decimal(1000), "m"), "[in_i]": (Decimal("0.0254"), "m"),
+    "mL": (Decimal("0.001"), "L"), "dL": (Decimal("0.1"), "L"), "L": (Decimal(1), "L"),
+}
+
+_CALENDAR_WORDS = frozenset(unit for unit in _DURATION_UNITS if len(unit) > 3 or unit == "day")
+
+
+class Quantity:
+    """A FHIRPath quantity: a decimal value with a UCUM or calendar unit."""
+
+    __slots__ = ("value", "unit")
+
+    def __init__(self, value: Decimal, unit: str = "1"):
+        self.value = value
+        self.unit = unit
+
+    def canonical(self) -> Tuple[Decimal, str]:
+        """``(value, unit)`` in the unit's base unit, for comparisons."""
+        duration = _DURATION_UNITS.get(self.unit)
+        if duration in _DURATION_SECONDS:
+            return self.value * _DURATION_SECONDS[duration], "s"
+        if duration is not None:
+            return self.value, duration
+        factor, base = _UNIT_CONVERSIONS.get(self.unit, (Decimal(1), self.unit))
+        return self.value * factor, base
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"value": self.value, "unit": self.unit}
+
+    def __str__(self) -> str:
+        if self.unit in _CALENDAR_WORDS:
+            return f"{self.value} {self.unit}"
+        return f"{self.value} '{self.unit}'"
+
+    __repr__ = __str__
+
+
+class Temporal:
+    """A FHIRPath Date, DateTime or Time with its precision and time zone.
+
+    ``parts`` holds the specified components (year, month, day, hour,
+    minute, second for dates and date times; hour, minute, second for
+    times); ``fraction`` the digits after the seconds' decimal point and
+    ``offset`` the zone offset in minutes (None when unspecified).
+    """
+
+    __slots__ = ("kind", "parts", "fraction", "offset")
+
+    def __init__(self, kind: str, parts: Tuple[int, ...], fraction: str = "", offset: Optional[int] = None):
+        self.kind = kind
+        self.parts = parts
+        self.fraction = fraction
+        self.offset = offset
+
+    @classmethod
+    def parse(cls, text: str, kind: Optional[str] = None) -> Optional[Temporal]:
+        """Parse ISO ``text`` as ``kind`` ("date", "dateTime", "time"), or as the kind it looks like."""
+        if kind in (None, "time") and (kind == "time" or ":" in text and "T" not in text and "-" not in text):
+            match = _TIME_VALUE.fullmatch(text)
+            return cls("time", _ints(match.groups()[:3]), match.group(4) or "") if match else None
+        if kind in (None, "dateTime") and "T" in text:
+            match = _DATETIME_VALUE.fullmatch(text)
+            if not match:
+                return None
+            groups = match.groups()
+            return cls("dateTime", _ints(groups[:6]), groups[6] or "", _offset(groups[7]))
+        match = _DATE_VALUE.fullmatch(text)
+        if not match:
+            return None
+        return cls(kind or "date", _ints(match.groups()))
+
+    def comparable_parts(self) -> List[Any]:
+        """Components for comparison: seconds as a decimal, date times in UTC when zoned."""
+        parts: List[Any] = list(self.parts)
+        if self.offset and self.kind == "dateTime" and len(parts) >= 4:
+            minute = parts[4] if len(parts) > 4 else 0
+            moment = datetime(parts[0], parts[1], parts[2], parts[3], minute) - timedelta(minutes=self.offset)
+            parts[:5] = [moment.year, moment.month, moment.day, moment.hour, moment.minute][:len(parts)]
+        seconds = 5 if self.kind != "time" else 2
+        if len(parts) > seconds:
+            parts[seconds] = Decimal(f"{parts[seconds]}.{self.fraction}" if self.fraction else parts[seconds])
+        return parts
+
+    def __str__(self) -> str:
+        parts = self.parts
+        if self.kind == "time":
+            text = ":".join(f"{part:02d}" for part in parts)
+        else:
+            text = "-".join([f"{parts[0]:04d}"] + [f"{part:02d}" for part in parts[1:3]])
+            if self.kind == "dateTime":
+                text += "T" + ":".join(f"{part:02d}" for part in parts[3:])
+        if self.fraction:
+            text += "." + self.fraction
+        if self.offset is not None and self.kind == "dateTime" and len(parts) > 3:
+            text += "Z" if self.offset == 0 else (
+                f"{'+' if self.offset > 0 else '-'}{abs(self.offset) // 60:02d}:{abs(self.offset) % 60:02d}")
+        return text
+
+    __repr__ = __str__
+
+
+def _ints(groups) -> Tuple[int, ...]:
+    parts = []
+    for group in groups:
+        if group is None:
+            break
+        parts.append(int(group))
+    return tuple(parts)
+
+
+def _offset(zone: Optional[str]) -> Optional[int]:
+    if not zone:
+        return None
+    if zone == "Z":
+        return 0
+    minutes = int(zone[1:3]) * 60 + int(zone[4:6])
+    return -minutes if zone[0] == "-" else minutes
+
+
+class _Env:
+    """Evaluation state: ``$this``, ``$index``, ``$total``, the root resource and variables."""
+
+    __slots__ = ("this", "index", "total", "root", "variables")
+
+    def __init__(self, this: List[Any], index: Optional[int], total: Optional[List[Any]],
+                 root: List[Any], variables: Mapping[str, Any]):
+        self.this = this
+        self.index = index
+        self.total = total
+        self.root = root
+        self.variables = variables
+
+    def item(self, item: Any, index: int) -> _Env:
+        return _Env([item], index, self.total, self.root, self.variables)
+
+
+class CompiledExpression:
+    """An expression compiled to closures; call it with a resource dict."""
+
+    __slots__ = ("expression", "_closure")
+
+    def __init__(self, expression: str, closure: Closure):
+        self.expression = expression
+        self._closure = closure
+
+    def __call__(self, resource: Mapping[str, Any], variables: Optional[Mapping[str, Any]] = None) -> List[Any]:
+        focus = [resource]
+        values = self._closure(focus, _Env(focus, None, None, focus, variables or {}))
+        for value in values:
+            if type(value) is Temporal or type(value) is Quantity:
+                return [_output(value) for value in values]
+        # Literals return the same list on every call; callers get their own.
+        return list(values)
+
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.expression!r})"
+
+
+def _output(value: Any) -> Any:
+    if type(value) is Temporal:
+        return str(value)
+    if type(value) is Quantity:
+        return value.to_json()
+    return value
+
+
+class ClosureEvaluator:
+    """Compiles FHIRPath expressions to closures and evaluates them in-process.
+
+    Args:
+        resource_type: Resource type expressions are parsed against (as
+            :class:`~fhir4ds.fhirpath.sql.executor.FHIRPathExecutor` does);
+            None to parse without a resource context
+        parser: Parser override
+        cache_size: Maximum number of compiled expressions kept (LRU order)
+    """
+
+    def __init__(self, resource_type: Optional[str] = None, *, parser: Optional[FHIRPathParser] = None,
+                 cache_size: int = DEFAULT_CLOSURE_CACHE_SIZE):
+        self.resource_type = resource_type
+        self.parser = parser or FHIRPathParser()
+        self._cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[str, CompiledExpression]" = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    def compile(self, expression: str) -> CompiledExpression:
+        """Parse and compile ``expression`` (cached).
+
+        Raises:
+            FHIRPathParseError: The expression does not parse
+            FHIRPathTranslationError: The expression uses a construct closures
+                do not cover
+        """
+        compiled = self._cache.get(expression)
+        if compiled is not None:
+            self._cache_hits += 1
+            self._cache.move_to_end(expression)
+            return compiled
+        self._cache_misses += 1
+        context = {"resourceType": self.resource_type} if self.resource_type else None
+        ast = self.parser.parse(expression, context=context).get_ast()
+        compiled = CompiledExpression(expression, _Compiler(ast).compile(ast))
+        if self._cache_size:
+            self._cache[expression] = compiled
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return compiled
+
+    def supports(self, expression: str) -> bool:
+        """Whether ``expression`` compiles to closures."""
+        try:
+            self.compile(expression)
+        except FHIRPathTranslationError:
+            return False
+        return True
+
+    def evaluate(self, expression: str, resource: Mapping[str, Any],
+                 variables: Optional[Mapping[str, Any]] = None) -> List[Any]:
+        """Evaluate ``expression`` against one resource, returning the result collection.
+
+        Args:
+            expression: FHIRPath expression
+            resource: The resource, as parsed JSON
+            variables: Values of ``%name`` variables (a value or a list)
+        """
+        return self.compile(expression)(resource, variables)
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {
+            "cache_size": len(self._cache),
+            "cache_hits": self._cache_hits,
+            "cache_misses": self._cache_misses,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Compilation
+# ---------------------------------------------------------------------------
+
+class _Compiler:
+    """Turns an EnhancedASTNode tree into closures."""
+
+    def __init__(self, root: Any):
+        attributes = getattr(getattr(root, "metadata", None), "custom_attributes", None) or {}
+        # The lexer drops the "T" of partial date times (@2015T); the parser records them.
+        self._partial_datetimes = set(attributes.get("datetime_t_mapping", {}))
+
+    def compile(self, node: Any) -> Closure:
+        handler = getattr(self, f"_compile_{node.node_type}", None)
+        if handler is None:
+            raise FHIRPathTranslationError(f"Closures do not support {node.node_type} '{node.text}'")
+        return handler(node)
+
+    # -- terms ---------------------------------------------------------------
+
+    def _compile_TermExpression(self, node: Any) -> Closure:
+        return self.compile(node.children[0])
+
+    _compile_InvocationTerm = _compile_TermExpression
+    _compile_ParenthesizedTerm = _compile_TermExpression
+
+    def _compile_MemberInvocation(self, node: Any) -> Closure:
+        return _navigate(_identifier(node.children[0].text))
+
+    def _compile_ThisInvocation(self, node: Any) -> Closure:
+        return lambda focus, env: env.this
+
+    def _compile_IndexInvocation(self, node: Any) -> Closure:
+        return lambda focus, env: [] if env.index is None else [env.index]
+
+    def _compile_TotalInvocation(self, node: Any) -> Closure:
+        return lambda focus, env: env.total or []
+
+    def _compile_ExternalConstantTerm(self, node: Any) -> Closure:
+        name = _identifier(node.children[0].children[0].text)
+        if name.startswith("'"):
+            name = _unescape(name[1:-1])
+        if name in ("resource", "context", "rootResource"):
+            return lambda focus, env: env.root
+        if name in _ENVIRONMENT_CONSTANTS:
+            return _constant([_ENVIRONMENT_CONSTANTS[name]])
+        if name.startswith("vs-"):
+            return _constant([f"http://hl7.org/fhir/ValueSet/{name[3:]}"])
+        if name.startswith("ext-"):
+            return _constant([f"http://hl7.org/fhir/StructureDefinition/{name[4:]}"])
+
+        def variable(focus, env):
+            if name not in env.variables:
+                raise FHIRPathRuntimeError(f"Undefined variable %{name}")
+            value = env.variables[name]
+            return list(value) if isinstance(value, (list, tuple)) else [value]
+        return variable
+
+    def _compile_literal(self, node: Any) -> Closure:
+        if node.children and node.children[0].node_type == "literal":
+            return self._compile_literal(node.children[0])
+        if node.children and node.children[0].node_type == "Quantity":
+            quantity = node.children[0]
+            unit = quantity.children[0] if quantity.children else None
+            if unit is None or not unit.text and not unit.children:
+                unit_text = "1"
+            elif unit.children:
+                unit_text = unit.children[0].text
+            else:
+                unit_text = _unescape(unit.text[1:-1])
+            return _constant([Quantity(Decimal(quantity.text), unit_text)])
+        return _constant(self._literal_value(node.text.strip()))
+
+    def _literal_value(self, text: str) -> List[Any]:
+        if text == "{}":
+            return []
+        if text in ("true", "false"):
+            return [text == "true"]
+        if text[0] in "'\"":
+            return [_unescape(text[1:-1])]
+        if text.startswith("@"):
+            if text.startswith("@T"):
+                value = Temporal.parse(text[2:], "time")
+            elif text in self._partial_datetimes:
+                value = Temporal.parse(text[1:], "date")
+                value = value and Temporal("dateTime", value.parts)
+            else:
+                value = Temporal.parse(text[1:])
+            if value is None:
+                raise FHIRPathTranslationError(f"Invalid date/time literal {text}")
+            return [value]
+        try:
+            return [Decimal(text) if "." in text else int(text)]
+        except (InvalidOperation, ValueError):
+            raise FHIRPathTranslationError(f"Closures do not support literal {text}")
+
+    # -- invocations ---------------------------------------------------------
+
+    def _compile_InvocationExpression(self, node: Any) -> Closure:
+        target = self.compile(node.children[0])
+        step = node.children[1]
+        if step.node_type == "MemberInvocation":
+            navigate = _navigate(_identifier(step.children[0].text))
+            return lambda focus, env: navigate(target(focus, env), env)
+        if step.node_type == "functionCall":
+            return self._function(step, target, node.children[0])
+        return self.compile(step)
+
+    def _compile_functionCall(self, node: Any) -> Closure:
+        return self._function(node, None, None)
+
+    def _function(self, node: Any, target: Optional[Closure], target_node: Any) -> Closure:
+        function = node.children[0]
+        name = _identifier(function.children[0].text)
+        arguments = function.children[1].children if len(function.children) > 1 else []
+        if name in ("is", "as", "ofType"):
+            if len(arguments) != 1:
+                raise FHIRPathTranslationError(f"{name}() takes one type argument")
+            return self._type_operation(name, arguments[0].text, target, target_node)
+        spec = CLOSURE_FUNCTIONS.get(name)
+        if spec is None:
+            raise FHIRPathTranslationError(f"Closures do not support function {name}()")
+        minimum, maximum, lazy, implementation = spec
+        if not minimum <= len(arguments) <= maximum:
+            raise FHIRPathTranslationError(f"{name}() takes {minimum} to {maximum} arguments")
+        if name == "iif" and _literal_text(arguments[0]) not in (None, "true", "false", "{}"):
+            raise FHIRPathValidationError(message="iif() criterion must be a Boolean",
+                                          validation_rule="iif_criterion_must_be_boolean")
+        compiled = [self.compile(argument) for argument in arguments]
+        if name == "sort":
+            compiled = [(self.compile(argument.children[0]), True)
+                        if argument.node_type == "PolarityExpression" and argument.text == "-"
+                        else (closure, False) for argument, closure in zip(arguments, compiled)]
+        if lazy:
+            def call(focus, env):
+                return implementation(focus if target is None else target(focus, env), env, *compiled)
+        else:
+            def call(focus, env):
+                values = [argument(env.this, env) for argument in compiled]
+                return implementation(focus if target is None else target(focus, env), *values)
+        return call
+
+    def _compile_IndexerExpression(self, node: Any) -> Closure:
+        collection = self.compile(node.children[0])
+        index = self.compile(node.children[1])
+
+        def indexer(focus, env):
+            position = _singleton(index(focus, env), "[]")
+            if position is None:
+                return []
+            items = collection(focus, env)
+            return [items[position]] if 0 <= position < len(items) else []
+        return indexer
+
+    def _compile_PolarityExpression(self, node: Any) -> Closure:
+        operand = self.compile(node.children[0])
+        if node.text == "+":
+            return operand
+
+        def negate(focus, env):
+            value = _singleton(operand(focus, env), "-")
+            if value is None:
+                return []
+            if type(value) is Quantity:
+                return [Quantity(-value.value, value.unit)]
+            if not _is_number(value):
+                raise FHIRPathRuntimeError(f"Cannot negate {value!r}")
+            return [-value]
+        return negate
+
+    # -- operators -----------------------------------------------------------
+
+    def _binary(self, node: Any) -> Tuple[Closure, Closure]:
+        return self.compile(node.children[0]), self.compile(node.children[1])
+
+    def _compile_EqualityExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+        operator = node.text
+        if operator in ("=", "!="):
+            negated = operator == "!="
+
+            def equality(focus, env):
+                result = _equal_collections(left(focus, env), right(focus, env))
+                if result is None:
+                    return []
+                return [result is not negated]
+            return equality
+        negated = operator == "!~"
+        return lambda focus, env: [_equivalent_collections(left(focus, env), right(focus, env)) is not negated]
+
+    def _compile_InequalityExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+        test = {"<": lambda order: order < 0, "<=": lambda order: order <= 0,
+                ">": lambda order: order > 0, ">=": lambda order: order >= 0}[node.text]
+        operator = node.text
+
+        def inequality(focus, env):
+            a = _singleton(left(focus, env), operator)
+            b = _singleton(right(focus, env), operator)
+            if a is None or b is None:
+                return []
+            order = _compare(a, b, operator)
+            return [] if order is None else [test(order)]
+        return inequality
+
+    def _compile_AdditiveExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+        operator = node.text
+        if operator == "&":
+            def concatenate(focus, env):
+                a = _singleton(left(focus, env), "&")
+                b = _singleton(right(focus, env), "&")
+                return [(a or "") + (b or "")]
+            return concatenate
+        return self._arithmetic(left, right, operator)
+
+    def _compile_MultiplicativeExpression(self, node: Any) -> Closure:
+        return self._arithmetic(*self._binary(node), node.text)
+
+    @staticmethod
+    def _arithmetic(left: Closure, right: Closure, operator: str) -> Closure:
+        def arithmetic(focus, env):
+            a = _singleton(left(focus, env), operator)
+            b = _singleton(right(focus, env), operator)
+            if a is None or b is None:
+                return []
+            result = _ARITHMETIC[operator](a, b)
+            return [] if result is None else [result]
+        return arithmetic
+
+    def _compile_UnionExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+        return lambda focus, env: _distinct(left(focus, env) + right(focus, env))
+
+    def _compile_MembershipExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+        if node.text == "contains":
+            left, right = right, left
+
+        def membership(focus, env):
+            item = _singleton(left(focus, env), node.text)
+            if item is None:
+                return []
+            return [any(_equal(item, other) for other in right(focus, env))]
+        return membership
+
+    def _compile_AndExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+
+        def conjunction(focus, env):
+            a = _boolean(left(focus, env), "and")
+            if a is False:
+                return [False]
+            b = _boolean(right(focus, env), "and")
+            if b is False:
+                return [False]
+            return [True] if a and b else []
+        return conjunction
+
+    def _compile_OrExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+        if node.text == "xor":
+            def exclusive(focus, env):
+                a = _boolean(left(focus, env), "xor")
+                b = _boolean(right(focus, env), "xor")
+                return [] if a is None or b is None else [a is not b]
+            return exclusive
+
+        def disjunction(focus, env):
+            a = _boolean(left(focus, env), "or")
+            if a is True:
+                return [True]
+            b = _boolean(right(focus, env), "or")
+            if b is True:
+                return [True]
+            return [False] if a is False and b is False else []
+        return disjunction
+
+    def _compile_ImpliesExpression(self, node: Any) -> Closure:
+        left, right = self._binary(node)
+
+        def implication(focus, env):
+            a = _boolean(left(focus, env), "implies")
+            if a is False:
+                return [True]
+            b = _boolean(right(focus, env), "implies")
+            if b is True:
+                return [True]
+            return [False] if a is True and b is False else []
+        return implication
+
+    def _compile_TypeExpression(self, node: Any) -> Closure:
+        operand, specifier = node.children
+        return self._type_operation(node.text, specifier.text, None, operand)
+
+    def _type_operation(self, operation: str, type_name: str, target: Optional[Closure],
+                        target_node: Any) -> Closure:
+        """``is``/``as``/``ofType``; on a member, choice elements are selected by type suffix."""
+        predicate, suffixes = _type_test(type_name)
+        member = _member_of(target_node) if target_node is not None else None
+        if member is not None:
+            parent_node, name = member
+            parent = self.compile(parent_node) if parent_node is not None else None
+            matching = frozenset(suffixes)
+            size = len(name)
+
+            def source(focus, env):
+                # Choice elements carry their type in their key: (matching, other types, unknown).
+                typed: List[Any] = []
+                other: List[Any] = []
+                untyped: List[Any] = []
+                for item in focus if parent is None else parent(focus, env):
+                    if type(item) is not dict:
+                        continue
+                    if name in item:
+                        untyped.extend(_values(item[name]))
+                        continue
+                    for key, value in item.items():
+                        if len(key) > size and key.startswith(name) and key[size:] in _CHOICE_SUFFIXES:
+                            (typed if key[size:] in matching else other).extend(_values(value))
+                            break
+                    else:
+                        if item.get("resourceType") == name:
+                            untyped.append(item)
+                return typed, other, untyped
+        else:
+            operand = target if target is not None else (self.compile(target_node) if target_node is not None
+                                                          else (lambda focus, env: focus))
+
+            def source(focus, env):
+                return [], [], operand(focus, env)
+
+        if operation == "ofType":
+            def of_type(focus, env):
+                typed, _, untyped = source(focus, env)
+                return typed + [item for item in untyped if predicate(item)]
+            return of_type
+
+        def single_type(focus, env):
+            typed, other, untyped = source(focus, env)
+            size = len(typed) + len(other) + len(untyped)
+            if size > 1:
+                raise FHIRPathRuntimeError(f"'{operation}' requires a single item, got {size}")
+            if typed:
+                return [True] if operation == "is" else typed
+            if other:
+                return [False] if operation == "is" else []
+            if not untyped:
+                return []
+            matches = predicate(untyped[0])
+            if operation == "is":
+                return [matches]
+            return untyped if matches else []
+        return single_type
+
+
+def _identifier(text: str) -> str:
+    return text[1:-1] if text.startswith("`") and text.endswith("`") else text
+
+
+def _literal_text(node: Any) -> Optional[str]:
+    """The text of ``node`` when it is a literal."""
+    while node.node_type in ("TermExpression", "literal") and len(node.children) == 1:
+        node = node.children[0]
+    return node.text.strip() if node.node_type == "literal" else None
+
+
+def _member_of(node: Any) -> Optional[Tuple[Any, str]]:
+    """``(parent node or None, name)`` when ``node`` is a member access."""
+    while node.node_type in ("TermExpression", "InvocationTerm") and len(node.children) == 1:
+        node = node.children[0]
+    if node.node_type == "MemberInvocation":
+        return None, _identifier(node.children[0].text)
+    if node.node_type == "InvocationExpression" and node.children[1].node_type == "MemberInvocation":
+        return node.children[0], _identifier(node.children[1].children[0].text)
+    return None
+
+
+def _unescape(text: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == "u" and len(escape) == 5:
+            return chr(int(escape[1:], 16))
+        return _STRING_ESCAPES.get(escape, escape)
+    return _ESCAPE.sub(replace, text) if "\\" in text else text
+
+
+def _constant(values: List[Any]) -> Closure:
+    return lambda focus, env: values
+
+
+# ---------------------------------------------------------------------------
+# Navigation
+# ---------------------------------------------------------------------------
+
+def _navigate(name: str) -> Closure:
+    """Child elements called ``name`` of each item (choice elements by their base name)."""
+    type_prefix = name[:1].isupper()
+
+    def navigate(focus, env):
+        out: List[Any] = []
+        for item in focus:
+            if type(item) is not dict:
+                continue
+            value = item.get(name)
+            if value is None:
+                if type_prefix and item.get("resourceType") == name:
+                    out.append(item)
+                    continue
+                value = _choice(item, name)
+                if value is None:
+                    continue
+            if type(value) is list:
+                for element in value:
+                    if element is not None:
+                        out.append(Decimal(repr(element)) if type(element) is float else element)
+            elif type(value) is float:
+                out.append(Decimal(repr(value)))
+            else:
+                out.append(value)
+        return out
+    return navigate
+
+
+def _choice(item: Dict[str, Any], name: str) -> Any:
+    size = len(name)
+    for key, value in item.items():
+        if len(key) > size and key.startswith(name) and key[size:] in _CHOICE_SUFFIXES:
+            return value
+    return None
+
+
+def _values(value: Any) -> List[Any]:
+    values = value if type(value) is list else [value]
+    return [Decimal(repr(element)) if type(element) is float else element
+            for element in values if element is not None]
+
+
+def _children(item: Any) -> List[Any]:
+    if type(item) is not dict:
+        return []
+    out: List[Any] = []
+    for key, value in item.items():
+        if key != "resourceType":
+            out.extend(_values(value))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Values
+# ---------------------------------------------------------------------------
+
+def _singleton(values: List[Any], operation: str) -> Any:
+    """The only item of ``values`` (None when empty); several items are an error."""
+    if not values:
+        return None
+    if len(values) > 1:
+        raise FHIRPathRuntimeError(f"'{operation}' requires a single item, got {len(values)}")
+    return values[0]
+
+
+def _boolean(values: List[Any], operation: str) -> Optional[bool]:
+    """Singleton evaluation of a collection as a Boolean (None when empty)."""
+    value = _singleton(values, operation)
+    if value is None:
+        return None
+    return value if type(value) is bool else True
+
+
+def _is_number(value: Any) -> bool:
+    return type(value) is int or type(value) is Decimal
+
+
+def _is_string(value: Any) -> bool:
+    return type(value) is str
+
+
+def _as_temporal(value: Any, like: Temporal) -> Optional[Temporal]:
+    if type(value) is Temporal:
+        return value
+    if type(value) is str:
+        return Temporal.parse(value, "time" if like.kind == "time" else None)
+    return None
+
+
+def _as_quantity(value: Any) -> Optional[Quantity]:
+    if type(value) is Quantity:
+        return value
+    if type(value) is dict and "value" in value and "resourceType" not in value:
+        number = value["value"]
+        if type(number) is float:
+            number = Decimal(repr(number))
+        elif type(number) is str and _DECIMAL.fullmatch(number):
+            number = Decimal(number)
+        if _is_number(number):
+            return Quantity(Decimal(number), value.get("code") or value.get("unit") or "1")
+    return None
+
+
+def _compare_temporals(a: Temporal, b: Temporal) -> Optional[int]:
+    if (a.kind == "time") != (b.kind == "time"):
+        return None
+    if (a.offset is None) != (b.offset is None) and len(a.parts) > 3 and len(b.parts) > 3:
+        return None
+    left, right = a.comparable_parts(), b.comparable_parts()
+    for x, y in zip(left, right):
+        if x != y:
+            return -1 if x < y else 1
+    return 0 if len(left) == len(right) else None
+
+
+def _compare_quantities(a: Quantity, b: Quantity) -> Optional[int]:
+    (x, unit), (y, other_unit) = a.canonical(), b.canonical()
+    if unit != other_unit:
+        return None
+    return (x > y) - (x < y)
+
+
+def _compare(a: Any, b: Any, operator: str) -> Optional[int]:
+    """Order of two items: -1, 0 or 1; None when incomparable at their precisions."""
+    if _is_number(a) and _is_number(b) or _is_string(a) and _is_string(b):
+        return (a > b) - (a < b)
+    if type(a) is Temporal or type(b) is Temporal:
+        left = _as_temporal(a, b if type(b) is Temporal else a)
+        right = _as_temporal(b, left) if left is not None else None
+        if left is not None and right is not None:
+            return _compare_temporals(left, right)
+    if type(a) is Quantity or type(b) is Quantity:
+        left, right = _as_quantity(a), _as_quantity(b)
+        if left is not None and right is not None:
+            return _compare_quantities(left, right)
+    raise FHIRPathRuntimeError(f"Cannot compare {a!r} and {b!r} with '{operator}'")
+
+
+def _equal(a: Any, b: Any) -> Optional[bool]:
+    """Item equality; None when the items' precisions make it unknown."""
+    if type(a) is bool or type(b) is bool:
+        return type(a) is type(b) and a == b
+    if _is_number(a) and _is_number(b) or _is_string(a) and _is_string(b):
+        return a == b
+    if type(a) is Temporal or type(b) is Temporal:
+        left = _as_temporal(a, b if type(b) is Temporal else a)
+        right = _as_temporal(b, left) if left is not None else None
+        if left is None or right is None:
+            return False
+        order = _compare_temporals(left, right)
+        return None if order is None else order == 0
+    if type(a) is Quantity or type(b) is Quantity:
+        left, right = _as_quantity(a), _as_quantity(b)
+        if left is None or right is None:
+            return False
+        order = _compare_quantities(left, right)
+        return None if order is None else order == 0
+    if type(a) is dict and type(b) is dict:
+        return a == b
+    return False
+
+
+def _equal_collections(left: List[Any], right: List[Any]) -> Optional[bool]:
+    if not left or not right:
+        return None
+    if len(left) != len(right):
+        return False
+    unknown = False
+    for a, b in zip(left, right):
+        result = _equal(a, b)
+        if result is False:
+            return False
+        unknown = unknown or result is None
+    return None if unknown else True
+
+
+def _decimal_places(value: Any) -> int:
+    return max(0, -value.as_tuple().exponent) if type(value) is Decimal else 0
+
+
+def _equivalent(a: Any, b: Any) -> bool:
+    if _is_string(a) and _is_string(b):
+        return " ".join(a.split()).lower() == " ".join(b.split()).lower()
+    if _is_number(a) and _is_number(b) and not (type(a) is int and type(b) is int):
+        places = Decimal(1).scaleb(-min(_decimal_places(a), _decimal_places(b)))
+        return Decimal(a).quantize(places, ROUND_HALF_UP) == Decimal(b).quantize(places, ROUND_HALF_UP)
+    if type(a) is Quantity or type(b) is Quantity:
+        left, right = _as_quantity(a), _as_quantity(b)
+        if left is None or right is None:
+            return False
+        (x, unit), (y, other_unit) = left.canonical(), right.canonical()
+        return unit == other_unit and _equivalent(x, y)
+    if type(a) is dict and type(b) is dict and a.keys() == b.keys():
+        return all(_equivalent_collections(_values(a[key]), _values(b[key])) for key in a)
+    return _equal(a, b) is True
+
+
+def _equivalent_collections(left: List[Any], right: List[Any]) -> bool:
+    if len(left) != len(right):
+        return False
+    remaining = list(right)
+    for a in left:
+        for position, b in enumerate(remaining):
+            if _equivalent(a, b):
+                del remaining[position]
+                break
+        else:
+            return False
+    return True
+
+
+def _distinct(values: List[Any]) -> List[Any]:
+    out: List[Any] = []
+    for value in values:
+        if not any(_equal(value, seen) is True for seen in out):
+            out.append(value)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Arithmetic
+# ---------------------------------------------------------------------------
+
+def _add(a: Any, b: Any, sign: int = 1) -> Any:
+    if _is_number(a) and _is_number(b):
+        return a + b if sign > 0 else a - b
+    if sign > 0 and _is_string(a) and _is_string(b):
+        return a + b
+    if type(a) is Temporal and type(b) is Quantity:
+        return _shift(a, b, sign)
+    if type(a) is Quantity and type(b) is Quantity and a.unit == b.unit:
+        return Quantity(a.value + b.value if sign > 0 else a.value - b.value, a.unit)
+    raise FHIRPathRuntimeError(f"Cannot {'add' if sign > 0 else 'subtract'} {a!r} and {b!r}")
+
+
+def _numbers(a: Any, b: Any, operator: str) -> None:
+    if not (_is_number(a) and _is_number(b)):
+        raise FHIRPathRuntimeError(f"'{operator}' requires numbers, got {a!r} and {b!r}")
+
+
+def _multiply(a: Any, b: Any) -> Any:
+    _numbers(a, b, "*")
+    return a * b
+
+
+def _divide(a: Any, b: Any) -> Any:
+    _numbers(a, b, "/")
+    return None if b == 0 else Decimal(a) / Decimal(b)
+
+
+def _div(a: Any, b: Any) -> Any:
+    _numbers(a, b, "div")
+    return None if b == 0 else int(Decimal(a) / Decimal(b))
+
+
+def _mod(a: Any, b: Any) -> Any:
+    _numbers(a, b, "mod")
+    if b == 0:
+        return None
+    remainder = Decimal(a) % Decimal(b)
+    return int(remainder) if type(a) is int and type(b) is int else remainder
+
+
+_ARITHMETIC: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": _add,
+    "-": lambda a, b: _add(a, b, -1),
+    "*": _multiply,
+    "/": _divide,
+    "div": _div,
+    "mod": _mod,
+}
+
+
+def _shift(value: Temporal, quantity: Quantity, sign: int) -> Temporal:
+    """``value`` moved by a calendar duration, keeping its precision."""
+    unit = _DURATION_UNITS.get(quantity.unit)
+    if unit is None:
+        raise FHIRPathRuntimeError(f"Cannot add '{quantity.unit}' to a date/time")
+    amount = quantity.value * sign
+    if unit not in ("second", "millisecond"):
+        amount = Decimal(int(amount))
+    parts = list(value.parts)
+    if value.kind == "time":
+        full = [2000, 1, 1] + parts + [0] * (3 - len(parts))
+    else:
+        full = parts + [1] * (3 - min(len(parts), 3)) + [0] * (6 - max(len(parts), 3))
+    if unit in ("year", "month"):
+        months = int(amount) * (12 if unit == "year" else 1)
+        if len(parts) < 2 and unit == "month":
+            months = months // 12 * 12
+        total = full[0] * 12 + full[1] - 1 + months
+        full[0], full[1] = total // 12, total % 12 + 1
+        full[2] = min(full[2], calendar.monthrange(full[0], full[1])[1])
+        fraction = value.fraction
+    else:
+        seconds = Decimal(full[5]) + (Decimal(f"0.{value.fraction}") if value.fraction else 0)
+        moment = datetime(*full[:5]) + timedelta(seconds=float(seconds + amount * _DURATION_SECONDS[unit]))
+        full = [moment.year, moment.month, moment.day, moment.hour, moment.minute, moment.second]
+        fraction = f"{moment.microsecond:06d}"[:len(value.fraction)] if value.fraction else ""
+    if value.kind == "time":
+        return Temporal("time", tuple(full[3:3 + len(parts)]), fraction)
+    return Temporal(value.kind, tuple(full[:len(parts)]), fraction, value.offset)
+
+
+# ---------------------------------------------------------------------------
+# Types
+# ---------------------------------------------------------------------------
+
+def _is_quantity(value: Any) -> bool:
+    return type(value) is Quantity or _as_quantity(value) is not None
+
+
+_SYSTEM_TYPES: Dict[str, Callable[[Any], bool]] = {
+    "Boolean": lambda value: type(value) is bool,
+    "Integer": lambda value: type(value) is int,
+    "Decimal": lambda value: type(value) is Decimal,
+    "String": _is_string,
+    "Date": lambda value: type(value) is Temporal and value.kind == "date",
+    "DateTime": lambda value: type(value) is Temporal and value.kind == "dateTime",
+    "Time": lambda value: type(value) is Temporal and value.kind == "time",
+    "Quantity": _is_quantity,
+}
+
+
+def _type_test(type_name: str) -> Tuple[Callable[[Any], bool], List[str]]:
+    """``(predicate on values, choice element suffixes)`` for a type specifier."""
+    namespace, _, name = type_name.replace("`", "").rpartition(".")
+    if namespace not in ("", "System", "FHIR"):
+        raise FHIRPathTranslationError(f"Closures do not support type {type_name}")
+    if not name[:1].isupper():
+        raise FHIRPathTranslationError(f"Type tests for FHIR primitive '{name}' need element definitions")
+    suffixes = [name] + (list(_QUANTITY_SUBTYPES) if name == "Quantity" else [])
+    if name in _SYSTEM_TYPES and namespace != "FHIR":
+        return _SYSTEM_TYPES[name], suffixes
+    if namespace == "System":
+        return lambda value: False, []
+
+    def resource_type(value: Any) -> bool:
+        if type(value) is not dict:
+            return False
+        if "resourceType" not in value:
+            raise FHIRPathRuntimeError(f"Cannot tell whether an element is a {name} without its definition")
+        return value["resourceType"] == name
+    return resource_type, suffixes
+
+
+# ---------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------
+
+def _string_input(values: List[Any], function: str) -> Optional[str]:
+    value = _singleton(values, function)
+    if value is not None and not _is_string(value):
+        raise FHIRPathRuntimeError(f"{function}() requires a string, got {value!r}")
+    return value
+
+
+def _string_function(function: str, implementation: Callable[..., Any]) -> Callable[..., List[Any]]:
+    def call(focus, *arguments):
+        value = _string_input(focus, function)
+        if value is None:
+            return []
+        values = []
+        for argument in arguments:
+            argument = _singleton(argument, function)
+            if argument is None:
+                return []
+            values.append(argument)
+        result = implementation(value, *values)
+        return [] if result is None else [result]
+    return call
+
+
+def _math_function(function: str, implementation: Callable[..., Any]) -> Callable[..., List[Any]]:
+    def call(focus, *arguments):
+        value = _singleton(focus, function)
+        if value is None:
+            return []
+        if type(value) is Quantity and function == "abs":
+            return [Quantity(abs(value.value), value.unit)]
+        if not _is_number(value):
+            raise FHIRPathRuntimeError(f"{function}() requires a number, got {value!r}")
+        values = []
+        for argument in arguments:
+            argument = _singleton(argument, function)
+            if argument is None:
+                return []
+            values.append(argument)
+        try:
+            result = implementation(value, *values)
+        except (InvalidOperation, ValueError, ZeroDivisionError):
+            return []
+        return [] if result is None else [result]
+    return call
+
+
+def _conversion(function: str, convert: Callable[[Any], Any], test: bool) -> Callable[..., List[Any]]:
+    def call(focus):
+        value = _singleton(focus, function)
+        if value is None:
+            return []
+        result = convert(value)
+        return [result is not None] if test else ([] if result is None else [result])
+    return call
+
+
+def _to_boolean(value: Any) -> Optional[bool]:
+    if type(value) is bool:
+        return value
+    if _is_number(value):
+        return True if value == 1 else False if value == 0 else None
+    if _is_string(value):
+        lowered = value.lower()
+        return True if lowered in _TRUE_STRINGS else False if lowered in _FALSE_STRINGS else None
+    return None
+
+
+def _to_integer(value: Any) -> Optional[int]:
+    if type(value) is bool:
+        return int(value)
+    if type(value) is int:
+        return value
+    if _is_string(value) and _INTEGER.fullmatch(value):
+        return int(value)
+    return None
+
+
+def _to_decimal(value: Any) -> Optional[Decimal]:
+    if type(value) is bool:
+        return Decimal("1.0") if value else Decimal("0.0")
+    if _is_number(value):
+        return Decimal(value)
+    if _is_string(value) and _DECIMAL.fullmatch(value):
+        return Decimal(value)
+    return None
+
+
+def _to_string(value: Any) -> Optional[str]:
+    if type(value) is bool:
+        return "true" if value else "false"
+    if type(value) is dict:
+        return None
+    return str(value)
+
+
+def _to_quantity(value: Any) -> Optional[Quantity]:
+    if type(value) is bool:
+        return Quantity(Decimal("1.0") if value else Decimal("0.0"))
+    if _is_number(value):
+        return Quantity(Decimal(value))
+    if _is_string(value):
+        match = _QUANTITY.fullmatch(value)
+        if not match:
+            return None
+        unit = match.group(2) or match.group(3)
+        if match.group(3) and match.group(3) not in _CALENDAR_WORDS:
+            return None
+        return Quantity(Decimal(match.group(1)), unit or "1")
+    return _as_quantity(value)
+
+
+def _to_temporal(kind: str) -> Callable[[Any], Optional[Temporal]]:
+    def convert(value: Any) -> Optional[Temporal]:
+        if type(value) is Temporal:
+            if value.kind == kind:
+                return value
+            if kind == "dateTime" and value.kind == "date":
+                return Temporal("dateTime", value.parts)
+            if kind == "date" and value.kind == "dateTime":
+                return Temporal("date", value.parts[:3])
+            return None
+        if not _is_string(value):
+            return None
+        parsed = Temporal.parse(value, kind)
+        if parsed is None and kind == "dateTime":
+            parsed = Temporal.parse(value, "date")
+            return parsed and Temporal("dateTime", parsed.parts)
+        return parsed
+    return convert
+
+
+def _iterate(focus: List[Any], env: _Env, criteria: Closure) -> List[Tuple[Any, List[Any]]]:
+    return [(item, criteria([item], env.item(item, index))) for index, item in enumerate(focus)]
+
+
+def _where(focus, env, criteria):
+    return [item for item, result in _iterate(focus, env, criteria) if _boolean(result, "where") is True]
+
+
+def _select(focus, env, projection):
+    out: List[Any] = []
+    for _, result in _iterate(focus, env, projection):
+        out.extend(result)
+    return out
+
+
+def _exists(focus, env, criteria=None):
+    if criteria is not None:
+        focus = _where(focus, env, criteria)
+    return [bool(focus)]
+
+
+def _all(focus, env, criteria):
+    return [all(_boolean(result, "all") is True for _, result in _iterate(focus, env, criteria))]
+
+
+def _repeat(focus, env, projection):
+    out: List[Any] = []
+    pending = focus
+    while pending:
+        found = [item for item in _select(pending, env, projection)
+                 if not any(_equal(item, seen) is True for seen in out)]
+        out.extend(found)
+        pending = found
+    return out
+
+
+def _aggregate(focus, env, aggregator, initial=None):
+    total = initial(env.this, env) if initial is not None else []
+    for index, item in enumerate(focus):
+        total = aggregator([item], _Env([item], index, total, env.root, env.variables))
+    return total
+
+
+def _iif(focus, env, criterion, true_result, otherwise=None):
+    if len(focus) > 1:
+        raise FHIRPathRuntimeError(f"iif() requires at most one input item, got {len(focus)}")
+    scope = _Env(focus, None, env.total, env.root, env.variables) if focus else env
+    this = scope.this
+    condition = criterion(this, scope)
+    if len(condition) > 1 or condition and type(condition[0]) is not bool:
+        raise FHIRPathRuntimeError("iif() criterion must be a Boolean")
+    if condition == [True]:
+        return true_result(this, scope)
+    return otherwise(this, scope) if otherwise is not None else []
+
+
+def _sort(focus, env, *keys):
+    if not keys:
+        return sorted(focus, key=_SortKey)
+    items = list(focus)
+    for key, descending in reversed(keys):
+        keyed = [(_singleton(key([item], env.item(item, index)), "sort"), item) for index, item in enumerate(items)]
+        # Items without a key sort first in either direction.
+        items = [item for value, item in keyed if value is None] + [
+            item for _, item in sorted((pair for pair in keyed if pair[0] is not None),
+                                       key=lambda pair: _SortKey(pair[0]), reverse=descending)]
+    return items
+
+
+class _SortKey:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __lt__(self, other: _SortKey) -> bool:
+        return (_compare(self.value, other.value, "sort") or 0) < 0
+
+
+def _trace(focus, env, name, projection=None):
+    label = _singleton(name(env.this, env), "trace")
+    logger.debug("trace %s: %r", label, _select(focus, env, projection) if projection is not None else focus)
+    return focus
+
+
+def _count(focus):
+    return [len(focus)]
+
+
+def _single(focus):
+    if len(focus) > 1:
+        raise FHIRPathRuntimeError(f"single() requires at most one item, got {len(focus)}")
+    return focus
+
+
+def _not(focus):
+    value = _boolean(focus, "not")
+    return [] if value is None else [not value]
+
+
+def _boolean_set(test: Callable[[List[bool]], bool], function: str) -> Callable[[List[Any]], List[bool]]:
+    def call(focus):
+        if any(type(item) is not bool for item in focus):
+            raise FHIRPathRuntimeError(f"{function}() requires Booleans")
+        return [test(focus)]
+    return call
+
+
+def _subset_of(focus, other):
+    return [all(any(_equal(item, candidate) is True for candidate in other) for item in focus)]
+
+
+def _index(focus, number, function):
+    position = _singleton(number, function)
+    if type(position) is not int:
+        raise FHIRPathRuntimeError(f"{function}() requires an integer")
+    return position
+
+
+def _intersect(focus, other):
+    return _distinct([item for item in focus if any(_equal(item, candidate) is True for candidate in other)])
+
+
+def _exclude(focus, other):
+    return [item for item in focus if not any(_equal(item, candidate) is True for candidate in other)]
+
+
+def _substring(value: str, start: int, length: Optional[int] = None) -> Optional[str]:
+    if start < 0 or start >= len(value):
+        return None
+    return value[start:] if length is None else value[start:start + max(length, 0)]
+
+
+def _substring_call(focus, start, length=None):
+    value = _string_input(focus, "substring")
+    begin = _singleton(start, "substring")
+    if value is None or begin is None:
+        return []
+    size = _singleton(length, "substring") if length is not None else None
+    result = _substring(value, begin, size)
+    return [] if result is None else [result]
+
+
+def _replace_matches(value: str, pattern: str, substitution: str) -> str:
+    if not pattern:
+        return value
+    return re.sub(pattern, re.sub(r"\$(\d+)", r"\\\1", substitution), value, flags=re.DOTALL)
+
+
+def _encode(value: str, encoding: str) -> Optional[str]:
+    data = value.encode("utf-8")
+    if encoding == "base64":
+        return base64.b64encode(data).decode("ascii")
+    if encoding == "urlbase64":
+        return base64.urlsafe_b64encode(data).decode("ascii")
+    if encoding == "hex":
+        return data.hex()
+    return None
+
+
+def _decode(value: str, encoding: str) -> Optional[str]:
+    try:
+        if encoding == "base64":
+            return base64.b64decode(value).decode("utf-8")
+        if encoding == "urlbase64":
+            return base64.urlsafe_b64decode(value).decode("utf-8")
+        if encoding == "hex":
+            return bytes.fromhex(value).decode("utf-8")
+    except (binascii.Error, ValueError):
+        return None
+    return None
+
+
+def _split(focus, separator):
+    value = _string_input(focus, "split")
+    separator = _singleton(separator, "split")
+    if value is None or separator is None:
+        return []
+    return value.split(separator) if separator else list(value)
+
+
+def _join(focus, separator=None):
+    separator = _singleton(separator, "join") if separator is not None else ""
+    if any(not _is_string(item) for item in focus):
+        raise FHIRPathRuntimeError("join() requires strings")
+    return [(separator or "").join(focus)]
+
+
+def _round(value, precision=0):
+    if type(precision) is not int or precision < 0:
+        raise FHIRPathRuntimeError("round() requires a non-negative integer precision")
+    return Decimal(value).quantize(Decimal(1).scaleb(-precision), ROUND_HALF_UP)
+
+
+def _power(value, exponent):
+    if not _is_number(exponent):
+        raise FHIRPathRuntimeError("power() requires a number")
+    if type(value) is int and type(exponent) is int and exponent >= 0:
+        return value ** exponent
+    if value < 0 and Decimal(exponent) != Decimal(exponent).to_integral_value():
+        return None
+    return Decimal(value) ** Decimal(exponent)
+
+
+def _log(value, base):
+    if not _is_number(base):
+        raise FHIRPathRuntimeError("log() requires a number")
+    return Decimal(value).ln() / Decimal(base).ln()
+
+
+def _extension(focus, url):
+    url = _singleton(url, "extension")
+    if url is None:
+        return []
+    return [extension for item in focus if type(item) is dict
+            for extension in _values(item.get("extension"))
+            if type(extension) is dict and extension.get("url") == url]
+
+
+def _descendants(focus):
+    out: List[Any] = []
+    pending = focus
+    while pending:
+        pending = [child for item in pending for child in _children(item)]
+        out.extend(pending)
+    return out
+
+
+def _now(focus):
+    moment = datetime.now(timezone.utc).astimezone()
+    offset = int(moment.utcoffset().total_seconds() // 60)
+    return [Temporal("dateTime", (moment.year, moment.month, moment.day, moment.hour, moment.minute,
+                                  moment.second), f"{moment.microsecond // 1000:03d}", offset)]
+
+
+def _today(focus):
+    today = datetime.now().date()
+    return [Temporal("date", (today.year, today.month, today.day))]
+
+
+def _time_of_day(focus):
+    moment = datetime.now()
+    return [Temporal("time", (moment.hour, moment.minute, moment.second), f"{moment.microsecond // 1000:03d}")]
+
+
+def _precision(focus):
+    value = _singleton(focus, "precision")
+    if value is None:
+        return []
+    if type(value) is Decimal:
+        return [_decimal_places(value)]
+    if type(value) is Temporal:
+        digits = 2 * len(value.parts) + (2 if value.kind != "time" else 0)
+        return [digits + len(value.fraction)]
+    raise FHIRPathRuntimeError(f"precision() requires a decimal, date or time, got {value!r}")
+
+
+def _has_value(focus):
+    return [len(focus) == 1 and type(focus[0]) is not dict]
+
+
+#: Functions closures implement: name -> (min arguments, max arguments,
+#: lazy, implementation). Lazy functions receive the input, the environment
+#: and their argument closures (evaluated per input item); the others
+#: receive the input and their arguments' values, evaluated against $this.
+#: ``is``, ``as`` and ``ofType`` are compiled separately.
+CLOSURE_FUNCTIONS: Dict[str, Tuple[int, int, bool, Callable[..., List[Any]]]] = {
+    # existence
+    "empty": (0, 0, False, lambda focus: [not focus]),
+    "exists": (0, 1, True, _exists),
+    "all": (1, 1, True, _all),
+    "allTrue": (0, 0, False, _boolean_set(lambda items: all(items), "allTrue")),
+    "anyTrue": (0, 0, False, _boolean_set(lambda items: any(items), "anyTrue")),
+    "allFalse": (0, 0, False, _boolean_set(lambda items: not any(items), "allFalse")),
+    "anyFalse": (0, 0, False, _boolean_set(lambda items: not all(items), "anyFalse")),
+    "subsetOf": (1, 1, False, _subset_of),
+    "supersetOf": (1, 1, False, lambda focus, other: _subset_of(other, focus)),
+    "count": (0, 0, False, _count),
+    "distinct": (0, 0, False, _distinct),
+    "isDistinct": (0, 0, False, lambda focus: [len(_distinct(focus)) == len(focus)]),
+    # filtering and projection
+    "where": (1, 1, True, _where),
+    "select": (1, 1, True, _select),
+    "repeat": (1, 1, True, _repeat),
+    # subsetting
+    "single": (0, 0, False, _single),
+    "first": (0, 0, False, lambda focus: focus[:1]),
+    "last": (0, 0, False, lambda focus: focus[-1:]),
+    "tail": (0, 0, False, lambda focus: focus[1:]),
+    "skip": (1, 1, False, lambda focus, number: focus[max(_index(focus, number, "skip"), 0):]),
+    "take": (1, 1, False, lambda focus, number: focus[:max(_index(focus, number, "take"), 0)]),
+    "intersect": (1, 1, False, _intersect),
+    "exclude": (1, 1, False, _exclude),
+    # combining
+    "union": (1, 1, False, lambda focus, other: _distinct(focus + other)),
+    "combine": (1, 1, False, lambda focus, other: focus + other),
+    # conversion
+    "iif": (2, 3, True, _iif),
+    "toBoolean": (0, 0, False, _conversion("toBoolean", _to_boolean, False)),
+    "convertsToBoolean": (0, 0, False, _conversion("convertsToBoolean", _to_boolean, True)),
+    "toInteger": (0, 0, False, _conversion("toInteger", _to_integer, False)),
+    "convertsToInteger": (0, 0, False, _conversion("convertsToInteger", _to_integer, True)),
+    "toDecimal": (0, 0, False, _conversion("toDecimal", _to_decimal, False)),
+    "convertsToDecimal": (0, 0, False, _conversion("convertsToDecimal", _to_decimal, True)),
+    "toString": (0, 0, False, _conversion("toString", _to_string, False)),
+    "convertsToString": (0, 0, False, _conversion("convertsToString", _to_string, True)),
+    "toQuantity": (0, 0, False, _conversion("toQuantity", _to_quantity, False)),
+    "convertsToQuantity": (0, 0, False, _conversion("convertsToQuantity", _to_quantity, True)),
+    "toDate": (0, 0, False, _conversion("toDate", _to_temporal("date"), False)),
+    "convertsToDate": (0, 0, False, _conversion("convertsToDate", _to_temporal("date"), True)),
+    "toDateTime": (0, 0, False, _conversion("toDateTime", _to_temporal("dateTime"), False)),
+    "convertsToDateTime": (0, 0, False, _conversion("convertsToDateTime", _to_temporal("dateTime"), True)),
+    "toTime": (0, 0, False, _conversion("toTime", _to_temporal("time"), False)),
+    "convertsToTime": (0, 0, False, _conversion("convertsToTime", _to_temporal("time"), True)),
+    # strings
+    "indexOf": (1, 1, False, _string_function("indexOf", lambda value, part: value.find(part))),
+    "substring": (1, 2, False, _substring_call),
+    "startsWith": (1, 1, False, _string_function("startsWith", str.startswith)),
+    "endsWith": (1, 1, False, _string_function("endsWith", str.endswith)),
+    "contains": (1, 1, False, _string_function("contains", lambda value, part: part in value)),
+    "upper": (0, 0, False, _string_function("upper", str.upper)),
+    "lower": (0, 0, False, _string_function("lower", str.lower)),
+    "replace": (2, 2, False, _string_function("replace", str.replace)),
+    "matches": (1, 1, False, _string_function(
+        "matches", lambda value, pattern: re.search(pattern, value, re.DOTALL) is not None)),
+    "matchesFull": (1, 1, False, _string_function(
+        "matchesFull", lambda value, pattern: re.fullmatch(pattern, value, re.DOTALL) is not None)),
+    "replaceMatches": (2, 2, False, _string_function("replaceMatches", _replace_matches)),
+    "length": (0, 0, False, _string_function("length", len)),
+    "toChars": (0, 0, False, lambda focus: list(_string_input(focus, "toChars") or "")),
+    "trim": (0, 0, False, _string_function("trim", str.strip)),
+    "split": (1, 1, False, _split),
+    "join": (0, 1, False, _join),
+    "encode": (1, 1, False, _string_function("encode", _encode)),
+    "decode": (1, 1, False, _string_function("decode", _decode)),
+    # math
+    "abs": (0, 0, False, _math_function("abs", abs)),
+    "ceiling": (0, 0, False, _math_function("ceiling", lambda value: int(Decimal(value).to_integral_value(
+        rounding=ROUND_CEILING)))),
+    "floor": (0, 0, False, _math_function("floor", lambda value: int(Decimal(value).to_integral_value(
+        rounding=ROUND_FLOOR)))),
+    "truncate": (0, 0, False, _math_function("truncate", lambda value: int(value))),
+    "round": (0, 1, False, _math_function("round", _round)),
+    "exp": (0, 0, False, _math_function("exp", lambda value: Decimal(value).exp())),
+    "ln": (0, 0, False, _math_function("ln", lambda value: Decimal(value).ln())),
+    "log": (1, 1, False, _math_function("log", _log)),
+    "power": (1, 1, False, _math_function("power", _power)),
+    "sqrt": (0, 0, False, _math_function("sqrt", lambda value: Decimal(value).sqrt() if value >= 0 else None)),
+    # tree navigation
+    "children": (0, 0, False, lambda focus: [child for item in focus for child in _children(item)]),
+    "descendants": (0, 0, False, _descendants),
+    "extension": (1, 1, False, _extension),
+    "hasValue": (0, 0, False, _has_value),
+    "precision": (0, 0, False, _precision),
+    # utility
+    "not": (0, 0, False, _not),
+    "trace": (1, 2, True, _trace),
+    "aggregate": (1, 2, True, _aggregate),
+    "sort": (0, 8, True, _sort),
+    "now": (0, 0, False, _now),
+    "today": (0, 0, False, _today),
+    "timeOfDay": (0, 0, False, _time_of_day),
+}
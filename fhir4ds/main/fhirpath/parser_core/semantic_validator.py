@@ -76,6 +76,10 @@ _FHIRPATH_BUILTIN_FUNCTIONS = {
     'sum', 'average', 'subsetOf', 'supersetOf', 'children',
     # Hierarchical and collection functions
     'descendants', 'sort', 'trace',
+    # SQL-on-FHIR shareable view functions
+    'getResourceKey', 'getReferenceKey',
+    # FHIR-specific functions
+    'resolve', 'memberOf', 'subsumes', 'subsumedBy', 'translate',
 }
 
 
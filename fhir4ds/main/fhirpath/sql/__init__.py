@@ -15,6 +15,16 @@ Key Components:
     - TranslationContext: Context manager tracking state during AST traversal
     - ASTToSQLTranslator: Main translator class using visitor pattern
     - FHIRPathExecutor: End-to-end execution pipeline orchestrator
+    - StorageCatalog: Maps resource types to the tables that store them
+    - TableSample: Bernoulli sample of a type's rows for approximate queries
+    - ExtractionProfile: Hot columns and side tables materialized at load time
+    - ReferenceIndex: Reference edges maintained at load time for resolve()
+    - CompartmentIndex: Patient compartment membership for per-patient pruning
+    - TerminologyStore: Value set, code closure and concept map tables
+    - SearchIndex: FHIR search parameter value tables and search URL compiler
+    - CohortEngine: Criteria evaluated into cached patient bitmaps for set algebra
+    - FHIRPathRouter: Closures for a few resources in hand, SQL for populations
+    - MicroBatcher: Concurrent per-patient requests coalesced into population queries
 
 Example Usage:
     >>> from fhir4ds.fhirpath.sql import ASTToSQLTranslator, SQLFragment
@@ -48,15 +58,40 @@ Author: FHIR4DS Development Team
 """
 
 from fhir4ds.fhirpath.sql.fragments import SQLFragment
+from fhir4ds.fhirpath.sql.extraction import ExtractedColumn, ExtractionProfile, SideTable
+from fhir4ds.fhirpath.sql.references import ReferenceIndex, ReferencePath
+from fhir4ds.fhirpath.sql.compartments import CompartmentIndex
+from fhir4ds.fhirpath.sql.terminology import TerminologyStore
+from fhir4ds.fhirpath.sql.search import IndexedParameter, SearchIndex
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog, TableMapping, TableSample
 from fhir4ds.fhirpath.sql.context import TranslationContext
 from fhir4ds.fhirpath.sql.translator import ASTToSQLTranslator
 from fhir4ds.fhirpath.sql.executor import FHIRPathExecutor
+from fhir4ds.fhirpath.sql.cohorts import Cohort, CohortEngine
+from fhir4ds.fhirpath.sql.router import FHIRPathRouter
+from fhir4ds.fhirpath.sql.batching import MicroBatcher
 
 __all__ = [
     "SQLFragment",
     "TranslationContext",
     "ASTToSQLTranslator",
     "FHIRPathExecutor",
+    "StorageCatalog",
+    "TableMapping",
+    "TableSample",
+    "ExtractionProfile",
+    "ExtractedColumn",
+    "SideTable",
+    "ReferenceIndex",
+    "ReferencePath",
+    "CompartmentIndex",
+    "TerminologyStore",
+    "SearchIndex",
+    "IndexedParameter",
+    "CohortEngine",
+    "Cohort",
+    "FHIRPathRouter",
+    "MicroBatcher",
 ]
 
 __version__ = "0.1.0"
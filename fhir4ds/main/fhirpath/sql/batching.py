@@ -0,0 +1,226 @@
+"""Micro-batching of concurrent per-patient FHIRPath requests.
+
+A service answering "evaluate expression X for patient P" would otherwise
+run one query per request; under a burst of thousands of concurrent
+requests the per-query overhead (parsing, translation, planning, a round
+trip) dominates. :class:`MicroBatcher` holds requests for the same
+expression on the same resource type for a short window and answers them
+all with one population query restricted to the batch's patients (the
+compartment semi-join of ``FHIRPathExecutor.execute(..., patients=[...])``),
+then fans the rows back out to each patient through the compartment
+membership table.
+
+``window_ms`` bounds the latency a request can gain from waiting and
+``max_batch_size`` dispatches a batch as soon as it is full; both trade
+per-request latency for throughput. :meth:`MicroBatcher.get_statistics`
+reports batch sizes, queueing delay and query time to tune them with.
+
+Batches are dispatched one at a time from a single background thread, so
+the dialect's connection is never used concurrently.
+
+Example:
+    >>> with MicroBatcher(dialect, catalog, window_ms=5) as batcher:
+    ...     # from many request threads
+    ...     batcher.evaluate("Observation", "status = 'final'", "p1")
+    {'o1': [True], 'o7': [False]}
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from fhir4ds.dialects.base import DatabaseDialect
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog
+from fhir4ds.fhirpath.sql.executor import FHIRPathExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_MS = 5.0
+DEFAULT_MAX_BATCH_SIZE = 1000
+
+
+class _Batch:
+    """Requests waiting for one ``(resource type, expression)`` query."""
+
+    __slots__ = ("deadline", "requests")
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.requests: List[Tuple[str, Future, float]] = []
+
+
+class MicroBatcher:
+    """Coalesces per-patient evaluations of the same expression into one query.
+
+    Args:
+        dialect: Database dialect queries run on
+        catalog: Storage catalog with a CompartmentIndex covering the
+            resource types requests are made for
+        window_ms: How long the first request of a batch waits for others
+        max_batch_size: Patients per query; a full batch is dispatched at once
+
+    Raises:
+        ValueError: If the catalog has no CompartmentIndex
+    """
+
+    def __init__(self, dialect: DatabaseDialect, catalog: StorageCatalog, *,
+                 window_ms: float = DEFAULT_WINDOW_MS, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        if catalog is None or catalog.compartment_index is None:
+            raise ValueError("Micro-batching requires a catalog with a CompartmentIndex")
+        if window_ms < 0 or max_batch_size < 1:
+            raise ValueError("window_ms must be non-negative and max_batch_size positive")
+        self.dialect = dialect
+        self.catalog = catalog
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self._executors: Dict[str, FHIRPathExecutor] = {}
+        self._pending: "OrderedDict[Tuple[str, str], _Batch]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._requests = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._largest_batch = 0
+        self._batched_requests = 0
+        self._wait_seconds = 0.0
+        self._query_seconds = 0.0
+        self._thread = threading.Thread(target=self._dispatch, name="fhir4ds-micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, resource_type: str, expression: str, patient: str) -> "Future[Dict[str, List[Any]]]":
+        """Queue ``expression`` for ``patient``'s ``resource_type`` resources.
+
+        The future resolves to the patient's results by resource id, as
+        ``{resource_id: [values]}`` (resources without results left out), or
+        to the FHIRPathExecutionError of the batch's query.
+        """
+        future: "Future[Dict[str, List[Any]]]" = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            now = time.perf_counter()
+            key = (resource_type, expression)
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(now + self.window_ms / 1000.0)
+            batch.requests.append((patient, future, now))
+            self._requests += 1
+            if len(batch.requests) == 1 or len(batch.requests) >= self.max_batch_size:
+                self._condition.notify()
+        return future
+
+    def evaluate(self, resource_type: str, expression: str, patient: str,
+                 timeout: Optional[float] = None) -> Dict[str, List[Any]]:
+        """Evaluate ``expression`` for one patient, waiting for its batch (see :meth:`submit`)."""
+        return self.submit(resource_type, expression, patient).result(timeout)
+
+    def close(self) -> None:
+        """Dispatch the batches still waiting and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self) -> "MicroBatcher":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Request, batch and timing counters since the batcher started."""
+        with self._condition:
+            batches = self._batches
+            return {
+                "requests": self._requests,
+                "pending": sum(len(batch.requests) for batch in self._pending.values()),
+                "batches": batches,
+                "failed_batches": self._failed_batches,
+                "largest_batch": self._largest_batch,
+                "mean_batch_size": self._batched_requests / batches if batches else 0.0,
+                "mean_wait_ms": self._wait_seconds * 1000.0 / self._batched_requests if self._batched_requests else 0.0,
+                "mean_query_ms": self._query_seconds * 1000.0 / batches if batches else 0.0,
+            }
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if not self._pending:
+                        if self._closed:
+                            return
+                        self._condition.wait()
+                        continue
+                    key, batch = self._next_batch()
+                    delay = batch.deadline - time.perf_counter()
+                    if self._closed or delay <= 0 or len(batch.requests) >= self.max_batch_size:
+                        break
+                    self._condition.wait(delay)
+                requests = batch.requests[:self.max_batch_size]
+                if len(batch.requests) > len(requests):
+                    del batch.requests[:self.max_batch_size]
+                else:
+                    del self._pending[key]
+            try:
+                self._run(key, requests)
+            except Exception:
+                logger.exception("Dispatching a batch of %d requests for %r failed", len(requests), key)
+
+    def _next_batch(self) -> Tuple[Tuple[str, str], _Batch]:
+        """A full batch if there is one, else the one waiting longest."""
+        for key, batch in self._pending.items():
+            if len(batch.requests) >= self.max_batch_size:
+                return key, batch
+        return next(iter(self._pending.items()))
+
+    def _run(self, key: Tuple[str, str], requests: List[Tuple[str, Future, float]]) -> None:
+        resource_type, expression = key
+        requests = [request for request in requests if request[1].set_running_or_notify_cancel()]
+        if not requests:
+            return
+        started = time.perf_counter()
+        patients = list(dict.fromkeys(patient for patient, _, _ in requests))
+        try:
+            results = self._query(resource_type, expression, patients)
+        except Exception as exc:
+            logger.debug("Batch of %d %s requests for %r failed: %s", len(requests), resource_type, expression, exc)
+            for _, future, _ in requests:
+                future.set_exception(exc)
+            failed = True
+        else:
+            for patient, future, _ in requests:
+                future.set_result({resource_id: list(values) for resource_id, values in results.get(patient, {}).items()})
+            failed = False
+        finished = time.perf_counter()
+        logger.debug("Answered %d %s requests for %r with one query in %.1fms",
+                     len(requests), resource_type, expression, (finished - started) * 1000.0)
+        with self._condition:
+            self._batches += 1
+            self._failed_batches += failed
+            self._largest_batch = max(self._largest_batch, len(requests))
+            self._batched_requests += len(requests)
+            self._wait_seconds += sum(started - submitted for _, _, submitted in requests)
+            self._query_seconds += finished - started
+
+    def _query(self, resource_type: str, expression: str,
+               patients: List[str]) -> Dict[str, Dict[str, List[Any]]]:
+        """Results of ``expression`` for ``patients``, as ``{patient: {resource_id: [values]}}``."""
+        executor = self._executors.get(resource_type)
+        if executor is None:
+            executor = self._executors[resource_type] = FHIRPathExecutor(
+                self.dialect, resource_type, catalog=self.catalog)
+        by_resource: Dict[str, List[Any]] = {}
+        for row in executor.execute(expression, patients=patients):
+            by_resource.setdefault(row[0], []).append(row[-1])
+        results: Dict[str, Dict[str, List[Any]]] = {}
+        if by_resource:
+            index = self.catalog.compartment_index
+            for patient, resource_id in self.dialect.execute_query(index.memberships_query(resource_type, patients)):
+                if resource_id in by_resource:
+                    results.setdefault(patient, {})[resource_id] = by_resource[resource_id]
+        return results
@@ -0,0 +1,462 @@
+"""Storage catalog mapping FHIR resource types to physical tables.
+
+Translated FHIRPath reads a logical ``resource`` relation with ``id`` and
+``resource`` columns. A :class:`StorageCatalog` tells the translator where
+the rows of each resource type physically live, and the translator defines
+``resource`` as a CTE over exactly those rows, so a query anchored on
+``Observation`` never reads ``Patient`` rows.
+
+Three layouts are supported:
+
+- **Per-type tables** (the NDJSON loader layout): ``Patient``,
+  ``Observation``... each with ``id`` and ``resource`` columns.
+- **One shared table partitioned by resourceType**: the mapping filters on
+  the type column. PostgreSQL prunes to the matching LIST partition; DuckDB
+  skips row groups through zone maps when rows are loaded grouped by type,
+  as the loaders do.
+- **Hive-partitioned Parquet** (see ParquetStore): each type is read in
+  place with ``read_parquet`` from its ``resource_type=<Type>`` directory,
+  so other types' files are never opened.
+
+Mappings may carry key columns extracted at load time (for example the
+``subject.reference`` of an Observation). They are projected next to ``id``
+and ``resource`` so generated SQL can filter and join on plain columns;
+callers may project only the key columns a query references. A catalog
+built with an ExtractionProfile adds typed columns (such as a ``TIMESTAMP``
+clinical date) and side tables (such as one row per ``code.coding`` item)
+derived from the FHIR search parameters, one with a ReferenceIndex
+maintains an edge table of the literal references between resources (used
+by ``resolve()``), and one with a CompartmentIndex maintains the Patient
+compartment membership used to restrict queries to given patients; the
+loaders keep all of them in sync with the resource JSON. A SearchIndex
+maintains the token, string, date, reference and quantity values of the FHIR
+search parameters, so :meth:`SearchIndex.search_query` can answer FHIR
+search URLs from them. A TerminologyStore names the value set, closure and
+concept map tables that ``memberOf()``, ``subsumes()`` and ``translate()``
+join. Passing a :class:`TableSample` to ``source_query()`` or ``relation()``
+reads a Bernoulli sample of a type's rows instead, for approximate queries.
+
+Example:
+    >>> catalog = StorageCatalog.partitioned("fhir_resources",
+    ...                                      key_columns={"subject_ref": "subject.reference"})
+    >>> catalog.source_query("Observation")
+    "SELECT id, resource, subject_ref FROM fhir_resources WHERE resource_type = 'Observation'"
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from fhir4ds.dialects.base import DatabaseDialect
+from .extraction import ExtractedColumn, ExtractionProfile, SideTable
+from .compartments import CompartmentIndex
+from .references import ReferenceIndex
+from .search import SearchIndex
+from .terminology import TerminologyStore
+
+# Name of the logical relation the translator reads resources from
+SOURCE_RELATION = "resource"
+
+DEFAULT_PARTITIONED_TABLE = "fhir_resources"
+DEFAULT_TYPE_COLUMN = "resource_type"
+
+# Resource types that are reserved words in SQL and cannot name a table as is
+_RESERVED_TYPES = frozenset({"Binary", "Group"})
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_ELEMENT_PATH = re.compile(r"^[A-Za-z][A-Za-z0-9]*(\.[A-Za-z][A-Za-z0-9]*)*$")
+
+
+@dataclass(frozen=True)
+class TableSample:
+    """Bernoulli sample of a table's rows, for approximate queries.
+
+    Attributes:
+        rate: Probability of keeping each row, in (0, 1]
+        seed: Makes the sample repeatable for the same data
+    """
+
+    rate: float
+    seed: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        if not 0 < self.rate <= 1:
+            raise ValueError(f"Sample rate must be in (0, 1], got {self.rate}")
+
+    def relation(self, dialect: DatabaseDialect, table: str) -> str:
+        """FROM-clause relation sampling ``table``."""
+        return dialect.generate_table_sample(table, self.rate * 100, self.seed)
+
+
+@dataclass
+class TableMapping:
+    """Physical location of one resource type.
+
+    Attributes:
+        resource_type: FHIR resource type stored by this mapping
+        table: Table (or view) holding the rows
+        id_column: Column with the resource id
+        resource_column: Column with the resource JSON
+        type_column: For shared tables, the column holding ``resourceType``
+        key_columns: Extracted columns, column name -> element path relative
+            to the resource (e.g. ``{"subject_ref": "subject.reference"}``)
+        paths: Parquet files or globs holding the rows; when set, rows are
+            read with the dialect's Parquet scan and ``table`` only names
+            the mapping
+        extracted: Typed columns from an ExtractionProfile
+        side_tables: Side tables (``<table>_<name>``) from an ExtractionProfile
+    """
+
+    resource_type: str
+    table: str
+    id_column: str = "id"
+    resource_column: str = "resource"
+    type_column: Optional[str] = None
+    key_columns: Dict[str, str] = field(default_factory=dict)
+    paths: List[str] = field(default_factory=list)
+    extracted: List[ExtractedColumn] = field(default_factory=list)
+    side_tables: List[SideTable] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        names = [self.resource_type, self.table, self.id_column, self.resource_column,
+                 *self.key_columns]
+        if self.type_column is not None:
+            names.append(self.type_column)
+        for name in names:
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"Invalid identifier in storage mapping: {name!r}")
+        for path in self.key_columns.values():
+            if not _ELEMENT_PATH.match(path):
+                raise ValueError(f"Invalid key column path: {path!r}")
+
+    @property
+    def is_plain(self) -> bool:
+        """True when the table already has exactly the ``id``/``resource`` shape."""
+        return (self.type_column is None and self.id_column == "id"
+                and self.resource_column == "resource" and not self.key_columns
+                and not self.paths and not self.extracted)
+
+    def columns(self) -> List[ExtractedColumn]:
+        """Key columns followed by the profile's extracted columns."""
+        columns = {column: ExtractedColumn(column, (path,)) for column, path in self.key_columns.items()}
+        for column in self.extracted:
+            columns.setdefault(column.name, column)
+        return list(columns.values())
+
+    def column_for_path(self, path: str) -> Optional[str]:
+        """Column holding exactly the JSON text at ``path``, if any."""
+        for column in self.columns():
+            if column.exact_path == path:
+                return column.name
+        return None
+
+    def source_query(self, dialect: Optional[DatabaseDialect] = None,
+                     key_columns: Optional[Iterable[str]] = None,
+                     sample: Optional[TableSample] = None) -> str:
+        """SELECT returning ``id``, ``resource`` and key columns for this type only.
+
+        Args:
+            dialect: Dialect rendering the Parquet scan (required for Parquet
+                mappings and samples)
+            key_columns: Key columns to project; None projects all of them
+            sample: Read only a sample of the rows
+        """
+        names = [column.name for column in self.columns()]
+        projected = names if key_columns is None else [
+            column for column in names if column in set(key_columns)
+        ]
+        columns = [
+            self.id_column if self.id_column == "id" else f"{self.id_column} AS id",
+            self.resource_column if self.resource_column == "resource" else f"{self.resource_column} AS resource",
+            *projected,
+        ]
+        if self.paths:
+            if dialect is None:
+                raise ValueError(f"Reading Parquet storage for '{self.resource_type}' requires a dialect")
+            source = dialect.generate_parquet_scan(self.paths)
+        else:
+            source = self.table
+        if sample is not None:
+            if dialect is None:
+                raise ValueError(f"Sampling storage for '{self.resource_type}' requires a dialect")
+            source = sample.relation(dialect, source)
+        query = f"SELECT {', '.join(columns)} FROM {source}"
+        if self.type_column:
+            query += f" WHERE {self.type_column} = '{self.resource_type}'"
+        return query
+
+    def relation(self, dialect: Optional[DatabaseDialect] = None,
+                 key_columns: Optional[Iterable[str]] = None,
+                 sample: Optional[TableSample] = None) -> str:
+        """Table name, or parenthesised source query, usable in a FROM clause."""
+        if self.is_plain and sample is None:
+            return self.table
+        return f"({self.source_query(dialect, key_columns, sample)})"
+
+
+class StorageCatalog:
+    """Resolves FHIR resource types to the tables that store them.
+
+    Types registered explicitly take precedence; other types fall back to the
+    catalog's default layout (a table named after the type, unless a shared
+    partitioned table was registered for all types).
+
+    Example:
+        >>> catalog = StorageCatalog()                       # Patient -> Patient, ...
+        >>> catalog.add_table("Observation", "obs_2024", key_columns={"subject_ref": "subject.reference"})
+        >>> executor = FHIRPathExecutor(dialect, "Observation", catalog=catalog)
+    """
+
+    def __init__(self, per_type_default: bool = True, profile: Optional[ExtractionProfile] = None,
+                 reference_index: Optional[ReferenceIndex] = None,
+                 compartment_index: Optional[CompartmentIndex] = None,
+                 terminology: Optional[TerminologyStore] = None,
+                 search_index: Optional[SearchIndex] = None):
+        """Initialize an empty catalog.
+
+        Args:
+            per_type_default: Map unregistered types to a table named after
+                the type (``id``/``resource`` columns); when False they raise
+            profile: Columns and side tables extracted at load time for the
+                tables of this catalog (not for Parquet mappings)
+            reference_index: Reference edges maintained at load time
+            compartment_index: Patient compartment membership maintained at load time
+            terminology: Terminology tables (filled by TerminologyLoader)
+            search_index: Search parameter values maintained at load time
+        """
+        self._mappings: Dict[str, TableMapping] = {}
+        self._default: Optional[TableMapping] = None
+        self._per_type_default = per_type_default
+        self.profile = profile
+        self.reference_index = reference_index
+        self.compartment_index = compartment_index
+        self.terminology = terminology
+        self.search_index = search_index
+
+    @classmethod
+    def partitioned(cls, table: str = DEFAULT_PARTITIONED_TABLE, type_column: str = DEFAULT_TYPE_COLUMN,
+                    key_columns: Optional[Dict[str, str]] = None,
+                    profile: Optional[ExtractionProfile] = None,
+                    reference_index: Optional[ReferenceIndex] = None,
+                    compartment_index: Optional[CompartmentIndex] = None,
+                    terminology: Optional[TerminologyStore] = None,
+                    search_index: Optional[SearchIndex] = None) -> "StorageCatalog":
+        """Catalog storing every resource type in one table partitioned by type."""
+        catalog = cls(per_type_default=False, profile=profile, reference_index=reference_index,
+                      compartment_index=compartment_index, terminology=terminology,
+                      search_index=search_index)
+        catalog.add_partitioned_table(table, type_column=type_column, key_columns=key_columns)
+        return catalog
+
+    def add_table(self, resource_type: str, table: Optional[str] = None, *, id_column: str = "id",
+                  resource_column: str = "resource",
+                  key_columns: Optional[Dict[str, str]] = None) -> TableMapping:
+        """Store ``resource_type`` in its own table (see per_type_table() for the default name)."""
+        mapping = TableMapping(resource_type, table or per_type_table(resource_type), id_column,
+                               resource_column, key_columns=dict(key_columns or {}))
+        self._mappings[resource_type] = mapping
+        return mapping
+
+    def add_partitioned_table(self, table: str, resource_types: Optional[List[str]] = None, *,
+                              type_column: str = DEFAULT_TYPE_COLUMN, id_column: str = "id",
+                              resource_column: str = "resource",
+                              key_columns: Optional[Dict[str, str]] = None) -> None:
+        """Store several types in one table filtered on ``type_column``.
+
+        Args:
+            table: Shared table
+            resource_types: Types stored there; None makes it the default for
+                every type not registered otherwise
+            type_column: Column holding the ``resourceType``
+        """
+        def mapping(resource_type: str) -> TableMapping:
+            return TableMapping(resource_type, table, id_column, resource_column, type_column,
+                                dict(key_columns or {}))
+
+        if resource_types is None:
+            self._default = mapping("Resource")
+            return
+        for resource_type in resource_types:
+            self._mappings[resource_type] = mapping(resource_type)
+
+    def resolve(self, resource_type: str) -> TableMapping:
+        """Return the mapping for ``resource_type``.
+
+        Raises:
+            ValueError: If the type is not mapped and the catalog has no default
+        """
+        mapping = self._mappings.get(resource_type)
+        if mapping is None and self._default is not None:
+            default = self._default
+            mapping = TableMapping(resource_type, default.table, default.id_column, default.resource_column,
+                                   default.type_column, dict(default.key_columns))
+        if mapping is None and self._per_type_default:
+            mapping = TableMapping(resource_type, per_type_table(resource_type))
+        if mapping is None:
+            raise ValueError(f"No storage mapping for resource type '{resource_type}'")
+        if self.profile is None or mapping.paths:
+            return mapping
+        return TableMapping(mapping.resource_type, mapping.table, mapping.id_column, mapping.resource_column,
+                            mapping.type_column, dict(mapping.key_columns),
+                            extracted=self.profile.columns_for(resource_type),
+                            side_tables=self.profile.side_tables_for(resource_type))
+
+    def add_parquet(self, resource_type: str, paths: List[str], *,
+                    key_columns: Optional[Dict[str, str]] = None) -> TableMapping:
+        """Read ``resource_type`` in place from Parquet files (``id``/``resource`` columns)."""
+        if not paths:
+            raise ValueError(f"No Parquet paths given for resource type '{resource_type}'")
+        mapping = TableMapping(resource_type, resource_type, key_columns=dict(key_columns or {}),
+                               paths=list(paths))
+        self._mappings[resource_type] = mapping
+        return mapping
+
+    def source_query(self, resource_type: str, dialect: Optional[DatabaseDialect] = None,
+                     key_columns: Optional[Iterable[str]] = None,
+                     sample: Optional[TableSample] = None) -> str:
+        return self.resolve(resource_type).source_query(dialect, key_columns, sample)
+
+    def relation(self, resource_type: str, dialect: Optional[DatabaseDialect] = None,
+                 key_columns: Optional[Iterable[str]] = None,
+                 sample: Optional[TableSample] = None) -> str:
+        return self.resolve(resource_type).relation(dialect, key_columns, sample)
+
+    def create_statements(self, dialect: DatabaseDialect, resource_type: str) -> List[str]:
+        """DDL creating the storage for ``resource_type`` if it does not exist.
+
+        For shared tables this also adds the type's partition on dialects with
+        declarative partitioning. With a reference index, the edge table and
+        the storage of every type the references may point to are created
+        too, so ``resolve()`` can join them before they are loaded. With a
+        compartment or search index, its tables are created.
+        """
+        statements = self._storage_statements(dialect, resource_type)
+        for index in self._indexes():
+            statements.extend(index.create_statements())
+        if self.reference_index is not None:
+            for target in self.reference_index.target_types(resource_type):
+                if target != resource_type and not self.resolve(target).paths:
+                    statements.extend(self._storage_statements(dialect, target))
+        return statements
+
+    def _indexes(self) -> List[Union[ReferenceIndex, CompartmentIndex, SearchIndex]]:
+        """The reference, compartment and search indexes maintained with the stored rows."""
+        return [index for index in (self.reference_index, self.compartment_index, self.search_index)
+                if index is not None]
+
+    def _storage_statements(self, dialect: DatabaseDialect, resource_type: str) -> List[str]:
+        mapping = self.resolve(resource_type)
+        if mapping.paths:
+            raise ValueError(f"'{resource_type}' is stored in Parquet files; write it with ParquetStore")
+        # A shared table holds the columns of every type it stores
+        extracted = mapping.columns()
+        if mapping.type_column is not None and self.profile is not None:
+            extracted += [column for column in self.profile.all_columns()
+                          if column.name not in {existing.name for existing in extracted}]
+        columns: List[Tuple[str, str]] = [
+            (mapping.id_column, "VARCHAR"),
+            (mapping.resource_column, dialect.json_type),
+            *((column.name, column.sql_type) for column in extracted),
+        ]
+        if mapping.type_column is None:
+            definitions = ", ".join(f"{name} {sql_type}" for name, sql_type in columns)
+            statements = [f"CREATE TABLE IF NOT EXISTS {mapping.table} ({definitions})"]
+        else:
+            statements = dialect.generate_partitioned_table_ddl(
+                mapping.table, [(mapping.type_column, "VARCHAR NOT NULL"), *columns],
+                mapping.type_column, [resource_type],
+            )
+        # Tables created before the profile changed gain its new columns
+        statements.extend(
+            f"ALTER TABLE {mapping.table} ADD COLUMN IF NOT EXISTS {column.name} {column.sql_type}"
+            for column in mapping.extracted
+        )
+        for side_table in mapping.side_tables:
+            side_columns = [(mapping.id_column, "VARCHAR")]
+            if mapping.type_column:
+                side_columns.append((mapping.type_column, "VARCHAR"))
+            side_columns.extend((column, "VARCHAR") for column, _ in side_table.columns)
+            definitions = ", ".join(f"{name} {sql_type}" for name, sql_type in side_columns)
+            statements.append(f"CREATE TABLE IF NOT EXISTS {side_table.table_name(mapping.table)} ({definitions})")
+        return statements
+
+    def key_column_expressions(self, dialect: DatabaseDialect, resource_type: str,
+                               json_column: str = "resource") -> List[Tuple[str, str]]:
+        """(column, SQL extracting it from ``json_column``) for each key and extracted column."""
+        mapping = self.resolve(resource_type)
+        return [(column.name, column.expression(dialect, json_column)) for column in mapping.columns()]
+
+    def side_table_inserts(self, dialect: DatabaseDialect, resource_type: str, source: str,
+                           id_column: str = "id", json_column: str = "resource") -> List[str]:
+        """INSERTs filling the side tables, reference edges, compartments and search index of ``resource_type``.
+
+        Args:
+            source: Table or parenthesised query with the resources to index
+            id_column: Column of ``source`` with the resource id
+            json_column: Column of ``source`` with the resource JSON
+        """
+        mapping = self.resolve(resource_type)
+        statements = []
+        for side_table in mapping.side_tables:
+            items = dialect.as_json_collection(
+                dialect.extract_json_path_value(f"src.{json_column}", side_table.collection.split("."))
+            )
+            target = [mapping.id_column]
+            values = [f"src.{id_column}"]
+            if mapping.type_column:
+                target.append(mapping.type_column)
+                values.append(f"'{resource_type}'")
+            for column, member in side_table.columns:
+                target.append(column)
+                values.append(dialect.extract_json_string("item.value", f"$.{member}"))
+            statements.append(
+                f"INSERT INTO {side_table.table_name(mapping.table)} ({', '.join(target)}) "
+                f"SELECT {', '.join(values)} FROM {source} AS src "
+                f"{dialect.generate_lateral_json_collection(items, 'item')}"
+            )
+        for index in self._indexes():
+            statements.extend(index.insert_statements(dialect, resource_type, source, id_column, json_column))
+        return statements
+
+    def backfill_statements(self, dialect: DatabaseDialect, resource_type: str) -> List[str]:
+        """Statements recomputing the extracted columns and side tables of stored rows.
+
+        Needed once for rows loaded before the profile gained a column.
+        """
+        mapping = self.resolve(resource_type)
+        statements = self.create_statements(dialect, resource_type)
+        assignments = [f"{column} = {expression}" for column, expression
+                       in self.key_column_expressions(dialect, resource_type, mapping.resource_column)]
+        if assignments:
+            where = f" WHERE {mapping.type_column} = '{resource_type}'" if mapping.type_column else ""
+            statements.append(f"UPDATE {mapping.table} SET {', '.join(assignments)}{where}")
+        statements.extend(self.side_table_deletes(resource_type))
+        statements.extend(self.side_table_inserts(
+            dialect, resource_type, f"({mapping.source_query(dialect, [])})",
+        ))
+        return statements
+
+    def side_table_deletes(self, resource_type: str, ids_query: Optional[str] = None) -> List[str]:
+        """DELETEs removing the side rows, reference edges, compartments and search index rows of ``resource_type``.
+
+        Only the rows of ``ids_query`` ids are removed, if given.
+        """
+        mapping = self.resolve(resource_type)
+        conditions = []
+        if mapping.type_column:
+            conditions.append(f"{mapping.type_column} = '{resource_type}'")
+        if ids_query is not None:
+            conditions.append(f"{mapping.id_column} IN ({ids_query})")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        statements = [f"DELETE FROM {side_table.table_name(mapping.table)}{where}"
+                      for side_table in mapping.side_tables]
+        for index in self._indexes():
+            statements.extend(index.delete_statements(resource_type, ids_query))
+        return statements
+
+
+def per_type_table(resource_type: str) -> str:
+    """Default table of a resource type: its name, suffixed if it is an SQL reserved word."""
+    return f"{resource_type}_resources" if resource_type in _RESERVED_TYPES else resource_type
@@ -0,0 +1,281 @@
+"""Cohort bitmaps: patient populations as in-memory sets.
+
+Cohort definitions combine inclusion and exclusion criteria with and/or/not
+("diabetics over 65 without a retinal exam"), and explorations re-combine
+the same criteria many times. A :class:`CohortEngine` evaluates each
+FHIRPath criterion once, in the database, into a :class:`Cohort`: a
+compressed bitmap over the dense patient ordinals the catalog's
+CompartmentIndex assigns at load time. Combinations, counts and samples are
+then set operations on bitmaps in memory, without another query. Criteria
+bitmaps are kept in an LRU cache.
+
+A criterion is a Boolean FHIRPath expression on one resource type; a
+patient is in its cohort when the expression is true for at least one
+resource in the patient's compartment (for ``Patient`` criteria, for the
+patient itself).
+
+Bitmaps are `pyroaring <https://pypi.org/project/pyroaring/>`_ BitMaps
+when it is installed, otherwise Python integers used as bitsets, which
+support the same operations at a higher memory cost for sparse cohorts.
+
+Example:
+    >>> engine = CohortEngine(dialect, catalog)
+    >>> diabetic = engine.criterion("Condition", "code.coding.where(code = '44054006').exists()")
+    >>> elderly = engine.criterion("Patient", "birthDate < @1960-01-01")
+    >>> cohort = diabetic & elderly & ~engine.criterion("Procedure", "status = 'completed'")
+    >>> len(cohort), cohort.sample(5, seed=1)
+    (1204, ['p1093', 'p2207', ...])
+    >>> cohort.to_table("study_cohort")     # for downstream joins
+"""
+
+from __future__ import annotations
+
+import random
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fhir4ds.dialects.base import DatabaseDialect
+
+from .catalog import StorageCatalog
+from .compartments import CompartmentIndex
+from .executor import FHIRPathExecutor
+from .search import string_literal
+from .terminology import INSERT_BATCH_SIZE
+
+# Optional compressed bitmaps
+try:
+    from pyroaring import BitMap
+    PYROARING_AVAILABLE = True
+except ImportError:
+    BitMap = None
+    PYROARING_AVAILABLE = False
+
+DEFAULT_COHORT_CACHE_SIZE = 256
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class Cohort:
+    """A set of patients, as a bitmap of their ordinals.
+
+    Cohorts combine with ``&`` (and), ``|`` (or), ``-`` (and not), ``^``
+    and ``~`` (patients not in the cohort); ``len()`` counts them.
+    """
+
+    def __init__(self, engine: CohortEngine, bits: Any):
+        self.engine = engine
+        self._bits = bits
+
+    def __len__(self) -> int:
+        if PYROARING_AVAILABLE:
+            return len(self._bits)
+        return bin(self._bits).count("1")
+
+    def __contains__(self, patient_id: str) -> bool:
+        ordinal = self.engine._ordinal(patient_id)
+        if ordinal is None:
+            return False
+        if PYROARING_AVAILABLE:
+            return ordinal in self._bits
+        return bool(self._bits >> ordinal & 1)
+
+    def __iter__(self) -> Iterator[str]:
+        ids = self.engine._patient_ids()
+        return (ids[ordinal] for ordinal in self.ordinals())
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Cohort) and self._bits == other._bits
+
+    def __and__(self, other: Cohort) -> Cohort:
+        return Cohort(self.engine, self._bits & other._bits)
+
+    def __or__(self, other: Cohort) -> Cohort:
+        return Cohort(self.engine, self._bits | other._bits)
+
+    def __xor__(self, other: Cohort) -> Cohort:
+        return Cohort(self.engine, self._bits ^ other._bits)
+
+    def __sub__(self, other: Cohort) -> Cohort:
+        if PYROARING_AVAILABLE:
+            return Cohort(self.engine, self._bits - other._bits)
+        return Cohort(self.engine, self._bits & ~other._bits)
+
+    def __invert__(self) -> Cohort:
+        return self.engine.patients() - self
+
+    def __repr__(self) -> str:
+        return f"Cohort({len(self)} patients)"
+
+    def ordinals(self) -> List[int]:
+        """Ordinals of the cohort's patients, ascending."""
+        if PYROARING_AVAILABLE:
+            return list(self._bits)
+        return _bitset_ordinals(self._bits)
+
+    def patient_ids(self) -> List[str]:
+        """Ids of the cohort's patients, in ordinal order."""
+        return list(self)
+
+    def sample(self, size: int, seed: Optional[int] = None) -> List[str]:
+        """Ids of ``size`` patients drawn without replacement (all of them if fewer)."""
+        count = len(self)
+        ranks = sorted(random.Random(seed).sample(range(count), min(size, count)))
+        ids = self.engine._patient_ids()
+        if PYROARING_AVAILABLE:
+            return [ids[self._bits[rank]] for rank in ranks]
+        ordinals = self.ordinals()
+        return [ids[ordinals[rank]] for rank in ranks]
+
+    def to_table(self, table: str, temporary: bool = False) -> int:
+        """Write the cohort's patient ids to ``table`` (replacing it); returns the row count.
+
+        Args:
+            table: Table of one ``patient_id`` column
+            temporary: Create a temporary table; only for dialects running
+                every statement on one connection (DuckDB), as pooled
+                PostgreSQL connections do not share temporary tables
+        """
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Invalid table name: {table!r}")
+        # Multi-row INSERTs of bounded size rather than one statement of every id
+        ids = self.patient_ids()
+        statements = [
+            f"DROP TABLE IF EXISTS {table}",
+            f"CREATE {'TEMPORARY ' if temporary else ''}TABLE {table} (patient_id VARCHAR)",
+        ]
+        for start in range(0, len(ids), INSERT_BATCH_SIZE):
+            values = ", ".join(f"({string_literal(patient_id)})"
+                               for patient_id in ids[start:start + INSERT_BATCH_SIZE])
+            statements.append(f"INSERT INTO {table} (patient_id) VALUES {values}")
+        self.engine.dialect.execute_transaction(statements)
+        return len(ids)
+
+
+class CohortEngine:
+    """Evaluates criteria into cached cohort bitmaps.
+
+    Args:
+        dialect: Database holding the resources
+        catalog: Storage catalog with a CompartmentIndex covering
+            ``Patient`` and the criteria's resource types
+        cache_size: Maximum number of criterion bitmaps kept (LRU order)
+    """
+
+    def __init__(self, dialect: DatabaseDialect, catalog: StorageCatalog,
+                 cache_size: int = DEFAULT_COHORT_CACHE_SIZE):
+        index = catalog.compartment_index
+        if index is None or not index.contains("Patient"):
+            raise ValueError("Cohorts need a catalog with a CompartmentIndex covering Patient")
+        self.dialect = dialect
+        self.catalog = catalog
+        self.index: CompartmentIndex = index
+        self._cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[Tuple[str, str], Cohort]" = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._ids: List[str] = []
+        self._ordinals: Dict[str, int] = {}
+
+    def criterion(self, resource_type: str, expression: str) -> Cohort:
+        """Patients with a ``resource_type`` resource for which ``expression`` is true."""
+        if resource_type != "Patient" and not self.index.contains(resource_type):
+            raise ValueError(f"'{resource_type}' resources are not in the Patient compartment")
+        return self._cached((resource_type, expression), lambda: self._criterion_query(resource_type, expression))
+
+    def patients(self) -> Cohort:
+        """Every stored patient."""
+        relation = self.catalog.relation("Patient", self.dialect)
+        return self._cached(("Patient", ""), lambda: (
+            f"SELECT m.ordinal FROM {self.index.patient_table} AS m "
+            f"WHERE m.patient_id IN (SELECT r.id FROM {relation} AS r)"))
+
+    def from_patient_ids(self, patient_ids: Iterable[str]) -> Cohort:
+        """Cohort of the given (loaded) patients; unknown ids are ignored."""
+        ordinals = (self._ordinal(patient_id) for patient_id in patient_ids)
+        return Cohort(self, _bitmap(ordinal for ordinal in ordinals if ordinal is not None))
+
+    def from_query(self, query: str) -> Cohort:
+        """Cohort of the patients whose ids ``query`` selects (first column; not cached)."""
+        return Cohort(self, self._evaluate(
+            f"SELECT m.ordinal FROM {self.index.patient_table} AS m WHERE m.patient_id IN ({query})"))
+
+    def clear(self) -> None:
+        """Forget cached bitmaps and ordinals, e.g. after loading resources."""
+        self._cache.clear()
+        self._ids, self._ordinals = [], {}
+
+    def get_statistics(self) -> Dict[str, int]:
+        """Cache size, hits and misses."""
+        return {
+            "cache_size": len(self._cache),
+            "cache_hits": self._cache_hits,
+            "cache_misses": self._cache_misses,
+        }
+
+    def _criterion_query(self, resource_type: str, expression: str) -> str:
+        sql = FHIRPathExecutor(self.dialect, resource_type, catalog=self.catalog).to_sql(expression)
+        matches = f"(SELECT c.id FROM ({sql.rstrip().rstrip(';')}) AS c WHERE c.result)"
+        if resource_type == "Patient":
+            return f"SELECT m.ordinal FROM {self.index.patient_table} AS m WHERE m.patient_id IN {matches}"
+        return (f"SELECT DISTINCT m.ordinal FROM {self.index.table} AS k "
+                f"JOIN {self.index.patient_table} AS m ON m.patient_id = k.patient_id "
+                f"WHERE k.resource_type = '{resource_type}' AND k.resource_id IN {matches}")
+
+    def _cached(self, key: Tuple[str, str], query) -> Cohort:
+        cohort = self._cache.get(key)
+        if cohort is not None:
+            self._cache.move_to_end(key)
+            self._cache_hits += 1
+            return cohort
+        self._cache_misses += 1
+        cohort = Cohort(self, self._evaluate(query()))
+        if self._cache_size:
+            self._cache[key] = cohort
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return cohort
+
+    def _evaluate(self, query: str) -> Any:
+        ordinals = [row[0] for row in self.dialect.execute_query(query)]
+        if ordinals and max(ordinals) >= len(self._ids):
+            # Patients loaded since the ordinals were read
+            self._ids, self._ordinals = [], {}
+        return _bitmap(ordinals)
+
+    def _patient_ids(self) -> List[str]:
+        """Patient id of every ordinal, read when first needed and after new patients appear."""
+        if not self._ids:
+            rows = self.dialect.execute_query(f"SELECT patient_id, ordinal FROM {self.index.patient_table}")
+            ids: List[Any] = [None] * (max((row[1] for row in rows), default=-1) + 1)
+            for patient_id, ordinal in rows:
+                ids[ordinal] = patient_id
+            self._ids = ids
+            self._ordinals = {patient_id: ordinal for patient_id, ordinal in rows}
+        return self._ids
+
+    def _ordinal(self, patient_id: str) -> Optional[int]:
+        self._patient_ids()
+        return self._ordinals.get(patient_id)
+
+
+def _bitmap(ordinals: Iterable[int]) -> Any:
+    if PYROARING_AVAILABLE:
+        return BitMap(ordinals)
+    bits = bytearray()
+    for ordinal in ordinals:
+        position = ordinal >> 3
+        if position >= len(bits):
+            bits.extend(bytes(position - len(bits) + 1))
+        bits[position] |= 1 << (ordinal & 7)
+    return int.from_bytes(bytes(bits), "little")
+
+
+def _bitset_ordinals(bits: int) -> List[int]:
+    ordinals = []
+    for position, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        while byte:
+            low = byte & -byte
+            ordinals.append(position * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ordinals
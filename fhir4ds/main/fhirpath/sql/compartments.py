@@ -0,0 +1,292 @@
+"""Patient compartment membership for per-patient pruning.
+
+Patient-centric evaluation (one patient's measure, a care-gap check) only
+needs the resources in that patient's compartment. A
+:class:`CompartmentIndex` precomputes the membership at load time as rows
+of::
+
+    (patient_id, resource_type, resource_id)
+    ('p1', 'Observation', 'o1')
+
+following the FHIR R4 Patient CompartmentDefinition: a resource is in a
+patient's compartment when one of the listed search parameters references
+that Patient (``Observation.subject``, ``Encounter.subject``...). Each
+patient is in its own compartment, and in that of the patients it links
+to. Queries restricted with ``FHIRPathExecutor.execute(...,
+patients=[...])`` semi-join the ``resource`` relation with this table, so
+their cost scales with the patients' data instead of the store. On
+PostgreSQL, index the id column of the resource tables so the semi-join
+runs as index lookups; DuckDB hash-joins against the id column.
+
+The index also gives every loaded patient a dense integer ordinal
+(``<table>_patients``), assigned in load order and kept when the patient
+is deleted or reloaded, which cohort bitmaps are built over.
+
+Example:
+    >>> index = CompartmentIndex.from_compartment_definition(resource_types=["Observation"])
+    >>> index.paths_for("Observation")
+    ['performer', 'subject']
+    >>> catalog = StorageCatalog(compartment_index=index)
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fhir4ds.dialects.base import DatabaseDialect
+from .extraction import SEARCH_PARAMETERS_PATH, _expressions_for
+from .references import _reference_rows
+
+DEFAULT_COMPARTMENT_TABLE = "fhir4ds_compartments"
+
+MEMBERSHIP_COLUMNS = ("patient_id", "resource_type", "resource_id")
+
+# Search parameters placing a resource in a Patient compartment
+# (R4 CompartmentDefinition/patient; types without parameters are never members)
+PATIENT_COMPARTMENT: Dict[str, Tuple[str, ...]] = {
+    "Account": ("subject",),
+    "AdverseEvent": ("subject",),
+    "AllergyIntolerance": ("patient", "recorder", "asserter"),
+    "Appointment": ("actor",),
+    "AppointmentResponse": ("actor",),
+    "AuditEvent": ("patient",),
+    "Basic": ("patient", "author"),
+    "BodyStructure": ("patient",),
+    "CarePlan": ("patient", "performer"),
+    "CareTeam": ("patient", "participant"),
+    "ChargeItem": ("subject",),
+    "Claim": ("patient", "payee"),
+    "ClaimResponse": ("patient",),
+    "ClinicalImpression": ("subject",),
+    "Communication": ("subject", "sender", "recipient"),
+    "CommunicationRequest": ("subject", "sender", "recipient", "requester"),
+    "Composition": ("subject", "author", "attester"),
+    "Condition": ("patient", "asserter"),
+    "Consent": ("patient",),
+    "Coverage": ("policy-holder", "subscriber", "beneficiary", "payor"),
+    "CoverageEligibilityRequest": ("patient",),
+    "CoverageEligibilityResponse": ("patient",),
+    "DetectedIssue": ("patient",),
+    "DeviceRequest": ("subject", "performer"),
+    "DeviceUseStatement": ("subject",),
+    "DiagnosticReport": ("subject",),
+    "DocumentManifest": ("subject", "author", "recipient"),
+    "DocumentReference": ("subject", "author"),
+    "Encounter": ("patient",),
+    "EnrollmentRequest": ("subject",),
+    "EpisodeOfCare": ("patient",),
+    "ExplanationOfBenefit": ("patient", "payee"),
+    "FamilyMemberHistory": ("patient",),
+    "Flag": ("patient",),
+    "Goal": ("patient",),
+    "Group": ("member",),
+    "ImagingStudy": ("patient",),
+    "Immunization": ("patient",),
+    "ImmunizationEvaluation": ("patient",),
+    "ImmunizationRecommendation": ("patient",),
+    "Invoice": ("subject", "patient", "recipient"),
+    "List": ("subject", "source"),
+    "MeasureReport": ("patient",),
+    "Media": ("subject",),
+    "MedicationAdministration": ("patient", "performer", "subject"),
+    "MedicationDispense": ("subject", "patient", "receiver"),
+    "MedicationRequest": ("subject",),
+    "MedicationStatement": ("subject",),
+    "MolecularSequence": ("patient",),
+    "NutritionOrder": ("patient",),
+    "Observation": ("subject", "performer"),
+    "Patient": ("link",),
+    "Person": ("patient",),
+    "Procedure": ("patient", "performer"),
+    "Provenance": ("patient",),
+    "QuestionnaireResponse": ("subject", "author"),
+    "RelatedPerson": ("patient",),
+    "RequestGroup": ("subject", "participant"),
+    "ResearchSubject": ("individual",),
+    "RiskAssessment": ("subject",),
+    "Schedule": ("actor",),
+    "ServiceRequest": ("subject", "performer"),
+    "Specimen": ("subject",),
+    "SupplyDelivery": ("patient",),
+    "SupplyRequest": ("subject",),
+    "VisionPrescription": ("patient",),
+}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_COMPARTMENT = re.compile(r"^Patient/([A-Za-z0-9\-.]{1,64})$")
+
+
+class CompartmentIndex:
+    """Patient compartment reference paths per resource type and their membership table."""
+
+    def __init__(self, paths: Optional[Dict[str, List[str]]] = None,
+                 table: str = DEFAULT_COMPARTMENT_TABLE):
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Invalid compartment table: {table!r}")
+        self.table = table
+        self._paths = {resource_type: list(items) for resource_type, items in (paths or {}).items()}
+
+    def paths_for(self, resource_type: str) -> List[str]:
+        return list(self._paths.get(resource_type, []))
+
+    def contains(self, resource_type: str) -> bool:
+        """True when resources of ``resource_type`` can be compartment members."""
+        return resource_type in self._paths
+
+    @classmethod
+    def from_compartment_definition(cls, resource_types: Optional[Iterable[str]] = None,
+                                    search_parameters_path: Path = SEARCH_PARAMETERS_PATH,
+                                    definition: Optional[Dict[str, Tuple[str, ...]]] = None,
+                                    table: str = DEFAULT_COMPARTMENT_TABLE) -> "CompartmentIndex":
+        """Resolve the compartment parameters to element paths.
+
+        Args:
+            resource_types: Only these member types (all of the definition when None)
+            search_parameters_path: FHIR ``search-parameters.json`` Bundle
+            definition: Resource type -> search parameter codes; the R4
+                Patient compartment when None
+            table: Membership table name
+        """
+        definition = PATIENT_COMPARTMENT if definition is None else definition
+        wanted = set(resource_types) if resource_types is not None else None
+
+        with open(search_parameters_path, encoding="utf-8") as handle:
+            bundle = json.load(handle)
+        expressions: Dict[Tuple[str, str], str] = {}
+        for entry in bundle.get("entry", []):
+            parameter = entry.get("resource", {})
+            if parameter.get("type") == "reference" and parameter.get("expression"):
+                for base in parameter.get("base", []):
+                    expressions[(base, parameter["code"])] = parameter["expression"]
+
+        paths: Dict[str, List[str]] = {}
+        for resource_type, codes in definition.items():
+            if wanted is not None and resource_type not in wanted:
+                continue
+            found = {
+                path
+                for code in codes if (resource_type, code) in expressions
+                for path, as_type in _expressions_for(expressions[(resource_type, code)], resource_type)
+                if not as_type
+            }
+            paths[resource_type] = sorted(found)
+        return cls(paths, table)
+
+    # SQL
+
+    @property
+    def patient_table(self) -> str:
+        """Table of ``(patient_id, ordinal)``: the dense ordinal of every loaded patient."""
+        return f"{self.table}_patients"
+
+    def create_statements(self) -> List[str]:
+        """DDL for the membership and ordinal tables and the patient lookup index (idempotent)."""
+        definitions = ", ".join(f"{column} VARCHAR" for column in MEMBERSHIP_COLUMNS)
+        return [
+            f"CREATE TABLE IF NOT EXISTS {self.table} ({definitions})",
+            f"CREATE INDEX IF NOT EXISTS {self.table}_patient ON {self.table} (patient_id)",
+            f"CREATE TABLE IF NOT EXISTS {self.patient_table} (patient_id VARCHAR PRIMARY KEY, ordinal INTEGER)",
+        ]
+
+    def insert_statements(self, dialect: DatabaseDialect, resource_type: str, source: str,
+                          id_column: str = "id", json_column: str = "resource") -> List[str]:
+        """INSERT adding the memberships of the resources in ``source``.
+
+        Args:
+            source: Table or parenthesised query with the resources to index
+            id_column: Column of ``source`` with the resource id
+            json_column: Column of ``source`` with the resource JSON
+        """
+        if resource_type not in self._paths:
+            return []
+        members = [
+            f"SELECT {dialect.generate_reference_key('refs.reference')} AS patient_id, "
+            f"refs.source_id AS resource_id "
+            f"FROM ({_reference_rows(dialect, source, path, id_column, json_column)}) AS refs "
+            f"WHERE {dialect.generate_reference_type('refs.reference')} = 'Patient'"
+            for path in self._paths[resource_type]
+        ]
+        statements = []
+        if resource_type == "Patient":
+            members.insert(0, f"SELECT src.{id_column} AS patient_id, src.{id_column} AS resource_id "
+                              f"FROM {source} AS src")
+            # Patients not seen before get the next ordinals, in id order
+            statements.append(
+                f"INSERT INTO {self.patient_table} (patient_id, ordinal) "
+                f"SELECT added.patient_id, base.first_ordinal + ROW_NUMBER() OVER (ORDER BY added.patient_id) - 1 "
+                f"FROM (SELECT DISTINCT src.{id_column} AS patient_id FROM {source} AS src "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {self.patient_table} AS known "
+                f"WHERE known.patient_id = src.{id_column})) AS added "
+                f"CROSS JOIN (SELECT COALESCE(MAX(ordinal) + 1, 0) AS first_ordinal "
+                f"FROM {self.patient_table}) AS base"
+            )
+        if members:
+            statements.append(
+                f"INSERT INTO {self.table} ({', '.join(MEMBERSHIP_COLUMNS)}) "
+                f"SELECT DISTINCT members.patient_id, '{resource_type}', members.resource_id "
+                f"FROM ({' UNION ALL '.join(members)}) AS members "
+                f"WHERE members.patient_id IS NOT NULL"
+            )
+        return statements
+
+    def delete_statements(self, resource_type: str, ids_query: Optional[str] = None) -> List[str]:
+        """DELETE removing the memberships of ``resource_type`` (of ``ids_query`` ids only, if given)."""
+        if resource_type not in self._paths:
+            return []
+        where = f"resource_type = '{resource_type}'"
+        if ids_query is not None:
+            where += f" AND resource_id IN ({ids_query})"
+        return [f"DELETE FROM {self.table} WHERE {where}"]
+
+    def rebuild_statements(self, dialect: DatabaseDialect, resource_type: str, source: str) -> List[str]:
+        """Statements re-deriving the compartment memberships of the ``resource_type`` rows in ``source``.
+
+        Args:
+            source: Table or parenthesised query with the stored rows
+                (``id`` and ``resource`` columns)
+        """
+        return [
+            *self.create_statements(),
+            *self.delete_statements(resource_type),
+            *self.insert_statements(dialect, resource_type, source),
+        ]
+
+    def members_query(self, resource_type: str, patients: Iterable[str]) -> str:
+        """SELECT of the ``resource_type`` ids in the compartments of ``patients``.
+
+        Raises:
+            ValueError: If ``resource_type`` is not a compartment member type
+        """
+        return self._membership_query("resource_id", resource_type, patients)
+
+    def memberships_query(self, resource_type: str, patients: Iterable[str]) -> str:
+        """SELECT of ``(patient_id, resource_id)`` for the ``resource_type`` members of ``patients``' compartments.
+
+        Raises:
+            ValueError: If ``resource_type`` is not a compartment member type
+        """
+        return self._membership_query("patient_id, resource_id", resource_type, patients)
+
+    def _membership_query(self, columns: str, resource_type: str, patients: Iterable[str]) -> str:
+        if resource_type not in self._paths:
+            raise ValueError(f"'{resource_type}' resources are not in the Patient compartment")
+        literals = ", ".join("'" + str(patient).replace("'", "''") + "'" for patient in patients)
+        if not literals:
+            raise ValueError("At least one patient id is required")
+        return (f"SELECT {columns} FROM {self.table} "
+                f"WHERE patient_id IN ({literals}) AND resource_type = '{resource_type}'")
+
+
+def parse_compartment(compartment: str) -> str:
+    """Patient id of a ``Patient/<id>`` compartment.
+
+    Raises:
+        ValueError: For anything but a Patient compartment
+    """
+    match = _COMPARTMENT.match(compartment)
+    if not match:
+        raise ValueError(f"Unsupported compartment {compartment!r}; expected 'Patient/<id>'")
+    return match.group(1)
@@ -446,7 +446,8 @@ class CTEManager:
         self.dialect = dialect
         self.cte_counter: int = 0
 
-    def generate_sql(self, fragments: List[SQLFragment]) -> str:
+    def generate_sql(self, fragments: List[SQLFragment], source_query: Optional[str] = None,
+                     member_query: Optional[str] = None) -> str:
         """Convert SQL fragments to complete SQL query.
 
         This is the main entry point. It:
@@ -457,6 +458,12 @@ class CTEManager:
 
         Args:
             fragments: Ordered SQL fragments from translator
+            source_query: SELECT defining the ``resource`` relation (``id``,
+                ``resource`` columns); when given it is emitted as the first
+                CTE and shadows any physical ``resource`` table
+            member_query: SELECT of the resource ids to evaluate (e.g. a
+                patient compartment); the ``resource`` CTE is semi-joined
+                with it, so requires ``source_query``
 
         Returns:
             Complete SQL query string ready for execution
@@ -474,7 +481,7 @@ class CTEManager:
         ctes = self._build_cte_chain(fragments)
 
         # Assemble into SQL (formerly CTEAssembler)
-        sql = self._assemble_query(ctes)
+        sql = self._assemble_query(ctes, source_query, member_query)
 
         return sql
 
@@ -1306,7 +1313,11 @@ class CTEManager:
                 # SP-110-FIX-009: Always add BOTH the result_alias column AND the result column
                 # This matches the UNNEST behavior and ensures the final SELECT can reference 'result'
                 # Format: "{expression} AS {result_alias}, {expression} AS result"
-                columns.append(f"{expression} AS {result_alias}, {expression} AS result")
+                # (once when the alias is "result": PostgreSQL rejects ambiguous columns)
+                if result_alias == "result":
+                    columns.append(f"{expression} AS result")
+                else:
+                    columns.append(f"{expression} AS {result_alias}, {expression} AS result")
                 logger.debug(
                     f"SP-110-FIX-009: Added both '{result_alias}' and 'result' columns for simple query"
                 )
@@ -1798,7 +1809,8 @@ class CTEManager:
 
     # === Methods from CTEAssembler ===
 
-    def _assemble_query(self, ctes: List[CTE]) -> str:
+    def _assemble_query(self, ctes: List[CTE], source_query: Optional[str] = None,
+                        member_query: Optional[str] = None) -> str:
         """Combine the provided CTEs into a single SQL query string.
 
         The method orchestrates the three assembler stages:
@@ -1817,6 +1829,10 @@ class CTEManager:
 
         Args:
             ctes: Ordered list of `CTE` objects produced by _build_cte_chain.
+            source_query: Optional definition of the ``resource`` relation,
+                prepended as the first CTE (see generate_sql).
+            member_query: Optional SELECT of the ids ``resource`` is
+                restricted to (see generate_sql).
 
         Returns:
             Complete SQL query string ready for execution.
@@ -1881,8 +1897,16 @@ class CTEManager:
                 ordered_ctes, final_cte, ordering_columns
             )
 
-        with_clause = self._generate_with_clause(ordered_ctes)
         final_select = self._generate_final_select(ordered_ctes[-1], ordering_columns)
+        if member_query:
+            if not source_query:
+                raise ValueError("Restricting resources to member ids requires a source query")
+            # Semi-join before any other CTE touches the rows
+            source_query = f"SELECT * FROM ({source_query}) AS source WHERE source.id IN ({member_query})"
+        if source_query:
+            # Storage catalog: "resource" reads only the anchor type's rows
+            ordered_ctes = [CTE(name="resource", query=source_query)] + ordered_ctes
+        with_clause = self._generate_with_clause(ordered_ctes)
 
         if with_clause:
             return f"{with_clause}\n{final_select}"
@@ -2613,7 +2637,8 @@ class CTEManager:
         """
         return self._build_cte_chain(fragments)
 
-    def assemble_query(self, ctes: List[CTE]) -> str:
+    def assemble_query(self, ctes: List[CTE], source_query: Optional[str] = None,
+                       member_query: Optional[str] = None) -> str:
         """Assemble CTEs into SQL (backward compatible with CTEAssembler).
 
         This method provides the same interface as CTEAssembler.assemble_query()
@@ -2621,11 +2646,13 @@ class CTEManager:
 
         Args:
             ctes: Ordered list of `CTE` objects.
+            source_query: Optional definition of the ``resource`` relation.
+            member_query: Optional SELECT of the ids ``resource`` is restricted to.
 
         Returns:
             Complete SQL query string ready for execution.
         """
-        return self._assemble_query(ctes)
+        return self._assemble_query(ctes, source_query, member_query)
 
 
 # Backward compatibility aliases
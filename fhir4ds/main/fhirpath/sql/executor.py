@@ -26,7 +26,9 @@ from __future__ import annotations
 
 import logging
 import time
-from typing import Any, Dict, List, Optional
+from datetime import date
+from statistics import NormalDist
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 from fhir4ds.dialects.base import DatabaseDialect
 from fhir4ds.fhirpath.exceptions import (
@@ -36,12 +38,30 @@ from fhir4ds.fhirpath.exceptions import (
     FHIRPathValidationError,
 )
 from fhir4ds.fhirpath.parser import FHIRPathParser
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog, TableSample
+from fhir4ds.fhirpath.sql.compartments import parse_compartment
 from fhir4ds.fhirpath.sql.cte import CTE, CTEManager
 from fhir4ds.fhirpath.sql.fragments import SQLFragment
 from fhir4ds.fhirpath.sql.translator import ASTToSQLTranslator
+from fhir4ds.sql.generator import SQLGenerator
 
 logger = logging.getLogger(__name__)
 
+#: Aggregates :meth:`FHIRPathExecutor.aggregate` accepts; all but the counts
+#: apply to the measure's numeric value.
+AGGREGATE_FUNCTIONS = ("count", "count_distinct", "sum", "avg", "min", "max", "median", "quantile")
+
+#: Share of resources approximate queries read by default.
+DEFAULT_SAMPLE_RATE = 0.01
+
+#: Confidence level of the intervals approximate aggregates report.
+DEFAULT_CONFIDENCE = 0.95
+
+#: Dimension buckets: date prefixes and age bands from a birth date.
+DIMENSION_BUCKETS = ("year", "month", "day", "age")
+
+_DATE_PREFIXES = {"year": 4, "month": 7, "day": 10}
+
 
 class FHIRPathExecutor:
     """Execute FHIRPath expressions end-to-end using the unified SQL pipeline.
@@ -65,6 +85,10 @@ class FHIRPathExecutor:
         Logical FHIR resource serving as the population anchor (for example
         ``Patient`` or ``Observation``). The translator relies on this value to
         resolve base tables and joins.
+    catalog:
+        Optional :class:`StorageCatalog` mapping ``resource_type`` to the table
+        (or partition) holding its rows. Without it, SQL reads the ``resource``
+        table. Ignored when a ``translator`` is supplied.
     parser, translator, cte_manager:
         Optional overrides that enable dependency injection during testing or
         advanced customization. Defaults are created automatically when omitted.
@@ -79,6 +103,18 @@ class FHIRPathExecutor:
     >>> report["timings_ms"]["execute"] < 10.0
     True
 
+    With a catalog that has a CompartmentIndex, ``patients=[...]`` or
+    ``compartment="Patient/<id>"`` restricts evaluation to the resources in
+    those patients' compartments:
+
+    >>> executor.execute("Observation.value", compartment="Patient/123")
+
+    :meth:`aggregate` groups the population in the database and returns only
+    the aggregated rows:
+
+    >>> executor.aggregate({"patients": "count"}, group_by=["gender"])
+    [{'gender': 'female', 'patients': 512}, {'gender': 'male', 'patients': 488}]
+
     Errors are reported through :class:`FHIRPathExecutionError` with the failing
     stage annotated, making it straightforward to diagnose translator, CTE, or
     database issues.
@@ -89,6 +125,7 @@ class FHIRPathExecutor:
         dialect: DatabaseDialect,
         resource_type: str,
         *,
+        catalog: Optional[StorageCatalog] = None,
         parser: Optional[FHIRPathParser] = None,
         adapter: Optional[Any] = None,  # Deprecated (SP-023-004C)
         translator: Optional[ASTToSQLTranslator] = None,
@@ -114,9 +151,10 @@ class FHIRPathExecutor:
 
         self.dialect = dialect
         self.resource_type = resource_type
+        self.catalog = catalog
         self.parser = parser or FHIRPathParser()
         # SP-023-004B: Translator works directly with EnhancedASTNode - no adapter needed
-        self.translator = translator or ASTToSQLTranslator(dialect, resource_type)
+        self.translator = translator or ASTToSQLTranslator(dialect, resource_type, catalog=catalog)
 
         # Use cte_manager if provided, otherwise check deprecated parameters
         # for backward compatibility
@@ -134,13 +172,22 @@ class FHIRPathExecutor:
         self.cte_builder = self.cte_manager
         self.cte_assembler = self.cte_manager
 
-    def execute(self, expression: str) -> List[Any]:
+    def execute(self, expression: str, *, patients: Optional[Sequence[str]] = None,
+                compartment: Optional[str] = None, approximate: bool = False,
+                sample_rate: float = DEFAULT_SAMPLE_RATE, seed: Optional[int] = None) -> List[Any]:
         """Execute a FHIRPath expression and return raw database results.
 
         Parameters
         ----------
         expression:
             FHIRPath expression string to evaluate.
+        patients, compartment:
+            Evaluate only resources in these patients' compartments (patient
+            ids, or one ``Patient/<id>`` compartment).
+        approximate, sample_rate, seed:
+            Evaluate only a Bernoulli sample of the resources, each kept with
+            probability ``sample_rate`` (``TABLESAMPLE`` on the resource
+            table; repeatable for a given ``seed``).
 
         Returns
         -------
@@ -154,24 +201,417 @@ class FHIRPathExecutor:
             Raised when validation, parsing, translation, CTE generation, or SQL
             execution fails.
         """
-        details = self.execute_with_details(expression)
+        details = self.execute_with_details(expression, patients=patients, compartment=compartment,
+                                            approximate=approximate, sample_rate=sample_rate, seed=seed)
         return details["results"]
 
-    def execute_with_details(self, expression: str) -> Dict[str, Any]:
+    def execute_with_details(self, expression: str, *, patients: Optional[Sequence[str]] = None,
+                             compartment: Optional[str] = None, approximate: bool = False,
+                             sample_rate: float = DEFAULT_SAMPLE_RATE,
+                             seed: Optional[int] = None) -> Dict[str, Any]:
         """Execute an expression and return results plus pipeline diagnostics.
 
+        ``patients`` and ``compartment`` restrict evaluation, and
+        ``approximate`` samples it, as in :meth:`execute`.
+
         Returns
         -------
         dict
             Payload containing the generated SQL, intermediate artifacts, and
             per-stage timings under the ``timings_ms`` key. Useful for debugging
-            translator output, verifying CTE ordering, and benchmarking.
+            translator output, verifying CTE ordering, and benchmarking. The
+            ``sample_rate`` key is the share of resources evaluated (1.0
+            unless approximate).
         """
         self._validate_expression(expression)
         timings: Dict[str, float] = {}
 
         logger.debug("Executing FHIRPath expression: %s", expression)
 
+        sample = self._sample(approximate, sample_rate, seed)
+        ast, sql = self._compile(expression, timings, self._patients(patients, compartment), sample)
+
+        # For backward compatibility and diagnostics, extract fragments from translator
+        # after translation (they are stored internally during translate_to_sql)
+        fragments = self.translator.fragments
+
+        # Build CTEs for diagnostics only (the SQL is already generated)
+        # This uses the same fragments that were used to generate the SQL
+        ctes = self._execute_stage(
+            "build",
+            expression,
+            timings,
+            lambda: self._build_ctes(expression, fragments),
+        )
+
+        results = self._execute_stage(
+            "execute",
+            expression,
+            timings,
+            lambda: self.dialect.execute_query(sql),
+        )
+
+        logger.debug("Execution complete for expression '%s'", expression)
+
+        return {
+            "expression": expression,
+            "ast": ast,  # SP-023-004B: EnhancedASTNode directly (no adapter conversion)
+            "fragments": fragments,
+            "ctes": ctes,
+            "sql": sql,
+            "results": results,
+            "sample_rate": sample.rate if sample else 1.0,
+            "timings_ms": timings,
+        }
+
+    def to_sql(self, expression: str, *, patients: Optional[Sequence[str]] = None,
+               compartment: Optional[str] = None) -> str:
+        """Translate an expression to the SQL :meth:`execute` runs, without running it.
+
+        The statement returns one row per resource, its ``id`` first and the
+        expression's value last; ``patients`` and ``compartment`` restrict it
+        as in :meth:`execute`.
+
+        Raises
+        ------
+        FHIRPathExecutionError
+            Raised when validation, parsing or translation fails.
+        """
+        self._validate_expression(expression)
+        _, sql = self._compile(expression, {}, self._patients(patients, compartment))
+        return sql
+
+    def export(
+        self,
+        expression: str,
+        destination: Any,
+        *,
+        format: str = "parquet",
+        partition_by: Optional[List[str]] = None,
+        row_group_size: Optional[int] = None,
+        compression: Optional[str] = None,
+        patients: Optional[Sequence[str]] = None,
+        compartment: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Export expression results to a file without fetching rows into Python.
+
+        The translated SQL is wrapped in the dialect's COPY statement (DuckDB
+        ``COPY ... TO``, PostgreSQL ``COPY ... TO STDOUT``), so results stream
+        from the database straight to ``destination``.
+
+        Parameters
+        ----------
+        destination:
+            Output path (a directory when ``partition_by`` is used) or, for
+            PostgreSQL, a binary file object.
+        format:
+            ``"parquet"``, ``"csv"`` or ``"ndjson"``.
+        partition_by, row_group_size, compression:
+            Passed through to :meth:`DatabaseDialect.export_query`.
+        patients, compartment:
+            Restrict the exported rows as in :meth:`execute`.
+
+        Returns
+        -------
+        dict
+            The exported ``sql`` and per-stage ``timings_ms``.
+        """
+        self._validate_expression(expression)
+        timings: Dict[str, float] = {}
+
+        _, sql = self._compile(expression, timings, self._patients(patients, compartment))
+        self._execute_stage(
+            "export",
+            expression,
+            timings,
+            lambda: self.dialect.export_query(
+                sql,
+                destination,
+                format=format,
+                partition_by=partition_by,
+                row_group_size=row_group_size,
+                compression=compression,
+            ),
+        )
+
+        return {"expression": expression, "sql": sql, "timings_ms": timings}
+
+    def aggregate(
+        self,
+        measures: Mapping[str, Union[str, Tuple[str, str]]],
+        group_by: Sequence[Union[str, Mapping[str, Any]]] = (),
+        *,
+        where: Optional[Sequence[str]] = None,
+        rollup: bool = False,
+        grouping_sets: Optional[Sequence[Sequence[str]]] = None,
+        patients: Optional[Sequence[str]] = None,
+        compartment: Optional[str] = None,
+        approximate: bool = False,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        seed: Optional[int] = None,
+        confidence: float = DEFAULT_CONFIDENCE,
+    ) -> List[Dict[str, Any]]:
+        """Aggregate the population by FHIRPath dimensions in one grouped query.
+
+        Dimensions and measures compile, as columns of one ViewDefinition,
+        into a single scan of the resource table wrapped in ``GROUP BY``
+        (``ROLLUP`` or ``GROUPING SETS`` for subtotals), so only aggregated
+        rows leave the database.
+
+        Parameters
+        ----------
+        measures:
+            Result key to aggregate. ``"count"`` counts resources;
+            ``(function, path)`` applies one of :data:`AGGREGATE_FUNCTIONS`
+            to a single-valued FHIRPath ``path``: ``count`` counts resources
+            with a value, ``count_distinct`` counts distinct values and
+            ``sum``, ``avg``, ``min``, ``max`` and ``median`` aggregate
+            numeric values. ``("quantile", path, fraction)`` is a continuous
+            quantile.
+        group_by:
+            Dimensions: FHIRPath paths (also their result key) or dicts with
+            ``path``, optional ``name``, ``collection`` and ``bucket``.
+            As in a ViewDefinition, a dimension with several values for a
+            resource is an error unless declared ``collection: True``, in
+            which case the resource is counted in the group of each value.
+            Buckets: ``"year"``, ``"month"`` or ``"day"`` truncate a date or
+            dateTime; ``"age"`` turns a birth date into the lower bound of
+            its age band, ``width`` years wide (default 10) at ``as_of`` (an
+            ISO date, default today).
+        where:
+            Boolean FHIRPath expressions resources must satisfy.
+        rollup:
+            Add subtotals for each prefix of ``group_by`` and a grand total.
+        grouping_sets:
+            Explicit lists of dimension names to group by, instead of
+            ``rollup``; every dimension must be in at least one.
+        patients, compartment:
+            Restrict the population as in :meth:`execute`.
+        approximate, sample_rate, seed:
+            Aggregate a Bernoulli sample of the resources, as in
+            :meth:`execute`: counts and sums are scaled up by the sampling
+            rate, and distinct counts and quantiles use the dialect's
+            sketches (``approx_count_distinct``, ``approx_quantile``) where
+            it has them. Distinct counts are those of the sample.
+        confidence:
+            Confidence level of the intervals reported when approximate.
+
+        Returns
+        -------
+        list
+            One dict per group with the dimension and measure keys, ordered
+            by dimension values. With ``rollup`` or ``grouping_sets``, a
+            ``grouping`` key holds the ``GROUPING()`` bitmask telling
+            subtotal rows (set bits for the dimensions rolled up) from
+            groups whose value is null. When approximate, each measure also
+            has a ``<name>_ci`` key: the ``(low, high)`` confidence interval
+            of counts, sums and means, None for the other aggregates.
+        """
+        dimensions = [_dimension(spec) for spec in group_by]
+        names = [name for name, _, _ in dimensions] + list(measures)
+        if len(set(names)) != len(names) or ((rollup or grouping_sets is not None) and "grouping" in names):
+            raise ValueError(f"Dimension and measure names must be unique: {names}")
+        if rollup and grouping_sets is not None:
+            raise ValueError("Use rollup or grouping_sets, not both")
+        for name, spec in measures.items():
+            if spec != "count" and (isinstance(spec, str) or spec[0] not in AGGREGATE_FUNCTIONS):
+                raise ValueError(f"Unknown aggregate {spec!r} for {name!r}; expected one of {AGGREGATE_FUNCTIONS}")
+            if spec != "count" and len(spec) != (3 if spec[0] == "quantile" else 2):
+                raise ValueError(f"Measure {name!r} should be (function, path), or (\"quantile\", path, fraction)")
+            if spec != "count" and spec[0] == "quantile" and not 0 <= spec[2] <= 1:
+                raise ValueError(f"Quantile of {name!r} must be between 0 and 1, got {spec[2]}")
+        if approximate and any(f"{name}_ci" in names for name in measures):
+            raise ValueError(f"Measure names clash with their confidence interval keys: {names}")
+        for grouping_set in grouping_sets or []:
+            unknown = [name for name in grouping_set if name not in names[:len(dimensions)]]
+            if unknown:
+                raise ValueError(f"Grouping set {list(grouping_set)} names unknown dimensions {unknown}")
+        ungrouped = [name for name, _, _ in dimensions
+                     if grouping_sets is not None and not any(name in grouping_set for grouping_set in grouping_sets)]
+        if ungrouped:
+            raise ValueError(f"Dimensions {ungrouped} are in no grouping set")
+        selected = self._patients(patients, compartment)
+        if selected is not None and (self.catalog is None or self.catalog.compartment_index is None):
+            raise ValueError("Restricting to patients needs a catalog with a CompartmentIndex")
+        sample = self._sample(approximate, sample_rate, seed)
+        summary = f"aggregate {', '.join(names)}"
+        timings: Dict[str, float] = {}
+
+        sql = self._execute_stage(
+            "translate",
+            summary,
+            timings,
+            lambda: self._aggregate_query(measures, dimensions, where or [], rollup, grouping_sets, selected,
+                                          sample, confidence),
+        )
+        rows = self._execute_stage("execute", summary, timings, lambda: self.dialect.execute_query(sql))
+        grouped = rollup or grouping_sets is not None
+        if sample is None:
+            keys = names + (["grouping"] if grouped else [])
+            return [dict(zip(keys, row)) for row in rows]
+
+        results = []
+        for row in rows:
+            result = dict(zip(names[:len(dimensions)], row))
+            position = len(dimensions)
+            for name in measures:
+                estimate, low, high = row[position:position + 3]
+                result[name] = estimate
+                result[f"{name}_ci"] = None if low is None else (low, high)
+                position += 3
+            if grouped:
+                result["grouping"] = row[position]
+            results.append(result)
+        return results
+
+    def _aggregate_query(self, measures: Mapping[str, Union[str, Tuple[Any, ...]]],
+                         dimensions: List[Tuple[str, str, Dict[str, Any]]], where: Sequence[str],
+                         rollup: bool, grouping_sets: Optional[Sequence[Sequence[str]]],
+                         patients: Optional[List[str]], sample: Optional[TableSample] = None,
+                         confidence: float = DEFAULT_CONFIDENCE) -> str:
+        """SQL of :meth:`aggregate`: its ViewDefinition, grouped.
+
+        With a ``sample``, every measure has three columns: its estimate and
+        the bounds of its confidence interval (NULL when there is none).
+        """
+        # Without multi-valued dimensions each view row is one resource
+        unnested = any(options.get("collection") for _, _, options in dimensions)
+        columns, nested, aggregates = [], [], []
+        for index, (name, spec) in enumerate(measures.items()):
+            function, path, *fraction = ("count", None) if spec == "count" else tuple(spec)
+            value = None
+            if path is not None:
+                columns.append({"name": f"m{index}", "path": path})
+                value = f"a.m{index}"
+            aggregates.extend(self._measure(function, value, fraction[0] if fraction else 0.5,
+                                            unnested, sample, confidence))
+        values = [f"v.{column['name']}" for column in columns]
+
+        for index, (_, path, options) in enumerate(dimensions):
+            if options.get("collection"):
+                # Lateral unnesting costs far more than a plain column, so
+                # only dimensions declared multi-valued get it
+                nested.append({"forEachOrNull": path, "column": [{"name": f"d{index}", "path": "$this"}]})
+            else:
+                columns.append({"name": f"d{index}", "path": path})
+        # A view needs a select even when only counting resources
+        view: Dict[str, Any] = {"resource": self.resource_type,
+                                "select": [{"column": columns or [{"name": "id", "path": "id"}]}] + nested}
+        if where:
+            view["where"] = [{"path": path} for path in where]
+        catalog = self.catalog or StorageCatalog()
+        source = catalog.relation(self.resource_type, self.dialect, sample=sample) if sample else None
+        if patients is not None:
+            index = catalog.compartment_index
+            relation = source or catalog.relation(self.resource_type, self.dialect)
+            source = (f"(SELECT * FROM {relation} AS r "
+                      f"WHERE r.id IN ({index.members_query(self.resource_type, patients)}))")
+        view_sql = SQLGenerator(self.dialect, catalog=self.catalog).generate_sql(view, source=source, lineage=True)
+
+        keys = [f"d{index}" for index in range(len(dimensions))]
+        inner = ["v._resource_id"] + values
+        inner += [f"{self._bucket(f'v.{key}', bucket)} AS {key}" for key, (_, _, bucket) in zip(keys, dimensions)]
+        select = [f"a.{key}" for key in keys] + aggregates
+        query = f"SELECT {', '.join(inner)} FROM ({view_sql.rstrip().rstrip(';')}) AS v"
+        group = ", ".join(f"a.{key}" for key in keys)
+        if keys and grouping_sets is not None:
+            positions = {name: key for (name, _, _), key in zip(dimensions, keys)}
+            sets = ["(" + ", ".join(f"a.{positions[name]}" for name in grouping_set) + ")"
+                    for grouping_set in grouping_sets]
+            group = f"GROUPING SETS ({', '.join(sets)})"
+        elif keys and rollup:
+            group = f"ROLLUP ({group})"
+        order = [f"a.{key} NULLS LAST" for key in keys]
+        if rollup or grouping_sets is not None:
+            select.append(f"GROUPING({', '.join(f'a.{key}' for key in keys)})" if keys else "0")
+            order += [f"{len(select)}"] if keys else []
+
+        sql = f"SELECT {', '.join(select)} FROM ({query}) AS a"
+        if group:
+            sql += f" GROUP BY {group} ORDER BY {', '.join(order)}"
+        return sql
+
+    def _measure(self, function: str, value: Optional[str], fraction: float, unnested: bool,
+                 sample: Optional[TableSample], confidence: float) -> List[str]:
+        """Aggregate columns of one measure; with a sample, estimate and interval bounds.
+
+        Counts and sums are scaled up by the sampling rate, with the variance
+        of that (Horvitz-Thompson) estimator under Bernoulli sampling; means
+        get the normal interval of a sample mean. Distinct counts, extremes
+        and quantiles of a sample have no such interval.
+        """
+        dialect = self.dialect
+        number = dialect.cast_to_double(value) if value is not None else None
+        if function == "count":
+            counted = "a._resource_id" if value is None else f"CASE WHEN {value} IS NOT NULL THEN a._resource_id END"
+            if not unnested:
+                aggregate = f"COUNT({counted})"
+            elif sample is not None:
+                aggregate = dialect.generate_approx_count_distinct(counted)
+            else:
+                aggregate = f"COUNT(DISTINCT {counted})"
+        elif function == "count_distinct":
+            aggregate = (dialect.generate_approx_count_distinct(value) if sample is not None
+                         else f"COUNT(DISTINCT {value})")
+        elif function in ("median", "quantile"):
+            aggregate = dialect.generate_quantile(number, fraction, approximate=sample is not None)
+        else:
+            aggregate = f"{function.upper()}({number})"
+        if sample is None:
+            return [aggregate]
+
+        rate = sample.rate
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        if function == "count":
+            # The lower bound is never below the resources seen in the sample
+            seen = dialect.cast_to_double(aggregate)
+            estimate = f"CAST(ROUND({seen} / {rate!r}) AS BIGINT)"
+            error = f"{z!r} * SQRT({seen} * {1 - rate!r}) / {rate!r}"
+            return [estimate, f"GREATEST({estimate} - {error}, {seen})", f"{estimate} + {error}"]
+        elif function == "sum":
+            estimate = f"{aggregate} / {rate!r}"
+            error = f"{z!r} * SQRT(SUM({number} * {number}) * {1 - rate!r}) / {rate!r}"
+        elif function == "avg":
+            estimate = aggregate
+            error = f"{z!r} * STDDEV_SAMP({number}) / SQRT(COUNT({number})) * {(1 - rate) ** 0.5!r}"
+        else:
+            return [aggregate, "NULL", "NULL"]
+        return [estimate, f"{estimate} - {error}", f"{estimate} + {error}"]
+
+    def _bucket(self, value: str, bucket: Dict[str, Any]) -> str:
+        """SQL of a dimension value, bucketed as requested."""
+        kind = bucket.get("bucket")
+        if kind is None:
+            return value
+        if kind in _DATE_PREFIXES:
+            return self.dialect.substring(value, "0", str(_DATE_PREFIXES[kind]))
+        as_of = date.fromisoformat(str(bucket.get("as_of") or date.today().isoformat()))
+        width = int(bucket.get("width", 10))
+        if width < 1:
+            raise ValueError(f"Age band width must be positive, got {width}")
+        birth_year = f"CAST({self.dialect.substring(value, '0', '4')} AS INTEGER)"
+        birthday = self.dialect.substring(value, "5", "5")
+        age = (f"({as_of.year} - {birth_year} - "
+               f"CASE WHEN '{as_of.strftime('%m-%d')}' < {birthday} THEN 1 ELSE 0 END)")
+        return f"({age} - {age} % {width})"
+
+    @staticmethod
+    def _sample(approximate: bool, sample_rate: float, seed: Optional[int]) -> Optional[TableSample]:
+        """Sample of the resources approximate evaluation reads, or None for all of them."""
+        return TableSample(sample_rate, seed) if approximate else None
+
+    def _patients(self, patients: Optional[Sequence[str]], compartment: Optional[str]) -> Optional[List[str]]:
+        """Patient ids evaluation is restricted to, or None for the whole population."""
+        if patients is None and compartment is None:
+            return None
+        selected = list(patients or [])
+        if compartment is not None:
+            selected.append(parse_compartment(compartment))
+        return selected
+
+    def _compile(self, expression: str, timings: Dict[str, float],
+                 patients: Optional[List[str]] = None, sample: Optional[TableSample] = None):
+        """Parse and translate ``expression``, returning ``(ast, sql)``."""
         parsed_expression = self._execute_stage(
             "parse",
             expression,
@@ -208,48 +648,24 @@ class FHIRPathExecutor:
             "translate",
             expression,
             timings,
-            lambda: self._translate_to_sql(expression, ast),
+            lambda: self._translate_to_sql(expression, ast, patients, sample),
         )
+        return ast, sql
 
-        # For backward compatibility and diagnostics, extract fragments from translator
-        # after translation (they are stored internally during translate_to_sql)
-        fragments = self.translator.fragments
-
-        # Build CTEs for diagnostics only (the SQL is already generated)
-        # This uses the same fragments that were used to generate the SQL
-        ctes = self._execute_stage(
-            "build",
-            expression,
-            timings,
-            lambda: self._build_ctes(expression, fragments),
-        )
-
-        results = self._execute_stage(
-            "execute",
-            expression,
-            timings,
-            lambda: self.dialect.execute_query(sql),
-        )
-
-        logger.debug("Execution complete for expression '%s'", expression)
-
-        return {
-            "expression": expression,
-            "ast": ast,  # SP-023-004B: EnhancedASTNode directly (no adapter conversion)
-            "fragments": fragments,
-            "ctes": ctes,
-            "sql": sql,
-            "results": results,
-            "timings_ms": timings,
-        }
-
-    def _translate_to_sql(self, expression: str, fhirpath_ast: Any) -> str:
+    def _translate_to_sql(self, expression: str, fhirpath_ast: Any,
+                          patients: Optional[List[str]] = None,
+                          sample: Optional[TableSample] = None) -> str:
         """Translate AST to SQL using the integrated translate_to_sql method.
 
         SP-023-003: Uses the translator's new translate_to_sql() method that
         combines fragment generation with CTE assembly into a single operation.
         """
-        sql = self.translator.translate_to_sql(fhirpath_ast)
+        if sample is not None:
+            sql = self.translator.translate_to_sql(fhirpath_ast, patients=patients, sample=sample)
+        elif patients is None:
+            sql = self.translator.translate_to_sql(fhirpath_ast)
+        else:
+            sql = self.translator.translate_to_sql(fhirpath_ast, patients=patients)
         if not sql:
             raise FHIRPathExecutionError(
                 "Translator returned empty SQL",
@@ -329,3 +745,17 @@ class FHIRPathExecutor:
             expression=expression,
             original_exception=exc,
         ) from exc
+
+
+def _dimension(spec: Union[str, Mapping[str, Any]]) -> Tuple[str, str, Dict[str, Any]]:
+    """``(name, path, bucket options)`` of a :meth:`FHIRPathExecutor.aggregate` dimension."""
+    if isinstance(spec, str):
+        return spec, spec, {}
+    options = dict(spec)
+    path = options.pop("path", None)
+    if not path:
+        raise ValueError(f"Dimension {spec!r} needs a path")
+    name = options.pop("name", path)
+    if options.get("bucket") not in (None,) + DIMENSION_BUCKETS:
+        raise ValueError(f"Unknown bucket {options['bucket']!r}; expected one of {DIMENSION_BUCKETS}")
+    return name, path, options
@@ -0,0 +1,320 @@
+"""Ingest-time extraction of frequently queried elements ("hot columns").
+
+Population queries filter and join on a handful of elements: the subject
+reference, codes, clinical dates, status and ``meta.lastUpdated``. An
+:class:`ExtractionProfile` lists, per resource type, which of them loaders
+materialize next to the resource JSON:
+
+- **Extracted columns**: one typed value per resource (``VARCHAR`` or
+  ``TIMESTAMP``), optionally the first present of several alternative paths
+  (e.g. ``effectiveDateTime`` or ``effectivePeriod.start``).
+- **Side tables**: one row per item of a repeating element, e.g. the
+  ``system``/``code`` pairs of ``code.coding``, keyed by resource id.
+
+The default profile is derived from the FHIR R4 SearchParameter definitions
+of the hot search parameters; element types come from the resource
+StructureDefinitions when they are available and from the element name
+otherwise. Single-path ``VARCHAR`` columns hold exactly the text the
+translator would extract from the JSON, so the translator reads them
+instead (see :meth:`ExtractionProfile.column_for_path`). They are only
+extracted for elements a definition declares single-valued: the shipped
+definitions cover data types only, so without resource StructureDefinitions
+reference and status columns are left out and read from the JSON.
+
+Example:
+    >>> profile = ExtractionProfile.from_search_parameters(
+    ...     resource_types=["Observation"], element_definitions=definitions)
+    >>> [column.name for column in profile.columns_for("Observation")]
+    ['subject_ref', 'clinical_date', 'status', 'last_updated']
+    >>> catalog = StorageCatalog(profile=profile)
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fhir4ds.dialects.base import DatabaseDialect
+from ..types.fhir_types import resolve_polymorphic_property
+
+DEFINITIONS_PATH = Path(__file__).resolve().parents[1] / "types" / "fhir_r4_definitions"
+SEARCH_PARAMETERS_PATH = DEFINITIONS_PATH / "search-parameters.json"
+
+# Search parameters materialized by the default profile
+HOT_SEARCH_PARAMETERS = ("subject", "patient", "code", "date", "onset-date", "status", "_lastUpdated")
+
+COLUMN_TYPES = ("VARCHAR", "TIMESTAMP")
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_ELEMENT_PATH = re.compile(r"^[A-Za-z][A-Za-z0-9]*(\.[A-Za-z][A-Za-z0-9]*)*$")
+
+# Column names for parameters whose code would make an awkward identifier
+_COLUMN_NAMES = {"date": "clinical_date", "_lastUpdated": "last_updated"}
+
+# Token elements that are plain codes when no StructureDefinition says otherwise
+CODE_ELEMENTS = frozenset({"status", "intent", "priority", "gender", "use", "kind", "mode"})
+
+_DATE_TYPES = ("DateTime", "Instant", "Date")
+
+
+@dataclass(frozen=True)
+class ExtractedColumn:
+    """A typed column holding one element value per resource.
+
+    Attributes:
+        name: Column name
+        paths: Element paths relative to the resource; the first present wins
+        sql_type: ``VARCHAR`` (the element text) or ``TIMESTAMP``
+    """
+
+    name: str
+    paths: Tuple[str, ...]
+    sql_type: str = "VARCHAR"
+
+    def __post_init__(self) -> None:
+        if not _IDENTIFIER.match(self.name):
+            raise ValueError(f"Invalid extracted column name: {self.name!r}")
+        if not self.paths or not all(_ELEMENT_PATH.match(path) for path in self.paths):
+            raise ValueError(f"Invalid element paths for column {self.name!r}: {self.paths!r}")
+        if self.sql_type not in COLUMN_TYPES:
+            raise ValueError(f"Unsupported extracted column type: {self.sql_type!r}")
+
+    @property
+    def exact_path(self) -> Optional[str]:
+        """The path whose JSON text this column equals, if there is exactly one."""
+        return self.paths[0] if len(self.paths) == 1 and self.sql_type == "VARCHAR" else None
+
+    def expression(self, dialect: DatabaseDialect, json_column: str = "resource") -> str:
+        """SQL computing the column from ``json_column``."""
+        values = [dialect.extract_json_string(json_column, f"$.{path}") for path in self.paths]
+        value = values[0] if len(values) == 1 else f"COALESCE({', '.join(values)})"
+        if self.sql_type == "TIMESTAMP":
+            # Date-only values count as midnight; partial dates stay NULL
+            padded = f"CASE WHEN LENGTH({value}) = 10 THEN {value} || 'T00:00:00' ELSE {value} END"
+            return dialect.safe_cast_to_timestamp(padded)
+        return value
+
+
+@dataclass(frozen=True)
+class SideTable:
+    """Rows for each item of a repeating element, keyed by resource id.
+
+    Attributes:
+        name: Suffix of the side table (``<table>_<name>``)
+        collection: Path of the repeating element, e.g. ``code.coding``
+        columns: (column, member path) pairs extracted from each item
+    """
+
+    name: str
+    collection: str
+    columns: Tuple[Tuple[str, str], ...]
+
+    def __post_init__(self) -> None:
+        names = [self.name, *(column for column, _ in self.columns)]
+        if not all(_IDENTIFIER.match(name) for name in names):
+            raise ValueError(f"Invalid side table identifiers: {names!r}")
+        paths = [self.collection, *(member for _, member in self.columns)]
+        if not self.columns or not all(_ELEMENT_PATH.match(path) for path in paths):
+            raise ValueError(f"Invalid side table paths: {paths!r}")
+
+    def table_name(self, base_table: str) -> str:
+        return f"{base_table}_{self.name}"
+
+
+class ExtractionProfile:
+    """Extracted columns and side tables per resource type.
+
+    Columns listed under ``"Resource"`` apply to every type.
+    """
+
+    def __init__(self, columns: Optional[Dict[str, List[ExtractedColumn]]] = None,
+                 side_tables: Optional[Dict[str, List[SideTable]]] = None):
+        self._columns = {resource_type: list(items) for resource_type, items in (columns or {}).items()}
+        self._side_tables = {resource_type: list(items) for resource_type, items in (side_tables or {}).items()}
+        types: Dict[str, str] = {}
+        for column in (column for items in self._columns.values() for column in items):
+            if types.setdefault(column.name, column.sql_type) != column.sql_type:
+                raise ValueError(f"Extracted column {column.name!r} has conflicting types")
+
+    def columns_for(self, resource_type: str) -> List[ExtractedColumn]:
+        """Columns extracted for ``resource_type``, type-specific ones first."""
+        columns: Dict[str, ExtractedColumn] = {}
+        for column in self._columns.get(resource_type, []) + self._columns.get("Resource", []):
+            columns.setdefault(column.name, column)
+        return list(columns.values())
+
+    def side_tables_for(self, resource_type: str) -> List[SideTable]:
+        return list(self._side_tables.get(resource_type, []))
+
+    def all_columns(self) -> List[ExtractedColumn]:
+        """One column per name across every type (the layout of a shared table)."""
+        columns: Dict[str, ExtractedColumn] = {}
+        for items in self._columns.values():
+            for column in items:
+                columns.setdefault(column.name, column)
+        return list(columns.values())
+
+    def all_side_tables(self) -> List[SideTable]:
+        tables: Dict[str, SideTable] = {}
+        for items in self._side_tables.values():
+            for table in items:
+                tables.setdefault(table.name, table)
+        return list(tables.values())
+
+    def column_for_path(self, resource_type: str, path: str) -> Optional[str]:
+        """Name of the column equal to the JSON text at ``path``, if one is extracted."""
+        for column in self.columns_for(resource_type):
+            if column.exact_path == path:
+                return column.name
+        return None
+
+    @classmethod
+    def from_search_parameters(cls, parameters: Iterable[str] = HOT_SEARCH_PARAMETERS,
+                               resource_types: Optional[Iterable[str]] = None,
+                               search_parameters_path: Path = SEARCH_PARAMETERS_PATH,
+                               element_definitions: Optional[Dict[str, Dict[str, Any]]] = None
+                               ) -> "ExtractionProfile":
+        """Derive a profile from SearchParameter definitions.
+
+        Args:
+            parameters: Search parameter codes to materialize
+            resource_types: Only these types (all bases of the parameters when None)
+            search_parameters_path: FHIR ``search-parameters.json`` Bundle
+            element_definitions: Element path -> definition (as returned by
+                StructureDefinitionLoader.extract_element_definitions); loaded
+                from the shipped definitions when None
+
+        Raises:
+            ValueError: If two parameters map the same column name to different types
+        """
+        if element_definitions is None:
+            element_definitions = _load_element_definitions()
+        wanted_types = set(resource_types) if resource_types is not None else None
+        wanted_codes = list(parameters)
+
+        with open(search_parameters_path, encoding="utf-8") as handle:
+            bundle = json.load(handle)
+        definitions = [
+            entry["resource"] for entry in bundle.get("entry", [])
+            if entry.get("resource", {}).get("code") in wanted_codes and entry["resource"].get("expression")
+        ]
+        definitions.sort(key=lambda parameter: wanted_codes.index(parameter["code"]))
+
+        columns: Dict[str, List[ExtractedColumn]] = {}
+        side_tables: Dict[str, List[SideTable]] = {}
+        for parameter in definitions:
+            for base in parameter.get("base", []):
+                if wanted_types is not None and base != "Resource" and base not in wanted_types:
+                    continue
+                expressions = _expressions_for(parameter["expression"], base)
+                if not expressions:
+                    continue
+                extracted = _extraction_for(parameter, base, expressions, element_definitions)
+                if isinstance(extracted, SideTable):
+                    tables = side_tables.setdefault(base, [])
+                    if all(table.collection != extracted.collection for table in tables):
+                        tables.append(extracted)
+                elif extracted is not None:
+                    existing = columns.setdefault(base, [])
+                    if all(column.paths != extracted.paths and column.name != extracted.name
+                           for column in existing):
+                        existing.append(extracted)
+        return cls(columns, side_tables)
+
+
+def _expressions_for(expression: str, resource_type: str) -> List[Tuple[str, Optional[str]]]:
+    """(element path, as() type) of the union members rooted at ``resource_type``."""
+    members = []
+    for part in expression.split("|"):
+        part = part.strip()
+        if part.startswith("(") and part.endswith(")"):
+            part = part[1:-1].strip()
+        match = re.match(rf"^{resource_type}\.([A-Za-z][A-Za-z0-9.]*?)"
+                         r"(?:\.as\((\w+)\)| as (\w+))?(?:\.where\(resolve\(\) is \w+\))?$", part)
+        if match:
+            members.append((match.group(1), match.group(2) or match.group(3)))
+    return members
+
+
+def _extraction_for(parameter: Dict[str, Any], resource_type: str,
+                    expressions: List[Tuple[str, Optional[str]]],
+                    element_definitions: Dict[str, Dict[str, Any]]):
+    """Extracted column or side table for one search parameter on one type."""
+    code = parameter["code"]
+    name = _COLUMN_NAMES.get(code, code.lstrip("_").replace("-", "_"))
+    kind = parameter.get("type")
+    # Nested paths without a definition may sit inside a repeating element
+    expressions = [
+        (path, as_type) for path, as_type in expressions
+        if "." not in path or f"{resource_type}.{path}" in element_definitions or resource_type == "Resource"
+    ]
+    if not expressions:
+        return None
+    path, as_type = expressions[0]
+    if as_type and kind != "date":
+        path = f"{path}{as_type[0].upper()}{as_type[1:]}"
+
+    # A single-valued column is only extracted when the element is known not
+    # to repeat; otherwise queries keep reading the JSON path
+    if kind == "reference":
+        if not _is_single(element_definitions, resource_type, path):
+            return None
+        return ExtractedColumn(f"{name}_ref", (f"{path}.reference",))
+
+    if kind == "token":
+        element_type = _element_type(element_definitions, resource_type, path)
+        if element_type == "CodeableConcept" or (element_type is None and path.split(".")[-1] not in CODE_ELEMENTS):
+            return SideTable(name, f"{path}.coding", (("system", "system"), ("code", "code")))
+        if element_type in ("code", "string", "uri", "boolean") and \
+                _is_single(element_definitions, resource_type, path):
+            return ExtractedColumn(name, (path,))
+        return None
+
+    if kind == "date":
+        paths: List[str] = []
+        for member, member_type in expressions:
+            paths.extend(_date_paths(element_definitions, resource_type, member, member_type))
+        return ExtractedColumn(name, tuple(dict.fromkeys(paths)), "TIMESTAMP") if paths else None
+    return None
+
+
+def _date_paths(element_definitions: Dict[str, Dict[str, Any]], resource_type: str,
+                path: str, as_type: Optional[str]) -> List[str]:
+    """Paths holding the (start) date of a date, dateTime, instant, Period or choice element."""
+    head, _, last = path.rpartition(".")
+    prefix = f"{head}." if head else ""
+    if as_type:
+        variants = [f"{last}{as_type[0].upper()}{as_type[1:]}"]
+    else:
+        variants = resolve_polymorphic_property(last) or [last]
+    paths = []
+    for variant in variants:
+        element_type = _element_type(element_definitions, resource_type, f"{prefix}{variant}")
+        if variant.endswith("Period") or element_type == "Period" or (element_type is None and last == "period"):
+            paths.append(f"{prefix}{variant}.start")
+        elif variant == last or variant.endswith(_DATE_TYPES):
+            paths.append(f"{prefix}{variant}")
+    return paths
+
+
+def _element_type(element_definitions: Dict[str, Dict[str, Any]], resource_type: str,
+                  path: str) -> Optional[str]:
+    definition = element_definitions.get(f"{resource_type}.{path}")
+    return definition.get("type") if definition else None
+
+
+def _is_single(element_definitions: Dict[str, Dict[str, Any]], resource_type: str, path: str) -> bool:
+    """True when ``path`` has a definition and does not repeat (unknown cardinality is False)."""
+    definition = element_definitions.get(f"{resource_type}.{path}")
+    return definition is not None and not definition.get("is_array")
+
+
+def _load_element_definitions() -> Dict[str, Dict[str, Any]]:
+    from ..types.structure_loader import StructureDefinitionLoader
+
+    loader = StructureDefinitionLoader(DEFINITIONS_PATH)
+    loader.load_all_definitions()
+    return loader.extract_element_definitions()
@@ -0,0 +1,243 @@
+"""Reference edge index for resolve() and cross-resource joins.
+
+Following a ``Reference`` otherwise means parsing its ``reference`` string
+in every row of every query. A :class:`ReferenceIndex` materializes each
+literal reference once, at load time, as an edge row::
+
+    (source_type, source_id, path, target_type, target_id)
+    ('Observation', 'o1', 'subject', 'Patient', 'p1')
+
+so ``resolve()`` and reference joins become equi-joins on ids that the
+database can run as hash joins (or index lookups on PostgreSQL). Relative
+(``Patient/p1``), versioned and absolute references are indexed by their
+trailing ``Type/id``; contained (``#id``) and logical references are not.
+
+The indexed paths come from the FHIR R4 SearchParameter definitions of
+type ``reference`` (e.g. ``Observation.subject``,
+``Encounter.participant.individual``), together with their target types,
+plus any ``Reference`` elements of the resource StructureDefinitions when
+those are available. Repeating elements anywhere on a path are followed.
+
+Example:
+    >>> index = ReferenceIndex.from_search_parameters(resource_types=["Observation"])
+    >>> index.path("Observation", "subject").targets
+    ('Device', 'Group', 'Location', 'Patient')
+    >>> catalog = StorageCatalog(reference_index=index)
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fhir4ds.dialects.base import DatabaseDialect
+from .extraction import SEARCH_PARAMETERS_PATH, _expressions_for, _load_element_definitions
+
+DEFAULT_REFERENCE_TABLE = "fhir4ds_references"
+
+EDGE_COLUMNS = ("source_type", "source_id", "path", "target_type", "target_id")
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_ELEMENT_PATH = re.compile(r"^[A-Za-z][A-Za-z0-9]*(\.[A-Za-z][A-Za-z0-9]*)*$")
+_RESOURCE_TYPE = re.compile(r"^[A-Z][A-Za-z]*$")
+
+
+@dataclass(frozen=True)
+class ReferencePath:
+    """An indexed Reference element.
+
+    Attributes:
+        path: Element path relative to the resource, e.g. ``participant.individual``
+        targets: Resource types the reference may point to (sorted)
+    """
+
+    path: str
+    targets: Tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if not _ELEMENT_PATH.match(self.path):
+            raise ValueError(f"Invalid reference path: {self.path!r}")
+        if not all(_RESOURCE_TYPE.match(target) for target in self.targets):
+            raise ValueError(f"Invalid reference targets: {self.targets!r}")
+
+
+class ReferenceIndex:
+    """Reference paths per resource type and the edge table holding them."""
+
+    def __init__(self, paths: Optional[Dict[str, List[ReferencePath]]] = None,
+                 table: str = DEFAULT_REFERENCE_TABLE):
+        if not _IDENTIFIER.match(table):
+            raise ValueError(f"Invalid reference index table: {table!r}")
+        self.table = table
+        self._paths = {resource_type: list(items) for resource_type, items in (paths or {}).items()}
+
+    def paths_for(self, resource_type: str) -> List[ReferencePath]:
+        return list(self._paths.get(resource_type, []))
+
+    def path(self, resource_type: str, path: str) -> Optional[ReferencePath]:
+        """The indexed Reference element at ``path`` of ``resource_type``, if any."""
+        for reference_path in self._paths.get(resource_type, []):
+            if reference_path.path == path:
+                return reference_path
+        return None
+
+    def target_types(self, resource_type: str) -> List[str]:
+        """Every type the references of ``resource_type`` may point to."""
+        return sorted({target for reference_path in self._paths.get(resource_type, [])
+                       for target in reference_path.targets})
+
+    @classmethod
+    def from_search_parameters(cls, resource_types: Optional[Iterable[str]] = None,
+                               search_parameters_path: Path = SEARCH_PARAMETERS_PATH,
+                               element_definitions: Optional[Dict[str, Dict[str, Any]]] = None,
+                               table: str = DEFAULT_REFERENCE_TABLE) -> "ReferenceIndex":
+        """Index the reference search parameter paths (and Reference elements).
+
+        Args:
+            resource_types: Only these source types (all when None)
+            search_parameters_path: FHIR ``search-parameters.json`` Bundle
+            element_definitions: Element path -> definition; loaded from the
+                shipped definitions when None
+            table: Edge table name
+        """
+        if element_definitions is None:
+            element_definitions = _load_element_definitions()
+        wanted = set(resource_types) if resource_types is not None else None
+
+        targets: Dict[str, Dict[str, set]] = {}
+        with open(search_parameters_path, encoding="utf-8") as handle:
+            bundle = json.load(handle)
+        for entry in bundle.get("entry", []):
+            parameter = entry.get("resource", {})
+            if parameter.get("type") != "reference" or not parameter.get("expression"):
+                continue
+            for base in parameter.get("base", []):
+                if wanted is not None and base not in wanted:
+                    continue
+                for path, as_type in _expressions_for(parameter["expression"], base):
+                    if as_type:
+                        if as_type != "Reference":
+                            continue
+                        path = f"{path}Reference"
+                    targets.setdefault(base, {}).setdefault(path, set()).update(
+                        target for target in parameter.get("target", []) if _RESOURCE_TYPE.match(target)
+                    )
+
+        for element_path, definition in element_definitions.items():
+            resource_type, _, path = element_path.partition(".")
+            if (definition.get("type") == "Reference" and path and _ELEMENT_PATH.match(path)
+                    and _RESOURCE_TYPE.match(resource_type)
+                    and (wanted is None or resource_type in wanted)):
+                targets.setdefault(resource_type, {}).setdefault(path, set())
+
+        paths = {
+            resource_type: [ReferencePath(path, tuple(sorted(types))) for path, types in sorted(by_path.items())]
+            for resource_type, by_path in targets.items()
+        }
+        return cls(paths, table)
+
+    # SQL
+
+    def create_statements(self) -> List[str]:
+        """DDL for the edge table and its lookup indexes (idempotent)."""
+        definitions = ", ".join(f"{column} VARCHAR" for column in EDGE_COLUMNS)
+        return [
+            f"CREATE TABLE IF NOT EXISTS {self.table} ({definitions})",
+            f"CREATE INDEX IF NOT EXISTS {self.table}_source ON {self.table} (source_type, source_id)",
+            f"CREATE INDEX IF NOT EXISTS {self.table}_target ON {self.table} (target_type, target_id)",
+        ]
+
+    def insert_statements(self, dialect: DatabaseDialect, resource_type: str, source: str,
+                          id_column: str = "id", json_column: str = "resource") -> List[str]:
+        """INSERTs adding the edges of the resources in ``source``.
+
+        Args:
+            source: Table or parenthesised query with the resources to index
+            id_column: Column of ``source`` with the resource id
+            json_column: Column of ``source`` with the resource JSON
+        """
+        statements = []
+        for reference_path in self._paths.get(resource_type, []):
+            reference_rows = _reference_rows(dialect, source, reference_path.path, id_column, json_column)
+            target_id = dialect.generate_reference_key("refs.reference")
+            statements.append(
+                f"INSERT INTO {self.table} ({', '.join(EDGE_COLUMNS)}) "
+                f"SELECT '{resource_type}', refs.source_id, '{reference_path.path}', "
+                f"{dialect.generate_reference_type('refs.reference')}, {target_id} "
+                f"FROM ({reference_rows}) AS refs "
+                f"WHERE {target_id} IS NOT NULL"
+            )
+        return statements
+
+    def delete_statements(self, resource_type: str, ids_query: Optional[str] = None) -> List[str]:
+        """DELETE removing the edges of ``resource_type`` (from ``ids_query`` ids only, if given)."""
+        if not self._paths.get(resource_type):
+            return []
+        where = f"source_type = '{resource_type}'"
+        if ids_query is not None:
+            where += f" AND source_id IN ({ids_query})"
+        return [f"DELETE FROM {self.table} WHERE {where}"]
+
+    def rebuild_statements(self, dialect: DatabaseDialect, resource_type: str, source: str) -> List[str]:
+        """Statements re-deriving the reference edges of the ``resource_type`` rows in ``source``.
+
+        Args:
+            source: Table or parenthesised query with the stored rows
+                (``id`` and ``resource`` columns)
+        """
+        return [
+            *self.create_statements(),
+            *self.delete_statements(resource_type),
+            *self.insert_statements(dialect, resource_type, source),
+        ]
+
+    def resolve_expression(self, dialect: DatabaseDialect, resource_type: str, path: str,
+                           source_id: str, targets: Dict[str, str]) -> str:
+        """Correlated subquery aggregating the resources referenced at ``path``.
+
+        Args:
+            source_id: SQL for the id of the referencing resource (correlated)
+            targets: Target type -> relation (table or parenthesised query)
+                with its ``id``/``resource`` rows
+
+        Returns:
+            SQL for a JSON array of the referenced resources (NULL when none)
+        """
+        # Inner column names differ from id/resource so source_id may refer to the outer row
+        candidates = " UNION ALL ".join(
+            f"SELECT '{target}' AS stored_type, stored.id AS stored_id, stored.resource AS stored_resource "
+            f"FROM {relation} AS stored"
+            for target, relation in targets.items()
+        )
+        return (
+            f"(SELECT {dialect.aggregate_to_json_array('target.stored_resource')} "
+            f"FROM {self.table} AS edge JOIN ({candidates}) AS target "
+            f"ON target.stored_type = edge.target_type AND target.stored_id = edge.target_id "
+            f"WHERE edge.source_type = '{resource_type}' AND edge.path = '{path}' "
+            f"AND edge.source_id = {source_id})"
+        )
+
+
+def element_rows(dialect: DatabaseDialect, source: str, path: str,
+                 id_column: str = "id", json_column: str = "resource") -> str:
+    """SELECT of (source_id, item) for every JSON item at ``path``."""
+    # One set-returning SELECT per path segment, so repeating elements at any level
+    # are followed; far cheaper than lateral joins on DuckDB
+    query = f"SELECT src.{id_column} AS source_id, src.{json_column} AS item FROM {source} AS src"
+    for segment in path.split("."):
+        items = dialect.as_json_collection(dialect.extract_json_path_value("parent.item", [segment]))
+        query = (f"SELECT parent.source_id, {dialect.unnest_json_collection(items)} AS item "
+                 f"FROM ({query}) AS parent")
+    return query
+
+
+def _reference_rows(dialect: DatabaseDialect, source: str, path: str,
+                    id_column: str = "id", json_column: str = "resource") -> str:
+    """SELECT of (source_id, reference) for every ``reference`` string at ``path``."""
+    return (
+        f"SELECT items.source_id, {dialect.extract_json_string('items.item', '$.reference')} AS reference "
+        f"FROM ({element_rows(dialect, source, path, id_column, json_column)}) AS items"
+    )
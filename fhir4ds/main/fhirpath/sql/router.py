@@ -0,0 +1,196 @@
+"""
+Route FHIRPath evaluation between in-process closures and SQL.
+
+Loading a handful of resources into a table to run one query costs far more
+than evaluating the expression on them directly, while a population is best
+left to the database. :class:`FHIRPathRouter` evaluates small batches of
+resources in hand with :class:`~fhir4ds.fhirpath.closures.ClosureEvaluator`
+and everything else with :class:`FHIRPathExecutor`:
+
+- no resources: SQL over the stored population
+- up to ``max_closure_resources`` resources: compiled closures, falling back
+  to SQL when the expression uses something closures do not cover
+- more resources: loaded into a scratch table and queried with SQL
+
+Example:
+    >>> router = FHIRPathRouter(dialect, "Observation", catalog=catalog)
+    >>> router.evaluate("status = 'final'", [observation])     # closures
+    {'o1': [True]}
+    >>> router.evaluate("status = 'final'")                     # SQL
+    {'o1': [True], 'o2': [False], ...}
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+from fhir4ds.dialects.base import DatabaseDialect
+from fhir4ds.fhirpath.closures import ClosureEvaluator
+from fhir4ds.fhirpath.exceptions import FHIRPathExecutionError, FHIRPathTranslationError
+from fhir4ds.fhirpath.sql.catalog import StorageCatalog
+from fhir4ds.fhirpath.sql.executor import FHIRPathExecutor
+
+logger = logging.getLogger(__name__)
+
+#: Largest batch of resources evaluated with closures rather than SQL.
+DEFAULT_MAX_CLOSURE_RESOURCES = 100
+
+#: Table resources evaluated with SQL are loaded into.
+DEFAULT_SCRATCH_TABLE = "fhir4ds_router_scratch"
+
+_JSON_SCALAR = re.compile(r"true|false|-?\d+(\.\d+)?([eE][+-]?\d+)?")
+
+
+class FHIRPathRouter:
+    """Evaluates FHIRPath with closures for a few resources and SQL for many.
+
+    Results map resource ids to their result collections, in the closures'
+    representation whichever path evaluated them (see
+    :mod:`fhir4ds.fhirpath.closures`): SQL values are converted back from
+    JSON text, dates and floats. SQL leaves out stored resources the
+    expression yields nothing for.
+
+    Args:
+        dialect: Database dialect for SQL evaluation
+        resource_type: Resource type expressions are evaluated on
+        catalog: Storage catalog of the stored population
+        max_closure_resources: Largest batch evaluated with closures
+        evaluator: Closure evaluator override (e.g. to share its cache)
+        scratch_table: Table batches evaluated with SQL are loaded into
+    """
+
+    def __init__(self, dialect: DatabaseDialect, resource_type: str, *,
+                 catalog: Optional[StorageCatalog] = None,
+                 max_closure_resources: int = DEFAULT_MAX_CLOSURE_RESOURCES,
+                 evaluator: Optional[ClosureEvaluator] = None,
+                 scratch_table: str = DEFAULT_SCRATCH_TABLE):
+        self.dialect = dialect
+        self.resource_type = resource_type
+        self.catalog = catalog
+        self.max_closure_resources = max_closure_resources
+        self.evaluator = evaluator or ClosureEvaluator(resource_type)
+        self.scratch_table = scratch_table
+        self.executor = FHIRPathExecutor(dialect, resource_type, catalog=catalog)
+
+    def evaluate(self, expression: str,
+                 resources: Optional[Sequence[Mapping[str, Any]]] = None) -> Dict[str, List[Any]]:
+        """Evaluate ``expression`` on ``resources``, or on the stored population when None.
+
+        Raises:
+            FHIRPathExecutionError: The expression does not parse or evaluation
+                failed, on either path (the closures' own error is the
+                ``original_exception``)
+        """
+        if resources is None:
+            return self._collect(self.executor.execute_with_details(expression))
+        if len(resources) <= self.max_closure_resources:
+            try:
+                compiled = self.evaluator.compile(expression)
+            except FHIRPathTranslationError as exc:
+                logger.debug("Evaluating %r with SQL: %s", expression, exc)
+            except Exception as exc:
+                raise _stage_error("parse", expression, exc) from exc
+            else:
+                try:
+                    return {resource.get("id"): compiled(resource) for resource in resources}
+                except Exception as exc:
+                    raise _stage_error("execute", expression, exc) from exc
+        return self._evaluate_loaded(expression, resources)
+
+    def _evaluate_loaded(self, expression: str, resources: Sequence[Mapping[str, Any]]) -> Dict[str, List[Any]]:
+        """Load ``resources`` into the scratch table and evaluate ``expression`` there with SQL."""
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        catalog = StorageCatalog(per_type_default=False)
+        catalog.add_table(self.resource_type, table=self.scratch_table)
+        self.dialect.execute_query(f"DROP TABLE IF EXISTS {self.scratch_table}")
+        try:
+            NDJSONLoader(self.dialect, catalog=catalog).load_resources(
+                (json.dumps(resource).encode("utf-8") for resource in resources), [self.resource_type])
+            details = FHIRPathExecutor(self.dialect, self.resource_type, catalog=catalog).execute_with_details(
+                expression)
+        finally:
+            self.dialect.execute_query(f"DROP TABLE IF EXISTS {self.scratch_table}")
+        results: Dict[str, List[Any]] = {resource.get("id"): [] for resource in resources}
+        results.update(self._collect(details))
+        return results
+
+    @staticmethod
+    def _collect(details: Mapping[str, Any]) -> Dict[str, List[Any]]:
+        """Result rows by resource id, with values as closures return them.
+
+        A path's values come back as JSON text: complex elements are decoded
+        (an array into its items) and booleans and numbers are typed by the
+        matching element of the row's resource.
+        """
+        fragments = details.get("fragments") or []
+        metadata = fragments[-1].metadata if fragments else {}
+        leaf = None
+        if metadata.get("source_path") and not metadata.get("is_literal"):
+            names = re.findall(r"[A-Za-z_]\w*", metadata["source_path"])
+            leaf = names[-1] if names else None
+        results: Dict[str, List[Any]] = {}
+        for row in details["results"]:
+            values = results.setdefault(row[0], [])
+            value = row[-1]
+            if value is None:
+                continue
+            if leaf is not None and isinstance(value, str):
+                values.extend(_element_values(value, row[1] if len(row) > 2 else None, leaf))
+            else:
+                values.append(_python_value(value))
+        return results
+
+
+def _stage_error(stage: str, expression: str, exc: Exception) -> FHIRPathExecutionError:
+    """The closures' ``exc`` as the FHIRPathExecutionError SQL evaluation raises."""
+    if isinstance(exc, FHIRPathExecutionError):
+        return exc
+    return FHIRPathExecutionError(f"{stage} stage failed for expression '{expression}'", stage, expression, exc)
+
+
+def _python_value(value: Any) -> Any:
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return value
+
+
+def _element_values(text: str, resource: Any, leaf: str) -> List[Any]:
+    """The values of a path element the database returned as ``text``."""
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            decoded = json.loads(stripped)
+        except ValueError:
+            return [text]
+        return decoded if isinstance(decoded, list) else [decoded]
+    if not _JSON_SCALAR.fullmatch(stripped) or resource is None:
+        return [text]
+    if isinstance(resource, (str, bytes)):
+        try:
+            resource = json.loads(resource)
+        except ValueError:
+            return [text]
+    for candidate in _named_values(resource, leaf):
+        if isinstance(candidate, (bool, int, float)) and json.dumps(candidate) == stripped:
+            return [Decimal(stripped) if isinstance(candidate, float) else candidate]
+    return [text]
+
+
+def _named_values(node: Any, name: str) -> Iterator[Any]:
+    """Values anywhere in ``node`` under ``name`` or a choice of it (``value`` matches ``valueInteger``)."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _named_values(item, name)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            if key == name or (key.startswith(name) and key[len(name):][:1].isupper()):
+                yield from value if isinstance(value, list) else [value]
+            yield from _named_values(value, name)
@@ -0,0 +1,723 @@
+"""FHIR search parameter indexes and a search query compiler.
+
+A FHIR server answers ``Observation?code=http://loinc.org|1234-5&date=ge2020``
+from indexes built when resources are written, not by parsing every
+resource. A :class:`SearchIndex` does the same for the analytics store: it
+evaluates the FHIRPath expression of each SearchParameter of the shipped
+``search-parameters.json`` once per resource at load time, in one batched
+INSERT per index table and resource type, and keeps the values in five
+typed tables keyed by ``(resource_type, resource_id, param)``:
+
+- **token** ``(system, code)``: Codings, the codings of CodeableConcepts,
+  Identifiers, ContactPoints and codes, booleans, ids (and ``uri`` values)
+- **string** ``(value, normalized)``: strings and the parts of HumanNames
+  and Addresses; ``normalized`` is lower-cased for case-insensitive matching
+- **date** ``(low, high)``: the half-open range covered by a date, dateTime,
+  instant or Period (a day covers 24 hours; an open Period end is NULL)
+- **reference** ``(target_type, target_id)``: literal references
+- **quantity** ``(value, system, code, unit)``: Quantities and ``number`` values
+
+Expressions are compiled to set-based SQL: union members of element paths
+with ``as``/``ofType`` type selection, ``where(resolve() is Type)`` and
+``where(member = 'literal')`` filters (``telecom.where(system='phone')``).
+Members using other functions, and composite and special parameters, are
+not indexed.
+
+:meth:`SearchIndex.search_conditions` compiles the parameters of a search
+URL to ``id IN (...)`` semi-joins on these tables, supporting the
+``eq/ne/gt/lt/ge/le/sa/eb/ap`` prefixes, comma-separated alternatives, the
+``:missing``, ``:not``, ``:exact``, ``:contains`` and ``:<Type>`` modifiers
+and chained reference parameters (``subject:Patient.name=smith``).
+:meth:`SearchIndex.search_query` wraps them in a query over the rows a
+StorageCatalog stores.
+
+Example:
+    >>> index = SearchIndex.from_search_parameters(resource_types=["Observation", "Patient"])
+    >>> catalog = StorageCatalog(search_index=index)
+    >>> NDJSONLoader(dialect, catalog=catalog).load("export/")
+    >>> dialect.execute_query(index.search_query(dialect, catalog, "Observation?code=http://loinc.org|1234-5"))
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from fhir4ds.dialects.base import DatabaseDialect
+from ..types.fhir_types import resolve_polymorphic_property
+from .extraction import SEARCH_PARAMETERS_PATH, _element_type, _load_element_definitions
+from .references import element_rows
+
+if TYPE_CHECKING:
+    from .catalog import StorageCatalog
+
+DEFAULT_SEARCH_PREFIX = "fhir4ds_search"
+
+KEY_COLUMNS = ("resource_type", "resource_id", "param")
+
+# Index table -> (column, type) of the indexed values
+INDEX_COLUMNS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "token": (("system", "VARCHAR"), ("code", "VARCHAR")),
+    "string": (("value", "VARCHAR"), ("normalized", "VARCHAR")),
+    "date": (("low", "TIMESTAMP"), ("high", "TIMESTAMP")),
+    "reference": (("target_type", "VARCHAR"), ("target_id", "VARCHAR")),
+    "quantity": (("value", "DOUBLE PRECISION"), ("system", "VARCHAR"), ("code", "VARCHAR"), ("unit", "VARCHAR")),
+}
+
+# Lookup column of each index table (after resource_type and param)
+_LOOKUP_COLUMNS = {"token": "code", "string": "normalized", "date": "low",
+                   "reference": "target_id", "quantity": "value"}
+
+# SearchParameter type -> index table
+INDEX_OF_TYPE = {"token": "token", "uri": "token", "string": "string", "date": "date",
+                 "reference": "reference", "quantity": "quantity", "number": "quantity"}
+
+PREFIXES = ("eq", "ne", "gt", "lt", "ge", "le", "sa", "eb", "ap")
+
+# Choice type suffixes worth indexing for each index table
+_CHOICE_SUFFIXES = {
+    "token": ("CodeableConcept", "Coding", "Identifier", "Code", "Boolean", "String", "Uri"),
+    "string": ("String", "Markdown", "HumanName", "Address"),
+    "date": ("Date", "DateTime", "Instant", "Period"),
+    "reference": ("Reference",),
+    "quantity": ("Quantity", "Age", "Duration", "Distance", "Count", "SimpleQuantity",
+                 "Integer", "Decimal", "PositiveInt", "UnsignedInt"),
+}
+
+# String parts of complex types searched by string parameters
+_STRING_MEMBERS = {
+    "HumanName": ("text", "family", "given", "prefix", "suffix"),
+    "Address": ("text", "line", "city", "district", "state", "postalCode", "country"),
+}
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_RESOURCE_TYPE = re.compile(r"^[A-Z][A-Za-z]*$")
+_MEMBER = r"[A-Za-z][A-Za-z0-9]*"
+_FILTER_STEP = re.compile(rf"^where\(({_MEMBER})\s*=\s*'([^'\\]*)'\)$")
+_STEP = re.compile(rf"where\({_MEMBER}\s*=\s*'[^'\\]*'\)|{_MEMBER}")
+_PATH = re.compile(rf"^(?:{_STEP.pattern})(?:\.(?:{_STEP.pattern}))*$")
+_DATE = re.compile(r"^(\d{4})(?:-(\d{2})(?:-(\d{2})(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?"
+                   r"(?:Z|[+-]\d{2}:\d{2})?)?)?)?$")
+_NUMBER = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$")
+
+
+@dataclass(frozen=True)
+class IndexedParameter:
+    """A search parameter and the element paths whose values it indexes.
+
+    Attributes:
+        code: Parameter name used in search URLs, e.g. ``code``
+        type: SearchParameter type (``token``, ``string``, ``date``...)
+        paths: Element paths relative to the resource; ``where(member='x')``
+            steps filter the items of the preceding element
+        targets: Resource types references may point to (reference parameters)
+    """
+
+    code: str
+    type: str
+    paths: Tuple[str, ...]
+    targets: Tuple[str, ...] = ()
+
+    def __post_init__(self) -> None:
+        if not re.match(r"^_?[A-Za-z][A-Za-z0-9\-]*$", self.code):
+            raise ValueError(f"Invalid search parameter code: {self.code!r}")
+        if self.type not in INDEX_OF_TYPE:
+            raise ValueError(f"Search parameters of type {self.type!r} cannot be indexed")
+        if not self.paths or not all(_PATH.match(path) for path in self.paths):
+            raise ValueError(f"Invalid paths for search parameter {self.code!r}: {self.paths!r}")
+        if not all(_RESOURCE_TYPE.match(target) for target in self.targets):
+            raise ValueError(f"Invalid reference targets: {self.targets!r}")
+
+    @property
+    def index(self) -> str:
+        """Index table holding the values of this parameter."""
+        return INDEX_OF_TYPE[self.type]
+
+
+class SearchIndex:
+    """Indexed search parameters per resource type and their value tables.
+
+    Parameters listed under ``"Resource"`` (``_id``, ``_lastUpdated``...)
+    apply to every type.
+    """
+
+    def __init__(self, parameters: Optional[Dict[str, List[IndexedParameter]]] = None,
+                 prefix: str = DEFAULT_SEARCH_PREFIX,
+                 element_definitions: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Initialize the index.
+
+        Args:
+            parameters: Resource type -> parameters to index
+            prefix: Prefix of the index tables (``<prefix>_token``...)
+            element_definitions: Element path -> definition, used to pick the
+                members indexed for each element type; without a definition
+                every member a value could have is tried
+        """
+        if not _IDENTIFIER.match(prefix):
+            raise ValueError(f"Invalid search index prefix: {prefix!r}")
+        self.prefix = prefix
+        self._parameters = {resource_type: list(items) for resource_type, items in (parameters or {}).items()}
+        self._element_definitions = element_definitions or {}
+
+    def table(self, index: str) -> str:
+        """Name of an index table (``token``, ``string``, ``date``, ``reference`` or ``quantity``)."""
+        return f"{self.prefix}_{index}"
+
+    def parameters_for(self, resource_type: str) -> List[IndexedParameter]:
+        """Parameters indexed for ``resource_type``, type-specific ones first."""
+        parameters: Dict[str, IndexedParameter] = {}
+        for parameter in self._parameters.get(resource_type, []) + self._parameters.get("Resource", []):
+            parameters.setdefault(parameter.code, parameter)
+        return list(parameters.values())
+
+    def parameter(self, resource_type: str, code: str) -> Optional[IndexedParameter]:
+        for parameter in self.parameters_for(resource_type):
+            if parameter.code == code:
+                return parameter
+        return None
+
+    @classmethod
+    def from_search_parameters(cls, resource_types: Optional[Iterable[str]] = None,
+                               parameters: Optional[Iterable[str]] = None,
+                               search_parameters_path: Path = SEARCH_PARAMETERS_PATH,
+                               element_definitions: Optional[Dict[str, Dict[str, Any]]] = None,
+                               prefix: str = DEFAULT_SEARCH_PREFIX) -> "SearchIndex":
+        """Index the SearchParameters of the FHIR R4 definitions.
+
+        Args:
+            resource_types: Only these types (all bases when None)
+            parameters: Only these parameter codes (all when None)
+            search_parameters_path: FHIR ``search-parameters.json`` Bundle
+            element_definitions: Element path -> definition; loaded from the
+                shipped definitions when None
+            prefix: Prefix of the index tables
+        """
+        if element_definitions is None:
+            element_definitions = _load_element_definitions()
+        wanted_types = set(resource_types) if resource_types is not None else None
+        wanted_codes = set(parameters) if parameters is not None else None
+
+        with open(search_parameters_path, encoding="utf-8") as handle:
+            bundle = json.load(handle)
+        indexed: Dict[str, List[IndexedParameter]] = {}
+        for entry in bundle.get("entry", []):
+            definition = entry.get("resource", {})
+            if (definition.get("type") not in INDEX_OF_TYPE or not definition.get("expression")
+                    or (wanted_codes is not None and definition.get("code") not in wanted_codes)):
+                continue
+            for base in definition.get("base", []):
+                if wanted_types is not None and base != "Resource" and base not in wanted_types:
+                    continue
+                paths, resolved = _parameter_paths(definition["expression"], base,
+                                                   INDEX_OF_TYPE[definition["type"]])
+                if paths:
+                    targets = tuple(sorted(resolved or (
+                        target for target in definition.get("target", [])
+                        if _RESOURCE_TYPE.match(target) and target != "Resource")))
+                    indexed.setdefault(base, []).append(
+                        IndexedParameter(definition["code"], definition["type"], tuple(paths), targets))
+        return cls(indexed, prefix, element_definitions)
+
+    # Indexing
+
+    def create_statements(self) -> List[str]:
+        """DDL for the index tables and their lookup indexes (idempotent)."""
+        statements = []
+        for index, columns in INDEX_COLUMNS.items():
+            table = self.table(index)
+            definitions = ", ".join([*(f"{column} VARCHAR" for column in KEY_COLUMNS),
+                                     *(f"{column} {sql_type}" for column, sql_type in columns)])
+            statements.extend([
+                f"CREATE TABLE IF NOT EXISTS {table} ({definitions})",
+                f"CREATE INDEX IF NOT EXISTS {table}_lookup ON {table} "
+                f"(resource_type, param, {_LOOKUP_COLUMNS[index]})",
+                f"CREATE INDEX IF NOT EXISTS {table}_resource ON {table} (resource_type, resource_id)",
+            ])
+        return statements
+
+    def insert_statements(self, dialect: DatabaseDialect, resource_type: str, source: str,
+                          id_column: str = "id", json_column: str = "resource") -> List[str]:
+        """INSERTs indexing the resources in ``source``, one per index table.
+
+        Args:
+            source: Table or parenthesised query with the resources to index
+            id_column: Column of ``source`` with the resource id
+            json_column: Column of ``source`` with the resource JSON
+        """
+        def rows(steps: List[str]) -> str:
+            return _path_rows(dialect, source, steps, id_column, json_column)
+
+        branches: Dict[str, List[str]] = {}
+        for parameter in self.parameters_for(resource_type):
+            for path in parameter.paths:
+                branches.setdefault(parameter.index, []).extend(
+                    self._value_rows(dialect, resource_type, parameter, path, rows))
+        statements = []
+        for index, selects in branches.items():
+            columns = [column for column, _ in INDEX_COLUMNS[index]]
+            statements.append(
+                f"INSERT INTO {self.table(index)} ({', '.join([*KEY_COLUMNS, *columns])}) "
+                f"SELECT '{resource_type}', indexed.resource_id, indexed.param, "
+                f"{', '.join(f'indexed.{column}' for column in columns)} "
+                f"FROM ({' UNION ALL '.join(selects)}) AS indexed"
+            )
+        return statements
+
+    def delete_statements(self, resource_type: str, ids_query: Optional[str] = None) -> List[str]:
+        """DELETEs removing the index rows of ``resource_type`` (of ``ids_query`` ids only, if given)."""
+        indexes = sorted({parameter.index for parameter in self.parameters_for(resource_type)})
+        where = f"resource_type = '{resource_type}'"
+        if ids_query is not None:
+            where += f" AND resource_id IN ({ids_query})"
+        return [f"DELETE FROM {self.table(index)} WHERE {where}" for index in indexes]
+
+    def rebuild_statements(self, dialect: DatabaseDialect, resource_type: str, source: str) -> List[str]:
+        """Statements re-deriving the search parameter values of the ``resource_type`` rows in ``source``.
+
+        Args:
+            source: Table or parenthesised query with the stored rows
+                (``id`` and ``resource`` columns)
+        """
+        return [
+            *self.create_statements(),
+            *self.delete_statements(resource_type),
+            *self.insert_statements(dialect, resource_type, source),
+        ]
+
+    def _value_rows(self, dialect: DatabaseDialect, resource_type: str, parameter: IndexedParameter,
+                    path: str, rows) -> List[str]:
+        """SELECTs of (resource_id, param, <index columns>) for the values at ``path``."""
+        steps = _STEP.findall(path)
+        element_type = _element_type(self._element_definitions, resource_type,
+                                     ".".join(step for step in steps if not step.startswith("where(")))
+        param = f"'{parameter.code}' AS param"
+        item = "items.item"
+
+        if parameter.index == "token":
+            is_scalar = dialect.json_value_type_in(item, ["string", "number", "boolean"])
+            code = (f"CASE WHEN {is_scalar} THEN {dialect.json_value_as_string(item)} "
+                    f"ELSE COALESCE({dialect.extract_json_string(item, '$.code')}, "
+                    f"{dialect.extract_json_string(item, '$.value')}) END")
+            system = f"CASE WHEN {is_scalar} THEN NULL ELSE {dialect.extract_json_string(item, '$.system')} END"
+            selects = [_select_values(rows(steps), param, [(system, "system"), (code, "code")], "code")]
+            if parameter.type == "token" and element_type in (None, "CodeableConcept"):
+                selects.append(_select_values(rows([*steps, "coding"]), param, [
+                    (dialect.extract_json_string(item, "$.system"), "system"),
+                    (dialect.extract_json_string(item, "$.code"), "code"),
+                ], "code"))
+            return selects
+
+        if parameter.index == "string":
+            members = _STRING_MEMBERS.get(element_type or {"name": "HumanName", "address": "Address"}.get(
+                steps[-1], ""), ())
+            is_string = dialect.json_value_type_in(item, ["string"])
+            value = dialect.json_value_as_string(item)
+            return [
+                _select_values(rows(member_steps), param, [(value, "value"), (f"LOWER({value})", "normalized")],
+                               "value", is_string)
+                for member_steps in [steps, *([*steps, member] for member in members)]
+            ]
+
+        if parameter.index == "date":
+            is_string = dialect.json_value_type_in(item, ["string"])
+            start = (f"CASE WHEN {is_string} THEN {dialect.json_value_as_string(item)} "
+                     f"ELSE {dialect.extract_json_string(item, '$.start')} END")
+            end = (f"CASE WHEN {is_string} THEN {dialect.json_value_as_string(item)} "
+                   f"ELSE {dialect.extract_json_string(item, '$.end')} END")
+            bounds = (
+                f"SELECT items.source_id, {start} AS start_text, {end} AS end_text "
+                f"FROM ({rows(steps)}) AS items"
+            )
+            low = date_start(dialect, "bounds.start_text")
+            high = f"{date_start(dialect, 'bounds.end_text')} + {_date_precision('bounds.end_text')}"
+            return [
+                f"SELECT bounds.source_id AS resource_id, {param}, {low} AS low, {high} AS high "
+                f"FROM ({bounds}) AS bounds WHERE {low} IS NOT NULL OR {high} IS NOT NULL"
+            ]
+
+        if parameter.index == "reference":
+            reference = dialect.extract_json_string(item, "$.reference")
+            return [_select_values(rows(steps), param, [
+                (dialect.generate_reference_type(reference), "target_type"),
+                (dialect.generate_reference_key(reference), "target_id"),
+            ], "target_id")]
+
+        number = dialect.extract_json_path_value(item, ["value"])
+        value = f"COALESCE({dialect.json_value_as_number(item)}, {dialect.json_value_as_number(number)})"
+        return [_select_values(rows(steps), param, [
+            (dialect.cast_to_double(value), "value"),
+            (dialect.extract_json_string(item, "$.system"), "system"),
+            (dialect.extract_json_string(item, "$.code"), "code"),
+            (dialect.extract_json_string(item, "$.unit"), "unit"),
+        ], "value")]
+
+    # Search
+
+    def search_query(self, dialect: DatabaseDialect, catalog: "StorageCatalog", url: str) -> str:
+        """Compile a FHIR search URL (``Observation?code=...&date=ge2020``) to SQL.
+
+        The query reads the rows of the URL's resource type from ``catalog``
+        and returns their ``id`` and ``resource``; ``_count`` limits them
+        (ordered by id).
+
+        Raises:
+            ValueError: For parameters the index cannot answer
+        """
+        resource_type, parameters = parse_search(url)
+        count = [value for name, value in parameters if name == "_count"]
+        conditions = self.search_conditions(
+            resource_type, [(name, value) for name, value in parameters if name != "_count"], "matched.id")
+        query = f"SELECT matched.id, matched.resource FROM {catalog.relation(resource_type, dialect, [])} AS matched"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        if count:
+            if not count[-1].isdigit():
+                raise ValueError(f"Invalid _count {count[-1]!r}")
+            query += f" ORDER BY matched.id LIMIT {int(count[-1])}"
+        return query
+
+    def search_conditions(self, resource_type: str, parameters: Iterable[Tuple[str, str]],
+                          id_column: str = "id") -> List[str]:
+        """SQL predicates on ``id_column`` selecting the resources matching ``parameters``.
+
+        Args:
+            resource_type: Type searched
+            parameters: (name, value) pairs of the search URL, names with
+                their modifier (``code:not``); repeated names must all match
+
+        Raises:
+            ValueError: For unknown or unsupported parameters, modifiers and values
+        """
+        conditions = []
+        for name, value in parameters:
+            name, _, modifier = name.partition(":")
+            if name.startswith("_") and name not in {p.code for p in self.parameters_for(resource_type)}:
+                raise ValueError(f"Unsupported search result parameter {name!r}")
+            chain = None
+            if "." in modifier:
+                modifier, _, chain = modifier.partition(".")
+            elif "." in name:
+                name, _, chain = name.partition(".")
+            if modifier == "missing":
+                if value not in ("true", "false"):
+                    raise ValueError(f"':missing' takes true or false, not {value!r}")
+                operator = "NOT IN" if value == "true" else "IN"
+                conditions.append(f"{id_column} {operator} ({self._indexed_ids(resource_type, name)})")
+            elif modifier == "not":
+                conditions.append(f"{id_column} NOT IN ({self.ids_query(resource_type, name, value)})")
+            else:
+                conditions.append(f"{id_column} IN ({self.ids_query(resource_type, name, value, modifier, chain)})")
+        return conditions
+
+    def ids_query(self, resource_type: str, name: str, value: str, modifier: str = "",
+                  chain: Optional[str] = None) -> str:
+        """SELECT of the ids of ``resource_type`` resources matching one search parameter.
+
+        Args:
+            name: Parameter code
+            value: Parameter value; commas separate alternatives
+            modifier: Modifier without the colon (``exact``, ``contains``, a
+                resource type for references)
+            chain: Parameter (with value) searched on the referenced
+                resources, e.g. ``name`` for ``subject:Patient.name=smith``
+        """
+        parameter = self.parameter(resource_type, name)
+        if parameter is None:
+            raise ValueError(f"Unknown search parameter {name!r} for {resource_type}")
+        if chain is not None and parameter.index != "reference":
+            raise ValueError(f"Only reference parameters can be chained, not {name!r}")
+        alternatives = [
+            self._predicate(parameter, _unescape(alternative), modifier, chain)
+            for alternative in _split_unescaped(value, ",")
+        ]
+        return (f"SELECT resource_id FROM {self.table(parameter.index)} "
+                f"WHERE resource_type = '{resource_type}' AND param = '{parameter.code}' "
+                f"AND ({' OR '.join(alternatives)})")
+
+    def _indexed_ids(self, resource_type: str, name: str) -> str:
+        parameter = self.parameter(resource_type, name)
+        if parameter is None:
+            raise ValueError(f"Unknown search parameter {name!r} for {resource_type}")
+        return (f"SELECT resource_id FROM {self.table(parameter.index)} "
+                f"WHERE resource_type = '{resource_type}' AND param = '{parameter.code}'")
+
+    def _predicate(self, parameter: IndexedParameter, value: str, modifier: str,
+                   chain: Optional[str]) -> str:
+        """Condition on the index row for one alternative of a parameter value."""
+        index = parameter.index
+        if index == "reference":
+            return self._reference_predicate(parameter, value, modifier, chain)
+        if index == "string":
+            if modifier not in ("", "exact", "contains"):
+                raise ValueError(f"Unsupported string modifier {modifier!r}")
+            if modifier == "exact":
+                return f"value = {string_literal(value)}"
+            pattern = _like_pattern(value.lower())
+            pattern = ("%" if modifier == "contains" else "") + pattern + "%"
+            return f"normalized LIKE {string_literal(pattern)} ESCAPE '\\'"
+        if modifier:
+            raise ValueError(f"Unsupported modifier {modifier!r} for {parameter.type} parameters")
+        if index == "token":
+            if parameter.type == "uri" or "|" not in value:
+                return f"code = {string_literal(value)}"
+            system, code = value.split("|", 1)
+            conditions = ["system IS NULL" if not system else f"system = {string_literal(system)}"]
+            if code:
+                conditions.append(f"code = {string_literal(code)}")
+            return f"({' AND '.join(conditions)})"
+        prefix, value = _prefix(value)
+        if index == "date":
+            return _date_predicate(prefix, *_date_range(value))
+        return _quantity_predicate(prefix, value)
+
+    def _reference_predicate(self, parameter: IndexedParameter, value: str, modifier: str,
+                             chain: Optional[str]) -> str:
+        if modifier and not _RESOURCE_TYPE.match(modifier):
+            raise ValueError(f"Unsupported reference modifier {modifier!r}")
+        if chain is not None:
+            targets = [modifier] if modifier else list(parameter.targets)
+            chained = [target for target in targets if self.parameter(target, chain.partition(":")[0])]
+            if not chained:
+                raise ValueError(f"No target of {parameter.code!r} has a search parameter {chain!r}")
+            inner = [
+                f"(target_type = '{target}' AND target_id IN ("
+                f"{self._chained_ids(target, chain, value)}))"
+                for target in chained
+            ]
+            return f"({' OR '.join(inner)})"
+        parts = value.rstrip("/").split("/")
+        target_id = parts[-1]
+        if len(parts) >= 4 and parts[-2] == "_history":
+            target_id, parts = parts[-3], parts[:-2]
+        target_type = parts[-2] if len(parts) >= 2 else modifier or (
+            parameter.targets[0] if len(parameter.targets) == 1 else None)
+        if modifier and target_type != modifier:
+            raise ValueError(f"Reference {value!r} does not point to a {modifier}")
+        condition = f"target_id = {string_literal(target_id)}"
+        if target_type:
+            condition = f"(target_type = {string_literal(target_type)} AND {condition})"
+        return condition
+
+    def _chained_ids(self, resource_type: str, chain: str, value: str) -> str:
+        name, _, modifier = chain.partition(":")
+        inner_chain = None
+        if "." in modifier:
+            modifier, _, inner_chain = modifier.partition(".")
+        elif "." in name:
+            name, _, inner_chain = name.partition(".")
+        return self.ids_query(resource_type, name, value, modifier, inner_chain)
+
+
+def parse_search(url: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Split a search URL (``[base/]Type?name=value&...``) into its type and parameters.
+
+    Raises:
+        ValueError: If the URL does not name a resource type
+    """
+    parts = urlsplit(url)
+    resource_type = parts.path.rstrip("/").rsplit("/", 1)[-1]
+    if not _RESOURCE_TYPE.match(resource_type):
+        raise ValueError(f"Search URL does not name a resource type: {url!r}")
+    return resource_type, parse_qsl(parts.query, keep_blank_values=True)
+
+
+def _parameter_paths(expression: str, resource_type: str, index: str) -> Tuple[List[str], List[str]]:
+    """Indexable element paths of the union members of ``expression`` rooted at ``resource_type``.
+
+    Returns:
+        The paths and the types their ``where(resolve() is Type)`` filters select
+    """
+    paths: List[str] = []
+    resolved: List[str] = []
+    for member in _split_unescaped(expression, "|", quotes=True):
+        member = member.strip()
+        # (Type.path as X).rest -> Type.path.as(X).rest
+        member = re.sub(r"^\((.+) as (\w+)\)", r"\1.as(\2)", member)
+        member = re.sub(r"^(.+) as (\w+)$", r"\1.as(\2)", member)
+        while member.startswith("(") and member.endswith(")"):
+            member = member[1:-1].strip()
+        steps = _split_unescaped(member, ".", quotes=True)
+        if steps[0] != resource_type or len(steps) < 2:
+            continue
+        path: List[str] = []
+        for step in steps[1:]:
+            step = step.strip()
+            typed = re.match(r"^(?:as|ofType)\((\w+)\)$", step)
+            if typed and path and not path[-1].startswith("where("):
+                path[-1] = f"{path[-1]}{typed.group(1)[0].upper()}{typed.group(1)[1:]}"
+            elif re.match(r"^where\(resolve\(\) is \w+\)$", step):
+                resolved.append(step[len("where(resolve() is "):-1])
+            elif re.match(rf"^{_MEMBER}$", step) or _FILTER_STEP.match(step):
+                path.append(re.sub(r"\s*=\s*", "=", step))
+            else:
+                path = []
+                break
+        if not path:
+            continue
+        variants = resolve_polymorphic_property(path[-1])
+        if variants:
+            head = ".".join(path[:-1])
+            paths.extend(f"{head}.{variant}" if head else variant for variant in variants
+                         if variant.endswith(_CHOICE_SUFFIXES[index]))
+        else:
+            paths.append(".".join(path))
+    return list(dict.fromkeys(paths)), resolved
+
+
+def _path_rows(dialect: DatabaseDialect, source: str, steps: List[str],
+               id_column: str, json_column: str) -> str:
+    """SELECT of (source_id, item) for the items at ``steps``, applying where() filters."""
+    query, members = None, []
+    for step in [*steps, None]:
+        condition = _FILTER_STEP.match(step) if step is not None else None
+        if step is not None and condition is None:
+            members.append(step)
+            continue
+        if query is None:
+            query = element_rows(dialect, source, ".".join(members), id_column, json_column)
+        elif members:
+            query = element_rows(dialect, f"({query})", ".".join(members), "source_id", "item")
+        members = []
+        if condition is not None:
+            member, literal = condition.groups()
+            query = (f"SELECT filtered.source_id, filtered.item FROM ({query}) AS filtered "
+                     f"WHERE {dialect.extract_json_string('filtered.item', f'$.{member}')} = {string_literal(literal)}")
+    return query
+
+
+def _select_values(rows: str, param: str, values: List[Tuple[str, str]], required: str,
+                   condition: Optional[str] = None) -> str:
+    """SELECT of (resource_id, param, values...) from item rows, dropping rows without ``required``."""
+    columns = ", ".join(f"{expression} AS {alias}" for expression, alias in values)
+    required_expression = dict((alias, expression) for expression, alias in values)[required]
+    where = f"{required_expression} IS NOT NULL"
+    if condition is not None:
+        where += f" AND {condition}"
+    return f"SELECT items.source_id AS resource_id, {param}, {columns} FROM ({rows}) AS items WHERE {where}"
+
+
+def date_start(dialect: DatabaseDialect, text: str) -> str:
+    """TIMESTAMP at which a (partial) date or dateTime string starts."""
+    padded = (f"CASE LENGTH({text}) WHEN 4 THEN {text} || '-01-01T00:00:00' "
+              f"WHEN 7 THEN {text} || '-01T00:00:00' WHEN 10 THEN {text} || 'T00:00:00' ELSE {text} END")
+    return dialect.safe_cast_to_timestamp(padded)
+
+
+def _date_precision(text: str) -> str:
+    """INTERVAL covered by a date or dateTime string of the precision of ``text``."""
+    return (f"CASE LENGTH({text}) WHEN 4 THEN INTERVAL '1 year' WHEN 7 THEN INTERVAL '1 month' "
+            f"WHEN 10 THEN INTERVAL '1 day' ELSE INTERVAL '1 second' END")
+
+
+def _date_range(value: str) -> Tuple[datetime, datetime]:
+    """Half-open range covered by a search date at its precision (time zones are ignored)."""
+    match = _DATE.match(value)
+    if not match:
+        raise ValueError(f"Invalid date search value {value!r}")
+    year, month, day, hour, minute, second = match.groups()
+    low = datetime(int(year), int(month or 1), int(day or 1), int(hour or 0), int(minute or 0), int(second or 0))
+    if month is None:
+        high = low.replace(year=low.year + 1)
+    elif day is None:
+        high = low.replace(year=low.year + low.month // 12, month=low.month % 12 + 1)
+    else:
+        seconds = 86400 if hour is None else 60 if second is None else 1
+        high = low + timedelta(seconds=seconds)
+    return low, high
+
+
+def _date_predicate(prefix: str, low: datetime, high: datetime) -> str:
+    """Condition on the indexed [low, high) range for a prefixed search range."""
+    lower, upper = (f"CAST('{bound.isoformat()}' AS TIMESTAMP)" for bound in (low, high))
+    # NULL bounds are open Period ends
+    conditions = {
+        "eq": f"(low >= {lower} AND high <= {upper})",
+        "ne": f"NOT (low >= {lower} AND high <= {upper})",
+        "gt": f"(high IS NULL OR high > {upper})",
+        "lt": f"(low IS NULL OR low < {lower})",
+        "ge": f"(high IS NULL OR high > {lower})",
+        "le": f"(low IS NULL OR low < {upper})",
+        "sa": f"low >= {upper}",
+        "eb": f"high <= {lower}",
+        "ap": f"((low IS NULL OR low < {upper}) AND (high IS NULL OR high > {lower}))",
+    }
+    return conditions[prefix]
+
+
+def _quantity_predicate(prefix: str, value: str) -> str:
+    """Condition on an indexed quantity or number for ``[prefix]number[|system|code]``."""
+    number, _, unit = value.partition("|")
+    if not _NUMBER.match(number):
+        raise ValueError(f"Invalid number search value {number!r}")
+    try:
+        exact = Decimal(number)
+    except InvalidOperation:
+        raise ValueError(f"Invalid number search value {number!r}") from None
+    # eq and ne match the range implied by the significant digits of the value
+    half = Decimal(5).scaleb(exact.as_tuple().exponent - 1)
+    low, high, ten_percent = exact - half, exact + half, abs(exact) / 10
+    conditions = {
+        "eq": f"(value >= {low} AND value < {high})",
+        "ne": f"NOT (value >= {low} AND value < {high})",
+        "gt": f"value > {exact}", "sa": f"value > {exact}",
+        "lt": f"value < {exact}", "eb": f"value < {exact}",
+        "ge": f"value >= {exact}", "le": f"value <= {exact}",
+        "ap": f"(value >= {exact - ten_percent} AND value <= {exact + ten_percent})",
+    }
+    condition = conditions[prefix]
+    if unit:
+        system, _, code = unit.partition("|") if "|" in unit else ("", "", unit)
+        if system:
+            condition += f" AND system = {string_literal(system)}"
+        if code:
+            condition += f" AND (code = {string_literal(code)} OR unit = {string_literal(code)})"
+        condition = f"({condition})"
+    return condition
+
+
+def _prefix(value: str) -> Tuple[str, str]:
+    if value[:2] in PREFIXES and value[2:3] and (value[2].isdigit() or value[2] in "-."):
+        return value[:2], value[2:]
+    return "eq", value
+
+
+def _split_unescaped(value: str, separator: str, quotes: bool = False) -> List[str]:
+    """Split on ``separator`` outside backslash escapes (and, with ``quotes``, parentheses and quotes)."""
+    parts, current, depth, quoted, escaped = [], "", 0, False, False
+    for char in value:
+        if escaped:
+            current, escaped = current + char, False
+            continue
+        if char == "\\":
+            current, escaped = current + char, True
+            continue
+        if quotes and char == "'":
+            quoted = not quoted
+        elif quotes and not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        if char == separator and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\([\\,|$])", r"\1", value)
+
+
+def _like_pattern(value: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+def string_literal(value: str) -> str:
+    """SQL string literal of ``value``."""
+    return "'" + str(value).replace("'", "''") + "'"
@@ -0,0 +1,356 @@
+"""Local terminology tables for memberOf(), subsumes() and translate().
+
+Quality measures test codes against value sets of thousands of codes;
+inlining those as ``IN (...)`` lists makes statements huge and slow to plan.
+A :class:`TerminologyStore` instead keeps the terminology in three indexed
+tables, filled by ``TerminologyLoader`` from FHIR resources:
+
+- **Value set codes** ``(valueset, system, code)``: the expansion of each
+  ValueSet, or its compose of concept lists, whole code systems and
+  ``is-a``/``descendent-of`` filters on loaded CodeSystems.
+- **Closure** ``(system, ancestor, descendant)``: the transitive (and
+  reflexive) hierarchy of each CodeSystem, from nested concepts and the
+  ``parent``/``subsumedBy`` properties.
+- **Concept maps** ``(map_url, source_system, source_code, target_system,
+  target_code, equivalence)``: the element mappings of each ConceptMap.
+
+The translator compiles ``memberOf()``, ``subsumes()``/``subsumedBy()`` and
+``translate()`` to joins of the resources' Codings with these tables, run
+once for the population as hash joins rather than per row; tests become
+``id IN (...)`` semi-joins. When the catalog's ExtractionProfile has a
+coding side table for the element, ``memberOf()`` joins the side table
+instead of unnesting the JSON.
+
+Example:
+    >>> store = TerminologyStore()
+    >>> TerminologyLoader(dialect, store).load("valuesets.json")
+    >>> catalog = StorageCatalog(terminology=store)
+    >>> FHIRPathExecutor(dialect, "Observation", catalog=catalog).execute(
+    ...     "code.memberOf('http://cts.nlm.nih.gov/fhir/ValueSet/2.16.840.1.113883.3.464.1003.198.12.1013')")
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fhir4ds.dialects.base import DatabaseDialect
+from .extraction import DEFINITIONS_PATH
+
+# ConceptMaps shipped with the FHIR R4 definitions
+CONCEPT_MAPS_PATH = DEFINITIONS_PATH / "conceptmaps.json"
+
+DEFAULT_TERMINOLOGY_PREFIX = "fhir4ds"
+
+VALUESET_COLUMNS = ("valueset", "system", "code")
+CLOSURE_COLUMNS = ("system", "ancestor", "descendant")
+CONCEPT_MAP_COLUMNS = ("map_url", "source_system", "source_code", "target_system", "target_code", "equivalence")
+
+# Mappings that do not carry the source meaning over to the target
+NON_MAPPING_EQUIVALENCES = ("unmatched", "disjoint")
+
+# Rows per multi-row INSERT
+INSERT_BATCH_SIZE = 1000
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_HIERARCHY_PROPERTIES = frozenset({"parent", "subsumedBy"})
+
+
+class TerminologyStore:
+    """Value set, code system closure and concept map tables."""
+
+    def __init__(self, prefix: str = DEFAULT_TERMINOLOGY_PREFIX):
+        if not _IDENTIFIER.match(prefix):
+            raise ValueError(f"Invalid terminology table prefix: {prefix!r}")
+        self.valueset_table = f"{prefix}_valueset_codes"
+        self.closure_table = f"{prefix}_code_closure"
+        self.concept_map_table = f"{prefix}_concept_maps"
+
+    def create_statements(self) -> List[str]:
+        """DDL for the terminology tables and their lookup indexes (idempotent)."""
+        tables = (
+            (self.valueset_table, VALUESET_COLUMNS, VALUESET_COLUMNS),
+            (self.closure_table, CLOSURE_COLUMNS, ("system", "descendant", "ancestor")),
+            (self.concept_map_table, CONCEPT_MAP_COLUMNS, ("map_url", "source_system", "source_code")),
+        )
+        statements = []
+        for table, columns, key in tables:
+            definitions = ", ".join(f"{column} VARCHAR" for column in columns)
+            statements.append(f"CREATE TABLE IF NOT EXISTS {table} ({definitions})")
+            statements.append(f"CREATE INDEX IF NOT EXISTS {table}_key ON {table} ({', '.join(key)})")
+        return statements
+
+    def load_statements(self, resource: Dict[str, Any]) -> List[str]:
+        """Statements replacing the terminology of a ValueSet, CodeSystem or ConceptMap.
+
+        Raises:
+            ValueError: For other resources, resources without a url and value
+                sets whose compose cannot be expanded from loaded CodeSystems
+        """
+        resource_type = resource.get("resourceType")
+        if resource_type not in ("ValueSet", "CodeSystem", "ConceptMap"):
+            raise ValueError(f"Not a terminology resource: {resource_type!r}")
+        url = resource.get("url")
+        if not url:
+            raise ValueError(f"{resource_type} '{resource.get('id')}' has no url")
+        if resource_type == "CodeSystem":
+            return self._codesystem_statements(url, resource)
+        if resource_type == "ConceptMap":
+            return self._concept_map_statements(url, resource)
+        return self._valueset_statements(url, resource)
+
+    # Loading
+
+    def _valueset_statements(self, url: str, valueset: Dict[str, Any]) -> List[str]:
+        statements = [f"DELETE FROM {self.valueset_table} WHERE valueset = {_literal(url)}"]
+        expansion = valueset.get("expansion")
+        if expansion is not None:
+            rows = {(url, item["system"], item["code"]) for item in _expansion_items(expansion.get("contains", []))}
+            return statements + _insert_statements(self.valueset_table, VALUESET_COLUMNS, sorted(rows))
+
+        compose = valueset.get("compose", {})
+        if not compose.get("include"):
+            raise ValueError(f"ValueSet '{url}' has neither an expansion nor a compose")
+        included = " UNION ".join(f"SELECT * FROM ({self._compose_query(url, include)}) AS include{position}"
+                                  for position, include in enumerate(compose["include"]))
+        statements.append(
+            f"INSERT INTO {self.valueset_table} ({', '.join(VALUESET_COLUMNS)}) "
+            f"SELECT {_literal(url)}, codes.system, codes.code FROM ({included}) AS codes"
+        )
+        for exclude in compose.get("exclude", []):
+            statements.append(
+                f"DELETE FROM {self.valueset_table} WHERE valueset = {_literal(url)} "
+                f"AND EXISTS (SELECT 1 FROM ({self._compose_query(url, exclude)}) AS codes "
+                f"WHERE codes.system = {self.valueset_table}.system AND codes.code = {self.valueset_table}.code)"
+            )
+        return statements
+
+    def _compose_query(self, url: str, rule: Dict[str, Any]) -> str:
+        """SELECT of the (system, code) pairs a compose include/exclude rule selects.
+
+        The rule's concepts or filters and its imported value sets must all
+        hold, so their selections are intersected.
+        """
+        parts = [
+            f"SELECT system, code FROM {self.valueset_table} WHERE valueset = {_literal(_canonical_url(canonical))}"
+            for canonical in rule.get("valueSet", [])
+        ]
+        system = rule.get("system")
+        if system is not None:
+            if rule.get("concept"):
+                values = ", ".join(f"({_literal(system)}, {_literal(concept['code'])})"
+                                   for concept in rule["concept"])
+                parts.append(f"SELECT system, code FROM (VALUES {values}) AS listed(system, code)")
+            for rule_filter in rule.get("filter", []):
+                operator = rule_filter.get("op")
+                if rule_filter.get("property") != "concept" or operator not in ("is-a", "descendent-of"):
+                    raise ValueError(
+                        f"ValueSet '{url}': filter {rule_filter.get('property')} {operator} needs an expansion"
+                    )
+                query = (f"SELECT system, descendant AS code FROM {self.closure_table} "
+                         f"WHERE system = {_literal(system)} AND ancestor = {_literal(rule_filter['value'])}")
+                if operator == "descendent-of":
+                    query += " AND descendant <> ancestor"
+                parts.append(query)
+            if not rule.get("concept") and not rule.get("filter"):
+                # The whole code system, as far as it is loaded
+                parts.append(f"SELECT system, descendant AS code FROM {self.closure_table} "
+                             f"WHERE system = {_literal(system)} AND ancestor = descendant")
+        if not parts:
+            raise ValueError(f"ValueSet '{url}' has a compose rule without a system or value set")
+        return " INTERSECT ".join(f"SELECT * FROM ({part}) AS part{position}"
+                                  for position, part in enumerate(parts)) if len(parts) > 1 else parts[0]
+
+    def _codesystem_statements(self, url: str, codesystem: Dict[str, Any]) -> List[str]:
+        parents: Dict[str, Set[str]] = {}
+        for code, parent in _concept_edges(codesystem.get("concept", []), None):
+            parents.setdefault(code, set())
+            if parent is not None:
+                parents[code].add(parent)
+        rows = sorted({(url, ancestor, code) for code in parents for ancestor in _ancestors(code, parents)})
+        return [
+            f"DELETE FROM {self.closure_table} WHERE system = {_literal(url)}",
+            *_insert_statements(self.closure_table, CLOSURE_COLUMNS, rows),
+        ]
+
+    def _concept_map_statements(self, url: str, concept_map: Dict[str, Any]) -> List[str]:
+        rows = []
+        for group in concept_map.get("group", []):
+            for element in group.get("element", []):
+                if "code" not in element:
+                    continue
+                for target in element.get("target", []):
+                    rows.append((url, group.get("source"), element["code"], group.get("target"),
+                                 target.get("code"), target.get("equivalence", "equivalent")))
+        return [
+            f"DELETE FROM {self.concept_map_table} WHERE map_url = {_literal(url)}",
+            *_insert_statements(self.concept_map_table, CONCEPT_MAP_COLUMNS, rows),
+        ]
+
+    # Queries
+    #
+    # ``items`` queries return (source_id, item) rows: the resource id and one
+    # Coding (or code) JSON value of it, as built by the reference index.
+    # Joining them with the terminology tables decorrelates the tests into
+    # hash joins over the whole population.
+
+    def member_ids_query(self, dialect: DatabaseDialect, items: str, valueset: str,
+                         codes_only: bool = False) -> str:
+        """SELECT of the resource ids with a Coding (or code) in ``valueset``.
+
+        Args:
+            items: SELECT of (source_id, item) Coding rows
+            valueset: ValueSet canonical; a ``|version`` suffix is ignored
+            codes_only: The items are plain codes, matched in any system
+        """
+        if codes_only:
+            match = f"member.code = {dialect.json_value_as_string('items.item')}"
+        else:
+            match = (f"member.system = {dialect.extract_json_string('items.item', '$.system')} "
+                     f"AND member.code = {dialect.extract_json_string('items.item', '$.code')}")
+        return (f"SELECT items.source_id FROM ({items}) AS items "
+                f"JOIN {self.valueset_table} AS member ON {match} "
+                f"WHERE member.valueset = {_literal(_canonical_url(valueset))}")
+
+    def side_table_member_ids_query(self, side_table: str, id_column: str, valueset: str,
+                                    system_column: str = "system", code_column: str = "code",
+                                    type_column: Optional[str] = None,
+                                    resource_type: Optional[str] = None) -> str:
+        """SELECT of the resource ids whose coding side table rows are in ``valueset``."""
+        query = (f"SELECT side.{id_column} FROM {side_table} AS side "
+                 f"JOIN {self.valueset_table} AS member "
+                 f"ON member.system = side.{system_column} AND member.code = side.{code_column} "
+                 f"WHERE member.valueset = {_literal(_canonical_url(valueset))}")
+        if type_column is not None:
+            query += f" AND side.{type_column} = {_literal(resource_type)}"
+        return query
+
+    def subsumes_ids_query(self, dialect: DatabaseDialect, items: str, other_items: Optional[str] = None,
+                           code: Optional[str] = None, subsumed_by: bool = False) -> str:
+        """SELECT of the resource ids with a Coding subsuming another Coding (or ``code``).
+
+        Codes subsume themselves and the codes below them in their loaded
+        CodeSystem; Codings of different systems never subsume each other.
+
+        Args:
+            items: SELECT of (source_id, item) Coding rows
+            other_items: SELECT of the (source_id, item) Codings to compare
+                with, from the same resource; None with ``code``
+            code: A code in the system of each Coding, instead of ``other_items``
+            subsumed_by: Test the reverse relation (subsumedBy())
+        """
+        mine, theirs = ("descendant", "ancestor") if subsumed_by else ("ancestor", "descendant")
+        system = dialect.extract_json_string("items.item", "$.system")
+        query = (f"SELECT items.source_id FROM ({items}) AS items "
+                 f"JOIN {self.closure_table} AS closure ON closure.system = {system} "
+                 f"AND closure.{mine} = {dialect.extract_json_string('items.item', '$.code')}")
+        if code is not None:
+            return query + f" WHERE closure.{theirs} = {_literal(code)}"
+        return (query + f" JOIN ({other_items}) AS others ON others.source_id = items.source_id "
+                f"AND {dialect.extract_json_string('others.item', '$.system')} = closure.system "
+                f"AND {dialect.extract_json_string('others.item', '$.code')} = closure.{theirs}")
+
+    def translate_expression(self, dialect: DatabaseDialect, items: str, source_id: str,
+                             concept_map: str) -> str:
+        """Correlated subquery: JSON array of the target Codings ``concept_map`` maps to.
+
+        Unmatched and disjoint mappings are left out; NULL when nothing maps.
+
+        Args:
+            items: SELECT of (source_id, item) Coding rows
+            source_id: SQL for the id of the translated resource (correlated)
+        """
+        target = dialect.create_json_object("'system'", "mapping.target_system", "'code'", "mapping.target_code")
+        excluded = ", ".join(_literal(equivalence) for equivalence in NON_MAPPING_EQUIVALENCES)
+        return (
+            f"(SELECT {dialect.aggregate_to_json_array(target)} FROM ({items}) AS items "
+            f"JOIN {self.concept_map_table} AS mapping "
+            f"ON mapping.source_system = {dialect.extract_json_string('items.item', '$.system')} "
+            f"AND mapping.source_code = {dialect.extract_json_string('items.item', '$.code')} "
+            f"WHERE mapping.map_url = {_literal(_canonical_url(concept_map))} "
+            f"AND mapping.equivalence NOT IN ({excluded}) AND mapping.target_code IS NOT NULL "
+            f"AND items.source_id = {source_id})"
+        )
+
+
+def _canonical_url(canonical: str) -> str:
+    """The url of a ``url|version`` canonical."""
+    return canonical.split("|")[0]
+
+
+def _literal(value: Optional[str]) -> str:
+    return "NULL" if value is None else "'" + str(value).replace("'", "''") + "'"
+
+
+def _insert_statements(table: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]]) -> List[str]:
+    statements = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        values = ", ".join(
+            "(" + ", ".join(_literal(value) for value in row) + ")"
+            for row in rows[start:start + INSERT_BATCH_SIZE]
+        )
+        statements.append(f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}")
+    return statements
+
+
+def _expansion_items(contains: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Selectable codes of an expansion, including nested ``contains``."""
+    for item in contains:
+        if item.get("system") and item.get("code") and not item.get("abstract"):
+            yield item
+        yield from _expansion_items(item.get("contains", []))
+
+
+def _concept_edges(concepts: List[Dict[str, Any]], parent: Optional[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """(code, parent code) for nested concepts and their hierarchy properties."""
+    for concept in concepts:
+        code = concept["code"]
+        yield code, parent
+        for concept_property in concept.get("property", []):
+            if concept_property.get("code") in _HIERARCHY_PROPERTIES and "valueCode" in concept_property:
+                yield code, concept_property["valueCode"]
+        yield from _concept_edges(concept.get("concept", []), code)
+
+
+def _ancestors(code: str, parents: Dict[str, Set[str]]) -> Set[str]:
+    """``code`` and every code above it (cycles are tolerated)."""
+    seen = {code}
+    pending = [code]
+    while pending:
+        for parent in parents.get(pending.pop(), ()):
+            if parent not in seen:
+                seen.add(parent)
+                pending.append(parent)
+    return seen
+
+
+def load_terminology_resources(resources: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Terminology resources in load order: CodeSystems, then ValueSets, then ConceptMaps.
+
+    Bundles are unpacked; value sets importing other value sets follow them.
+    """
+    found: List[Dict[str, Any]] = []
+    for resource in resources:
+        if resource.get("resourceType") == "Bundle":
+            found.extend(load_terminology_resources(
+                entry["resource"] for entry in resource.get("entry", []) if "resource" in entry))
+        elif resource.get("resourceType") in ("CodeSystem", "ValueSet", "ConceptMap"):
+            found.append(resource)
+
+    def imports(valueset: Dict[str, Any]) -> List[str]:
+        return [_canonical_url(canonical) for rule in valueset.get("compose", {}).get("include", [])
+                for canonical in rule.get("valueSet", [])]
+
+    valuesets = [resource for resource in found if resource["resourceType"] == "ValueSet"]
+    ordered: List[Dict[str, Any]] = []
+    placed: Set[str] = set()
+    while valuesets:
+        ready = [valueset for valueset in valuesets
+                 if all(url in placed or url not in {other.get("url") for other in valuesets}
+                        for url in imports(valueset))] or valuesets[:1]
+        for valueset in ready:
+            ordered.append(valueset)
+            placed.add(valueset.get("url"))
+            valuesets.remove(valueset)
+    return ([resource for resource in found if resource["resourceType"] == "CodeSystem"] + ordered
+            + [resource for resource in found if resource["resourceType"] == "ConceptMap"])
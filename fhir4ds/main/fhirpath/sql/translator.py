@@ -27,7 +27,7 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 import re
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from ..ast.visitor import ASTVisitor
 from ..ast.nodes import (
@@ -53,6 +53,8 @@ from ..types.type_discriminators import get_type_discriminator
 from ..types.structure_loader import StructureDefinitionLoader
 from ..types.quantity_builder import build_quantity_json_string
 from pathlib import Path
+from .catalog import SOURCE_RELATION, StorageCatalog, TableSample
+from .references import element_rows
 from .fragments import SQLFragment
 from .context import TranslationContext, VariableBinding
 from .cte import CTEManager
@@ -124,12 +126,15 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         - PEP-003: Complete specification for AST-to-SQL translation
     """
 
-    def __init__(self, dialect: DatabaseDialect, resource_type: str = "Patient"):
+    def __init__(self, dialect: DatabaseDialect, resource_type: str = "Patient",
+                 catalog: Optional[StorageCatalog] = None):
         """Initialize the AST-to-SQL translator.
 
         Args:
             dialect: Database dialect instance for SQL generation
             resource_type: FHIR resource type being translated (default: "Patient")
+            catalog: Storage catalog locating the ``resource_type`` rows; without
+                one, generated SQL reads a physical ``resource`` table
 
         Example:
             >>> from fhir4ds.dialects import DuckDBDialect
@@ -139,12 +144,15 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         super().__init__()
         self.dialect = dialect
         self.resource_type = resource_type
+        self.catalog = catalog
         self.context = TranslationContext(current_resource_type=resource_type)
         self.fragments: List[SQLFragment] = []
         self.type_registry: TypeRegistry = get_type_registry()
         self.element_type_resolver = get_element_type_resolver()
         self.temporal_parser = get_temporal_parser()
         self._internal_alias_counter = 0
+        # resolve() result and the member steps navigated from it so far
+        self._resolved_resources: Optional[Tuple[SQLFragment, List[str]]] = None
 
         # Initialize CTE manager for SQL generation (SP-023-003)
         self._cte_manager = CTEManager(dialect)
@@ -321,6 +329,7 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         """
         # Clear fragments from previous translation
         self.fragments.clear()
+        self._resolved_resources = None
 
         # Reset context to initial state
         self.context.reset()
@@ -347,7 +356,9 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
 
         return self.fragments
 
-    def translate_to_sql(self, ast_root: FHIRPathASTNode) -> str:
+    def translate_to_sql(self, ast_root: FHIRPathASTNode,
+                         patients: Optional[Sequence[str]] = None,
+                         sample: Optional[TableSample] = None) -> str:
         """Translate FHIRPath AST directly to SQL.
 
         Main entry point that coordinates translation and generates complete SQL.
@@ -360,6 +371,9 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
 
         Args:
             ast_root: Root node of the FHIRPath AST to translate
+            patients: Evaluate only the resources in these patients' compartments
+                (requires a catalog with a CompartmentIndex)
+            sample: Evaluate only a Bernoulli sample of the resources
 
         Returns:
             Complete SQL query string ready for execution
@@ -387,13 +401,39 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         if not fragments:
             raise ValueError("Translation produced no SQL fragments")
 
-        # Use the internal CTE manager to generate the final SQL
-        sql = self._cte_manager.generate_sql(fragments)
+        # Use the internal CTE manager to generate the final SQL; with a storage
+        # catalog the "resource" relation becomes a CTE over this type's rows,
+        # projecting only the key columns the fragments reference
+        source_query = None
+        if self.catalog:
+            mapping = self.catalog.resolve(self.resource_type)
+            referenced = [
+                column.name for column in mapping.columns()
+                if any(re.search(rf"\b{column.name}\b", fragment.expression) for fragment in fragments)
+            ]
+            source_query = mapping.source_query(self.dialect, referenced, sample)
+        elif sample is not None:
+            source_query = f"SELECT id, resource FROM {sample.relation(self.dialect, SOURCE_RELATION)}"
+        member_query = None
+        if patients is not None:
+            index = self.catalog.compartment_index if self.catalog else None
+            if index is None:
+                raise ValueError("Restricting to patients requires a catalog with a CompartmentIndex")
+            member_query = index.members_query(self.resource_type, patients)
+        sql = self._cte_manager.generate_sql(fragments, source_query, member_query)
 
         logger.info(f"Generated SQL from {len(fragments)} fragments")
 
         return sql
 
+    def _extracted_column(self, json_path: str) -> Optional[str]:
+        """Catalog column holding the text at ``json_path`` of the root resource, if any."""
+        if (not self.catalog or not json_path.startswith("$.")
+                or self.context.current_table != SOURCE_RELATION
+                or self.context.current_resource_type != self.resource_type):
+            return None
+        return self.catalog.resolve(self.resource_type).column_for_path(json_path[2:])
+
     def _resolve_canonical_type(self, type_name: Any, strict: bool = False) -> str:
         """Resolve provided type name to canonical FHIR type, enforcing validation.
 
@@ -2165,6 +2205,19 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         """
         identifier_value = node.identifier or node.text
         logger.debug(f"Translating identifier: {identifier_value}")
+
+        # Member steps after resolve() navigate the resolved resources, not the path
+        if self._resolved_resources is not None:
+            resolved, members = self._resolved_resources
+            members = members + [identifier_value]
+            self._resolved_resources = (resolved, members)
+            return SQLFragment(
+                expression=self.dialect.project_json_array(resolved.expression, members),
+                source_table=resolved.source_table,
+                requires_unnest=False,
+                is_aggregate=False,
+                dependencies=list(resolved.dependencies)
+            )
         logger.debug(f"SP-103-005: visit_identifier: identifier_value='{identifier_value}', parent_path={self.context.parent_path}")
 
         # SP-110 FIX: Special handling for identifier navigation after repeat() results
@@ -2682,7 +2735,12 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         # For primitive types, use extract_primitive_value to handle both simple and complex representations
         # This ensures we maintain the "thin dialect" architecture principle:
         # business logic here, only syntax differences in dialects
-        if is_primitive:
+        extracted_column = self._extracted_column(json_path)
+        if extracted_column:
+            # The loader stored exactly this element's text in a column
+            sql_expr = f"{self.context.current_table}.{extracted_column}"
+            logger.debug(f"Reading {field_path} from extracted column {extracted_column}")
+        elif is_primitive:
             sql_expr = self.dialect.extract_primitive_value(
                 column=self.context.current_table,
                 path=json_path
@@ -2865,6 +2923,7 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
 
         # Dispatch to specific function translation method
         function_name = node.function_name.lower()
+        self._resolved_resources = None
 
         if function_name == "where":
             return self._translate_where(node)
@@ -2985,6 +3044,14 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
             return self._translate_conforms_to(node)
         elif function_name == "extension":
             return self._translate_extension_function(node)
+        elif function_name == "resolve":
+            return self._translate_resolve(node)
+        elif function_name == "memberof":
+            return self._translate_member_of(node)
+        elif function_name in ("subsumes", "subsumedby"):
+            return self._translate_subsumes(node)
+        elif function_name == "translate":
+            return self._translate_concept_map(node)
         elif function_name == "iif":
             return self._translate_iif(node)
         elif function_name == "alltrue":
@@ -8270,6 +8337,206 @@ class ASTToSQLTranslator(ASTVisitor[SQLFragment]):
         finally:
             self._restore_context(snapshot)
 
+    def _translate_resolve(self, node: FunctionCallNode) -> SQLFragment:
+        """Translate resolve() to a join through the catalog's reference index.
+
+        Only indexed Reference elements of the root resource can be resolved;
+        the result is the JSON array of referenced resources of the element's
+        target types.
+        """
+        if node.arguments:
+            raise ValueError("resolve() function takes no arguments")
+        index = self.catalog.reference_index if self.catalog else None
+        if index is None:
+            raise ValueError("resolve() requires a StorageCatalog with a ReferenceIndex")
+
+        (
+            _,
+            dependencies,
+            _,
+            snapshot,
+            _,
+            target_path,
+        ) = self._resolve_function_target(node)
+
+        try:
+            path = ".".join(re.sub(r"\[\d+\]$", "", component) for component in target_path or [])
+            reference_path = index.path(self.resource_type, path)
+            if snapshot["current_table"] != SOURCE_RELATION or reference_path is None:
+                raise ValueError(
+                    f"resolve() is only supported on indexed Reference elements of {self.resource_type}; "
+                    f"'{path}' is not indexed"
+                )
+            if not reference_path.targets:
+                raise ValueError(f"resolve() on '{path}' needs the reference's target types")
+
+            targets = {
+                target: self.catalog.relation(target, self.dialect)
+                for target in reference_path.targets
+            }
+            # Every CTE of the chain carries the resource's id column
+            result_expression = index.resolve_expression(self.dialect, self.resource_type, path, "id", targets)
+
+            fragment = SQLFragment(
+                expression=result_expression,
+                source_table=snapshot["current_table"],
+                requires_unnest=False,
+                is_aggregate=False,
+                dependencies=dependencies.copy() if dependencies else []
+            )
+        finally:
+            self._restore_context(snapshot)
+        self._resolved_resources = (fragment, [])
+        # Functions chained after resolve() operate on the resolved resources
+        self.context.pending_fragment_result = (fragment.expression, self.context.parent_path.copy(), True)
+        return fragment
+
+    def _translate_member_of(self, node: FunctionCallNode) -> SQLFragment:
+        """Translate memberOf(valueset) to a semi-join with the terminology store.
+
+        True when any Coding (or code) of the element is in the value set.
+        Elements with a coding side table are matched through it.
+        """
+        if len(node.arguments) != 1:
+            raise ValueError("memberOf() requires exactly 1 argument (value set url)")
+        store = self._terminology_store("memberOf")
+        valueset = self._string_argument(node.arguments[0], "memberOf")
+
+        _, dependencies, _, snapshot, _, target_path = self._resolve_function_target(node)
+        try:
+            path = self._terminology_path(snapshot, target_path, "memberOf")
+            mapping = self.catalog.resolve(self.resource_type)
+            element = ".".join(path)
+            side_table = next((side_table for side_table in mapping.side_tables
+                               if side_table.collection in (element, f"{element}.coding")), None)
+            columns = {member: column for column, member in side_table.columns} if side_table else {}
+            if "system" in columns and "code" in columns:
+                members = store.side_table_member_ids_query(
+                    side_table.table_name(mapping.table), mapping.id_column, valueset,
+                    columns["system"], columns["code"], mapping.type_column, self.resource_type)
+            else:
+                items, codes_only = self._coding_items(path)
+                members = store.member_ids_query(self.dialect, items, valueset, codes_only)
+            # Every CTE of the chain carries the resource's id column
+            return SQLFragment(
+                expression=f"id IN ({members})",
+                source_table=snapshot["current_table"],
+                requires_unnest=False,
+                is_aggregate=False,
+                dependencies=dependencies.copy() if dependencies else [],
+                metadata={"function": "memberOf", "result_type": "boolean"}
+            )
+        finally:
+            self._restore_context(snapshot)
+
+    def _translate_subsumes(self, node: FunctionCallNode) -> SQLFragment:
+        """Translate subsumes()/subsumedBy() to a semi-join with the code system closure.
+
+        The argument is a code (in the system of the element's Codings) or a
+        path to Codings of the same resource.
+        """
+        function_name = node.function_name
+        if len(node.arguments) != 1:
+            raise ValueError(f"{function_name}() requires exactly 1 argument (code or Coding)")
+        store = self._terminology_store(function_name)
+
+        _, dependencies, _, snapshot, _, target_path = self._resolve_function_target(node)
+        try:
+            path = self._terminology_path(snapshot, target_path, function_name)
+            items, codes_only = self._coding_items(path)
+            argument = node.arguments[0]
+            code = other_items = None
+            if isinstance(argument, LiteralNode) or getattr(argument, "text", "").strip().startswith(("'", '"')):
+                code = self._string_argument(argument, function_name)
+            else:
+                other_path = argument.text.strip()
+                if other_path.startswith(f"{self.resource_type}."):
+                    other_path = other_path[len(self.resource_type) + 1:]
+                if not re.match(r"^[A-Za-z][A-Za-z0-9]*(\.[A-Za-z][A-Za-z0-9]*)*$", other_path):
+                    raise ValueError(f"{function_name}() argument must be a code or a path to Codings")
+                other_items, other_codes_only = self._coding_items(other_path.split("."))
+                codes_only = codes_only or other_codes_only
+            if codes_only:
+                raise ValueError(f"{function_name}() needs Codings; '{'.'.join(path)}' holds plain codes")
+            subsuming = store.subsumes_ids_query(self.dialect, items, other_items, code,
+                                                 subsumed_by=function_name.lower() == "subsumedby")
+            return SQLFragment(
+                expression=f"id IN ({subsuming})",
+                source_table=snapshot["current_table"],
+                requires_unnest=False,
+                is_aggregate=False,
+                dependencies=dependencies.copy() if dependencies else [],
+                metadata={"function": function_name, "result_type": "boolean"}
+            )
+        finally:
+            self._restore_context(snapshot)
+
+    def _translate_concept_map(self, node: FunctionCallNode) -> SQLFragment:
+        """Translate translate(conceptMap) to a join with the concept map table.
+
+        Returns the JSON array of target Codings the element's Codings map to.
+        """
+        if len(node.arguments) != 1:
+            raise ValueError("translate() requires exactly 1 argument (ConceptMap url)")
+        store = self._terminology_store("translate")
+        concept_map = self._string_argument(node.arguments[0], "translate")
+
+        _, dependencies, _, snapshot, _, target_path = self._resolve_function_target(node)
+        try:
+            path = self._terminology_path(snapshot, target_path, "translate")
+            items, codes_only = self._coding_items(path)
+            if codes_only:
+                raise ValueError(f"translate() needs Codings; '{'.'.join(path)}' holds plain codes")
+            fragment = SQLFragment(
+                expression=store.translate_expression(self.dialect, items, "id", concept_map),
+                source_table=snapshot["current_table"],
+                requires_unnest=False,
+                is_aggregate=False,
+                dependencies=dependencies.copy() if dependencies else []
+            )
+        finally:
+            self._restore_context(snapshot)
+        # Member steps after translate() navigate the target Codings
+        self._resolved_resources = (fragment, [])
+        self.context.pending_fragment_result = (fragment.expression, self.context.parent_path.copy(), True)
+        return fragment
+
+    def _terminology_store(self, function_name: str):
+        store = self.catalog.terminology if self.catalog else None
+        if store is None:
+            raise ValueError(f"{function_name}() requires a StorageCatalog with a TerminologyStore")
+        return store
+
+    def _string_argument(self, argument: Any, function_name: str) -> str:
+        """Value of a string literal function argument."""
+        if isinstance(argument, LiteralNode) and isinstance(argument.value, str):
+            return argument.value
+        text = getattr(argument, "text", "").strip()
+        if len(text) >= 2 and text[0] == text[-1] and text[0] in ("'", '"'):
+            return text[1:-1]
+        raise ValueError(f"{function_name}() argument must be a string literal")
+
+    def _terminology_path(self, snapshot: dict, target_path: Optional[List[str]], function_name: str) -> List[str]:
+        """Element path of a terminology function's input, relative to the resource."""
+        if snapshot["current_table"] != SOURCE_RELATION or not target_path:
+            raise ValueError(f"{function_name}() is only supported on coded elements of {self.resource_type}")
+        return [re.sub(r"\[\d+\]$", "", component) for component in target_path]
+
+    def _coding_items(self, path: List[str]) -> Tuple[str, bool]:
+        """(source_id, item) rows of the Codings at ``path`` and whether they are plain codes instead.
+
+        Raises:
+            ValueError: If the element is not a CodeableConcept, Coding or code
+        """
+        if path[-1] == "coding":
+            element_type = "Coding"
+        else:
+            element_type = self.element_type_resolver.resolve_element_type(self.resource_type, ".".join(path))
+        if element_type not in ("CodeableConcept", "Coding", "code", "string", "uri"):
+            raise ValueError(f"'{'.'.join(path)}' is not a coded element (type {element_type})")
+        element = ".".join(path + (["coding"] if element_type == "CodeableConcept" else []))
+        return element_rows(self.dialect, SOURCE_RELATION, element), element_type not in ("CodeableConcept", "Coding")
+
     def _translate_conforms_to(self, node: FunctionCallNode) -> SQLFragment:
         """Translate conformsTo() profile membership function.
 
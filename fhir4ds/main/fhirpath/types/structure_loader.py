@@ -178,7 +178,9 @@ class StructureDefinitionLoader:
             'max': max_card,
             'cardinality': f"{min_card}..{max_card}",
             'is_array': max_card == '*',
-            'is_required': min_card > 0
+            'is_required': min_card > 0,
+            # e.g. '#Questionnaire.item' for recursive elements without a type
+            'content_reference': element.get('contentReference')
         }
 
     def extract_type_hierarchies(self) -> Dict[str, Set[str]]:
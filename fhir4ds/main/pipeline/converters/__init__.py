@@ -0,0 +1,7 @@
+"""
+Converters from other FHIR serializations to FHIR JSON.
+"""
+
+from .xml_to_json import ElementIndex, XMLToJSONConverter
+
+__all__ = ['XMLToJSONConverter', 'ElementIndex']
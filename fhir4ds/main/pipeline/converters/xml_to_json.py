@@ -0,0 +1,417 @@
+"""
+Streaming conversion of FHIR XML to FHIR JSON.
+
+Documents are read with ``iterparse`` and the root is cleared after each of
+its children (e.g. each Bundle entry) has been converted, so memory is
+bounded by the largest single entry rather than the document. Array-versus-scalar and
+primitive typing (booleans, integers and decimals become JSON literals) are
+decided in the same pass from the StructureDefinition element index, and
+the JSON text is written directly from the element events instead of
+building Python dicts first.
+
+Resource types the index has no definitions for are rejected, since their
+JSON would silently come out mistyped; fhir4ds ships only the datatype
+definitions (``profiles-types.json``), so add ``profiles-resources.json``
+from the FHIR R4 definitions to the definitions directory. With
+``strict=False`` such resources, and elements the index does not describe,
+fall back to the XML shape with a warning: repeated elements and
+``extension``/``modifierExtension``/``contained`` become arrays, and their
+values stay strings.
+
+Example:
+    from fhir4ds.pipeline.converters import XMLToJSONConverter
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    converter = XMLToJSONConverter()
+    NDJSONLoader(dialect).load_resources(converter.iter_resources("bundle.xml"))
+"""
+
+import gzip
+import logging
+import re
+import xml.etree.ElementTree as ET
+from json.encoder import encode_basestring
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+FHIR_NAMESPACE = "http://hl7.org/fhir"
+XHTML_NAMESPACE = "http://www.w3.org/1999/xhtml"
+
+DEFAULT_DEFINITIONS_PATH = Path(__file__).resolve().parents[2] / "fhirpath" / "types" / "fhir_r4_definitions"
+
+PRIMITIVE_TYPES = frozenset({
+    "base64Binary", "boolean", "canonical", "code", "date", "dateTime", "decimal", "id",
+    "instant", "integer", "markdown", "oid", "positiveInt", "string", "time",
+    "unsignedInt", "uri", "url", "uuid", "xhtml",
+})
+
+# Elements that are arrays wherever they appear
+ALWAYS_ARRAY = frozenset({"extension", "modifierExtension", "contained"})
+
+_INTEGER_TYPES = frozenset({"integer", "positiveInt", "unsignedInt"})
+_INTEGER = re.compile(r"-?[0-9]+\Z")
+_DECIMAL = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?\Z")
+
+Source = Union[str, Path, BinaryIO]
+
+
+class ElementInfo(NamedTuple):
+    """What the index knows about a child element."""
+
+    is_array: Optional[bool]  # None when the element is not in the index
+    type_code: Optional[str]
+    context: Optional[str]    # path or type its own children are looked up under
+
+
+_UNKNOWN = ElementInfo(None, None, None)
+_EXTENSION = ElementInfo(True, "Extension", "Extension")
+
+
+class ElementIndex:
+    """Element lookups over the StructureDefinition element definitions."""
+
+    def __init__(self, element_definitions: Dict[str, Dict[str, Any]]):
+        self._definitions = element_definitions
+        self._cache: Dict[Tuple[Optional[str], str], ElementInfo] = {}
+        self._types = frozenset(path.split(".", 1)[0] for path in element_definitions)
+
+    @classmethod
+    def load(cls, definitions_path: Optional[Union[str, Path]] = None) -> "ElementIndex":
+        """Build the index from a directory of FHIR R4 definition bundles."""
+        from fhir4ds.fhirpath.types.structure_loader import StructureDefinitionLoader
+
+        loader = StructureDefinitionLoader(Path(definitions_path or DEFAULT_DEFINITIONS_PATH))
+        loader.load_all_definitions()
+        return cls(loader.extract_element_definitions())
+
+    def describes(self, type_name: str) -> bool:
+        """Whether the index has element definitions for ``type_name``."""
+        return type_name in self._types
+
+    def child(self, context: Optional[str], name: str) -> ElementInfo:
+        """Describe element ``name`` of ``context`` (a type name or element path)."""
+        key = (context, name)
+        info = self._cache.get(key)
+        if info is None:
+            info = self._cache[key] = self._lookup(context, name)
+        return info
+
+    def _lookup(self, context: Optional[str], name: str) -> ElementInfo:
+        if context is None:
+            # Any element may carry extensions, even one the index does not describe
+            return _EXTENSION if name in ("extension", "modifierExtension") else _UNKNOWN
+        path = f"{context}.{name}"
+        definition = self._definitions.get(path)
+        if definition is not None:
+            type_code = _normalize_type(definition.get("type"))
+            reference = definition.get("content_reference")
+            if reference:
+                child_context = reference.lstrip("#")
+            elif type_code in ("BackboneElement", "Element"):
+                child_context = path
+            else:
+                child_context = type_code
+            return ElementInfo(definition.get("is_array", False), type_code, child_context)
+
+        # Choice elements: valueQuantity -> value[x] of type Quantity
+        for position in range(1, len(name)):
+            if name[position].isupper() and f"{context}.{name[:position]}[x]" in self._definitions:
+                suffix = name[position:]
+                primitive = suffix[0].lower() + suffix[1:]
+                type_code = primitive if primitive in PRIMITIVE_TYPES else suffix
+                return ElementInfo(False, type_code, type_code)
+        return self._lookup(None, name)
+
+
+def _normalize_type(type_code: Optional[str]) -> Optional[str]:
+    """Map FHIRPath system types (used for ``id``, ``Extension.url``...) to FHIR primitives."""
+    if type_code and type_code.startswith("http://hl7.org/fhirpath/System."):
+        name = type_code.rsplit(".", 1)[1]
+        return name[0].lower() + name[1:]
+    return type_code
+
+
+class _Frame:
+    """An open XML element being converted."""
+
+    __slots__ = ("name", "info", "primitive", "value", "members", "resource_type", "resource_json", "emit")
+
+    def __init__(self, name: str, info: ElementInfo, primitive: bool = False, value: Optional[str] = None,
+                 resource_type: Optional[str] = None, emit: bool = False):
+        self.name = name
+        self.info = info
+        self.primitive = primitive
+        self.value = value
+        # name -> [is_array, [(json value or None, json of primitive id/extension or None), ...]]
+        self.members: Dict[str, list] = {}
+        self.resource_type = resource_type
+        self.resource_json: Optional[str] = None
+        self.emit = emit
+
+    def add(self, name: str, is_array: Optional[bool], value: Optional[str], extra: Optional[str] = None) -> None:
+        member = self.members.get(name)
+        if member is None:
+            self.members[name] = [is_array, [(value, extra)]]
+        else:
+            member[1].append((value, extra))
+
+    def encode(self) -> str:
+        parts: List[str] = []
+        if self.resource_type:
+            parts.append(f'"resourceType":"{self.resource_type}"')
+        for name, (is_array, entries) in self.members.items():
+            if len(entries) == 1 and not (is_array or (is_array is None and name in ALWAYS_ARRAY)):
+                value, extra = entries[0]
+                if value is not None:
+                    parts.append(f'"{name}":{value}')
+                if extra is not None:
+                    parts.append(f'"_{name}":{extra}')
+                continue
+            values = [value for value, _ in entries]
+            extras = [extra for _, extra in entries]
+            if any(value is not None for value in values):
+                parts.append(f'"{name}":[{",".join("null" if v is None else v for v in values)}]')
+            if any(extra is not None for extra in extras):
+                parts.append(f'"_{name}":[{",".join("null" if e is None else e for e in extras)}]')
+        return "{" + ",".join(parts) + "}"
+
+
+# Markers for Bundle structure that is walked but not converted when unbundling
+_SKIP = object()
+_PASS = object()
+_ENTRY = object()
+_ENTRY_RESOURCE = object()
+
+
+class XMLToJSONConverter:
+    """Converts FHIR XML documents to FHIR JSON resources in one streaming pass.
+
+    Example:
+        converter = XMLToJSONConverter()
+        for resource in converter.iter_resources("bundle.xml"):   # raw JSON bytes
+            ...
+        converter.convert_file("feed.xml", "feed.ndjson")
+    """
+
+    def __init__(self, definitions_path: Optional[Union[str, Path]] = None,
+                 index: Optional[ElementIndex] = None, strict: bool = True):
+        """Initialize the converter.
+
+        Args:
+            definitions_path: Directory of FHIR R4 definition bundles (defaults
+                to the definitions shipped with fhir4ds)
+            index: Prebuilt element index, shared between converters
+            strict: Reject resource types the index has no definitions for;
+                when False they are converted in the XML shape with a warning
+        """
+        self.index = index or ElementIndex.load(definitions_path)
+        self.strict = strict
+        self._tags: Dict[str, Tuple[str, str]] = {}
+        self._checked_types: Set[str] = set()
+        self._warned_elements: Set[Tuple[Optional[str], str]] = set()
+
+    def iter_resources(self, source: Source, unbundle: bool = True) -> Iterator[bytes]:
+        """Yield the resources of an XML document as single-line UTF-8 JSON.
+
+        Args:
+            source: Path (``.gz`` is decompressed) or binary stream
+            unbundle: For a Bundle root, yield each ``entry.resource`` instead
+                of the Bundle itself
+
+        Raises:
+            xml.etree.ElementTree.ParseError: If the document is not well-formed
+            ValueError: In strict mode, for a resource type the element index
+                has no definitions for
+        """
+        if isinstance(source, (str, Path)):
+            name = str(source)
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(name, "rb") as stream:
+                yield from self._convert(stream, unbundle)
+        else:
+            yield from self._convert(source, unbundle)
+
+    def convert(self, source: Source) -> bytes:
+        """Convert a single-resource document (a Bundle stays one resource)."""
+        for resource in self.iter_resources(source, unbundle=False):
+            return resource
+        raise ValueError("XML document contains no FHIR resource")
+
+    def convert_file(self, source: Source, destination: Union[str, Path], unbundle: bool = True) -> int:
+        """Write the resources of an XML document to an NDJSON file; returns the count."""
+        count = 0
+        with open(destination, "wb") as handle:
+            for resource in self.iter_resources(source, unbundle):
+                handle.write(resource)
+                handle.write(b"\n")
+                count += 1
+        logger.info(f"Converted {count} resources from {source} to {destination}")
+        return count
+
+    # Conversion
+
+    def _split_tag(self, tag: str) -> Tuple[str, str]:
+        split = self._tags.get(tag)
+        if split is None:
+            namespace, _, local = tag[1:].partition("}") if tag[0] == "{" else ("", "", tag)
+            split = self._tags[tag] = (namespace, local)
+        return split
+
+    def _convert(self, stream: BinaryIO, unbundle: bool) -> Iterator[bytes]:
+        index = self.index
+        split_tag = self._split_tag
+        frames: List[Any] = []
+        root: Optional[ET.Element] = None
+        xhtml_depth = 0
+
+        for event, element in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if xhtml_depth:
+                    xhtml_depth += 1
+                    continue
+                namespace, name = split_tag(element.tag)
+                if namespace == XHTML_NAMESPACE:
+                    xhtml_depth = 1
+                    continue
+                if root is None:
+                    root = element
+                frames.append(self._open(frames, name, element.attrib, unbundle, index))
+                continue
+
+            if xhtml_depth:
+                xhtml_depth -= 1
+                if xhtml_depth:
+                    continue
+                parent = frames[-1]
+                if type(parent) is _Frame:
+                    parent.add(split_tag(element.tag)[1], False, encode_basestring(_serialize_xhtml(element)))
+                continue
+
+            frame = frames.pop()
+            if type(frame) is _Frame:
+                resource = self._close(frame, frames)
+                if resource is not None:
+                    yield resource.encode("utf-8")
+            if len(frames) == 1:
+                # Children of the root hold their whole subtree until here; drop them
+                root.clear()
+
+    def _open(self, frames: List[Any], name: str, attributes: Dict[str, str], unbundle: bool,
+              index: ElementIndex) -> Any:
+        parent = frames[-1] if frames else None
+        if parent is _SKIP:
+            return _SKIP
+        if parent is None:
+            if unbundle and name == "Bundle":
+                return _PASS
+            return self._resource_frame(name, index, emit=True)
+        if parent is _PASS:
+            return _ENTRY if name == "entry" else _SKIP
+        if parent is _ENTRY:
+            return _ENTRY_RESOURCE if name == "resource" else _SKIP
+        if parent is _ENTRY_RESOURCE:
+            return self._resource_frame(name, index, emit=True)
+        if name[0].isupper():
+            # A resource inside resource/contained/... wrapper elements
+            return self._resource_frame(name, index)
+
+        # Primitives only have the id and extension children every Element has
+        context = "Element" if parent.primitive else parent.info.context
+        info = index.child(context, name)
+        if info.is_array is None and (context, name) not in self._warned_elements:
+            self._warned_elements.add((context, name))
+            logger.warning(f"No definition for element '{name}' of '{context}'; converting it in the XML shape")
+        type_code = info.type_code
+        primitive = type_code in PRIMITIVE_TYPES if type_code else "value" in attributes
+        frame = _Frame(name, info, primitive, attributes.get("value") if primitive else None)
+        for attribute, value in attributes.items():
+            if attribute != "value" or not primitive:
+                frame.add(attribute, False, encode_basestring(value))
+        return frame
+
+    def _resource_frame(self, resource_type: str, index: ElementIndex, emit: bool = False) -> _Frame:
+        if resource_type not in self._checked_types:
+            if not index.describes(resource_type):
+                message = f"Element index has no definitions for '{resource_type}' resources"
+                if self.strict:
+                    raise ValueError(f"{message}; add profiles-resources.json to the definitions "
+                                     f"directory or pass strict=False")
+                logger.warning(f"{message}; converting them in the XML shape")
+            self._checked_types.add(resource_type)
+        return _Frame(resource_type, ElementInfo(False, resource_type, resource_type),
+                      resource_type=resource_type, emit=emit)
+
+    def _close(self, frame: _Frame, frames: List[Any]) -> Optional[str]:
+        """Finish a frame; returns the JSON of resources to yield."""
+        if frame.resource_type:
+            encoded = frame.encode()
+            if frame.emit:
+                return encoded
+            parent = frames[-1]
+            if parent.resource_json is None:
+                parent.resource_json = encoded
+            return None
+
+        parent = frames[-1]
+        if type(parent) is not _Frame:
+            return None
+        if frame.primitive:
+            value = None if frame.value is None else _encode_primitive(frame.value, frame.info.type_code)
+            extra = frame.encode() if frame.members else None
+            if value is not None or extra is not None:
+                parent.add(frame.name, frame.info.is_array, value, extra)
+        elif frame.resource_json is not None:
+            parent.add(frame.name, frame.info.is_array, frame.resource_json)
+        elif frame.members:
+            parent.add(frame.name, frame.info.is_array, frame.encode())
+        return None
+
+
+def _encode_primitive(value: str, type_code: Optional[str]) -> str:
+    """JSON for a primitive ``value`` attribute according to its FHIR type."""
+    if type_code == "boolean" and value in ("true", "false"):
+        return value
+    if type_code in _INTEGER_TYPES and _INTEGER.match(value):
+        return str(int(value))
+    if type_code == "decimal" and _DECIMAL.match(value):
+        # Keep the lexical form so precision (e.g. "1.50") survives
+        return value
+    return encode_basestring(value)
+
+
+def _serialize_xhtml(element: ET.Element) -> str:
+    """Serialize narrative XHTML with a default namespace instead of ET's ``ns0:`` prefixes."""
+    parts = ['<div xmlns="http://www.w3.org/1999/xhtml"']
+    _write_xhtml_attributes(element, parts)
+    _write_xhtml_content(element, parts)
+    parts.append("</div>")
+    return "".join(parts)
+
+
+def _write_xhtml_attributes(element: ET.Element, parts: List[str]) -> None:
+    for attribute, value in element.attrib.items():
+        if attribute.startswith("{"):
+            namespace, _, local = attribute[1:].partition("}")
+            attribute = f"xml:{local}" if namespace == "http://www.w3.org/XML/1998/namespace" else local
+        parts.append(f' {attribute}="{_escape_xml(value, True)}"')
+    parts.append(">")
+
+
+def _write_xhtml_content(element: ET.Element, parts: List[str]) -> None:
+    if element.text:
+        parts.append(_escape_xml(element.text))
+    for child in element:
+        tag = child.tag.rpartition("}")[2]
+        parts.append(f"<{tag}")
+        _write_xhtml_attributes(child, parts)
+        _write_xhtml_content(child, parts)
+        parts.append(f"</{tag}>")
+        if child.tail:
+            parts.append(_escape_xml(child.tail))
+
+
+def _escape_xml(text: str, attribute: bool = False) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace('"', "&quot;") if attribute else text
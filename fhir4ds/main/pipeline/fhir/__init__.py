@@ -0,0 +1,7 @@
+"""
+Readers for FHIR serialization formats.
+"""
+
+from .streaming import BundleFormatError, iter_bundle_resources, iter_ndjson_resources, iter_resources
+
+__all__ = ['iter_resources', 'iter_bundle_resources', 'iter_ndjson_resources', 'BundleFormatError']
@@ -0,0 +1,243 @@
+"""
+Streaming readers for large FHIR Bundle and NDJSON files.
+
+Resources are yielded as raw JSON bytes, one single-line document each, so
+they can go straight to the bulk loaders without a parse/dump round trip.
+Bundles are scanned in fixed-size chunks: only the Bundle's own members and
+the ``entry`` objects are tokenized, and each ``entry.resource`` value is
+sliced out by bracket matching. Memory is bounded by the chunk size plus the
+largest single entry, regardless of the Bundle size.
+
+Example:
+    from fhir4ds.pipeline.fhir.streaming import iter_resources
+    from fhir4ds.pipeline.operations import PostgreSQLIngestor
+
+    PostgreSQLIngestor(dialect).ingest_lines(iter_resources("bundle.json"))
+"""
+
+import gzip
+import json
+import re
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(rb"[ \t\r\n]*")
+_CONTAINER_FILLER = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*')
+_SCALAR_END = re.compile(rb"[,\]}\s]")
+
+
+class BundleFormatError(ValueError):
+    """Raised when a Bundle stream is not well-formed JSON."""
+
+
+def iter_resources(path: Union[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield resources from a Bundle (``.json``) or NDJSON (``.ndjson``/``.jsonl``) file.
+
+    Gzipped files (``.gz``) are decompressed on the fly.
+    """
+    name = str(path)
+    opener = gzip.open if name.endswith(".gz") else open
+    with opener(name, "rb") as stream:
+        if name.endswith((".ndjson", ".jsonl", ".ndjson.gz", ".jsonl.gz")):
+            yield from iter_ndjson_resources(stream)
+        else:
+            yield from iter_bundle_resources(stream, chunk_size)
+
+
+def iter_ndjson_resources(stream: BinaryIO) -> Iterator[bytes]:
+    """Yield the non-blank lines of an NDJSON stream without the line ending."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def iter_bundle_resources(stream: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield each ``entry[].resource`` of a JSON Bundle as single-line raw bytes.
+
+    Entries without a ``resource`` are skipped. Raises BundleFormatError if the
+    stream is not a JSON object or is truncated.
+    """
+    scanner = _ChunkScanner(stream, chunk_size)
+    scanner.expect(b"{")
+    for key in scanner.members():
+        if key != "entry" or scanner.peek() != b"[":
+            scanner.skip_value()
+            continue
+        for _ in scanner.elements():
+            if scanner.peek() != b"{":
+                scanner.skip_value()
+                continue
+            scanner.expect(b"{")
+            for entry_key in scanner.members():
+                if entry_key == "resource":
+                    yield as_single_line(scanner.capture_value())
+                else:
+                    scanner.skip_value()
+
+
+def as_single_line(raw: bytes) -> bytes:
+    """Replace line breaks in a JSON document, which can only be insignificant whitespace."""
+    if b"\n" in raw or b"\r" in raw:
+        return raw.replace(b"\r", b" ").replace(b"\n", b" ")
+    return raw
+
+
+class _ChunkScanner:
+    """Minimal pull tokenizer over a byte stream read in chunks."""
+
+    def __init__(self, stream: BinaryIO, chunk_size: int):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = b""
+        self._pos = 0
+        self._eof = False
+
+    # Buffer management
+
+    def _fill(self) -> bool:
+        """Read another chunk, dropping consumed bytes; False at end of stream."""
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _skip_whitespace(self) -> None:
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def peek(self) -> bytes:
+        self._skip_whitespace()
+        if self._pos >= len(self._buffer):
+            raise BundleFormatError("Unexpected end of Bundle")
+        return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, token: bytes) -> None:
+        found = self.peek()
+        if found != token:
+            raise BundleFormatError(f"Expected {token!r} but found {found!r}")
+        self._pos += 1
+
+    # Structure
+
+    def members(self) -> Iterator[str]:
+        """Iterate the keys of the object just opened, leaving each value unread."""
+        if self.peek() == b"}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != b'"':
+                raise BundleFormatError("Expected an object key")
+            raw_key = self._read_string()
+            key = json.loads(raw_key) if b"\\" in raw_key else raw_key[1:-1].decode("utf-8")
+            self.expect(b":")
+            yield key
+            if self._close_or_comma(b"}"):
+                return
+
+    def elements(self) -> Iterator[None]:
+        """Iterate the elements of an array, leaving each value unread."""
+        self.expect(b"[")
+        if self.peek() == b"]":
+            self._pos += 1
+            return
+        while True:
+            yield None
+            if self._close_or_comma(b"]"):
+                return
+
+    def _close_or_comma(self, close: bytes) -> bool:
+        token = self.peek()
+        self._pos += 1
+        if token == close:
+            return True
+        if token != b",":
+            raise BundleFormatError(f"Expected ',' or {close!r} but found {token!r}")
+        return False
+
+    # Values
+
+    def skip_value(self) -> None:
+        self._scan_value(capture=False)
+
+    def capture_value(self) -> bytes:
+        return self._scan_value(capture=True)
+
+    def _scan_value(self, capture: bool) -> Optional[bytes]:
+        first = self.peek()
+        if first in (b"{", b"["):
+            return self._scan_container(capture)
+        raw = self._read_string() if first == b'"' else self._read_scalar()
+        return raw if capture else None
+
+    def _read_string(self) -> bytes:
+        """Consume the string starting at the current quote and return it quoted."""
+        scan = self._pos + 1
+        while True:
+            end = self._buffer.find(b'"', scan)
+            if end < 0:
+                scan = len(self._buffer) - self._pos
+                if not self._fill():
+                    raise BundleFormatError("Unterminated string in Bundle")
+                scan += self._pos
+                continue
+            backslash = end - 1
+            while self._buffer[backslash] == 0x5C:  # b"\\"
+                backslash -= 1
+            if (end - 1 - backslash) % 2 == 0:
+                start, self._pos = self._pos, end + 1
+                return self._buffer[start:self._pos]
+            scan = end + 1
+
+    def _read_scalar(self) -> bytes:
+        scan = self._pos
+        while True:
+            match = _SCALAR_END.search(self._buffer, scan)
+            if match:
+                start, self._pos = self._pos, match.start()
+                return self._buffer[start:self._pos]
+            scan = len(self._buffer) - self._pos
+            if not self._fill():
+                start, self._pos = self._pos, len(self._buffer)
+                return self._buffer[start:]
+            scan += self._pos
+
+    def _scan_container(self, capture: bool) -> Optional[bytes]:
+        """Consume a balanced object/array, returning its bytes when capturing."""
+        parts = []
+        depth = 0
+        start = self._pos
+        buffer = self._buffer
+        while True:
+            # Skip filler and complete strings (which may hold brackets) in one match
+            pos = _CONTAINER_FILLER.match(buffer, self._pos).end()
+            if pos < len(buffer) and buffer[pos] != 0x22:  # b'"'
+                self._pos = pos + 1
+                depth += 1 if buffer[pos] in (0x7B, 0x5B) else -1  # b"{", b"["
+                if depth == 0:
+                    if not capture:
+                        return None
+                    parts.append(buffer[start:self._pos])
+                    return b"".join(parts)
+                continue
+            # The chunk ends in filler, or a string runs past its end
+            self._pos = pos
+            if capture:
+                parts.append(buffer[start:pos])
+            if pos < len(buffer):
+                string = self._read_string()
+                if capture:
+                    parts.append(string)
+            elif not self._fill():
+                raise BundleFormatError("Unexpected end of Bundle")
+            start = self._pos
+            buffer = self._buffer
@@ -0,0 +1,12 @@
+"""
+Pipeline operations for loading FHIR data into FHIR4DS databases.
+"""
+
+from .incremental_loader import IncrementalLoader, MergeResult
+from .ndjson_loader import LoadResult, NDJSONLoader
+from .parquet_store import ParquetStore
+from .postgres_ingest import PostgreSQLIngestor
+from .terminology_loader import TerminologyLoader
+
+__all__ = ['NDJSONLoader', 'IncrementalLoader', 'ParquetStore', 'PostgreSQLIngestor',
+           'TerminologyLoader', 'LoadResult', 'MergeResult']
@@ -0,0 +1,82 @@
+"""
+Loading of ValueSets, CodeSystems and ConceptMaps into a TerminologyStore.
+
+Terminology arrives as FHIR JSON: single resources, Bundles (such as a
+measure package's value set expansions) or NDJSON. The loader orders the
+resources so closures exist before the value sets filtering on them, and
+replaces the terminology of each url in a single transaction.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+from fhir4ds.dialects.base import DatabaseDialect
+from fhir4ds.fhirpath.sql.terminology import CONCEPT_MAPS_PATH, TerminologyStore, load_terminology_resources
+
+logger = logging.getLogger(__name__)
+
+_NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+
+class TerminologyLoader:
+    """Loads terminology resources into the tables of a TerminologyStore.
+
+    Example:
+        loader = TerminologyLoader(DuckDBDialect(database="fhir.db"))
+        loader.load("measure-valuesets.json")
+        loader.load_fhir_concept_maps()
+    """
+
+    def __init__(self, dialect: DatabaseDialect, store: Optional[TerminologyStore] = None):
+        """Initialize the loader.
+
+        Args:
+            dialect: Dialect connected to the target database
+            store: Terminology tables to fill (the default table names when None)
+        """
+        self.dialect = dialect
+        self.store = store or TerminologyStore()
+
+    def load(self, source: Union[str, Path, Iterable[Union[str, Path]]]) -> int:
+        """Load JSON or NDJSON files, or a directory of them.
+
+        Returns:
+            Number of terminology resources loaded
+        """
+        return self.load_resources(_read_resources(_collect_files(source)))
+
+    def load_resources(self, resources: Iterable[Dict[str, Any]]) -> int:
+        """Load parsed resources; Bundles are unpacked and other resource types ignored."""
+        ordered = load_terminology_resources(resources)
+        self.dialect.execute_transaction(
+            self.store.create_statements()
+            + [statement for resource in ordered for statement in self.store.load_statements(resource)]
+        )
+        logger.info(f"Loaded {len(ordered)} terminology resources")
+        return len(ordered)
+
+    def load_fhir_concept_maps(self) -> int:
+        """Load the ConceptMaps shipped with the FHIR R4 definitions."""
+        return self.load(CONCEPT_MAPS_PATH)
+
+
+def _collect_files(source: Union[str, Path, Iterable[Union[str, Path]]]) -> Iterator[Path]:
+    sources = [source] if isinstance(source, (str, Path)) else source
+    for item in sources:
+        path = Path(item)
+        if path.is_dir():
+            yield from sorted(child for child in path.iterdir()
+                              if child.suffix in (".json", *_NDJSON_SUFFIXES))
+        else:
+            yield path
+
+
+def _read_resources(files: Iterable[Path]) -> Iterator[Dict[str, Any]]:
+    for path in files:
+        with open(path, encoding="utf-8") as handle:
+            if path.suffix in _NDJSON_SUFFIXES:
+                yield from (json.loads(line) for line in handle if line.strip())
+            else:
+                yield json.load(handle)
@@ -3,5 +3,6 @@ SQL generation components for FHIR4DS.
 """
 
 from .generator import SQLGenerator
+from .materialization import MaterializationResult, ViewMaterializer
 
-__all__ = ['SQLGenerator']
\ No newline at end of file
+__all__ = ['SQLGenerator', 'ViewMaterializer', 'MaterializationResult']
\ No newline at end of file
@@ -1,5 +1,28 @@
-from typing import Optional
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+from fhir4ds.dialects.base import DatabaseDialect
 from .exceptions import SQLGenerationError, UndefinedConstantError
+from .view_definition import ViewColumn, ViewDefinition, ViewSelect
+from .view_paths import CompiledPath, ViewPathCompiler
+
+if TYPE_CHECKING:
+    from fhir4ds.fhirpath.sql.catalog import StorageCatalog
+
+# Root-level paths that map directly onto a JSON path: "id", "name.first()",
+# "name.family.first()"
+_SIMPLE_PATH_PATTERN = re.compile(r"^[A-Za-z_]\w*(?:(?:\.[A-Za-z_]\w*)?\.first\(\))?$")
+
+DEFAULT_SQL_CACHE_SIZE = 256
+
+# Lineage columns prepended by generate_sql(..., lineage=True). ViewDefinition
+# column names cannot start with an underscore, so these never collide.
+RESOURCE_ID_COLUMN = "_resource_id"
+VERSION_ID_COLUMN = "_version_id"
+
 
 class SQLGenerator:
     """
@@ -9,21 +32,41 @@ class SQLGenerator:
     by dialect classes, while SQL generation logic remains database-agnostic.
     """
 
-    def __init__(self, dialect: str = "duckdb"):
+    def __init__(self, dialect: Union[str, DatabaseDialect] = "duckdb",
+                 cache_size: int = DEFAULT_SQL_CACHE_SIZE,
+                 catalog: Optional["StorageCatalog"] = None):
         """Initialize the SQL generator with a database dialect.
 
         Args:
-            dialect: Database dialect name ('duckdb' or 'postgresql')
+            dialect: Database dialect name ('duckdb' or 'postgresql'), or an
+                existing dialect instance whose connection settings to reuse
+            cache_size: Maximum number of generated statements kept in the
+                LRU SQL cache (0 disables caching)
+            catalog: Storage catalog locating each resource type's rows;
+                without one, views read a table named after the resource type
         """
+        dialect_instance = None
+        if isinstance(dialect, DatabaseDialect):
+            dialect_instance = dialect
+            dialect = dialect.name.lower()
         self.dialect = dialect
+        self.catalog = catalog
         self._generation_count = 0
         self._fhirpath_parser = None
-        self._fhirpath_translator = None
+        self._view_compiler = None
         self._constants = {}
 
+        # Generated SQL keyed by canonical ViewDefinition hash (LRU order)
+        self._sql_cache_size = max(0, cache_size)
+        self._sql_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
         # Initialize dialect instance for SQL generation
         # This follows the thin dialect architecture: syntax-only differences
-        if dialect.lower() == "duckdb":
+        if dialect_instance is not None:
+            self._dialect_instance = dialect_instance
+        elif dialect.lower() == "duckdb":
             from fhir4ds.dialects.duckdb import DuckDBDialect
             self._dialect_instance = DuckDBDialect()
         elif dialect.lower() == "postgresql":
@@ -36,11 +79,26 @@ class SQLGenerator:
             from fhir4ds.dialects.duckdb import DuckDBDialect
             self._dialect_instance = DuckDBDialect()
 
-    def generate_sql(self, view_definition: dict) -> str:
+    def generate_sql(self, view_definition: dict, source: Optional[str] = None,
+                     lineage: bool = False) -> str:
         """Generate SQL from a ViewDefinition.
 
+        The whole view compiles to a single SELECT over the resource table:
+        forEach/forEachOrNull become lateral joins, nested selects share the
+        same FROM list (cross product semantics) and unionAll branches become
+        a lateral UNION ALL subquery, and where paths are predicates on the
+        same scan, so the resource table is read once.
+
+        Generated statements are cached by a canonical hash of the
+        ViewDefinition, so repeated calls for the same view skip compilation.
+
         Args:
             view_definition: A SQL-on-FHIR ViewDefinition.
+            source: Table or parenthesised subquery (with a ``resource``
+                column) to read instead of the resource table, e.g. to
+                evaluate the view over a subset of resources.
+            lineage: Prepend ``_resource_id`` and ``_version_id`` columns
+                identifying the resource version each row was derived from.
 
         Returns:
             A SQL query string.
@@ -49,204 +107,238 @@ class SQLGenerator:
             raise SQLGenerationError("ViewDefinition is empty")
 
         self._generation_count += 1
-
-        # Parse constants from ViewDefinition
-        self._constants = self._parse_constants(view_definition)
-
-        resource = view_definition.get("resource")
-        if not resource:
-            raise SQLGenerationError("ViewDefinition must have a resource")
-
-        selects = view_definition.get("select")
-        if not selects:
-            raise SQLGenerationError("ViewDefinition must have at least one select")
-
-        columns = []
-        for select in selects:
-            for column in select.get("column", []):
-                path = column["path"]
-                name = column["name"]
-                column_type = column.get("type", "string")
-
-                # Check if path requires FHIRPath translation (contains functions like ofType())
-                # Substitute constants BEFORE checking, so FHIRPath sees the substituted values
-                path_with_constants = self._substitute_constants(path)
-
-                if self._needs_fhirpath_translation(path_with_constants):
-                    # Use substituted path for FHIRPath translation
-                    path = path_with_constants
-                    # Use FHIRPath translator for complex expressions
-                    extract_expr = self._translate_fhirpath_to_sql(path, resource)
-
-                    # The FHIRPath translator uses json_extract() by default, but we need
-                    # to use the correct extraction function based on the column type
-                    # Replace json_extract( with the appropriate function for the type
-                    if column_type in ["string", "id"]:
-                        # For string types, use json_extract_string() to avoid JSON quotes
-                        extract_expr = extract_expr.replace("json_extract(", "json_extract_string(", 1)
-                    elif column_type == "boolean":
-                        # Keep json_extract() and add boolean cast
-                        extract_expr = f"({extract_expr})::BOOLEAN"
-                    elif column_type in ["integer", "int"]:
-                        # Keep json_extract() and add integer cast
-                        extract_expr = f"({extract_expr})::INTEGER"
-                    elif column_type in ["decimal", "number"]:
-                        # Keep json_extract() and add decimal cast
-                        extract_expr = f"({extract_expr})::DECIMAL"
-                    # For other types, use as-is
-
-                else:
-                    # Use substituted path for simple JSON path conversion
-                    path = path_with_constants
-
-                    # Use simple JSON path conversion for basic paths
-                    # Handle first() function by removing it and using [0] indexing
-                    # ARCHITECTURAL FIX: Use array indexing for population-friendly first() function
-                    # This maintains population-scale analytics capability (no LIMIT 1 anti-pattern)
-                    if path.endswith('.first()'):
-                        path_without_first = path[:-8]  # Remove '.first()'
-                        # For paths like "name.family.first()", we need "name[0].family"
-                        # Split at first dot to identify the collection
-                        parts = path_without_first.split('.', 1)
-                        if len(parts) == 2:
-                            # e.g., "name.family" → "name[0].family"
-                            collection, remainder = parts
-                            json_path = f"$.{collection}[0].{remainder}"
-                        else:
-                            # e.g., "name" → "name[0]"
-                            json_path = f"$.{parts[0]}[0]"
-                    else:
-                        json_path = "$." + path.replace('.', '[0].')
-
-                    # Use thin dialect architecture: delegate to dialect for syntax
-                    # Handle type conversion based on column type
-                    if column_type == "boolean":
-                        extract_expr = self._dialect_instance.extract_json_boolean('resource', json_path)
-                    elif column_type in ["integer", "int"]:
-                        extract_expr = self._dialect_instance.extract_json_integer('resource', json_path)
-                    elif column_type in ["decimal", "number"]:
-                        extract_expr = self._dialect_instance.extract_json_decimal('resource', json_path)
-                    else:
-                        # Default to string extraction
-                        extract_expr = self._dialect_instance.extract_json_string('resource', json_path)
-
-                columns.append(f'{extract_expr} AS {name}')
-
-        if not columns:
-            raise SQLGenerationError("ViewDefinition select must have at least one column")
-
-        # Build WHERE clause using CTE infrastructure
-        where_ctes, where_clause = self._build_where_clause(view_definition, resource)
-
-        # Construct final SQL query with WHERE evaluation CTEs
-        if where_ctes:
-            # Build WITH clause manually from WHERE evaluation CTEs
-            # Format: WITH cte1 AS (query1), cte2 AS (query2), ...
-            cte_definitions = []
-            for cte in where_ctes:
-                cte_definitions.append(f"{cte.name} AS (\n{cte.query}\n)")
-
-            with_clause = "WITH " + ",\n".join(cte_definitions)
-
-            # Build query: WITH ... SELECT ... FROM ... WHERE ...
-            sql_query = f"{with_clause}\nSELECT {', '.join(columns)} FROM {resource}"
-            if where_clause:
-                sql_query += f"\n{where_clause}"
-        else:
-            # No WHERE clause - simple SELECT
-            sql_query = f"SELECT {', '.join(columns)} FROM {resource}"
+        # Resolve the storage from the raw resource type so cache hits skip
+        # ViewDefinition validation; an invalid resource fails in compilation
+        resource_type = view_definition.get("resource")
+        if source is None and self.catalog is not None and isinstance(resource_type, str) and resource_type:
+            relation = self.catalog.relation(resource_type, self._dialect_instance)
+            source = relation if relation != resource_type else None
+
+        cache_key = (
+            self._view_definition_key(view_definition, source, lineage)
+            if self._sql_cache_size else None
+        )
+        if cache_key is not None and cache_key in self._sql_cache:
+            self._sql_cache.move_to_end(cache_key)
+            self._cache_hits += 1
+            return self._sql_cache[cache_key]
+        self._cache_misses += 1
+
+        sql_query = self._compile_view_definition(view_definition, source, lineage)
+
+        if cache_key is not None:
+            self._sql_cache[cache_key] = sql_query
+            while len(self._sql_cache) > self._sql_cache_size:
+                self._sql_cache.popitem(last=False)
 
         return sql_query
 
-    # REMOVED: generate_from_fhirpath() method - architectural violation
-    # This method created duplicate FHIRPath parsing logic that should be in Layer 2B (FHIRPath Engine)
-    # Parsing expressions is not the responsibility of the SQL generator
-    # Use FHIRPathParser directly for parsing, and generate_sql() for ViewDefinitions
+    def resource_relation(self, resource_type: str) -> str:
+        """FROM-clause relation holding ``resource_type`` rows (``id``/``resource`` columns)."""
+        if self.catalog is None:
+            return resource_type
+        return self.catalog.relation(resource_type, self._dialect_instance)
 
-    # REMOVED: get_dialect_specific_function() method - unused helper
-    # Database-specific logic should be handled through proper dialect classes in Layer 5
+    def export(self, view_definition: dict, destination, format: str = "parquet",
+               partition_by: Optional[List[str]] = None, row_group_size: Optional[int] = None,
+               compression: Optional[str] = None) -> str:
+        """Export view rows to Parquet/CSV/NDJSON without fetching them into Python.
 
-    def _needs_fhirpath_translation(self, path: str) -> bool:
-        """Check if a path requires FHIRPath translator (contains functions).
+        The generated statement is wrapped in the dialect's COPY, so the
+        generator must be constructed with a dialect instance connected to the
+        database holding the resource tables.
 
         Args:
-            path: FHIRPath expression string
+            view_definition: A SQL-on-FHIR ViewDefinition.
+            destination: Output path (directory when partitioning) or, for
+                PostgreSQL, a binary file object.
+            format: 'parquet', 'csv' or 'ndjson'
+            partition_by: View columns to partition output by
+            row_group_size: Rows per Parquet row group
+            compression: Codec name (e.g. 'zstd', 'snappy', 'gzip')
 
         Returns:
-            True if path contains function calls that need translation
+            The exported SQL query.
         """
-        # Simple .first() at the end can be handled by simple path logic
-        # Only use FHIRPath translator for complex cases
-        if path.endswith('.first()'):
-            # Check if there are OTHER functions besides .first() at the end
-            path_without_trailing_first = path[:-8]  # Remove '.first()'
-            # Check for functions in the remaining path
-            complex_functions = ['ofType(', 'where(', 'exists(', 'all(', 'first(', 'last(',
-                                'tail(', 'skip(', 'take(', 'select(', 'repeat(', 'empty(',
-                                'distinct(', 'isDistinct(']
-            return any(func in path_without_trailing_first for func in complex_functions)
-
-        # Check for common FHIRPath functions that require translation
-        fhirpath_functions = ['ofType(', 'where(', 'exists(', 'all(', 'first(', 'last(',
-                             'tail(', 'skip(', 'take(', 'select(', 'repeat(', 'empty(',
-                             'distinct(', 'isDistinct(', 'join(']
-        return any(func in path for func in fhirpath_functions)
-
-    def _get_fhirpath_components(self, resource_type: str):
-        """Lazy-load FHIRPath parser and translator.
+        sql_query = self.generate_sql(view_definition)
+        unknown = set(partition_by or []) - set(ViewDefinition.from_dict(view_definition).column_names())
+        if unknown:
+            raise SQLGenerationError(f"Partition columns are not view columns: {', '.join(sorted(unknown))}")
+        self._dialect_instance.export_query(
+            sql_query, destination, format=format, partition_by=partition_by,
+            row_group_size=row_group_size, compression=compression,
+        )
+        return sql_query
 
-        Args:
-            resource_type: FHIR resource type for context
+    @staticmethod
+    def _view_definition_key(view_definition: dict, *options) -> Optional[str]:
+        """Canonical hash of a ViewDefinition, or None if it is not JSON-serializable."""
+        try:
+            canonical = json.dumps([view_definition, *options], sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def clear_cache(self) -> None:
+        """Drop all cached SQL statements."""
+        self._sql_cache.clear()
+
+    def _compile_view_definition(self, view_definition: dict, source: Optional[str] = None,
+                                 lineage: bool = False) -> str:
+        """Compile a ViewDefinition to SQL, bypassing the SQL cache."""
+        # Parse constants from ViewDefinition
+        self._constants = self._parse_constants(view_definition)
 
-        Returns:
-            Tuple of (parser, translator)
-        """
-        if self._fhirpath_parser is None:
-            # Import here to avoid circular dependencies
-            from fhir4ds.fhirpath.parser import FHIRPathParser
-            self._fhirpath_parser = FHIRPathParser()
+        view = ViewDefinition.from_dict(view_definition)
+        resource = view.resource
+
+        compiler = self._get_view_compiler()
+        compiler.reset()
+        root = compiler.root('resource')
+
+        columns: List[Tuple[str, str]] = []
+        joins: List[str] = []
+        if lineage:
+            columns.append((RESOURCE_ID_COLUMN, self._dialect_instance.extract_json_string('resource', '$.id')))
+            columns.append((VERSION_ID_COLUMN,
+                            self._dialect_instance.extract_json_string('resource', '$.meta.versionId')))
+        for select in view.selects:
+            select_columns, select_joins = self._compile_select(select, root, root, compiler)
+            columns.extend(select_columns)
+            joins.extend(select_joins)
 
-        # Always create a new translator with the current resource type
-        # Dialect instance is already initialized in __init__
-        from fhir4ds.fhirpath.sql.translator import ASTToSQLTranslator
-        translator = ASTToSQLTranslator(self._dialect_instance, resource_type)
+        select_list = ', '.join(f'{expr} AS {name}' for name, expr in columns)
+        table = f"{source} AS {resource}" if source else resource
+        from_clause = ' '.join([table] + joins)
 
-        # SP-023-004B: Return only parser and translator - no adapter needed
-        return self._fhirpath_parser, translator
+        sql_query = f"SELECT {select_list} FROM {from_clause}"
 
-    def _translate_fhirpath_to_sql(self, path: str, resource_type: str) -> str:
-        """Translate a FHIRPath expression to SQL using the FHIRPath translator.
+        # where paths filter resources on the same scan: plain predicates are
+        # inlined and collection filters become EXISTS semi-joins
+        conditions = [self._compile_where(path, root, compiler) for path in view.where]
+        if conditions:
+            sql_query += "\nWHERE " + " AND ".join(conditions)
+
+        return sql_query
+
+    def _compile_select(self, select: ViewSelect, focus: CompiledPath, root: CompiledPath,
+                        compiler: ViewPathCompiler) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """Compile one select block into (name, expression) columns and join clauses.
 
         Args:
-            path: FHIRPath expression string
-            resource_type: FHIR resource type for context
+            select: The select block
+            focus: Focus the select is evaluated on (root resource or forEach item)
+            root: Root resource focus, used by getResourceKey()
+            compiler: Path compiler for the current statement
 
         Returns:
-            SQL expression string
+            Tuple of (columns, joins) where joins are appended to the FROM list
         """
-        # Decode HTML entities that may be present in JSON (e.g., &quot; for ")
-        import html
-        decoded_path = html.unescape(path)
+        joins: List[str] = []
+
+        iteration_path = select.iteration_path
+        if iteration_path:
+            items = compiler.compile(self._substitute_constants(iteration_path), focus, root)
+            alias = compiler.new_alias('each')
+            joins.append(self._dialect_instance.generate_lateral_json_collection(
+                compiler.to_collection(items), alias, keep_empty=select.for_each_or_null is not None
+            ))
+            focus = compiler.item(alias)
+
+        columns = [
+            (column.name, self._compile_column(column, focus, root, compiler))
+            for column in select.columns
+        ]
+
+        for nested in select.selects:
+            nested_columns, nested_joins = self._compile_select(nested, focus, root, compiler)
+            columns.extend(nested_columns)
+            joins.extend(nested_joins)
+
+        if select.union_all:
+            alias = compiler.new_alias('u')
+            branches = []
+            for branch in select.union_all:
+                branch_columns, branch_joins = self._compile_select(branch, focus, root, compiler)
+                branch_select = ', '.join(f'{expr} AS {name}' for name, expr in branch_columns)
+                branch_from = ' '.join([f'(SELECT 1) AS {alias}_src'] + branch_joins)
+                branches.append(f'SELECT {branch_select} FROM {branch_from}')
+            joins.append(f"CROSS JOIN LATERAL ({' UNION ALL '.join(branches)}) AS {alias}")
+            columns.extend(
+                (name, f'{alias}.{name}') for name in select.union_all[0].column_names()
+            )
 
-        # SP-023-004B: Get parser and translator (no adapter needed)
-        parser, translator = self._get_fhirpath_components(resource_type)
+        return columns, joins
 
-        # Parse the FHIRPath expression
-        parsed = parser.parse(decoded_path, context={"resourceType": resource_type})
+    def _compile_column(self, column: ViewColumn, focus: CompiledPath, root: CompiledPath,
+                        compiler: ViewPathCompiler) -> str:
+        """Compile a column path to a typed SQL expression."""
+        path = self._substitute_constants(column.path)
+        column_type = column.type or None
 
-        # SP-023-004B: Use EnhancedASTNode directly - translator handles it via accept()
-        ast = parsed.get_ast()
+        # Simple root-level paths keep the direct JSON path extraction
+        if focus is root and not column.collection and _SIMPLE_PATH_PATTERN.match(path):
+            return self._extract_simple_path(path, column_type or "string")
 
-        # Translate to SQL fragments
-        fragments = translator.translate(ast)
+        compiled = compiler.compile(path, focus, root, type_hint=column_type)
+        return compiler.column_value(compiled, column_type, column.collection)
 
-        # For simple column selection, we expect a single fragment
-        # Extract the SQL expression from the fragment
-        if fragments and len(fragments) > 0:
-            # Get the last fragment's expression (the final result)
-            return fragments[-1].expression
+    def _compile_where(self, path: str, root: CompiledPath, compiler: ViewPathCompiler) -> str:
+        """Compile a where path to a boolean predicate on the resource row."""
+        compiled = compiler.compile(self._substitute_constants(path), root, root, type_hint="boolean")
+        return compiler.predicate(compiled)
 
-        return ""
+    def _extract_simple_path(self, path: str, column_type: str) -> str:
+        """Extract a simple path (optionally ending in first()) from the resource."""
+        # ARCHITECTURAL FIX: Use array indexing for population-friendly first() function
+        # This maintains population-scale analytics capability (no LIMIT 1 anti-pattern)
+        if path.endswith('.first()'):
+            path_without_first = path[:-8]  # Remove '.first()'
+            # For paths like "name.family.first()", we need "name[0].family"
+            # Split at first dot to identify the collection
+            parts = path_without_first.split('.', 1)
+            if len(parts) == 2:
+                # e.g., "name.family" → "name[0].family"
+                collection, remainder = parts
+                json_path = f"$.{collection}[0].{remainder}"
+            else:
+                # e.g., "name" → "name[0]"
+                json_path = f"$.{parts[0]}[0]"
+        else:
+            json_path = f"$.{path}"
+
+        # Use thin dialect architecture: delegate to dialect for syntax
+        # Handle type conversion based on column type
+        if column_type == "boolean":
+            return self._dialect_instance.extract_json_boolean('resource', json_path)
+        elif column_type in ["integer", "int"]:
+            return self._dialect_instance.extract_json_integer('resource', json_path)
+        elif column_type in ["decimal", "number"]:
+            return self._dialect_instance.extract_json_decimal('resource', json_path)
+        # Default to string extraction
+        return self._dialect_instance.extract_json_string('resource', json_path)
+
+    def _get_view_compiler(self) -> ViewPathCompiler:
+        """Lazy-load the ViewDefinition path compiler (sharing the FHIRPath parser)."""
+        if self._view_compiler is None:
+            self._view_compiler = ViewPathCompiler(self._dialect_instance, self._get_fhirpath_parser())
+        return self._view_compiler
+
+    # REMOVED: generate_from_fhirpath() method - architectural violation
+    # This method created duplicate FHIRPath parsing logic that should be in Layer 2B (FHIRPath Engine)
+    # Parsing expressions is not the responsibility of the SQL generator
+    # Use FHIRPathParser directly for parsing, and generate_sql() for ViewDefinitions
+
+    # REMOVED: get_dialect_specific_function() method - unused helper
+    # Database-specific logic should be handled through proper dialect classes in Layer 5
+
+    def _get_fhirpath_parser(self):
+        """Lazy-load the FHIRPath parser shared by all paths of this generator."""
+        if self._fhirpath_parser is None:
+            # Import here to avoid circular dependencies
+            from fhir4ds.fhirpath.parser import FHIRPathParser
+            self._fhirpath_parser = FHIRPathParser()
+        return self._fhirpath_parser
 
     def get_statistics(self) -> dict:
         """Get usage statistics.
@@ -257,7 +349,10 @@ class SQLGenerator:
         # Basic statistics tracking
         return {
             "dialect": self.dialect,
-            "generation_count": getattr(self, '_generation_count', 0)
+            "generation_count": getattr(self, '_generation_count', 0),
+            "cache_size": len(self._sql_cache),
+            "cache_hits": self._cache_hits,
+            "cache_misses": self._cache_misses,
         }
 
     def _parse_constants(self, view_definition: dict) -> dict:
@@ -354,136 +449,3 @@ class SQLGenerator:
             result = result.replace(f"%{const_name}", formatted)
 
         return result
-
-    def _build_where_clause(self, view_definition: dict, resource_type: str) -> tuple:
-        """Build SQL WHERE clause using CTE infrastructure.
-
-        Uses PEP-004 CTE infrastructure to evaluate WHERE expressions at population scale,
-        following the CTE-First architectural principle.
-
-        Args:
-            view_definition: SQL-on-FHIR ViewDefinition
-            resource_type: FHIR resource type for FHIRPath context
-
-        Returns:
-            Tuple of (where_ctes, where_clause):
-            - where_ctes: List[CTE] for WHERE evaluation
-            - where_clause: SQL WHERE clause string or empty string
-
-        Example:
-            ViewDefinition with where: [{"path": "active = true"}]
-            Returns: ([CTE(...)], "WHERE resource.id IN (SELECT id FROM where_eval_1 WHERE result = true)")
-
-        Architecture:
-            Follows CTE-First design principle (CLAUDE.md line 175):
-            - WHERE expressions translated using existing FHIRPath translator
-            - CTEBuilder wraps fragments in population-level CTEs
-            - Main query filters by joining with WHERE evaluation CTEs
-            - Uniform execution model regardless of expression complexity
-        """
-        # Extract where elements from top-level of ViewDefinition
-        where_elements = view_definition.get("where", [])
-        if not where_elements:
-            return ([], "")
-
-        # Import CTE infrastructure
-        from fhir4ds.fhirpath.sql.cte import CTEBuilder
-
-        all_where_ctes = []
-        where_cte_names = []
-
-        for idx, where_elem in enumerate(where_elements):
-            where_path = where_elem.get("path")
-            if not where_path:
-                # Skip empty where elements
-                continue
-
-            # Substitute constants in WHERE path
-            where_path_with_constants = self._substitute_constants(where_path)
-
-            try:
-                # Parse and translate FHIRPath expression using existing translator
-                # SP-023-004B: Get parser and translator (no adapter needed)
-                parser, translator = self._get_fhirpath_components(resource_type)
-                parsed = parser.parse(where_path_with_constants, context={"resourceType": resource_type})
-
-                # SP-023-004B: Use EnhancedASTNode directly - translator handles via accept()
-                ast = parsed.get_ast()
-
-                # Translate to SQL fragments
-                fragments = translator.translate(ast)
-
-                # Build CTEs using PEP-004 infrastructure
-                # CTEBuilder automatically creates: SELECT id, <boolean_expr> AS result FROM resource
-                cte_builder = CTEBuilder(self._dialect_instance)
-
-                # IMPORTANT: Update the first fragment's source_table to use actual resource type
-                # The translator uses "resource" as a generic placeholder, but we need the
-                # actual table name (e.g., "Patient") for the FROM clause
-                if fragments and len(fragments) > 0:
-                    # Only update the first fragment if it references "resource"
-                    # This ensures the first CTE queries FROM the actual table
-                    if fragments[0].source_table == "resource":
-                        # Create a modified fragment with updated source_table
-                        from fhir4ds.fhirpath.sql.fragments import SQLFragment
-                        updated_fragment = SQLFragment(
-                            expression=fragments[0].expression,
-                            source_table=resource_type,
-                            requires_unnest=fragments[0].requires_unnest,
-                            is_aggregate=fragments[0].is_aggregate,
-                            dependencies=list(fragments[0].dependencies) if fragments[0].dependencies else [],
-                            metadata=dict(fragments[0].metadata)
-                        )
-                        # Replace the first fragment
-                        fragments = [updated_fragment] + fragments[1:]
-
-                where_ctes = cte_builder.build_cte_chain(fragments)
-
-                # Rename CTEs to indicate they're WHERE evaluations
-                # Build a name mapping and use rename_cte_chain() to update all references
-                name_mapping = {}
-                for i, cte in enumerate(where_ctes):
-                    old_name = cte.name
-                    new_name = f"where_eval_{idx + 1}_{i + 1}"
-                    name_mapping[old_name] = new_name
-
-                # Import CTE class to access static method
-                from fhir4ds.fhirpath.sql.cte import CTE
-                CTE.rename_cte_chain(where_ctes, name_mapping)
-
-                all_where_ctes.extend(where_ctes)
-
-                # Track the final CTE name for this WHERE condition
-                if where_ctes:
-                    where_cte_names.append(where_ctes[-1].name)
-
-            except Exception as e:
-                raise SQLGenerationError(
-                    f"Failed to translate WHERE path '{where_path}': {e}\n"
-                    f"Note: Known limitation - FHIRPath .where() function with filtering "
-                    f"may not translate correctly. See translator bug documentation."
-                )
-
-        # Build WHERE clause that references the WHERE evaluation CTEs
-        if not where_cte_names:
-            return ([], "")
-
-        # Combine multiple WHERE conditions with AND logic
-        # Each WHERE CTE has: SELECT id, <boolean> AS result
-        # Filter by: WHERE id IN (SELECT id FROM cte WHERE result = true)
-        if len(where_cte_names) == 1:
-            where_clause = (
-                f"WHERE {resource_type}.id IN "
-                f"(SELECT id FROM {where_cte_names[0]} WHERE result = true)"
-            )
-        else:
-            # Multiple WHERE conditions - must pass ALL
-            # Use INTERSECT for AND logic
-            cte_selects = [
-                f"(SELECT id FROM {cte_name} WHERE result = true)"
-                for cte_name in where_cte_names
-            ]
-            intersected = "\nINTERSECT\n".join(cte_selects)
-            where_clause = f"WHERE {resource_type}.id IN (\n{intersected}\n)"
-
-        return (all_where_ctes, where_clause)
@@ -0,0 +1,223 @@
+"""
+Incremental materialization of SQL-on-FHIR ViewDefinitions.
+
+A materialized view is persisted as a table holding the view columns plus
+``_resource_id``/``_version_id`` lineage. A companion ``<table>__lineage``
+table records the ``meta.versionId``/``meta.lastUpdated`` of every resource
+evaluated, and a shared state table stores the view hash and the
+``meta.lastUpdated`` watermark of the last refresh.
+
+On refresh only resources updated at or after the watermark (or without a
+``lastUpdated``) whose version differs from the recorded lineage are
+re-evaluated; their rows are deleted and re-inserted in one transaction.
+Rows and lineage of resources no longer in the source (e.g. removed by an
+incremental load's deletions) are deleted in the same transaction.
+Resources loaded with a ``lastUpdated`` older than the watermark are not
+picked up; run materialize() after such backfills.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fhir4ds.dialects.base import DatabaseDialect
+
+from .exceptions import SQLGenerationError
+from .generator import RESOURCE_ID_COLUMN, SQLGenerator
+from .view_definition import ViewDefinition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_TABLE = "fhir4ds_view_state"
+
+FULL = "full"
+INCREMENTAL = "incremental"
+
+
+@dataclass
+class MaterializationResult:
+    """Outcome of a materialize() or refresh() call."""
+
+    table_name: str
+    mode: str
+    resources_evaluated: Optional[int]
+    watermark: Optional[str]
+
+
+class ViewMaterializer:
+    """Persists ViewDefinition output and refreshes it incrementally.
+
+    Example:
+        materializer = ViewMaterializer(DuckDBDialect(database="fhir.db"))
+        materializer.materialize(patient_view, "patient_view")   # first build
+        materializer.refresh(patient_view, "patient_view")       # nightly
+    """
+
+    def __init__(self, dialect: DatabaseDialect, generator: Optional[SQLGenerator] = None,
+                 state_table: str = DEFAULT_STATE_TABLE):
+        """Initialize the materializer.
+
+        Args:
+            dialect: Dialect whose connection holds the resource tables
+            generator: SQL generator to compile views with (defaults to one
+                sharing ``dialect``)
+            state_table: Table recording view hashes and watermarks
+        """
+        self.dialect = dialect
+        self.generator = generator or SQLGenerator(dialect)
+        self.state_table = state_table
+        self._state_table_ready = False
+
+    def materialize(self, view_definition: dict, table_name: str) -> MaterializationResult:
+        """(Re)build the materialized table from all resources."""
+        view = ViewDefinition.from_dict(view_definition)
+        self._ensure_state_table()
+
+        lineage_table = self._lineage_table(table_name)
+        view_sql = self.generator.generate_sql(view_definition, lineage=True)
+        self.dialect.execute_transaction([
+            f"DROP TABLE IF EXISTS {table_name}",
+            f"DROP TABLE IF EXISTS {lineage_table}",
+            f"CREATE TABLE {table_name} AS {view_sql}",
+            f"CREATE TABLE {lineage_table} AS {self._resource_versions_sql(view.resource)}",
+            *self._state_statements(table_name, view.resource, _view_hash(view_definition)),
+        ])
+
+        watermark = self._stored_watermark(table_name)
+        logger.info(f"Materialized view '{table_name}' from all {view.resource} resources")
+        return MaterializationResult(table_name, FULL, None, watermark)
+
+    def refresh(self, view_definition: dict, table_name: str) -> MaterializationResult:
+        """Re-evaluate resources changed since the last refresh.
+
+        Falls back to a full materialize() when the table has not been built
+        yet or the ViewDefinition changed since it was built.
+        """
+        view = ViewDefinition.from_dict(view_definition)
+        self._ensure_state_table()
+
+        state = self._state(table_name)
+        if state is None or state[1] != _view_hash(view_definition) or state[0] != view.resource:
+            return self.materialize(view_definition, table_name)
+        watermark = state[2]
+
+        lineage_table = self._lineage_table(table_name)
+        changed_table = f"{table_name}__changed"
+        id_expr = self.dialect.extract_json_string('r.resource', '$.id')
+        source = (
+            f"(SELECT r.resource FROM {self.generator.resource_relation(view.resource)} r "
+            f"WHERE {id_expr} IN (SELECT resource_id FROM {changed_table}))"
+        )
+        view_sql = self.generator.generate_sql(view_definition, source=source, lineage=True)
+        # Lineage rows whose resource left the source; an anti-join, so source
+        # rows without an id cannot hide deletions as a NULL in NOT IN would
+        removed = (
+            f"NOT EXISTS (SELECT 1 FROM {self.generator.resource_relation(view.resource)} r "
+            f"WHERE {id_expr} = {lineage_table}.resource_id)"
+        )
+
+        self.dialect.execute_transaction([
+            f"DELETE FROM {table_name} WHERE {RESOURCE_ID_COLUMN} IN "
+            f"(SELECT resource_id FROM {lineage_table} WHERE {removed})",
+            f"DELETE FROM {lineage_table} WHERE {removed}",
+            f"DROP TABLE IF EXISTS {changed_table}",
+            f"CREATE TABLE {changed_table} AS {self._changed_resources_sql(view.resource, lineage_table, watermark)}",
+            f"DELETE FROM {table_name} WHERE {RESOURCE_ID_COLUMN} IN (SELECT resource_id FROM {changed_table})",
+            f"INSERT INTO {table_name} {view_sql}",
+            f"DELETE FROM {lineage_table} WHERE resource_id IN (SELECT resource_id FROM {changed_table})",
+            f"INSERT INTO {lineage_table} SELECT resource_id, version_id, last_updated FROM {changed_table}",
+            *self._state_statements(table_name, view.resource, state[1]),
+        ])
+
+        count = self.dialect.execute_query(f"SELECT COUNT(*) FROM {changed_table}")[0][0]
+        self.dialect.execute_query(f"DROP TABLE {changed_table}")
+        new_watermark = self._stored_watermark(table_name)
+        logger.info(f"Refreshed view '{table_name}': re-evaluated {count} {view.resource} resources")
+        return MaterializationResult(table_name, INCREMENTAL, count, new_watermark)
+
+    # SQL building
+
+    def _resource_versions_sql(self, resource: str, alias: str = "r") -> str:
+        """(resource_id, version_id, last_updated) for every resource row."""
+        return (
+            f"SELECT {self.dialect.extract_json_string(f'{alias}.resource', '$.id')} AS resource_id, "
+            f"{self.dialect.extract_json_string(f'{alias}.resource', '$.meta.versionId')} AS version_id, "
+            f"{self.dialect.extract_json_string(f'{alias}.resource', '$.meta.lastUpdated')} AS last_updated "
+            f"FROM {self.generator.resource_relation(resource)} {alias}"
+        )
+
+    def _changed_resources_sql(self, resource: str, lineage_table: str, watermark: Optional[str]) -> str:
+        """Resources updated after the watermark whose version is not in the lineage."""
+        after_watermark = self._after_watermark_condition('v.last_updated', watermark)
+        candidates = f"v.last_updated IS NULL OR {after_watermark}" if after_watermark else "TRUE"
+        return (
+            f"SELECT v.resource_id, v.version_id, v.last_updated "
+            f"FROM ({self._resource_versions_sql(resource)}) v "
+            f"WHERE ({candidates}) AND NOT EXISTS ("
+            f"SELECT 1 FROM {lineage_table} l WHERE l.resource_id = v.resource_id "
+            f"AND l.version_id IS NOT DISTINCT FROM v.version_id "
+            f"AND l.last_updated IS NOT DISTINCT FROM v.last_updated)"
+        )
+
+    def _after_watermark_condition(self, column: str, watermark: Optional[str]) -> str:
+        if watermark is None:
+            return ""
+        return (
+            f"{self.dialect.cast_to_timestamptz(column)} >= "
+            f"{self.dialect.cast_to_timestamptz(_quote(watermark))}"
+        )
+
+    def _state_statements(self, table_name: str, resource: str, view_hash: str) -> List[str]:
+        """Replace the state row; the watermark is the latest lastUpdated in the lineage."""
+        lineage_table = self._lineage_table(table_name)
+        latest = (
+            f"(SELECT last_updated FROM {lineage_table} WHERE last_updated IS NOT NULL "
+            f"ORDER BY {self.dialect.cast_to_timestamptz('last_updated')} DESC LIMIT 1)"
+        )
+        refreshed_at = datetime.now(timezone.utc).isoformat()
+        return [
+            f"DELETE FROM {self.state_table} WHERE view_name = {_quote(table_name)}",
+            f"INSERT INTO {self.state_table} (view_name, resource_type, view_hash, watermark, refreshed_at) "
+            f"SELECT {_quote(table_name)}, {_quote(resource)}, {_quote(view_hash)}, {latest}, {_quote(refreshed_at)}",
+        ]
+
+    # State
+
+    def _ensure_state_table(self) -> None:
+        if self._state_table_ready:
+            return
+        self.dialect.execute_query(
+            f"CREATE TABLE IF NOT EXISTS {self.state_table} ("
+            f"view_name VARCHAR PRIMARY KEY, resource_type VARCHAR, view_hash VARCHAR, "
+            f"watermark VARCHAR, refreshed_at VARCHAR)"
+        )
+        self._state_table_ready = True
+
+    def _state(self, table_name: str):
+        """(resource_type, view_hash, watermark) for a materialized view, or None."""
+        rows = self.dialect.execute_query(
+            f"SELECT resource_type, view_hash, watermark FROM {self.state_table} "
+            f"WHERE view_name = {_quote(table_name)}"
+        )
+        return tuple(rows[0]) if rows else None
+
+    def _stored_watermark(self, table_name: str) -> Optional[str]:
+        state = self._state(table_name)
+        return state[2] if state else None
+
+    @staticmethod
+    def _lineage_table(table_name: str) -> str:
+        return f"{table_name}__lineage"
+
+
+def _view_hash(view_definition: dict) -> str:
+    view_hash = SQLGenerator._view_definition_key(view_definition)
+    if view_hash is None:
+        raise SQLGenerationError("ViewDefinition is not JSON-serializable")
+    return view_hash
+
+
+def _quote(value: str) -> str:
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
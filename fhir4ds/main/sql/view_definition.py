@@ -0,0 +1,163 @@
+"""
+SQL-on-FHIR ViewDefinition model.
+
+Parses and validates the ViewDefinition structure (columns, nested selects,
+forEach/forEachOrNull, unionAll and where) before SQL generation, so that
+structural errors are reported up front instead of surfacing as invalid SQL.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .exceptions import SQLGenerationError
+
+_COLUMN_NAME_PATTERN = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+
+@dataclass
+class ViewColumn:
+    """A single ViewDefinition column."""
+
+    name: str
+    path: str
+    type: Optional[str] = None
+    collection: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ViewColumn":
+        if not isinstance(data, dict):
+            raise SQLGenerationError(f"Column must be an object, got {data!r}")
+
+        name = data.get("name")
+        if not isinstance(name, str) or not _COLUMN_NAME_PATTERN.match(name):
+            raise SQLGenerationError(f"Column name {name!r} is not a valid column name")
+
+        path = data.get("path")
+        if not isinstance(path, str) or not path.strip():
+            raise SQLGenerationError(f"Column '{name}' must have a FHIRPath path")
+
+        return cls(
+            name=name,
+            path=path,
+            type=data.get("type"),
+            collection=bool(data.get("collection", False)),
+        )
+
+
+@dataclass
+class ViewSelect:
+    """A select block: columns plus optional forEach, nested selects and unionAll."""
+
+    columns: List[ViewColumn] = field(default_factory=list)
+    selects: List["ViewSelect"] = field(default_factory=list)
+    union_all: List["ViewSelect"] = field(default_factory=list)
+    for_each: Optional[str] = None
+    for_each_or_null: Optional[str] = None
+
+    @property
+    def iteration_path(self) -> Optional[str]:
+        """The forEach or forEachOrNull path, if any."""
+        return self.for_each or self.for_each_or_null
+
+    def column_names(self) -> List[str]:
+        """Output column names in SQL-on-FHIR order: column, select, unionAll."""
+        names = [column.name for column in self.columns]
+        for nested in self.selects:
+            names.extend(nested.column_names())
+        if self.union_all:
+            names.extend(self.union_all[0].column_names())
+        return names
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ViewSelect":
+        if not isinstance(data, dict):
+            raise SQLGenerationError(f"Select must be an object, got {data!r}")
+
+        for key in ("forEach", "forEachOrNull"):
+            if key in data and (not isinstance(data[key], str) or not data[key].strip()):
+                raise SQLGenerationError(f"{key} must be a FHIRPath string, got {data[key]!r}")
+        if "forEach" in data and "forEachOrNull" in data:
+            raise SQLGenerationError("Select cannot have both forEach and forEachOrNull")
+
+        select = cls(
+            columns=[ViewColumn.from_dict(column) for column in _as_list(data, "column")],
+            selects=[cls.from_dict(nested) for nested in _as_list(data, "select")],
+            union_all=[cls.from_dict(branch) for branch in _as_list(data, "unionAll")],
+            for_each=data.get("forEach"),
+            for_each_or_null=data.get("forEachOrNull"),
+        )
+
+        if select.union_all:
+            expected = select.union_all[0].column_names()
+            for branch in select.union_all[1:]:
+                if branch.column_names() != expected:
+                    raise SQLGenerationError(
+                        f"unionAll branches must have the same columns in the same order: "
+                        f"{expected} != {branch.column_names()}"
+                    )
+
+        return select
+
+
+@dataclass
+class ViewDefinition:
+    """A validated SQL-on-FHIR ViewDefinition."""
+
+    resource: str
+    selects: List[ViewSelect]
+    where: List[str] = field(default_factory=list)
+
+    def column_names(self) -> List[str]:
+        """Output column names of the view, in order."""
+        names: List[str] = []
+        for select in self.selects:
+            names.extend(select.column_names())
+        return names
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ViewDefinition":
+        """Build a ViewDefinition from its JSON representation.
+
+        Raises:
+            SQLGenerationError: If the ViewDefinition is structurally invalid
+        """
+        if not data or not isinstance(data, dict):
+            raise SQLGenerationError("ViewDefinition is empty")
+
+        resource = data.get("resource")
+        if not resource or not isinstance(resource, str):
+            raise SQLGenerationError("ViewDefinition must have a resource")
+
+        raw_selects = data.get("select")
+        if not raw_selects:
+            raise SQLGenerationError("ViewDefinition must have at least one select")
+
+        view = cls(
+            resource=resource,
+            selects=[ViewSelect.from_dict(select) for select in _as_list(data, "select")],
+            where=[_where_path(where) for where in _as_list(data, "where")],
+        )
+
+        names = view.column_names()
+        if not names:
+            raise SQLGenerationError("ViewDefinition select must have at least one column")
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise SQLGenerationError(f"Duplicate column names: {', '.join(duplicates)}")
+
+        return view
+
+
+def _as_list(data: Dict[str, Any], key: str) -> List[Any]:
+    value = data.get(key, [])
+    if not isinstance(value, list):
+        raise SQLGenerationError(f"'{key}' must be an array, got {value!r}")
+    return value
+
+
+def _where_path(where: Any) -> str:
+    path = where.get("path") if isinstance(where, dict) else None
+    if not isinstance(path, str) or not path.strip():
+        raise SQLGenerationError(f"Where element must have a FHIRPath path, got {where!r}")
+    return path
@@ -0,0 +1,649 @@
+"""
+FHIRPath compilation for SQL-on-FHIR ViewDefinition paths.
+
+ViewDefinition paths use the shareable FHIRPath subset (member navigation,
+where/exists/empty/first, ofType, extension, join, boundaries and the
+getResourceKey()/getReferenceKey() helpers) and are evaluated against a focus
+that changes with every forEach level. The ASTToSQLTranslator builds CTE
+chains over a fixed resource-level context, so view paths are compiled here
+into inline SQL expressions that can be placed directly in the SELECT list
+and lateral joins of a single statement. All database syntax is delegated to
+the dialect's ViewDefinition collection primitives.
+"""
+
+import html
+import re
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from .exceptions import InvalidExpressionError
+
+# Kinds of compiled values
+COLLECTION = "collection"  # JSON array, never NULL
+VALUE = "value"            # JSON member value; an array when the element repeats
+ELEMENT = "element"        # a single JSON value, or NULL
+SCALAR = "scalar"          # SQL-typed value ('string', 'number' or 'boolean')
+
+_NUMBER_TYPES = {"integer", "decimal", "positiveInt", "unsignedInt", "integer64"}
+_STRING_TYPES = {
+    "string", "code", "id", "uri", "url", "canonical", "oid", "uuid", "markdown",
+    "base64Binary", "date", "dateTime", "instant", "time",
+}
+_INTEGER_COLUMN_TYPES = {"integer", "int", "positiveInt", "unsignedInt", "integer64"}
+_DECIMAL_COLUMN_TYPES = {"decimal", "number"}
+
+_NUMBER_LITERAL = re.compile(r"^\d+(\.\d+)?$")
+_ESCAPES = {"'": "'", '"': '"', "`": "`", "\\": "\\", "/": "/",
+            "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+@dataclass
+class CompiledPath:
+    """SQL for a compiled FHIRPath (sub)expression.
+
+    ``base``/``segments`` keep single-valued navigation in JSON path form so
+    that chains like ``name[1].family`` compile to one extraction call.
+    ``parent``/``member`` record the last member step, which ofType() uses to
+    resolve choice elements (``value.ofType(Quantity)`` -> ``valueQuantity``).
+    ``filter`` keeps the (collection, alias, condition) of a filtered
+    collection so that exists()/empty() compile to a semi-join instead of
+    materialising the matching items.
+    """
+
+    sql: str
+    kind: str
+    sql_type: Optional[str] = None
+    fhir_type: Optional[str] = None
+    parent: Optional["CompiledPath"] = None
+    member: Optional[str] = None
+    base: Optional[str] = None
+    segments: Tuple[Any, ...] = ()
+    empty_literal: bool = False
+    filter: Optional[Tuple[str, str, str]] = None
+
+
+class ViewPathCompiler:
+    """Compiles ViewDefinition FHIRPath expressions to inline SQL expressions.
+
+    Example:
+        compiler = ViewPathCompiler(dialect)
+        root = compiler.root()
+        family = compiler.compile("name.where(use = 'official').family", root)
+        sql = compiler.column_value(family, "string")
+    """
+
+    def __init__(self, dialect, parser=None):
+        self.dialect = dialect
+        self._parser = parser
+        self._alias_count = 0
+        self._ast_cache: Dict[str, Any] = {}
+        self._root: Optional[CompiledPath] = None
+        self._type_hint: Optional[str] = None
+
+    @property
+    def parser(self):
+        if self._parser is None:
+            # Import here to avoid circular dependencies
+            from fhir4ds.fhirpath.parser import FHIRPathParser
+            self._parser = FHIRPathParser()
+        return self._parser
+
+    def reset(self) -> None:
+        """Restart alias numbering and the AST cache for a new statement."""
+        self._alias_count = 0
+        self._ast_cache.clear()
+
+    def new_alias(self, prefix: str = "v") -> str:
+        self._alias_count += 1
+        return f"{prefix}{self._alias_count}"
+
+    def root(self, column: str = "resource") -> CompiledPath:
+        """Focus for the resource row itself."""
+        return CompiledPath(column, ELEMENT, base=column)
+
+    def item(self, alias: str) -> CompiledPath:
+        """Focus for the current item of a lateral join or filter."""
+        value = f"{alias}.value"
+        return CompiledPath(value, ELEMENT, base=value)
+
+    def compile(self, expression: str, focus: CompiledPath,
+                root: Optional[CompiledPath] = None,
+                type_hint: Optional[str] = None) -> CompiledPath:
+        """Compile a FHIRPath expression evaluated against ``focus``.
+
+        Args:
+            expression: FHIRPath expression (constants already substituted)
+            focus: Compiled focus ($this) the expression is evaluated on
+            root: Resource focus used by getResourceKey() (defaults to focus)
+            type_hint: Declared column type, used by lowBoundary()/highBoundary()
+
+        Raises:
+            InvalidExpressionError: If the expression cannot be compiled
+        """
+        expression = html.unescape(expression).strip()
+        if expression == "$this":
+            return focus
+
+        ast = self._parse(expression)
+
+        saved = (self._root, self._type_hint)
+        self._root = root or self._root or focus
+        self._type_hint = type_hint
+        try:
+            return self._visit(ast, focus)
+        finally:
+            self._root, self._type_hint = saved
+
+    def _parse(self, expression: str):
+        """Parse an expression once per statement; views repeat paths across columns and branches."""
+        ast = self._ast_cache.get(expression)
+        if ast is None:
+            from fhir4ds.fhirpath.exceptions import FHIRPathError
+            try:
+                ast = self.parser.parse(expression).get_ast()
+            except FHIRPathError as e:
+                raise InvalidExpressionError(f"Invalid FHIRPath expression '{expression}': {e}")
+            self._ast_cache[expression] = ast
+        return ast
+
+    # Conversions
+
+    def to_collection(self, value: CompiledPath) -> str:
+        """SQL for ``value`` as a JSON array."""
+        if value.kind == COLLECTION:
+            return value.sql
+        if value.kind == SCALAR:
+            return (
+                f"CASE WHEN {value.sql} IS NULL THEN {self.dialect.empty_json_array()} "
+                f"ELSE {self.dialect.wrap_json_array(value.sql)} END"
+            )
+        return self.dialect.as_json_collection(value.sql)
+
+    def to_single(self, value: CompiledPath) -> CompiledPath:
+        """The first item of ``value`` as an element (scalars are returned as-is)."""
+        if value.kind in (ELEMENT, SCALAR):
+            return value
+        return self._index(value, 0)
+
+    def to_string(self, value: CompiledPath) -> str:
+        if value.kind == SCALAR:
+            return value.sql if value.sql_type == "string" else f"CAST({value.sql} AS VARCHAR)"
+        return self.dialect.json_value_as_string(self.to_single(value).sql)
+
+    def to_number(self, value: CompiledPath) -> str:
+        if value.kind == SCALAR:
+            return value.sql
+        return self.dialect.json_value_as_number(self.to_single(value).sql)
+
+    def to_boolean(self, value: CompiledPath) -> str:
+        if value.kind == SCALAR:
+            if value.sql_type != "boolean":
+                raise InvalidExpressionError(
+                    f"Expression of type {value.sql_type} cannot be used as a boolean"
+                )
+            return value.sql
+        return self.dialect.json_value_as_boolean(self.to_single(value).sql)
+
+    def predicate(self, value: CompiledPath) -> str:
+        """SQL predicate for a where path, which must evaluate to a boolean.
+
+        Raises:
+            InvalidExpressionError: If the path is known not to be boolean
+        """
+        if value.kind == SCALAR:
+            return self.to_boolean(value)
+        if value.kind == COLLECTION:
+            value = self._single_valued(value)
+        item = self.to_single(value).sql
+        boolean = self.dialect.json_value_as_boolean(item)
+        error = self.dialect.generate_runtime_error("where path must evaluate to a boolean")
+        if error is None:
+            return boolean
+        is_boolean = self.dialect.json_value_type_in(item, ["boolean"])
+        return f"(CASE WHEN {item} IS NOT NULL AND NOT {is_boolean} THEN {error} ELSE {boolean} END)"
+
+    def column_value(self, value: CompiledPath, column_type: Optional[str] = None,
+                     collection: bool = False) -> str:
+        """SQL for a view column with the declared type."""
+        if collection:
+            return self.dialect.json_collection_to_column(self.to_collection(value))
+        if value.kind == COLLECTION:
+            value = self._single_valued(value)
+        if column_type == "boolean":
+            return self.to_boolean(value)
+        if column_type in _INTEGER_COLUMN_TYPES:
+            return self.dialect.cast_to_type(f"({self.to_number(value)})", "INTEGER")
+        if column_type in _DECIMAL_COLUMN_TYPES:
+            return self.to_number(value)
+        if value.kind == SCALAR and column_type is None:
+            return value.sql
+        return self.to_string(value)
+
+    def _single_valued(self, value: CompiledPath) -> CompiledPath:
+        """The only item of a collection, raising at runtime if there are more."""
+        first = self._index(value, 0)
+        error = self.dialect.generate_runtime_error(
+            "Collection with more than one value used for a non-collection column"
+        )
+        if error is None:
+            return first
+        sql = f"CASE WHEN {self.dialect.count_json_collection(value.sql)} > 1 THEN {error} ELSE {first.sql} END"
+        return replace(first, sql=sql, base=sql, segments=())
+
+    # AST traversal
+
+    def _visit(self, node, focus: CompiledPath) -> CompiledPath:
+        handler = self._NODE_HANDLERS.get(node.node_type)
+        if handler is None:
+            raise InvalidExpressionError(
+                f"Unsupported FHIRPath construct '{node.text}' in ViewDefinition path"
+            )
+        return getattr(self, handler)(node, focus)
+
+    def _visit_first_child(self, node, focus: CompiledPath) -> CompiledPath:
+        return self._visit(node.children[0], focus)
+
+    def _visit_invocation_term(self, node, focus: CompiledPath) -> CompiledPath:
+        return self._invoke(node.children[0], focus)
+
+    def _visit_invocation_expression(self, node, focus: CompiledPath) -> CompiledPath:
+        target = self._visit(node.children[0], focus)
+        return self._invoke(node.children[1], target)
+
+    def _invoke(self, node, target: CompiledPath) -> CompiledPath:
+        if node.node_type == "MemberInvocation":
+            return self._member(target, _identifier(node.children[0].text))
+        if node.node_type == "functionCall":
+            return self._function(node, target)
+        if node.node_type == "ThisInvocation":
+            return target
+        raise InvalidExpressionError(f"Unsupported invocation '{node.text}' in ViewDefinition path")
+
+    def _visit_indexer(self, node, focus: CompiledPath) -> CompiledPath:
+        target = self._visit(node.children[0], focus)
+        index = self._visit(node.children[1], focus)
+        if index.kind != SCALAR or index.sql_type != "number" or not index.sql.isdigit():
+            raise InvalidExpressionError(f"Indexer must be a non-negative integer literal: '{node.text}'")
+        return self._index(target, int(index.sql))
+
+    def _visit_literal(self, node, focus: CompiledPath) -> CompiledPath:
+        if node.children:
+            return self._visit(node.children[0], focus)
+        text = node.text
+        if text == "{}":
+            return CompiledPath(self.dialect.empty_json_array(), COLLECTION, empty_literal=True)
+        if text in ("true", "false"):
+            return CompiledPath(text.upper(), SCALAR, sql_type="boolean", fhir_type="boolean")
+        if text.startswith("'"):
+            return _string_literal(_unescape(text[1:-1]))
+        if text.startswith("@"):
+            value = text[1:]
+            if value.startswith("T"):
+                return _string_literal(value[1:], fhir_type="time")
+            return _string_literal(value, fhir_type="dateTime" if "T" in value else "date")
+        if _NUMBER_LITERAL.match(text):
+            return CompiledPath(text, SCALAR, sql_type="number",
+                                fhir_type="decimal" if "." in text else "integer")
+        raise InvalidExpressionError(f"Unsupported literal '{text}' in ViewDefinition path")
+
+    def _visit_polarity(self, node, focus: CompiledPath) -> CompiledPath:
+        operand = self._visit(node.children[0], focus)
+        if node.text == "+":
+            return operand
+        if operand.kind == SCALAR and _NUMBER_LITERAL.match(operand.sql):
+            return replace(operand, sql=f"-{operand.sql}")
+        return CompiledPath(f"(-{self.to_number(operand)})", SCALAR, sql_type="number")
+
+    def _visit_comparison(self, node, focus: CompiledPath) -> CompiledPath:
+        left = self._visit(node.children[0], focus)
+        right = self._visit(node.children[1], focus)
+        return self._compare(node.text, left, right)
+
+    def _visit_boolean_operator(self, node, focus: CompiledPath) -> CompiledPath:
+        left = self.to_boolean(self._visit(node.children[0], focus))
+        right = self.to_boolean(self._visit(node.children[1], focus))
+        operator = node.text
+        if operator == "and":
+            sql = f"({left} AND {right})"
+        elif operator == "or":
+            sql = f"({left} OR {right})"
+        elif operator == "xor":
+            sql = f"({left} <> {right})"
+        else:  # implies
+            sql = f"((NOT {left}) OR {right})"
+        return CompiledPath(sql, SCALAR, sql_type="boolean")
+
+    def _visit_arithmetic(self, node, focus: CompiledPath) -> CompiledPath:
+        left = self._visit(node.children[0], focus)
+        right = self._visit(node.children[1], focus)
+        operator = node.text
+        if operator == "&":
+            sql = f"(COALESCE({self.to_string(left)}, '') || COALESCE({self.to_string(right)}, ''))"
+            return CompiledPath(sql, SCALAR, sql_type="string")
+        if operator == "+" and "string" in (self._domain(left), self._domain(right)):
+            return CompiledPath(f"({self.to_string(left)} || {self.to_string(right)})",
+                                SCALAR, sql_type="string")
+
+        lhs, rhs = self.to_number(left), self.to_number(right)
+        if operator in ("+", "-", "*"):
+            sql = f"({lhs} {operator} {rhs})"
+        elif operator == "/":
+            sql = f"({lhs} / NULLIF({rhs}, 0))"
+        elif operator == "div":
+            sql = f"TRUNC({lhs} / NULLIF({rhs}, 0))"
+        elif operator == "mod":
+            sql = f"({lhs} % NULLIF({rhs}, 0))"
+        else:
+            raise InvalidExpressionError(f"Unsupported operator '{operator}' in ViewDefinition path")
+        return CompiledPath(sql, SCALAR, sql_type="number")
+
+    _NODE_HANDLERS = {
+        "TermExpression": "_visit_first_child",
+        "ParenthesizedTerm": "_visit_first_child",
+        "InvocationTerm": "_visit_invocation_term",
+        "InvocationExpression": "_visit_invocation_expression",
+        "IndexerExpression": "_visit_indexer",
+        "literal": "_visit_literal",
+        "PolarityExpression": "_visit_polarity",
+        "EqualityExpression": "_visit_comparison",
+        "InequalityExpression": "_visit_comparison",
+        "AndExpression": "_visit_boolean_operator",
+        "OrExpression": "_visit_boolean_operator",
+        "ImpliesExpression": "_visit_boolean_operator",
+        "AdditiveExpression": "_visit_arithmetic",
+        "MultiplicativeExpression": "_visit_arithmetic",
+    }
+
+    # Navigation
+
+    def _member(self, target: CompiledPath, name: str) -> CompiledPath:
+        if target.kind == SCALAR:
+            raise InvalidExpressionError(f"Cannot navigate '{name}' on a computed value")
+        if target.kind == ELEMENT:
+            base = target.base if target.base is not None else target.sql
+            segments = target.segments + (name,)
+            sql = self.dialect.extract_json_path_value(base, list(segments))
+            return CompiledPath(sql, VALUE, parent=target, member=name,
+                                base=base, segments=segments)
+        alias = self.new_alias()
+        sql = self.dialect.flatten_json_collection(self.to_collection(target), name, alias)
+        return CompiledPath(sql, COLLECTION, parent=target, member=name)
+
+    def _index(self, target: CompiledPath, index: int) -> CompiledPath:
+        if target.kind == VALUE and target.base is not None and index >= 0:
+            item = self.dialect.extract_json_path_value(target.base, list(target.segments + (index,)))
+            if index > 0:
+                return CompiledPath(item, ELEMENT, fhir_type=target.fhir_type,
+                                    base=target.base, segments=target.segments + (index,))
+            # A non-repeating element is its own first item
+            sql = f"COALESCE({item}, {target.sql})"
+            return CompiledPath(sql, ELEMENT, fhir_type=target.fhir_type, base=sql)
+        if target.kind == ELEMENT and index in (0, -1):
+            return target
+        sql = self.dialect.index_json_collection(self.to_collection(target), index)
+        return CompiledPath(sql, ELEMENT, fhir_type=target.fhir_type, base=sql)
+
+    def _filter(self, target: CompiledPath, criteria_node) -> CompiledPath:
+        alias = self.new_alias()
+        condition = self.to_boolean(self._visit(criteria_node, self.item(alias)))
+        return self._filtered(target, alias, condition, target.fhir_type)
+
+    def _filtered(self, target: CompiledPath, alias: str, condition: str,
+                  fhir_type: Optional[str] = None) -> CompiledPath:
+        collection = self.to_collection(target)
+        sql = self.dialect.filter_json_collection(collection, alias, condition)
+        return CompiledPath(sql, COLLECTION, fhir_type=fhir_type, filter=(collection, alias, condition))
+
+    # Functions
+
+    def _function(self, node, target: CompiledPath) -> CompiledPath:
+        functn = node.children[0]
+        name = functn.children[0].text
+        args = list(functn.children[1].children) if len(functn.children) > 1 else []
+        handler = self._FUNCTION_HANDLERS.get(name)
+        if handler is None:
+            raise InvalidExpressionError(f"Function '{name}()' is not supported in ViewDefinition paths")
+        return getattr(self, handler)(target, args)
+
+    def _fn_where(self, target, args):
+        self._expect_args("where", args, 1, 1)
+        return self._filter(target, args[0])
+
+    def _fn_exists(self, target, args):
+        self._expect_args("exists", args, 0, 1)
+        if args:
+            target = self._filter(target, args[0])
+        if target.empty_literal:
+            return CompiledPath("FALSE", SCALAR, sql_type="boolean")
+        if target.filter is not None:
+            return CompiledPath(self.dialect.exists_in_json_collection(*target.filter),
+                                SCALAR, sql_type="boolean")
+        if target.kind == COLLECTION:
+            sql = f"({self.dialect.count_json_collection(target.sql)} > 0)"
+        else:
+            sql = f"({target.sql} IS NOT NULL)"
+        return CompiledPath(sql, SCALAR, sql_type="boolean")
+
+    def _fn_empty(self, target, args):
+        self._expect_args("empty", args, 0, 0)
+        exists = self._fn_exists(target, [])
+        return CompiledPath(f"(NOT {exists.sql})", SCALAR, sql_type="boolean")
+
+    def _fn_first(self, target, args):
+        self._expect_args("first", args, 0, 0)
+        return self._index(target, 0)
+
+    def _fn_last(self, target, args):
+        self._expect_args("last", args, 0, 0)
+        return self._index(target, -1)
+
+    def _fn_count(self, target, args):
+        self._expect_args("count", args, 0, 0)
+        sql = self.dialect.count_json_collection(self.to_collection(target))
+        return CompiledPath(sql, SCALAR, sql_type="number")
+
+    def _fn_not(self, target, args):
+        self._expect_args("not", args, 0, 0)
+        return CompiledPath(f"(NOT {self.to_boolean(target)})", SCALAR, sql_type="boolean")
+
+    def _fn_join(self, target, args):
+        self._expect_args("join", args, 0, 1)
+        separator = self._visit(args[0], target).sql if args else "''"
+        sql = self.dialect.join_json_collection(self.to_collection(target), self.new_alias(), separator)
+        return CompiledPath(sql, SCALAR, sql_type="string")
+
+    def _fn_of_type(self, target, args):
+        self._expect_args("ofType", args, 1, 1)
+        type_name = _type_name(args[0].text)
+        if target.member and target.parent is not None:
+            # Choice element: value.ofType(Quantity) is stored as valueQuantity
+            choice = target.member + type_name[0].upper() + type_name[1:]
+            return replace(self._member(target.parent, choice), fhir_type=type_name)
+
+        if type_name in _NUMBER_TYPES:
+            kinds = ["number"]
+        elif type_name == "boolean":
+            kinds = ["boolean"]
+        elif type_name in _STRING_TYPES:
+            kinds = ["string"]
+        else:
+            kinds = ["object"]
+        alias = self.new_alias()
+        condition = self.dialect.json_value_type_in(f"{alias}.value", kinds)
+        return self._filtered(target, alias, condition, type_name)
+
+    def _fn_extension(self, target, args):
+        self._expect_args("extension", args, 1, 1)
+        url = self._visit(args[0], target)
+        extensions = self._member(target, "extension")
+        alias = self.new_alias()
+        url_value = self.dialect.extract_json_path_value(f"{alias}.value", ["url"])
+        condition = f"{self.dialect.json_value_as_string(url_value)} = {url.sql}"
+        return self._filtered(extensions, alias, condition)
+
+    def _fn_get_resource_key(self, target, args):
+        self._expect_args("getResourceKey", args, 0, 0)
+        return CompiledPath(self.to_string(self._member(self._root, "id")), SCALAR, sql_type="string")
+
+    def _fn_get_reference_key(self, target, args):
+        self._expect_args("getReferenceKey", args, 0, 1)
+        resource_type = _type_name(args[0].text) if args else None
+        reference = self.to_string(self._member(self.to_single(target), "reference"))
+        sql = self.dialect.generate_reference_key(reference, resource_type)
+        return CompiledPath(sql, SCALAR, sql_type="string")
+
+    def _fn_low_boundary(self, target, args):
+        self._expect_args("lowBoundary", args, 0, 0)
+        return self._boundary(target, "low")
+
+    def _fn_high_boundary(self, target, args):
+        self._expect_args("highBoundary", args, 0, 0)
+        return self._boundary(target, "high")
+
+    _FUNCTION_HANDLERS = {
+        "where": "_fn_where",
+        "exists": "_fn_exists",
+        "hasValue": "_fn_exists",
+        "empty": "_fn_empty",
+        "first": "_fn_first",
+        "last": "_fn_last",
+        "count": "_fn_count",
+        "not": "_fn_not",
+        "join": "_fn_join",
+        "ofType": "_fn_of_type",
+        "extension": "_fn_extension",
+        "getResourceKey": "_fn_get_resource_key",
+        "getReferenceKey": "_fn_get_reference_key",
+        "lowBoundary": "_fn_low_boundary",
+        "highBoundary": "_fn_high_boundary",
+    }
+
+    def _boundary(self, target: CompiledPath, boundary_type: str) -> CompiledPath:
+        value_type = target.fhir_type or self._type_hint
+        if value_type in ("date", "dateTime", "instant", "time"):
+            text = self.to_string(target)
+            if value_type == "time":
+                sql = self._time_boundary(text, boundary_type)
+            elif value_type == "date":
+                sql = self._date_boundary(text, boundary_type)
+            else:
+                sql = self._date_time_boundary(text, boundary_type)
+            return CompiledPath(sql, SCALAR, sql_type="string", fhir_type=value_type)
+
+        sql = self.dialect.generate_decimal_boundary(self.to_number(target), None, boundary_type)
+        return CompiledPath(sql, SCALAR, sql_type="number", fhir_type="decimal")
+
+    def _date_boundary(self, text: str, boundary_type: str) -> str:
+        if boundary_type == "low":
+            return (
+                f"CASE LENGTH({text}) WHEN 4 THEN {text} || '-01-01' "
+                f"WHEN 7 THEN {text} || '-01' ELSE {text} END"
+            )
+        return (
+            f"CASE LENGTH({text}) WHEN 4 THEN {text} || '-12-31' "
+            f"WHEN 7 THEN {self.dialect.generate_month_end_date(text)} ELSE {text} END"
+        )
+
+    def _date_time_boundary(self, text: str, boundary_type: str) -> str:
+        # Date-only values widen to the full day across all timezones
+        suffix = "T00:00:00.000+14:00" if boundary_type == "low" else "T23:59:59.999-12:00"
+        date_part = self._date_boundary(text, boundary_type)
+        return f"CASE WHEN LENGTH({text}) <= 10 THEN ({date_part}) || '{suffix}' ELSE {text} END"
+
+    def _time_boundary(self, text: str, boundary_type: str) -> str:
+        if boundary_type == "low":
+            hour, minute, second = ":00:00.000", ":00.000", ".000"
+        else:
+            hour, minute, second = ":59:59.999", ":59.999", ".999"
+        return (
+            f"CASE LENGTH({text}) WHEN 2 THEN {text} || '{hour}' "
+            f"WHEN 5 THEN {text} || '{minute}' "
+            f"WHEN 8 THEN {text} || '{second}' ELSE {text} END"
+        )
+
+    # Comparisons
+
+    def _domain(self, value: CompiledPath) -> Optional[str]:
+        if value.kind == SCALAR:
+            return value.sql_type
+        if value.fhir_type in _NUMBER_TYPES:
+            return "number"
+        if value.fhir_type == "boolean":
+            return "boolean"
+        if value.fhir_type in _STRING_TYPES:
+            return "string"
+        return None
+
+    def _compare(self, operator: str, left: CompiledPath, right: CompiledPath) -> CompiledPath:
+        if left.empty_literal or right.empty_literal:
+            return CompiledPath("CAST(NULL AS BOOLEAN)", SCALAR, sql_type="boolean")
+
+        sql_operator = {"=": "=", "!=": "<>", "~": "=", "!~": "<>",
+                        "<": "<", ">": ">", "<=": "<=", ">=": ">="}.get(operator)
+        if sql_operator is None:
+            raise InvalidExpressionError(f"Unsupported operator '{operator}' in ViewDefinition path")
+
+        domain = self._domain(left) or self._domain(right)
+        if domain == "number":
+            sql = f"({self.to_number(left)} {sql_operator} {self.to_number(right)})"
+        elif domain == "boolean":
+            sql = f"({self.to_boolean(left)} {sql_operator} {self.to_boolean(right)})"
+        elif domain == "string" or operator in ("~", "!~"):
+            lhs, rhs = self.to_string(left), self.to_string(right)
+            if operator in ("~", "!~"):
+                lhs, rhs = f"LOWER({lhs})", f"LOWER({rhs})"
+            sql = f"({lhs} {sql_operator} {rhs})"
+        else:
+            # Both sides are untyped JSON: compare numerically only when both are numbers
+            lhs, rhs = self.to_single(left).sql, self.to_single(right).sql
+            both_numbers = (
+                f"{self.dialect.json_value_type_in(lhs, ['number'])} AND "
+                f"{self.dialect.json_value_type_in(rhs, ['number'])}"
+            )
+            sql = (
+                f"(CASE WHEN {both_numbers} "
+                f"THEN {self.dialect.json_value_as_number(lhs)} {sql_operator} {self.dialect.json_value_as_number(rhs)} "
+                f"ELSE {self.dialect.json_value_as_string(lhs)} {sql_operator} {self.dialect.json_value_as_string(rhs)} END)"
+            )
+        return CompiledPath(sql, SCALAR, sql_type="boolean")
+
+    @staticmethod
+    def _expect_args(name: str, args: List[Any], minimum: int, maximum: int) -> None:
+        if not minimum <= len(args) <= maximum:
+            raise InvalidExpressionError(
+                f"Function '{name}()' expects between {minimum} and {maximum} arguments, got {len(args)}"
+            )
+
+
+def _string_literal(value: str, fhir_type: str = "string") -> CompiledPath:
+    escaped = value.replace("'", "''")
+    return CompiledPath(f"'{escaped}'", SCALAR, sql_type="string", fhir_type=fhir_type)
+
+
+def _unescape(value: str) -> str:
+    """Resolve FHIRPath string escapes (\\', \\n, \\uXXXX, ...)."""
+    result = []
+    index = 0
+    while index < len(value):
+        char = value[index]
+        if char == "\\" and index + 1 < len(value):
+            escape = value[index + 1]
+            if escape == "u" and index + 5 < len(value):
+                result.append(chr(int(value[index + 2:index + 6], 16)))
+                index += 6
+                continue
+            result.append(_ESCAPES.get(escape, escape))
+            index += 2
+            continue
+        result.append(char)
+        index += 1
+    return "".join(result)
+
+
+def _identifier(text: str) -> str:
+    return text[1:-1] if text.startswith("`") and text.endswith("`") else text
+
+
+def _type_name(text: str) -> str:
+    """Strip namespaces and quotes from a type specifier ('FHIR.string' -> 'string')."""
+    return _identifier(text.strip().strip("'").split(".")[-1])
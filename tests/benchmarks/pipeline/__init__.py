@@ -0,0 +1,6 @@
+"""
+Ingestion benchmark tests.
+
+The modules in this package measure bulk-loading throughput into the
+supported databases.
+"""
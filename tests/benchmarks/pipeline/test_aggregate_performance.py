@@ -0,0 +1,59 @@
+"""
+Benchmark for population aggregation on DuckDB.
+
+Generates Patients in SQL and times ``FHIRPathExecutor.aggregate()`` counting
+them by gender and ten-year age band, grouped in the database, against
+fetching both values for every patient and counting in Python. Defaults to
+1M patients; set ``FHIR4DS_AGGREGATE_BENCHMARK_PATIENTS`` to change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections import Counter
+
+import pytest
+
+from fhir4ds.fhirpath.sql import FHIRPathExecutor, StorageCatalog
+from fhir4ds.sql import SQLGenerator
+
+PATIENTS = int(os.environ.get("FHIR4DS_AGGREGATE_BENCHMARK_PATIENTS", "1000000"))
+AS_OF = "2024-12-31"
+
+
+@pytest.mark.slow
+def test_aggregate_by_gender_and_age(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=str(tmp_path / "aggregate.duckdb"))
+    catalog = StorageCatalog()
+    for statement in catalog.create_statements(dialect, "Patient"):
+        dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Patient SELECT 'p' || i, json_object('resourceType', 'Patient', 'id', 'p' || i, "
+        "'gender', CASE WHEN i % 2 = 0 THEN 'female' ELSE 'male' END, "
+        f"'birthDate', strftime(DATE '1930-01-01' + CAST(i % 30000 AS INTEGER), '%Y-%m-%d')) FROM range({PATIENTS}) t(i)"
+    )
+    executor = FHIRPathExecutor(dialect, "Patient", catalog=catalog)
+
+    started = time.perf_counter()
+    rows = executor.aggregate(
+        {"patients": "count"},
+        group_by=["gender", {"name": "age", "path": "birthDate", "bucket": "age", "as_of": AS_OF}],
+    )
+    pushed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    view = {"resource": "Patient", "select": [{"column": [
+        {"name": "gender", "path": "gender"}, {"name": "birth_date", "path": "birthDate"}]}]}
+    counts = Counter()
+    for gender, birth_date in dialect.execute_query(SQLGenerator(dialect, catalog=catalog).generate_sql(view)):
+        age = 2024 - int(birth_date[:4]) - (AS_OF[5:] < birth_date[5:])
+        counts[gender, age - age % 10] += 1
+    fetched = time.perf_counter() - started
+
+    print(f"\nDUCKDB: {PATIENTS:,} patients by gender and age band into {len(rows)} groups in "
+          f"{pushed * 1000:,.0f}ms grouped in SQL vs {fetched * 1000:,.0f}ms fetched and counted in Python")
+    assert {(row["gender"], row["age"]): row["patients"] for row in rows} == counts
@@ -0,0 +1,56 @@
+"""
+Benchmark for approximate aggregation on DuckDB.
+
+Generates Observations in SQL and times ``FHIRPathExecutor.aggregate()``
+counting them and averaging their values by status, exactly and from a 1%
+sample, checking that the exact results fall in the reported confidence
+intervals. Defaults to 1M Observations; set
+``FHIR4DS_APPROXIMATE_BENCHMARK_RESOURCES`` to change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath.sql import FHIRPathExecutor, StorageCatalog
+
+RESOURCES = int(os.environ.get("FHIR4DS_APPROXIMATE_BENCHMARK_RESOURCES", "1000000"))
+MEASURES = {"n": "count", "mean": ("avg", "value.ofType(Quantity).value")}
+
+
+@pytest.mark.slow
+def test_approximate_aggregate(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=str(tmp_path / "approximate.duckdb"))
+    catalog = StorageCatalog()
+    for statement in catalog.create_statements(dialect, "Observation"):
+        dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Observation SELECT 'o' || i, json_object('resourceType', 'Observation', 'id', 'o' || i, "
+        "'status', CASE WHEN i % 3 = 0 THEN 'final' ELSE 'amended' END, "
+        f"'valueQuantity', json_object('value', (i * 7919) % 100 * 1.5)) FROM range({RESOURCES}) t(i)"
+    )
+    executor = FHIRPathExecutor(dialect, "Observation", catalog=catalog)
+
+    started = time.perf_counter()
+    exact = executor.aggregate(MEASURES, group_by=["status"])
+    exact_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    approximate = executor.aggregate(MEASURES, group_by=["status"], approximate=True, sample_rate=0.01, seed=42)
+    approximate_seconds = time.perf_counter() - started
+
+    print(f"\nDUCKDB: count and mean of {RESOURCES:,} Observations by status in {exact_seconds:.2f}s exactly "
+          f"vs {approximate_seconds:.2f}s from a 1% sample")
+    for truth, estimate in zip(exact, approximate):
+        assert truth["status"] == estimate["status"]
+        for measure in MEASURES:
+            low, high = estimate[f"{measure}_ci"]
+            print(f"  {truth['status']} {measure}: {truth[measure]:,.2f} exact, {estimate[measure]:,.2f} "
+                  f"estimated ({low:,.2f} to {high:,.2f})")
+            assert low <= truth[measure] <= high
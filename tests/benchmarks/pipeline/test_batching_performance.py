@@ -0,0 +1,73 @@
+"""
+Benchmark for micro-batched per-patient requests against one query each on DuckDB.
+
+Fires a burst of concurrent "evaluate this expression for patient P"
+requests from a thread pool, once through ``MicroBatcher`` and once with a
+``FHIRPathExecutor.execute(..., patients=[P])`` query per request, and
+reports throughput and the batcher's statistics. Defaults to 2,000 requests
+over as many patients; set ``FHIR4DS_BATCHING_BENCHMARK_REQUESTS`` to change it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fhir4ds.fhirpath.sql import CompartmentIndex, FHIRPathExecutor, MicroBatcher, StorageCatalog
+
+REQUESTS = int(os.environ.get("FHIR4DS_BATCHING_BENCHMARK_REQUESTS", "2000"))
+WORKERS = 64
+EXPRESSION = "status = 'final'"
+
+
+@pytest.mark.slow
+def test_micro_batching(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    source = tmp_path / "export.ndjson"
+    with source.open("w") as handle:
+        for index in range(REQUESTS):
+            handle.write(json.dumps({"resourceType": "Patient", "id": f"p{index}"}) + "\n")
+            for number in range(3):
+                handle.write(json.dumps({
+                    "resourceType": "Observation", "id": f"o{index}-{number}",
+                    "status": "final" if number else "amended", "subject": {"reference": f"Patient/p{index}"},
+                }) + "\n")
+    catalog = StorageCatalog(compartment_index=CompartmentIndex.from_compartment_definition(
+        resource_types=["Patient", "Observation"]))
+    catalog.dialect = DuckDBDialect(database=str(tmp_path / "batching.duckdb"))
+    NDJSONLoader(catalog.dialect, catalog=catalog).load(source)
+    patients = [f"p{index}" for index in range(REQUESTS)]
+
+    with MicroBatcher(catalog.dialect, catalog, window_ms=5) as batcher, ThreadPoolExecutor(WORKERS) as pool:
+        started = time.perf_counter()
+        batched = list(pool.map(lambda patient: batcher.evaluate("Observation", EXPRESSION, patient), patients))
+        batched_seconds = time.perf_counter() - started
+        statistics = batcher.get_statistics()
+
+    executor = FHIRPathExecutor(catalog.dialect, "Observation", catalog=catalog)
+    lock = threading.Lock()
+
+    def one_query(patient):
+        with lock:
+            rows = executor.execute(EXPRESSION, patients=[patient])
+        return {row[0]: [row[-1]] for row in rows}
+
+    with ThreadPoolExecutor(WORKERS) as pool:
+        started = time.perf_counter()
+        separate = list(pool.map(one_query, patients))
+        separate_seconds = time.perf_counter() - started
+
+    print(f"\nDUCKDB: {REQUESTS:,} concurrent requests in {batched_seconds:.2f}s micro-batched "
+          f"({statistics['batches']:,} queries, mean batch {statistics['mean_batch_size']:.0f}, "
+          f"mean wait {statistics['mean_wait_ms']:.1f}ms, mean query {statistics['mean_query_ms']:.1f}ms) "
+          f"vs {separate_seconds:.2f}s with one query each")
+    assert batched == separate
+    assert statistics["batches"] < REQUESTS
@@ -0,0 +1,75 @@
+"""
+Benchmark for streaming Bundle reading.
+
+Compares peak Python memory and throughput of iter_bundle_resources with
+``json.load`` of the whole Bundle.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from fhir4ds.pipeline.fhir import iter_resources
+
+ENTRY_COUNT = 100_000
+
+
+def _write_bundle(path) -> None:
+    with path.open("w") as handle:
+        handle.write('{"resourceType": "Bundle", "type": "collection", "entry": [')
+        for index in range(ENTRY_COUNT):
+            if index:
+                handle.write(",")
+            handle.write(json.dumps({
+                "fullUrl": f"urn:uuid:{index}",
+                "resource": {
+                    "resourceType": "Observation",
+                    "id": f"obs{index}",
+                    "status": "final",
+                    "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+                    "subject": {"reference": f"Patient/pt{index % 1000}"},
+                    "valueQuantity": {"value": index % 200, "unit": "/min"},
+                    "note": [{"text": "n" * 200}],
+                },
+            }, indent=1))
+        handle.write("]}")
+
+
+def _measure(fn):
+    """(result, seconds, peak traced bytes); timing runs without tracemalloc."""
+    start = time.perf_counter()
+    count = fn()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, seconds, peak
+
+
+@pytest.mark.slow
+def test_streaming_reader_memory_and_throughput(tmp_path) -> None:
+    """The streaming reader holds one entry at a time."""
+    bundle = tmp_path / "bundle.json"
+    _write_bundle(bundle)
+    size_mb = bundle.stat().st_size / 1e6
+
+    def load_whole():
+        with bundle.open("rb") as handle:
+            return len(json.load(handle)["entry"])
+
+    streamed, stream_seconds, stream_peak = _measure(lambda: sum(1 for _ in iter_resources(bundle)))
+    loaded, load_seconds, load_peak = _measure(load_whole)
+
+    print(
+        f"{size_mb:.0f} MB Bundle: streaming {size_mb / stream_seconds:.0f} MB/s peak {stream_peak / 1e6:.1f} MB; "
+        f"json.load {size_mb / load_seconds:.0f} MB/s peak {load_peak / 1e6:.1f} MB"
+    )
+
+    assert streamed == loaded == ENTRY_COUNT
+    assert stream_peak < 8e6
+    assert stream_peak * 20 < load_peak
@@ -0,0 +1,58 @@
+"""
+Benchmark for in-process closure evaluation against SQL on DuckDB.
+
+Times ``ClosureEvaluator`` evaluating typical gateway expressions on one
+Patient, per evaluation, against ``FHIRPathRouter`` evaluating the same
+resource with SQL (loaded into a scratch table and queried). Defaults to
+100,000 closure evaluations per expression; set
+``FHIR4DS_CLOSURE_BENCHMARK_EVALUATIONS`` to change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath import ClosureEvaluator
+from fhir4ds.fhirpath.sql import FHIRPathRouter, StorageCatalog
+
+EVALUATIONS = int(os.environ.get("FHIR4DS_CLOSURE_BENCHMARK_EVALUATIONS", "100000"))
+SQL_EVALUATIONS = 20
+PATIENT = {
+    "resourceType": "Patient", "id": "p1", "gender": "female", "birthDate": "1984-12-31",
+    "name": [{"use": "official", "family": "Chalmers", "given": ["Peter", "James"]}, {"use": "usual", "given": ["Jim"]}],
+}
+EXPRESSIONS = {
+    "gender": ["female"],
+    "birthDate < @2000-01-01": [True],
+    "gender = 'female' or gender = 'male'": [True],
+}
+
+
+@pytest.mark.slow
+def test_closure_evaluation(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    evaluator = ClosureEvaluator("Patient")
+    router = FHIRPathRouter(DuckDBDialect(database=str(tmp_path / "closures.duckdb")), "Patient",
+                            catalog=StorageCatalog(), max_closure_resources=0)
+
+    print()
+    for expression, expected in EXPRESSIONS.items():
+        started = time.perf_counter()
+        for _ in range(EVALUATIONS):
+            result = evaluator.evaluate(expression, PATIENT)
+        closure = (time.perf_counter() - started) / EVALUATIONS
+
+        started = time.perf_counter()
+        for _ in range(SQL_EVALUATIONS):
+            sql = router.evaluate(expression, [PATIENT])
+        loaded = (time.perf_counter() - started) / SQL_EVALUATIONS
+
+        print(f"DUCKDB: {expression} on one Patient in {closure * 1e6:,.1f}us with closures "
+              f"vs {loaded * 1000:,.1f}ms loaded and queried with SQL")
+        assert result == expected
+        assert sql["p1"] == [value if isinstance(value, bool) else str(value) for value in expected]
@@ -0,0 +1,75 @@
+"""
+Benchmark for cohort bitmaps on DuckDB.
+
+Generates Patients and Observations in SQL, builds their compartment
+memberships and patient ordinals with ``NDJSONLoader.rebuild_compartments``,
+evaluates three criteria into bitmaps and times their combination in memory
+against re-running the combined criteria as SQL. Defaults to 1M patients
+(with two Observations each); set ``FHIR4DS_COHORT_BENCHMARK_PATIENTS`` to
+change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath.sql import CohortEngine, CompartmentIndex, StorageCatalog
+from fhir4ds.fhirpath.sql import cohorts
+from fhir4ds.pipeline.operations import NDJSONLoader
+
+PATIENTS = int(os.environ.get("FHIR4DS_COHORT_BENCHMARK_PATIENTS", "1000000"))
+
+
+@pytest.mark.slow
+def test_cohort_algebra(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=str(tmp_path / "cohorts.duckdb"))
+    catalog = StorageCatalog(compartment_index=CompartmentIndex.from_compartment_definition(
+        resource_types=["Patient", "Observation"]))
+    for resource_type in ("Patient", "Observation"):
+        for statement in catalog.create_statements(dialect, resource_type):
+            dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Patient SELECT 'p' || i, json_object('resourceType', 'Patient', 'id', 'p' || i, "
+        f"'gender', CASE WHEN i % 2 = 0 THEN 'female' ELSE 'male' END) FROM range({PATIENTS}) t(i)"
+    )
+    dialect.execute_query(
+        "INSERT INTO Observation SELECT 'o' || i, json_object('resourceType', 'Observation', 'id', 'o' || i, "
+        "'status', CASE WHEN i % 3 = 0 THEN 'final' ELSE 'amended' END, "
+        f"'subject', json_object('reference', 'Patient/p' || (i % {PATIENTS}))) FROM range({PATIENTS * 2}) t(i)"
+    )
+    NDJSONLoader(dialect, catalog=catalog).rebuild_compartments(["Patient", "Observation"])
+    engine = CohortEngine(dialect, catalog)
+
+    started = time.perf_counter()
+    male = engine.criterion("Patient", "gender = 'male'")
+    final = engine.criterion("Observation", "status = 'final'")
+    amended = engine.criterion("Observation", "status = 'amended'")
+    evaluate = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(100):
+        cohort = (male & final) - amended | ~male & final
+        count = len(cohort)
+    combine = (time.perf_counter() - started) / 100
+
+    started = time.perf_counter()
+    subject = "json_extract_string(o.resource, '$.subject.reference') = 'Patient/' || p.id"
+    status = "json_extract_string(o.resource, '$.status')"
+    expected = dialect.execute_query(
+        f"SELECT COUNT(*) FROM Patient AS p "
+        f"WHERE EXISTS (SELECT 1 FROM Observation AS o WHERE {subject} AND {status} = 'final') "
+        f"AND (json_extract_string(p.resource, '$.gender') != 'male' "
+        f"OR NOT EXISTS (SELECT 1 FROM Observation AS o WHERE {subject} AND {status} = 'amended'))"
+    )[0][0]
+    sql = time.perf_counter() - started
+
+    backend = "pyroaring" if cohorts.PYROARING_AVAILABLE else "int bitsets"
+    print(f"\nDUCKDB: 3 criteria over {PATIENTS:,} patients evaluated in {evaluate:.2f}s; combined and counted "
+          f"in {combine * 1e6:,.0f}us with {backend} vs {sql * 1000:,.0f}ms as SQL")
+    assert count == expected
@@ -0,0 +1,93 @@
+"""
+Benchmark for per-patient compartment pruning on DuckDB and PostgreSQL.
+
+Generates Observations for a population in SQL, builds the Patient
+compartment membership with ``NDJSONLoader.rebuild_compartments`` and
+times one patient's evaluation (``compartment="Patient/<id>"``) against the
+whole population. PostgreSQL runs against ``FHIR4DS_POSTGRESQL_CONN_STRING``
+and is skipped without it; its resource table gets an id index, as the
+module docs recommend. Defaults to 50M resources (50 per patient); set
+``FHIR4DS_COMPARTMENT_BENCHMARK_ROWS`` to change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath.sql import CompartmentIndex, FHIRPathExecutor, StorageCatalog
+from fhir4ds.pipeline.operations import NDJSONLoader
+
+CONN_STRING = os.environ.get("FHIR4DS_POSTGRESQL_CONN_STRING")
+
+ROWS = int(os.environ.get("FHIR4DS_COMPARTMENT_BENCHMARK_ROWS", "50000000"))
+PATIENTS = max(ROWS // 50, 1)
+
+
+def _duckdb_dialect(tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    return DuckDBDialect(database=str(tmp_path / "compartments.duckdb"))
+
+
+def _postgresql_dialect(tmp_path):
+    if not CONN_STRING:
+        pytest.skip("FHIR4DS_POSTGRESQL_CONN_STRING is not set")
+    pytest.importorskip("psycopg2")
+    from fhir4ds.dialects.postgresql import PostgreSQLDialect
+
+    dialect = PostgreSQLDialect(CONN_STRING)
+    for table in ("Observation", "fhir4ds_compartments"):
+        dialect.execute_query(f"DROP TABLE IF EXISTS {table}")
+    return dialect
+
+
+def _generate_observations(dialect) -> None:
+    if dialect.name == "POSTGRESQL":
+        dialect.execute_query(
+            "INSERT INTO Observation SELECT 'o' || i, jsonb_build_object('resourceType', 'Observation', "
+            "'id', 'o' || i, 'status', 'final', 'subject', "
+            f"jsonb_build_object('reference', 'Patient/p' || (i % {PATIENTS}))) "
+            f"FROM generate_series(0, {ROWS - 1}) AS i"
+        )
+        dialect.execute_query("CREATE INDEX IF NOT EXISTS observation_id_idx ON Observation (id)")
+        dialect.execute_query("ANALYZE Observation")
+    else:
+        dialect.execute_query(
+            "INSERT INTO Observation SELECT 'o' || i, json_object('resourceType', 'Observation', "
+            "'id', 'o' || i, 'status', 'final', 'subject', "
+            f"json_object('reference', 'Patient/p' || (i % {PATIENTS}))) FROM range({ROWS}) t(i)"
+        )
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("make_dialect", [_duckdb_dialect, _postgresql_dialect], ids=["duckdb", "postgresql"])
+def test_single_patient_evaluation(tmp_path, make_dialect) -> None:
+    dialect = make_dialect(tmp_path)
+    catalog = StorageCatalog(compartment_index=CompartmentIndex.from_compartment_definition(
+        resource_types=["Observation"]))
+    for statement in catalog.create_statements(dialect, "Observation"):
+        dialect.execute_query(statement)
+    _generate_observations(dialect)
+
+    started = time.perf_counter()
+    NDJSONLoader(dialect, catalog=catalog).rebuild_compartments(["Observation"])
+    rebuild = time.perf_counter() - started
+
+    executor = FHIRPathExecutor(dialect, "Observation", catalog=catalog)
+    executor.execute("status", compartment="Patient/p7")
+    single = min(
+        executor.execute_with_details("status", compartment="Patient/p7")["timings_ms"]["execute"]
+        for _ in range(5)
+    )
+    population = executor.execute_with_details("status")
+
+    print(
+        f"\n{dialect.name}: compartments of {ROWS:,} resources built in {rebuild:.2f}s; "
+        f"one patient {single:.1f}ms, whole population {population['timings_ms']['execute']:.0f}ms"
+    )
+    assert len(executor.execute("status", compartment="Patient/p7")) == ROWS // PATIENTS
+    assert len(population["results"]) == ROWS
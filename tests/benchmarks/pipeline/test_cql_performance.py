@@ -0,0 +1,156 @@
+"""
+Benchmark for population-level CQL evaluation on DuckDB.
+
+Generates Patients, Encounters and Observations in SQL, compiles a
+measure library with ``CQLCompiler`` and times the single statement that
+evaluates its populations for every patient, then compares a
+``MeasureBatch`` of overlapping measures with evaluating them one by one
+and times re-running an edited library through a ``DefinitionCache``.
+Defaults to 100K patients (with two Encounters and three Observations
+each) and 10 measures; set ``FHIR4DS_CQL_BENCHMARK_PATIENTS`` and
+``FHIR4DS_CQL_BENCHMARK_MEASURES`` to change them.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+import pytest
+
+from fhir4ds.cql import CQLCompiler, DefinitionCache, MeasureBatch
+from fhir4ds.fhirpath.sql import StorageCatalog, TerminologyStore
+
+PATIENTS = int(os.environ.get("FHIR4DS_CQL_BENCHMARK_PATIENTS", "100000"))
+MEASURES = int(os.environ.get("FHIR4DS_CQL_BENCHMARK_MEASURES", "10"))
+
+MEASURE = """
+library Benchmark version '1.0'
+codesystem "LOINC": 'http://loinc.org'
+valueset "Inpatient": 'http://example.org/vs/inpatient'
+code "HbA1c": '4548-4' from "LOINC"
+parameter "Measurement Period" Interval<DateTime>
+  default Interval[@2024-01-01T00:00:00.0, @2025-01-01T00:00:00.0)
+context Patient
+define "Stays": [Encounter: "Inpatient"] E where E.period ends during "Measurement Period"
+define "Initial Population": AgeInYearsAt(start of "Measurement Period") >= 18 and exists "Stays"
+define "Denominator": "Initial Population"
+define "Numerator":
+  exists ("Stays" E with [Observation: "HbA1c"] O
+    such that O.effective 30 days or less after end of E.period and O.value > 9)
+"""
+
+
+def _load(tmp_path):
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import TerminologyLoader
+
+    dialect = DuckDBDialect(database=str(tmp_path / "cql.duckdb"))
+    store = TerminologyStore()
+    terminology = tmp_path / "terminology.ndjson"
+    terminology.write_text(json.dumps({
+        "resourceType": "ValueSet", "url": "http://example.org/vs/inpatient",
+        "expansion": {"contains": [{"system": "http://snomed.info/sct", "code": "183452005"}]}}) + "\n")
+    TerminologyLoader(dialect, store).load(terminology)
+    catalog = StorageCatalog(terminology=store)
+    for resource_type in ("Patient", "Encounter", "Observation"):
+        for statement in catalog.create_statements(dialect, resource_type):
+            dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Patient SELECT 'p' || i, json_object('resourceType', 'Patient', 'id', 'p' || i, "
+        "'birthDate', strftime(DATE '1940-01-01' + CAST(i % 29000 AS INTEGER), '%Y-%m-%d')) "
+        f"FROM range({PATIENTS}) t(i)"
+    )
+    dialect.execute_query(
+        "INSERT INTO Encounter SELECT 'e' || i, json_object('resourceType', 'Encounter', 'id', 'e' || i, "
+        "'type', json_array(json_object('coding', json_array(json_object('system', 'http://snomed.info/sct', "
+        "'code', CASE WHEN i % 3 = 0 THEN '183452005' ELSE '185349003' END)))), "
+        f"'subject', json_object('reference', 'Patient/p' || (i % {PATIENTS})), "
+        "'period', json_object('start', strftime(DATE '2023-06-01' + CAST(i % 500 AS INTEGER), '%Y-%m-%d'), "
+        "'end', strftime(DATE '2023-06-03' + CAST(i % 500 AS INTEGER), '%Y-%m-%d'))) "
+        f"FROM range({PATIENTS * 2}) t(i)"
+    )
+    dialect.execute_query(
+        "INSERT INTO Observation SELECT 'o' || i, json_object('resourceType', 'Observation', 'id', 'o' || i, "
+        "'code', json_object('coding', json_array(json_object('system', 'http://loinc.org', "
+        "'code', CASE WHEN i % 2 = 0 THEN '4548-4' ELSE '2345-7' END))), "
+        f"'subject', json_object('reference', 'Patient/p' || (i % {PATIENTS})), "
+        "'effectiveDateTime', strftime(DATE '2023-06-10' + CAST(i % 500 AS INTEGER), '%Y-%m-%d'), "
+        "'valueQuantity', json_object('value', 5 + (i % 70) / 10.0)) "
+        f"FROM range({PATIENTS * 3}) t(i)"
+    )
+    return dialect, catalog
+
+
+@pytest.mark.slow
+def test_measure_population(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    dialect, catalog = _load(tmp_path)
+
+    started = time.perf_counter()
+    compiled = CQLCompiler(dialect, catalog=catalog).compile(
+        MEASURE, ["Initial Population", "Denominator", "Numerator"])
+    compile_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    counts = dialect.execute_query(
+        'SELECT COUNT(*), COUNT(*) FILTER (WHERE "Initial Population"), COUNT(*) FILTER (WHERE "Numerator") '
+        f"FROM ({compiled.sql}) AS population"
+    )[0]
+    elapsed = time.perf_counter() - started
+
+    print(f"\nDUCKDB: measure over {PATIENTS:,} patients compiled in {compile_time * 1000:.0f}ms, "
+          f"evaluated in {elapsed:.2f}s ({PATIENTS / elapsed:,.0f} patients/s); "
+          f"initial population {counts[1]:,}, numerator {counts[2]:,}")
+    assert counts[0] == PATIENTS
+    assert 0 < counts[2] <= counts[1]
+
+
+@pytest.mark.slow
+def test_measure_batch(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    dialect, catalog = _load(tmp_path)
+    # Measures differing only in their Numerator threshold share everything else
+    libraries = {f"M{k}": MEASURE.replace("O.value > 9", f"O.value > {5 + k % 7}") for k in range(MEASURES)}
+
+    started = time.perf_counter()
+    separate = {}
+    for measure, library in libraries.items():
+        batch = MeasureBatch(dialect, catalog)
+        batch.add(measure, library)
+        separate.update(batch.evaluate(patient_lists=False))
+    separate_time = time.perf_counter() - started
+
+    batch = MeasureBatch(dialect, catalog)
+    for measure, library in libraries.items():
+        batch.add(measure, library)
+    started = time.perf_counter()
+    batched = batch.evaluate(patient_lists=False)
+    batch_time = time.perf_counter() - started
+
+    print(f"\nDUCKDB: {MEASURES} measures over {PATIENTS:,} patients evaluated one by one in "
+          f"{separate_time:.2f}s, as a batch in {batch_time:.2f}s ({separate_time / batch_time:.1f}x)")
+    assert {measure: result.counts for measure, result in batched.items()} == {
+        measure: result.counts for measure, result in separate.items()}
+
+
+@pytest.mark.slow
+def test_definition_cache(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    dialect, catalog = _load(tmp_path)
+    cache = DefinitionCache(dialect, catalog)
+
+    started = time.perf_counter()
+    first = cache.evaluate(MEASURE)
+    first_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    edited = cache.evaluate(MEASURE.replace("O.value > 9", "O.value > 8"))
+    edited_time = time.perf_counter() - started
+
+    print(f"\nDUCKDB: library over {PATIENTS:,} patients run in {first_time:.2f}s, re-run after editing "
+          f"the Numerator in {edited_time:.2f}s ({len(edited.executed)} of {len(first.executed)} "
+          f"definitions executed)")
+    assert edited.executed == ["Numerator"]
+    assert len(edited.rows) == PATIENTS
@@ -0,0 +1,102 @@
+"""
+Benchmark for incremental (upsert/CDC) merges on DuckDB and PostgreSQL.
+
+Loads a base population, then merges a change batch of updated, replayed
+(stale) and new resources with IncrementalLoader and compares it with
+rebuilding the table from the full export. PostgreSQL runs against
+``FHIR4DS_POSTGRESQL_CONN_STRING`` and is skipped without it. Sizes default
+to 200k base resources and 50k changes; set ``FHIR4DS_MERGE_BENCHMARK_ROWS``
+to change the base size (changes are a quarter of it).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+import pytest
+
+from fhir4ds.pipeline.operations import IncrementalLoader, NDJSONLoader
+
+CONN_STRING = os.environ.get("FHIR4DS_POSTGRESQL_CONN_STRING")
+
+BASE_ROWS = int(os.environ.get("FHIR4DS_MERGE_BENCHMARK_ROWS", "200000"))
+CHANGE_ROWS = BASE_ROWS // 4
+
+
+def _patient(index: int, version: int) -> dict:
+    return {
+        "resourceType": "Patient",
+        "id": f"pt{index}",
+        "meta": {"versionId": str(version), "lastUpdated": f"2024-01-{version:02d}T00:00:00Z"},
+        "gender": "female" if index % 2 else "male",
+        "name": [{"family": f"F{index % 100}", "given": ["A", "B"]}],
+    }
+
+
+def _write(path, resources) -> None:
+    with path.open("w") as handle:
+        for resource in resources:
+            handle.write(json.dumps(resource) + "\n")
+
+
+def _change_batch():
+    """60% updates, 20% replays of stored versions, 20% new resources."""
+    for offset in range(CHANGE_ROWS):
+        bucket = offset % 5
+        if bucket < 3:
+            yield _patient(offset, 2)
+        elif bucket == 3:
+            yield _patient(offset, 1)
+        else:
+            yield _patient(BASE_ROWS + offset, 1)
+
+
+def _duckdb_dialect(tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    return DuckDBDialect(database=str(tmp_path / "merge.duckdb"))
+
+
+def _postgresql_dialect(tmp_path):
+    if not CONN_STRING:
+        pytest.skip("FHIR4DS_POSTGRESQL_CONN_STRING is not set")
+    pytest.importorskip("psycopg2")
+    from fhir4ds.dialects.postgresql import PostgreSQLDialect
+
+    dialect = PostgreSQLDialect(CONN_STRING)
+    for table in ("Patient", "fhir4ds_watermarks", "fhir4ds_resource_history"):
+        dialect.execute_query(f"DROP TABLE IF EXISTS {table}")
+    return dialect
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("make_dialect", [_duckdb_dialect, _postgresql_dialect], ids=["duckdb", "postgresql"])
+def test_incremental_merge_throughput(tmp_path, make_dialect) -> None:
+    dialect = make_dialect(tmp_path)
+    base, changes, full = tmp_path / "base.ndjson", tmp_path / "changes.ndjson", tmp_path / "full.ndjson"
+    _write(base, (_patient(index, 1) for index in range(BASE_ROWS)))
+    _write(changes, _change_batch())
+    _write(full, (_patient(index, 1) for index in range(BASE_ROWS + CHANGE_ROWS)))
+
+    loader = IncrementalLoader(dialect)
+    loader.merge(base)
+    if dialect.name == "POSTGRESQL":
+        # Incremental merges into large tables rely on an id index
+        dialect.execute_query("CREATE INDEX IF NOT EXISTS patient_id_idx ON Patient (id)")
+        dialect.execute_query("ANALYZE Patient")
+
+    result = loader.merge(changes)
+    rebuild = NDJSONLoader(dialect).load(full, replace=True)
+
+    print(
+        f"\n{dialect.name}: merged {result.rows} changes into {BASE_ROWS} rows in {result.seconds:.2f}s "
+        f"({result.rows_per_second:,.0f} rows/s: {result.inserted} inserted, {result.updated} updated, "
+        f"{result.stale} stale); full rebuild of {rebuild.rows} rows {rebuild.seconds:.2f}s"
+    )
+    assert result.updated == CHANGE_ROWS * 3 // 5
+    assert result.stale == CHANGE_ROWS // 5
+    assert result.inserted == CHANGE_ROWS // 5
+    assert result.watermarks == {"Patient": "2024-01-02T00:00:00Z"}
@@ -0,0 +1,109 @@
+"""
+Benchmark for querying bulk exports in place from the Parquet store.
+
+Compares ParquetStore (hive-partitioned Parquet read with ``read_parquet``)
+with the in-database JSON tables written by NDJSONLoader on the same
+generated export: conversion/load time, storage size, a ViewDefinition over
+the JSON and a query answered from an extracted key column. The export size
+defaults to 50k Observations; set ``FHIR4DS_PARQUET_BENCHMARK_ROWS``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.pipeline.operations import NDJSONLoader, ParquetStore
+from fhir4ds.sql import SQLGenerator
+
+OBSERVATIONS = int(os.environ.get("FHIR4DS_PARQUET_BENCHMARK_ROWS", "50000"))
+PATIENTS = max(OBSERVATIONS // 20, 1)
+REPEATS = 3
+
+VIEW = {
+    "resource": "Observation",
+    "select": [{"column": [
+        {"name": "id", "path": "id"},
+        {"name": "subject", "path": "subject.reference"},
+        {"name": "value", "path": "valueQuantity.value"},
+    ]}],
+    "where": [{"path": "status = 'final'"}],
+}
+
+
+def _write_export(path) -> None:
+    with path.open("w") as handle:
+        for index in range(PATIENTS):
+            handle.write(json.dumps({
+                "resourceType": "Patient", "id": f"pt{index}",
+                "name": [{"family": f"F{index % 100}", "given": ["A"]}], "gender": "female",
+            }) + "\n")
+        for index in range(OBSERVATIONS):
+            handle.write(json.dumps({
+                "resourceType": "Observation", "id": f"obs{index}",
+                "meta": {"lastUpdated": "2024-01-01T00:00:00Z"},
+                "status": "final" if index % 10 else "amended",
+                "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+                "subject": {"reference": f"Patient/pt{index % PATIENTS}"},
+                "valueQuantity": {"value": index % 200, "unit": "/min"},
+            }) + "\n")
+
+
+def _best_of(dialect, sql):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        rows = dialect.execute_query(sql)
+        timings.append(time.perf_counter() - start)
+    return rows, min(timings)
+
+
+def _directory_size(path) -> int:
+    return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+
+
+@pytest.mark.slow
+def test_parquet_store_versus_json_tables(tmp_path) -> None:
+    export = tmp_path / "export.ndjson"
+    _write_export(export)
+
+    table_db = tmp_path / "tables.duckdb"
+    tables = DuckDBDialect(database=str(table_db))
+    load = NDJSONLoader(tables).load(export)
+    tables.execute_query("CHECKPOINT")
+
+    lake = DuckDBDialect(database=":memory:")
+    store = ParquetStore(tmp_path / "lake", lake)
+    convert = store.convert(export)
+    catalog = store.catalog()
+
+    print(
+        f"\n{load.rows} resources: load into JSON tables {load.seconds:.2f}s "
+        f"({table_db.stat().st_size / 1e6:.1f} MB), convert to Parquet {convert.seconds:.2f}s "
+        f"({_directory_size(tmp_path / 'lake') / 1e6:.1f} MB)"
+    )
+    assert convert.rows_by_type == load.rows_by_type
+
+    table_rows, table_seconds = _best_of(tables, SQLGenerator(tables).generate_sql(VIEW))
+    lake_rows, lake_seconds = _best_of(lake, SQLGenerator(lake, catalog=catalog).generate_sql(VIEW))
+    print(f"ViewDefinition: JSON tables {table_seconds * 1000:.0f} ms, Parquet {lake_seconds * 1000:.0f} ms")
+    assert sorted(lake_rows) == sorted(table_rows)
+
+    table_count, table_key_seconds = _best_of(tables, (
+        "SELECT COUNT(*) FROM Observation "
+        "WHERE json_extract_string(resource, '$.subject.reference') = 'Patient/pt7'"
+    ))
+    lake_count, lake_key_seconds = _best_of(lake, (
+        f"SELECT COUNT(*) FROM {catalog.relation('Observation', lake)} WHERE subject_ref = 'Patient/pt7'"
+    ))
+    print(f"Key lookup: JSON tables {table_key_seconds * 1000:.0f} ms, "
+          f"Parquet key column {lake_key_seconds * 1000:.0f} ms")
+    assert lake_count == table_count
+    # The key column query never reads the JSON column
+    assert lake_key_seconds < table_key_seconds
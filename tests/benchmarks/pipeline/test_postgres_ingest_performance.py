@@ -0,0 +1,76 @@
+"""
+Benchmark for PostgreSQL bulk ingestion.
+
+Compares PostgreSQLIngestor (parallel binary COPY plus partitioned
+ON CONFLICT merges) with row-by-row inserts through
+PostgreSQLDialect.execute_query. Requires a server reachable through
+``FHIR4DS_POSTGRESQL_CONN_STRING``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from fhir4ds.dialects.postgresql import PostgreSQLDialect
+from fhir4ds.pipeline.operations.postgres_ingest import PostgreSQLIngestor
+
+CONN_STRING = os.environ.get("FHIR4DS_POSTGRESQL_CONN_STRING")
+
+POPULATION_SIZE = 500_000
+ROW_BY_ROW_SAMPLE = 2_000
+TARGET_ROWS_PER_SECOND = 50_000
+
+
+def _patient(index: int) -> dict:
+    return {
+        "resourceType": "Patient",
+        "id": f"pt{index}",
+        "meta": {"versionId": "1", "lastUpdated": "2024-01-01T00:00:00Z"},
+        "gender": "female" if index % 2 else "male",
+        "birthDate": "1970-01-01",
+        "name": [{"use": "official", "family": f"F{index % 100}", "given": ["A", "B"]}],
+        "telecom": [{"system": "phone", "value": f"555-{index}"}],
+    }
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not CONN_STRING, reason="FHIR4DS_POSTGRESQL_CONN_STRING is not set")
+def test_parallel_copy_ingestion_throughput(tmp_path) -> None:
+    """Half a million Patients ingest at 50k+ resources per second."""
+    export = tmp_path / "Patient.ndjson"
+    with export.open("w") as handle:
+        for index in range(POPULATION_SIZE):
+            handle.write(json.dumps(_patient(index)) + "\n")
+
+    dialect = PostgreSQLDialect(CONN_STRING, pool_size=8)
+    try:
+        dialect.execute_query("DROP TABLE IF EXISTS Patient")
+        dialect.execute_query("CREATE TABLE Patient (id VARCHAR, resource JSONB)")
+        start = time.perf_counter()
+        for index in range(ROW_BY_ROW_SAMPLE):
+            dialect.execute_query(
+                "INSERT INTO Patient VALUES (%s, %s)", (f"pt{index}", json.dumps(_patient(index)))
+            )
+        row_by_row_rate = ROW_BY_ROW_SAMPLE / (time.perf_counter() - start)
+        dialect.execute_query("DROP TABLE Patient")
+
+        result = PostgreSQLIngestor(dialect, workers=8).ingest(export)
+        count = dialect.execute_query("SELECT COUNT(*) FROM Patient")[0][0]
+    finally:
+        dialect.execute_query("DROP TABLE IF EXISTS Patient")
+        dialect.close_all_connections()
+
+    print(
+        f"{POPULATION_SIZE} resources: ingestor={result.rows_per_second:,.0f}/s "
+        f"row-by-row={row_by_row_rate:,.0f}/s"
+    )
+
+    assert count == POPULATION_SIZE
+    assert result.rows_per_second > row_by_row_rate
+    assert result.rows_per_second > TARGET_ROWS_PER_SECOND
@@ -0,0 +1,71 @@
+"""
+Benchmark for the reference edge index on DuckDB.
+
+Generates Patients and Observations (one ``subject`` reference each) in
+SQL, rebuilds the edge table with ``NDJSONLoader.rebuild_references`` and
+times ``Observation.subject.resolve().gender`` through the index against
+parsing ``subject.reference`` per row. Defaults to 10M edges; set
+``FHIR4DS_REFERENCE_BENCHMARK_EDGES`` to change it (patients are a tenth).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath.parser import FHIRPathExpression, FHIRPathParser
+from fhir4ds.fhirpath.sql import ASTToSQLTranslator, ReferenceIndex, StorageCatalog
+from fhir4ds.pipeline.operations import NDJSONLoader
+
+EDGES = int(os.environ.get("FHIR4DS_REFERENCE_BENCHMARK_EDGES", "10000000"))
+PATIENTS = max(EDGES // 10, 1)
+
+
+@pytest.mark.slow
+def test_reference_index_rebuild_and_resolve(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=str(tmp_path / "references.duckdb"))
+    catalog = StorageCatalog(reference_index=ReferenceIndex.from_search_parameters(
+        resource_types=["Observation"]))
+    for resource_type in ("Patient", "Observation"):
+        for statement in catalog.create_statements(dialect, resource_type):
+            dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Patient SELECT 'p' || i, json_object('resourceType', 'Patient', 'id', 'p' || i, "
+        f"'gender', CASE WHEN i % 2 = 0 THEN 'male' ELSE 'female' END) FROM range({PATIENTS}) t(i)"
+    )
+    dialect.execute_query(
+        "INSERT INTO Observation SELECT 'o' || i, json_object('resourceType', 'Observation', 'id', 'o' || i, "
+        f"'subject', json_object('reference', 'Patient/p' || (i % {PATIENTS}))) FROM range({EDGES}) t(i)"
+    )
+
+    started = time.perf_counter()
+    NDJSONLoader(dialect, catalog=catalog).rebuild_references(["Observation"])
+    rebuild = time.perf_counter() - started
+
+    parsed = FHIRPathParser().enhanced_parser.parse(
+        "Observation.subject.resolve().gender", analyze_complexity=True, find_optimizations=True)
+    sql = ASTToSQLTranslator(dialect, "Observation", catalog=catalog).translate_to_sql(
+        FHIRPathExpression(parsed).get_ast()).rstrip(";")
+    started = time.perf_counter()
+    indexed = dialect.execute_query(f"SELECT COUNT(*) FROM ({sql}) AS resolved WHERE result IS NOT NULL")
+    indexed_seconds = time.perf_counter() - started
+
+    reference = dialect.extract_json_string("o.resource", "$.subject.reference")
+    started = time.perf_counter()
+    parsed_join = dialect.execute_query(
+        f"SELECT COUNT(*) FROM Observation AS o JOIN Patient AS p "
+        f"ON p.id = {dialect.generate_reference_key(reference)}"
+    )
+    parsed_seconds = time.perf_counter() - started
+
+    print(
+        f"\nDUCKDB: rebuilt {EDGES:,} edges in {rebuild:.2f}s ({EDGES / rebuild:,.0f} edges/s); "
+        f"resolve() via index {indexed_seconds:.2f}s, reference string parsing join {parsed_seconds:.2f}s"
+    )
+    assert dialect.execute_query("SELECT COUNT(*) FROM fhir4ds_references")[0][0] == EDGES
+    assert indexed[0][0] == parsed_join[0][0] == EDGES
@@ -0,0 +1,65 @@
+"""
+Benchmark for FHIR search through the search parameter index on DuckDB.
+
+Generates Observations in SQL, builds the token, date and reference indexes
+of their search parameters with ``NDJSONLoader.rebuild_search_index`` and
+times ``Observation?code=...&date=ge...`` compiled by
+``SearchIndex.search_query`` against the same search written over the
+resource JSON. Defaults to 10M resources; set
+``FHIR4DS_SEARCH_BENCHMARK_ROWS`` to change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath.sql import SearchIndex, StorageCatalog
+from fhir4ds.pipeline.operations import NDJSONLoader
+
+ROWS = int(os.environ.get("FHIR4DS_SEARCH_BENCHMARK_ROWS", "10000000"))
+DISTINCT_CODES = 10000
+SYSTEM = "http://loinc.org"
+
+
+@pytest.mark.slow
+def test_code_and_date_search(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=str(tmp_path / "search.duckdb"))
+    catalog = StorageCatalog(search_index=SearchIndex.from_search_parameters(
+        resource_types=["Observation"], parameters=["code", "date", "subject"]))
+    for statement in catalog.create_statements(dialect, "Observation"):
+        dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Observation SELECT 'o' || i, json_object('resourceType', 'Observation', 'id', 'o' || i, "
+        f"'code', json_object('coding', json_array(json_object('system', '{SYSTEM}', "
+        f"'code', 'c' || (i % {DISTINCT_CODES})))), "
+        "'effectiveDateTime', strftime(DATE '2015-01-01' + CAST(i % 3650 AS INTEGER), '%Y-%m-%d'), "
+        "'subject', json_object('reference', 'Patient/p' || (i % 100000))) "
+        f"FROM range({ROWS}) t(i)"
+    )
+
+    started = time.perf_counter()
+    NDJSONLoader(dialect, catalog=catalog).rebuild_search_index(["Observation"])
+    build = time.perf_counter() - started
+
+    def timed_count(sql: str):
+        started = time.perf_counter()
+        count = dialect.execute_query(f"SELECT COUNT(*) FROM ({sql}) AS matched")[0][0]
+        return count, time.perf_counter() - started
+
+    indexed = timed_count(catalog.search_index.search_query(dialect, catalog, f"Observation?code={SYSTEM}|c42&date=ge2020-01-01"))
+    scanned = timed_count(
+        "SELECT id FROM Observation WHERE EXISTS (SELECT 1 FROM json_each(json_extract(resource, "
+        f"'$.code.coding')) AS coding WHERE json_extract_string(coding.value, '$.system') = '{SYSTEM}' "
+        "AND json_extract_string(coding.value, '$.code') = 'c42') "
+        "AND TRY_CAST(json_extract_string(resource, '$.effectiveDateTime') AS DATE) >= DATE '2020-01-01'"
+    )
+
+    print(f"\nDUCKDB: search index over {ROWS:,} resources built in {build:.2f}s; "
+          f"code+date search {indexed[1] * 1000:.0f}ms indexed, {scanned[1] * 1000:.0f}ms over the JSON")
+    assert indexed[0] == scanned[0] > 0
@@ -0,0 +1,76 @@
+"""
+Benchmark for value set membership through the terminology store on DuckDB.
+
+Generates Observations with one ``code.coding`` each in SQL, loads a value
+set of 5,000 codes with ``TerminologyLoader`` and times
+``Observation.code.memberOf(...)`` through the JSON and through the coding
+side table against the same test written as an inlined ``IN`` list.
+Defaults to 10M resources; set ``FHIR4DS_TERMINOLOGY_BENCHMARK_ROWS`` to
+change it.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from fhir4ds.fhirpath.parser import FHIRPathExpression, FHIRPathParser
+from fhir4ds.fhirpath.sql import ASTToSQLTranslator, ExtractionProfile, StorageCatalog, TerminologyStore
+from fhir4ds.pipeline.operations import NDJSONLoader, TerminologyLoader
+
+ROWS = int(os.environ.get("FHIR4DS_TERMINOLOGY_BENCHMARK_ROWS", "10000000"))
+VALUESET_CODES = 5000
+DISTINCT_CODES = 20000
+SYSTEM = "http://loinc.org"
+VALUESET = "http://example.org/fhir/ValueSet/benchmark"
+
+
+@pytest.mark.slow
+def test_member_of_value_set(tmp_path) -> None:
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=str(tmp_path / "terminology.duckdb"))
+    store = TerminologyStore()
+    TerminologyLoader(dialect, store).load_resources([{
+        "resourceType": "ValueSet", "url": VALUESET,
+        "expansion": {"contains": [{"system": SYSTEM, "code": f"c{i}"} for i in range(VALUESET_CODES)]},
+    }])
+    catalog = StorageCatalog(profile=ExtractionProfile.from_search_parameters(resource_types=["Observation"]),
+                             terminology=store)
+    for statement in catalog.create_statements(dialect, "Observation"):
+        dialect.execute_query(statement)
+    dialect.execute_query(
+        "INSERT INTO Observation (id, resource) SELECT 'o' || i, json_object('resourceType', 'Observation', "
+        f"'id', 'o' || i, 'code', json_object('coding', json_array(json_object('system', '{SYSTEM}', "
+        f"'code', 'c' || (i % {DISTINCT_CODES}))))) FROM range({ROWS}) t(i)"
+    )
+    NDJSONLoader(dialect, catalog=catalog).backfill(["Observation"])
+
+    parsed = FHIRPathParser().enhanced_parser.parse(
+        f"Observation.code.memberOf('{VALUESET}')", analyze_complexity=True, find_optimizations=True)
+
+    def timed_count(sql: str):
+        started = time.perf_counter()
+        count = dialect.execute_query(f"SELECT COUNT(*) FROM ({sql}) AS matched WHERE result")[0][0]
+        return count, time.perf_counter() - started
+
+    timings = {}
+    for name, layout in (("json", StorageCatalog(terminology=store)), ("side table", catalog)):
+        sql = ASTToSQLTranslator(dialect, "Observation", catalog=layout).translate_to_sql(
+            FHIRPathExpression(parsed).get_ast()).rstrip(";")
+        timings[name] = timed_count(sql)
+
+    codes = ", ".join(f"'c{i}'" for i in range(VALUESET_CODES))
+    timings["inlined IN list"] = timed_count(
+        f"SELECT id, EXISTS (SELECT 1 FROM json_each(json_extract(resource, '$.code.coding')) AS coding "
+        f"WHERE json_extract_string(coding.value, '$.system') = '{SYSTEM}' "
+        f"AND json_extract_string(coding.value, '$.code') IN ({codes})) AS result FROM Observation"
+    )
+
+    print(f"\nDUCKDB: memberOf() over {ROWS:,} resources, {VALUESET_CODES:,}-code value set: " + ", ".join(
+        f"{name} {seconds:.2f}s" for name, (_, seconds) in timings.items()))
+    expected = ROWS // DISTINCT_CODES * VALUESET_CODES + min(ROWS % DISTINCT_CODES, VALUESET_CODES)
+    assert {count for count, _ in timings.values()} == {expected}
@@ -0,0 +1,115 @@
+"""
+Benchmark for streaming FHIR XML to JSON conversion.
+
+Measures throughput and peak Python memory of XMLToJSONConverter on a
+generated XML Bundle and compares them with ``ET.parse`` plus recursive
+dict building. The Bundle size defaults to 50 MB; set
+``FHIR4DS_XML_BENCHMARK_MB=1000`` for the 1 GB run. The tree-building
+baseline is measured on at most 50 MB, since it holds the whole tree.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from fhir4ds.pipeline.converters import XMLToJSONConverter
+
+BENCHMARK_MB = int(os.environ.get("FHIR4DS_XML_BENCHMARK_MB", "50"))
+BASELINE_MB = min(BENCHMARK_MB, 50)
+
+ENTRY = """<entry>
+  <fullUrl value="urn:uuid:{index}"/>
+  <resource>
+    <Observation>
+      <id value="obs{index}"/>
+      <status value="final"/>
+      <code><coding><system value="http://loinc.org"/><code value="8867-4"/></coding></code>
+      <subject><reference value="Patient/pt{patient}"/></subject>
+      <valueQuantity><value value="{value}.5"/><unit value="/min"/></valueQuantity>
+      <note><text value="{note}"/></note>
+    </Observation>
+  </resource>
+</entry>
+"""
+
+
+def _write_bundle(path, size_mb: int) -> int:
+    count = 0
+    with path.open("w") as handle:
+        handle.write('<Bundle xmlns="http://hl7.org/fhir"><type value="collection"/>\n')
+        while handle.tell() < size_mb * 1e6:
+            handle.write(ENTRY.format(index=count, patient=count % 1000, value=count % 200, note="n" * 200))
+            count += 1
+        handle.write("</Bundle>")
+    return count
+
+
+def _tree_to_dict(element):
+    """The ET.parse approach: build the whole tree, then dicts recursively."""
+    children = list(element)
+    if not children:
+        return element.attrib.get("value")
+    result = {}
+    for child in children:
+        tag = child.tag.rpartition("}")[2]
+        value = _tree_to_dict(child)
+        if tag in result:
+            if not isinstance(result[tag], list):
+                result[tag] = [result[tag]]
+            result[tag].append(value)
+        else:
+            result[tag] = value
+    return result
+
+
+def _measure(fn):
+    """(result, seconds, peak traced bytes); timing runs without tracemalloc."""
+    start = time.perf_counter()
+    count = fn()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, seconds, peak
+
+
+@pytest.mark.slow
+def test_xml_conversion_memory_and_throughput(tmp_path) -> None:
+    """The converter holds one resource at a time at any input size."""
+    # Throughput does not depend on the resource definitions being installed
+    converter = XMLToJSONConverter(strict=False)
+    bundle = tmp_path / "bundle.xml"
+    entries = _write_bundle(bundle, BENCHMARK_MB)
+    size_mb = bundle.stat().st_size / 1e6
+
+    converted, seconds, peak = _measure(lambda: sum(1 for _ in converter.iter_resources(bundle)))
+    print(f"{size_mb:.0f} MB XML Bundle: streaming {size_mb / seconds:.1f} MB/s peak {peak / 1e6:.1f} MB")
+
+    assert converted == entries
+    assert peak < 8e6
+
+    sample = tmp_path / "sample.xml"
+    _write_bundle(sample, BASELINE_MB)
+    sample_mb = sample.stat().st_size / 1e6
+
+    def parse_tree():
+        root = ET.parse(sample).getroot()
+        return sum(1 for entry in root if entry.tag.endswith("entry") and json.dumps(_tree_to_dict(entry)))
+
+    streamed, stream_seconds, stream_peak = _measure(lambda: sum(1 for _ in converter.iter_resources(sample)))
+    parsed, parse_seconds, parse_peak = _measure(parse_tree)
+    print(
+        f"{sample_mb:.0f} MB XML Bundle: streaming {sample_mb / stream_seconds:.1f} MB/s "
+        f"peak {stream_peak / 1e6:.1f} MB; ET.parse {sample_mb / parse_seconds:.1f} MB/s "
+        f"peak {parse_peak / 1e6:.1f} MB"
+    )
+
+    assert streamed == parsed
+    assert stream_peak * 20 < parse_peak
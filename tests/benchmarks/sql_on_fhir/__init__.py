@@ -0,0 +1,6 @@
+"""
+SQL-on-FHIR benchmark tests.
+
+The modules in this package run the official SQL-on-FHIR ViewDefinition
+suite at population scale to track single-statement view compilation.
+"""
@@ -0,0 +1,125 @@
+"""
+Performance benchmarks for single-statement ViewDefinition compilation.
+
+Every view from the official SQL-on-FHIR test suite is compiled once and
+executed against its fixture resources replicated to population scale. The
+checks assert that nested forEach/unionAll views still read the resource
+table in one scan and that the row count scales linearly with the input.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import time
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.sql import SQLGenerator
+
+from tests.compliance.sql_on_fhir.test_sql_on_fhir_compliance import TEST_FILES
+from tests.compliance.sql_on_fhir.viewdefinition_parser import load_test_file
+
+REPLICATION_FACTOR = 1000
+GENERATION_BUDGET_SECONDS = 0.5
+EXECUTION_BUDGET_SECONDS = 5.0
+
+
+def _benchmark_cases():
+    cases = []
+    for file_path in TEST_FILES:
+        test_file = load_test_file(file_path)
+        for test_case in test_file.tests:
+            if test_case.expect_error or test_case.expect is None:
+                continue
+            cases.append(pytest.param(test_case, test_file, id=f"{test_file.title}-{test_case.title}"))
+    return cases
+
+
+def _load_replicated(conn, resources, factor: int) -> None:
+    for resource_type in {r["resourceType"] for r in resources}:
+        conn.execute(f"CREATE OR REPLACE TABLE {resource_type} (resource JSON)")
+        for resource in resources:
+            if resource["resourceType"] == resource_type:
+                conn.execute(f"INSERT INTO {resource_type} VALUES (?)", [json.dumps(resource)])
+        conn.execute(
+            f"INSERT INTO {resource_type} SELECT t.resource FROM {resource_type} t, range({factor - 1})"
+        )
+
+
+@pytest.mark.parametrize("test_case, test_file", _benchmark_cases())
+def test_official_view_population_scale(test_case, test_file) -> None:
+    """Official suite views compile to one scan and scale linearly with population size."""
+    generator = SQLGenerator(dialect="duckdb")
+
+    start = time.perf_counter()
+    try:
+        sql = generator.generate_sql(test_case.view)
+    except Exception as exc:  # pragma: no cover - tracked by the compliance suite
+        pytest.skip(f"View not supported yet: {exc}")
+    generation_seconds = time.perf_counter() - start
+
+    resource = test_case.view["resource"]
+    assert len(re.findall(rf"\bFROM {resource}\b", sql)) == 1
+
+    conn = duckdb.connect(":memory:")
+    try:
+        _load_replicated(conn, test_file.resources, REPLICATION_FACTOR)
+
+        start = time.perf_counter()
+        try:
+            rows = conn.execute(sql).fetchall()
+        except Exception as exc:  # pragma: no cover - tracked by the compliance suite
+            pytest.skip(f"View not executable yet: {exc}")
+        execution_seconds = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    print(
+        f"{test_file.title} / {test_case.title}: generation={generation_seconds * 1000:.2f}ms "
+        f"execution={execution_seconds * 1000:.2f}ms rows={len(rows)}"
+    )
+
+    assert len(rows) == len(test_case.expect) * REPLICATION_FACTOR
+    assert generation_seconds < GENERATION_BUDGET_SECONDS
+    assert execution_seconds < EXECUTION_BUDGET_SECONDS
+
+
+def _wide_view(width: int) -> dict:
+    paths = [
+        "id",
+        "gender",
+        "name.where(use = 'official').family",
+        "telecom.where(system = 'phone').value.first()",
+        "address.city.first()",
+        "identifier.where(system = 'urn:mrn').value",
+    ]
+    return {
+        "resource": "Patient",
+        "select": [{"column": [
+            {"name": f"c{i}", "path": paths[i % len(paths)]} for i in range(width)
+        ]}],
+    }
+
+
+def test_wide_view_generation_and_cache() -> None:
+    """A 150-column view compiles quickly and repeated calls are served from the SQL cache."""
+    generator = SQLGenerator(dialect="duckdb")
+    view = _wide_view(150)
+
+    start = time.perf_counter()
+    sql = generator.generate_sql(view)
+    cold_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(100):
+        assert generator.generate_sql(view) == sql
+    warm_seconds = (time.perf_counter() - start) / 100
+
+    print(f"150-column view: cold={cold_seconds * 1000:.2f}ms cached={warm_seconds * 1000:.3f}ms")
+
+    assert cold_seconds < GENERATION_BUDGET_SECONDS
+    assert warm_seconds < cold_seconds / 10
+    assert generator.get_statistics()["cache_hits"] == 100
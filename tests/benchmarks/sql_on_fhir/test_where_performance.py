@@ -0,0 +1,108 @@
+"""
+Benchmark for ViewDefinition where compilation.
+
+Compares the single-scan predicates produced by SQLGenerator (inline
+conjuncts plus EXISTS semi-joins) with the previous formulation, which
+evaluated every where path in its own scan and filtered the view with
+``id IN (... INTERSECT ...)`` over the resulting id sets.
+"""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.sql import SQLGenerator
+
+POPULATION_SIZE = 1_000_000
+
+WHERE_PATHS = [
+    "active = true",
+    "gender = 'female'",
+    "name.where(use = 'official').exists()",
+    "telecom.where(system = 'phone').exists()",
+    "address.where(city = 'Boston').empty()",
+]
+
+VIEW = {
+    "resource": "Patient",
+    "select": [{"column": [
+        {"name": "id", "path": "id"},
+        {"name": "gender", "path": "gender"},
+        {"name": "family", "path": "name.family.first()"},
+    ]}],
+    "where": [{"path": path} for path in WHERE_PATHS],
+}
+
+
+def _materialise_population(conn, size: int) -> None:
+    conn.execute("CREATE TABLE Patient (resource JSON)")
+    conn.execute(f"""
+        INSERT INTO Patient
+        SELECT json_object(
+            'resourceType', 'Patient',
+            'id', 'pt' || i,
+            'active', i % 3 <> 0,
+            'gender', CASE WHEN i % 2 = 0 THEN 'female' ELSE 'male' END,
+            'name', json_array(json_object('use', CASE WHEN i % 5 = 0 THEN 'usual' ELSE 'official' END,
+                                           'family', 'F' || (i % 100))),
+            'telecom', CASE WHEN i % 7 = 0 THEN json_array()
+                            ELSE json_array(json_object('system', 'phone', 'value', '555-' || i)) END,
+            'address', json_array(json_object('city', CASE WHEN i % 11 = 0 THEN 'Boston' ELSE 'Salem' END))
+        )
+        FROM range({size}) AS t(i)
+    """)
+
+
+def _id_set_formulation(generator: SQLGenerator) -> str:
+    """Rebuild the view with one id-set scan per where path, intersected."""
+    unfiltered = generator.generate_sql({k: v for k, v in VIEW.items() if k != "where"})
+    id_sets = [
+        generator.generate_sql({
+            "resource": "Patient",
+            "select": [{"column": [
+                {"name": "id", "path": "id"},
+                {"name": "result", "path": path, "type": "boolean"},
+            ]}],
+        })
+        for path in WHERE_PATHS
+    ]
+    intersected = "\nINTERSECT\n".join(f"(SELECT id FROM ({sql}) WHERE result = true)" for sql in id_sets)
+    return f"{unfiltered}\nWHERE json_extract_string(resource, '$.id') IN (\n{intersected}\n)"
+
+
+def _timed(conn, sql: str):
+    start = time.perf_counter()
+    rows = conn.execute(f"SELECT count(*) FROM ({sql})").fetchone()[0]
+    return rows, time.perf_counter() - start
+
+
+@pytest.mark.slow
+def test_semi_join_where_vs_id_set_intersection() -> None:
+    """Five where paths on one million resources filter in a single scan."""
+    generator = SQLGenerator(dialect="duckdb")
+    semi_join_sql = generator.generate_sql(VIEW)
+
+    assert semi_join_sql.count("FROM Patient") == 1
+    assert "INTERSECT" not in semi_join_sql
+
+    conn = duckdb.connect(":memory:")
+    try:
+        _materialise_population(conn, POPULATION_SIZE)
+
+        semi_join_rows, semi_join_seconds = _timed(conn, semi_join_sql)
+        id_set_rows, id_set_seconds = _timed(conn, _id_set_formulation(generator))
+    finally:
+        conn.close()
+
+    print(
+        f"{len(WHERE_PATHS)} where paths / {POPULATION_SIZE} resources: "
+        f"semi-join={semi_join_seconds:.2f}s id-set INTERSECT={id_set_seconds:.2f}s "
+        f"speedup={id_set_seconds / semi_join_seconds:.1f}x"
+    )
+
+    assert semi_join_rows == id_set_rows
+    assert semi_join_seconds < id_set_seconds
@@ -3,11 +3,13 @@ import os
 import xml.etree.ElementTree as ET
 from pathlib import Path
 from fhir4ds.cql.evaluator import evaluate
+from fhir4ds.dialects.duckdb import DuckDBDialect
 
 def run_tests():
     print("Running CQL tests...")
     cql_tests_path = Path(__file__).parent.parent / "cql_src" / "tests" / "cql"
     test_files = list(cql_tests_path.glob("*.xml"))
+    dialect = DuckDBDialect(database=":memory:")
 
     passed_count = 0
     failed_count = 0
@@ -35,9 +37,10 @@ def run_tests():
                     print(f"  [SKIPPED] Test: {test_name} (invalid expression)")
                     continue
 
-                # For now, the evaluator is a stub that returns the expected output.
-                # This is to set up the test infrastructure.
-                actual_output = evaluate(expression, expected_output)
+                try:
+                    actual_output = evaluate(expression, dialect)
+                except Exception as error:
+                    actual_output = f"error: {error}"
 
                 if actual_output == expected_output:
                     passed_count += 1
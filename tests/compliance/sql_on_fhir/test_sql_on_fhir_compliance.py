@@ -59,6 +59,12 @@ def test_sql_on_fhir_compliance(request, test_case: ViewDefinitionTest, test_fil
 
     # 2. Translate test_case.view to SQL
     sql_generator = SQLGenerator(dialect=dialect)
+    if test_case.expect_error:
+        # Invalid views must be rejected either at generation or at execution time
+        with pytest.raises(Exception):
+            conn.execute(sql_generator.generate_sql(test_case.view)).fetchall()
+        return
+
     try:
         sql_query = sql_generator.generate_sql(test_case.view)
     except Exception as e:
@@ -11,6 +11,7 @@ class ViewDefinitionTest:
         self.view: Dict[str, Any] = test_data["view"]
         self.expect: List[Dict[str, Any]] = test_data.get("expect")
         self.expect_columns: List[str] | None = test_data.get("expectColumns")
+        self.expect_error: bool = bool(test_data.get("expectError", False))
 
 
 class ViewDefinitionTestFile:
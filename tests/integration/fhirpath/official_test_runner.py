@@ -150,6 +150,16 @@ class EnhancedOfficialTestRunner:
 
         return report
 
+    def load_test_context(self, input_file: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Resource a test input file is evaluated on, None when the file is missing"""
+        return self._load_test_context(input_file)
+
+    def validate_result(self, actual_result: Dict[str, Any], test_data: Dict[str, Any]) -> bool:
+        """Check a result in the runner's format (is_valid, result, error_type) against an official test"""
+        return self._validate_test_result(actual_result, test_data.get("outputs", []),
+                                          invalid_flag=test_data.get("invalid"),
+                                          predicate_flag=test_data.get("predicate"))
+
     def _execute_single_test(self, test_data: Dict[str, Any]) -> TestResult:
         """Execute a single test case with enhanced metadata collection"""
         start_time = time.time()
@@ -0,0 +1,71 @@
+"""
+Parity of the closure evaluator with the SQL path on the official FHIRPath suite.
+
+Every official test the SQL path passes must also pass when evaluated with
+:class:`ClosureEvaluator`, unless closures do not compile the expression (the
+router then falls back to SQL). Both paths are checked with the runner's own
+result validation.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+from fhir4ds.fhirpath.closures import ClosureEvaluator
+from fhir4ds.fhirpath.exceptions import (
+    FHIRPathEvaluationError,
+    FHIRPathParseError,
+    FHIRPathTranslationError,
+    FHIRPathValidationError,
+)
+from tests.compliance.fhirpath.test_parser import parse_fhirpath_tests
+from tests.integration.fhirpath.official_test_runner import EnhancedOfficialTestRunner
+
+
+def _evaluate_with_closures(evaluator: ClosureEvaluator, expression: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """Closure result in the runner's result format; translation errors propagate."""
+    try:
+        return {"is_valid": True, "result": evaluator.evaluate(expression, context), "error_type": None}
+    except FHIRPathValidationError:
+        error_type = "semantic"
+    except FHIRPathParseError:
+        error_type = "parse"
+    except FHIRPathEvaluationError:
+        error_type = "execution"
+    return {"is_valid": False, "result": None, "error_type": error_type}
+
+
+@pytest.fixture(scope="module")
+def official_runner() -> EnhancedOfficialTestRunner:
+    """Runner that has run the official suite on SQL (DuckDB)."""
+    pytest.importorskip("duckdb")
+    runner = EnhancedOfficialTestRunner()
+    runner.run_official_tests()
+    return runner
+
+
+@pytest.mark.slow
+def test_closures_pass_every_official_test_sql_passes(official_runner: EnhancedOfficialTestRunner) -> None:
+    sql_passed = {(result.name, result.expression) for result in official_runner.test_results if result.passed}
+    evaluator = ClosureEvaluator()
+    checked = 0
+    regressions = []
+
+    for test in parse_fhirpath_tests():
+        if (test["name"], test["expression"]) not in sql_passed:
+            continue
+        context = official_runner.load_test_context(test.get("inputfile"))
+        if context is None:
+            continue
+        try:
+            result = _evaluate_with_closures(evaluator, test["expression"], context)
+        except FHIRPathTranslationError:
+            continue
+        checked += 1
+        if not official_runner.validate_result(result, test):
+            regressions.append(f"{test['name']}: {test['expression']} -> {result}")
+
+    assert checked, "closures compiled none of the official tests SQL passes"
+    assert not regressions, "\n".join(regressions)
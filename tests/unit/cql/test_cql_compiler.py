@@ -0,0 +1,349 @@
+"""
+Unit tests for the CQL library compiler and the expression evaluator.
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.cql import CQLCompiler, DefinitionCache, MeasureBatch, parse_library
+from fhir4ds.cql.evaluator import evaluate
+from fhir4ds.fhirpath.sql import ExtractionProfile, StorageCatalog, TerminologyStore
+
+MEASURE = """
+library Diabetes version '1.0'
+using FHIR version '4.0.1'
+include FHIRHelpers version '4.0.1' called FHIRHelpers
+codesystem "LOINC": 'http://loinc.org'
+valueset "Inpatient": 'http://example.org/vs/inpatient'
+valueset "HbA1c Tests": 'http://example.org/vs/hba1c'
+code "HbA1c": '4548-4' from "LOINC"
+parameter "Measurement Period" Interval<DateTime>
+  default Interval[@2024-01-01T00:00:00.0, @2025-01-01T00:00:00.0)
+context Patient
+define "Inpatient Stays":
+  [Encounter: "Inpatient"] E
+    where E.status = 'finished' and E.period ends during "Measurement Period"
+define "Age": AgeInYearsAt(start of "Measurement Period")
+define "Initial Population": "Age" >= 18 and exists "Inpatient Stays"
+define "HbA1c In Period": [Observation: "HbA1c"] O where O.effective during "Measurement Period"
+define "Numerator": exists ("HbA1c In Period" O where O.value > 9)
+define "Tested After Discharge":
+  exists ("Inpatient Stays" E
+    with [Observation: "HbA1c Tests"] O such that O.effective 3 days or less after end of E.period)
+define "Stay Count": Count("Inpatient Stays")
+define "Female": Patient.gender = 'female'
+"""
+
+RESOURCES = [
+    {"resourceType": "Patient", "id": "p1", "birthDate": "1960-05-01", "gender": "female"},
+    {"resourceType": "Patient", "id": "p2", "birthDate": "2010-01-01", "gender": "male"},
+    {"resourceType": "Patient", "id": "p3", "birthDate": "1950-07-15", "gender": "male"},
+    {"resourceType": "Encounter", "id": "e1", "status": "finished", "subject": {"reference": "Patient/p1"},
+     "type": [{"coding": [{"system": "http://snomed.info/sct", "code": "183452005"}]}],
+     "period": {"start": "2024-03-01T10:00:00", "end": "2024-03-04T12:00:00"}},
+    {"resourceType": "Encounter", "id": "e2", "status": "finished", "subject": {"reference": "Patient/p2"},
+     "type": [{"coding": [{"system": "http://snomed.info/sct", "code": "183452005"}]}],
+     "period": {"start": "2024-03-01", "end": "2024-03-02"}},
+    {"resourceType": "Encounter", "id": "e3", "status": "finished", "subject": {"reference": "Patient/p3"},
+     "type": [{"coding": [{"system": "http://snomed.info/sct", "code": "183452005"}]}],
+     "period": {"start": "2023-06-01", "end": "2024-06-02"}},
+    {"resourceType": "Encounter", "id": "e4", "status": "cancelled", "subject": {"reference": "Patient/p3"},
+     "type": [{"coding": [{"system": "http://snomed.info/sct", "code": "183452005"}]}],
+     "period": {"start": "2024-07-01", "end": "2024-07-02"}},
+    {"resourceType": "Observation", "id": "o1", "status": "final", "subject": {"reference": "Patient/p1"},
+     "code": {"coding": [{"system": "http://loinc.org", "code": "4548-4"}]},
+     "effectiveDateTime": "2024-03-05", "valueQuantity": {"value": 9.5, "unit": "%"}},
+    {"resourceType": "Observation", "id": "o2", "status": "final", "subject": {"reference": "Patient/p3"},
+     "code": {"coding": [{"system": "http://loinc.org", "code": "4548-4"}]},
+     "effectivePeriod": {"start": "2024-06-10", "end": "2024-06-10"}, "valueQuantity": {"value": 6.1}},
+]
+
+VALUE_SETS = [
+    {"resourceType": "ValueSet", "url": "http://example.org/vs/inpatient",
+     "expansion": {"contains": [{"system": "http://snomed.info/sct", "code": "183452005"}]}},
+    {"resourceType": "ValueSet", "url": "http://example.org/vs/hba1c",
+     "expansion": {"contains": [{"system": "http://loinc.org", "code": "4548-4"}]}},
+]
+
+
+@pytest.fixture(params=["per_type", "side_table"])
+def loaded(request, tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader, TerminologyLoader
+
+    dialect = DuckDBDialect(database=":memory:")
+    store = TerminologyStore()
+    terminology = tmp_path / "terminology.ndjson"
+    terminology.write_text("".join(json.dumps(resource) + "\n" for resource in VALUE_SETS))
+    TerminologyLoader(dialect, store).load(terminology)
+    if request.param == "side_table":
+        catalog = StorageCatalog.partitioned(
+            profile=ExtractionProfile.from_search_parameters(resource_types=["Encounter", "Observation"]),
+            terminology=store)
+    else:
+        catalog = StorageCatalog(terminology=store)
+    source = tmp_path / "export.ndjson"
+    source.write_text("".join(json.dumps(resource) + "\n" for resource in RESOURCES))
+    NDJSONLoader(dialect, catalog=catalog).load(source)
+    return dialect, catalog
+
+
+class TestCQLCompilerDuckDB:
+    """End to end: a measure library evaluated for all patients in one statement."""
+
+    def test_population_is_one_statement(self, loaded):
+        dialect, catalog = loaded
+
+        compiled = CQLCompiler(dialect, catalog=catalog).compile(MEASURE, ["Initial Population", "Numerator"])
+
+        assert compiled.sql.startswith("WITH")
+        assert [cte.name for cte in compiled.ctes][-1] == "cql_result"
+        assert "cql_initial_population" in compiled.sql
+        assert sorted(dialect.execute_query(compiled.sql)) == [
+            ("p1", True, True), ("p2", False, False), ("p3", True, False)]
+
+    def test_definitions(self, loaded):
+        dialect, catalog = loaded
+
+        results = {row["patient_id"]: row for row in CQLCompiler(dialect, catalog=catalog).evaluate(MEASURE)}
+
+        assert [results[patient]["Age"] for patient in ("p1", "p2", "p3")] == [63, 14, 73]
+        assert json.loads(results["p3"]["Inpatient Stays"]) == ["e3"]
+        assert results["p2"]["HbA1c In Period"] is None
+        assert [results[patient]["Stay Count"] for patient in ("p1", "p2", "p3")] == [1, 1, 1]
+        assert [results[patient]["Tested After Discharge"] for patient in ("p1", "p2", "p3")] == [
+            True, False, False]
+        assert json.loads(results["p3"]["HbA1c In Period"]) == ["o2"]
+        assert results["p1"]["Female"] is True
+
+    def test_parameters_override_defaults(self, loaded):
+        dialect, catalog = loaded
+        compiler = CQLCompiler(dialect, catalog=catalog, parameters={
+            "Measurement Period": "Interval[@2023-01-01, @2024-01-01)"})
+
+        results = {row["patient_id"]: row for row in compiler.evaluate(MEASURE, ["Initial Population"])}
+
+        assert results == {"p1": {"patient_id": "p1", "Initial Population": False},
+                           "p2": {"patient_id": "p2", "Initial Population": False},
+                           "p3": {"patient_id": "p3", "Initial Population": False}}
+
+
+class TestMeasureBatch:
+    """Several measures in one statement, sharing their common retrieves and definitions."""
+
+    SECOND = MEASURE.replace("library Diabetes", "library Readmission").replace(
+        'define "Numerator": exists ("HbA1c In Period" O where O.value > 9)',
+        'define "Numerator": "Stay Count" > 1')
+
+    def test_shared_work_is_compiled_once(self, loaded):
+        dialect, catalog = loaded
+        batch = MeasureBatch(dialect, catalog)
+        batch.add("Diabetes", MEASURE)
+        batch.add("Readmission", self.SECOND)
+
+        compiled = batch.compile()
+        single = CQLCompiler(dialect, catalog=catalog).compile(MEASURE, ["Initial Population", "Numerator"])
+
+        # Only the second measure's Numerator (and the Count it needs) is new
+        assert len(compiled.ctes) == len(single.ctes) + 2
+        assert compiled.expressions == ["Diabetes.Initial Population", "Diabetes.Numerator",
+                                        "Readmission.Initial Population", "Readmission.Numerator"]
+        assert compiled.measures == ["Diabetes", "Diabetes", "Readmission", "Readmission"]
+
+    @pytest.mark.parametrize("patient_lists", [True, False])
+    def test_populations(self, loaded, patient_lists):
+        dialect, catalog = loaded
+        batch = MeasureBatch(dialect, catalog)
+        batch.add("Diabetes", MEASURE)
+        batch.add("Readmission", self.SECOND, populations=["Initial Population", "Numerator"])
+
+        results = batch.evaluate(patient_lists=patient_lists)
+
+        assert results["Diabetes"].counts == {"Initial Population": 2, "Numerator": 1}
+        assert results["Readmission"].counts == {"Initial Population": 2, "Numerator": 0}
+        if patient_lists:
+            assert results["Diabetes"].patients["Initial Population"] == ["p1", "p3"]
+            assert results["Diabetes"].patients["Numerator"] == ["p1"]
+
+    @pytest.mark.parametrize("patient_lists", [True, False])
+    def test_proportion_scoring(self, loaded, patient_lists):
+        dialect, catalog = loaded
+        batch = MeasureBatch(dialect, catalog)
+        batch.add("Adults", """
+context Patient
+define "Initial Population": AgeInYearsAt(@2024-01-01) >= 18
+define "Denominator": "Initial Population"
+define "Denominator Exclusion": Patient.gender = 'female'
+define "Denominator Exception": true
+define "Numerator": true
+""")
+
+        result = batch.evaluate(patient_lists=patient_lists)["Adults"]
+
+        # p2 meets the Numerator criteria but is not in the Initial Population,
+        # p1 is excluded and p3, in the Numerator, is no exception
+        assert result.counts == {"Initial Population": 2, "Denominator": 2, "Denominator Exclusion": 1,
+                                 "Denominator Exception": 0, "Numerator": 1}
+        if patient_lists:
+            assert result.patients["Numerator"] == ["p3"]
+            assert result.patients["Denominator Exclusion"] == ["p1"]
+
+    def test_measures_need_populations(self):
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+
+        batch = MeasureBatch(DuckDBDialect(database=":memory:"))
+        with pytest.raises(ValueError, match="none of the populations"):
+            batch.add("Empty", 'context Patient\ndefine "X": true')
+        with pytest.raises(ValueError, match="no measures"):
+            batch.compile()
+
+
+class TestDefinitionCache:
+    """Definition results cached in tables and reused while the definition is unchanged."""
+
+    def test_only_edited_definitions_and_their_dependents_rerun(self, loaded):
+        dialect, catalog = loaded
+        cache = DefinitionCache(dialect, catalog)
+        expected = sorted(CQLCompiler(dialect, catalog=catalog).evaluate(MEASURE), key=lambda row: row["patient_id"])
+
+        first = cache.evaluate(MEASURE)
+        second = cache.evaluate(MEASURE)
+        edited_cql = MEASURE.replace("O.value > 9", "O.value > 6")
+        edited = cache.evaluate(edited_cql)
+        upstream = cache.evaluate(edited_cql.replace("E.status = 'finished'", "E.status != 'cancelled'"))
+
+        assert sorted(first.rows, key=lambda row: row["patient_id"]) == expected
+        assert sorted(second.rows, key=lambda row: row["patient_id"]) == expected
+        assert second.executed == [] and len(second.reused) == len(first.executed)
+        assert edited.executed == ["Numerator"]
+        assert {row["patient_id"]: row["Numerator"] for row in edited.rows} == {"p1": True, "p2": False, "p3": True}
+        assert sorted(upstream.executed) == [
+            "Initial Population", "Inpatient Stays", "Stay Count", "Tested After Discharge"]
+
+    def test_superseded_versions_are_dropped(self, loaded):
+        dialect, catalog = loaded
+        cache = DefinitionCache(dialect, catalog)
+        cache.evaluate(MEASURE)
+        tables = {table for table, in dialect.execute_query(f"SELECT table_name FROM {cache.state_table}")}
+
+        cache.evaluate(MEASURE.replace("O.value > 9", "O.value > 6"))
+        cache.evaluate(MEASURE.replace("O.value > 9", "O.value > 7"))
+
+        edited = {table for table, in dialect.execute_query(f"SELECT table_name FROM {cache.state_table}")}
+        assert len(edited) == len(tables) and len(edited - tables) == 1
+        dropped = (tables - edited).pop()
+        with pytest.raises(Exception):
+            dialect.execute_query(f"SELECT COUNT(*) FROM {dropped}")
+
+    def test_libraries_sharing_definition_names_keep_their_tables(self, loaded):
+        dialect, catalog = loaded
+        cache = DefinitionCache(dialect, catalog)
+        other = MEASURE.replace("library Diabetes", "library Screening").replace("O.value > 9", "O.value > 6")
+
+        cache.evaluate(MEASURE)
+        cache.evaluate(other)
+
+        assert cache.evaluate(MEASURE).executed == []
+        assert cache.evaluate(other).executed == []
+
+    def test_time_dependent_definitions_are_not_cached(self, loaded):
+        dialect, catalog = loaded
+        cache = DefinitionCache(dialect, catalog)
+        library = MEASURE + 'define "Adult Today": AgeInYears() >= 18\ndefine "Checked": "Adult Today" and true\n'
+
+        cache.evaluate(library)
+        run = cache.evaluate(library)
+
+        assert sorted(run.executed) == ["Adult Today", "Checked"]
+        assert {row["patient_id"]: row["Adult Today"] for row in run.rows} == {"p1": True, "p2": False, "p3": True}
+
+    def test_dependency_graph_and_clear(self, loaded):
+        dialect, catalog = loaded
+        cache = DefinitionCache(dialect, catalog)
+
+        run = cache.evaluate(MEASURE, ["Initial Population"])
+
+        assert run.compiled.dependencies == {
+            "Age": [], "Inpatient Stays": [], "Initial Population": ["Age", "Inpatient Stays"]}
+        assert cache.clear() == 3
+        assert cache.evaluate(MEASURE, ["Initial Population"]).executed == [
+            "Age", "Inpatient Stays", "Initial Population"]
+
+
+def test_definition_ctes_follow_their_dependencies():
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    library = parse_library("""
+        valueset "VS": 'http://example.org/vs'
+        context Patient
+        define "B": exists "A"
+        define "A": [Condition: "VS"]
+    """)
+    compiled = CQLCompiler(DuckDBDialect(database=":memory:"),
+                           catalog=StorageCatalog(terminology=TerminologyStore()), prefix="m1").compile(library)
+
+    names = [cte.name for cte in compiled.ctes]
+    assert names.index("m1_retrieve_condition") < names.index("m1_a") < names.index("m1_b")
+    assert compiled.expressions == ["B", "A"]
+
+
+@pytest.mark.parametrize("cql, message", [
+    ('context Patient\ndefine "A": "B"\ndefine "B": "A"', "references itself"),
+    ('context Patient\ndefine "A": "Missing"', "Unknown identifier"),
+    ('valueset "VS": \'u\'\ncontext Patient\ndefine "A": exists [Condition: "VS"]', "TerminologyStore"),
+    ('code "C": \'x\' from "Nowhere"\ncontext Patient\ndefine "A": exists [Basic: "C"]', "Unknown code system"),
+    ('context Patient\ndefine "A": [Encounter] E return E.period', "returning their source alias"),
+])
+def test_unsupported_libraries_are_rejected(cql, message):
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    with pytest.raises(ValueError, match=message):
+        CQLCompiler(DuckDBDialect(database=":memory:")).compile(cql)
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("1 + 2 * 3", "7"),
+    ("7 div 2", "3"),
+    ("'a' & null", "'a'"),
+    ("null is null", "true"),
+    ("@2024-01-31 + 1 month", "@2024-02-29"),
+    ("@2024-01-31T10:30:00 + 1 month", "@2024-02-29T10:30:00.000"),
+    ("date from @2024-03-05T10:30:00", "@2024-03-05"),
+    ("Interval[1, 5) contains 5", "false"),
+    ("@2024-03-01 during Interval[@2024-01-01, @2024-03-01)", "false"),
+    ("duration in years between @2000-03-01 and @2024-02-29", "23"),
+    ("difference in years between @2000-12-31 and @2001-01-01", "1"),
+    ("@2024-01-10 3 days or less after @2024-01-08", "true"),
+    ("@2024-01-10 more than 3 days after @2024-01-08", "false"),
+    ("if 1 > 2 then 'x' else 'y'", "'y'"),
+    ("Interval[@2024-01-01, @2024-02-01)", "Interval[@2024-01-01, @2024-01-31]"),
+    ("Interval[@2024-01-01T00:00:00, @2024-02-01T00:00:00)",
+     "Interval[@2024-01-01T00:00:00.000, @2024-01-31T23:59:59.999]"),
+    ("@2024-01-01 < @2024-01-01T10:00:00", "true"),
+    ("5 'mg' = 5 'mg'", "true"),
+    ("1 'd' = 1 day", "true"),
+    ("6 'mg' / 2 'mg'", "3.0"),
+    ("10 'mg' + 5 'mg'", "15 'mg'"),
+    ("-(2 'cm')", "-2 'cm'"),
+    ("Sum({1, 2, 3})", "6"),
+    ("Sum({1 'mg', 2.5 'mg'})", "3.5 'mg'"),
+    ("Min({3, null, 2})", "2"),
+    ("Max({@2024-01-01, @2024-03-01})", "@2024-03-01"),
+    ("Avg({1, 2})", "1.5"),
+    ("Sum({})", "null"),
+])
+def test_evaluate(expression, expected):
+    pytest.importorskip("duckdb")
+
+    assert evaluate(expression) == expected
+
+
+@pytest.mark.parametrize("expression", ["5 'mg' = 5 'g'", "5 'mg' + 1 'g'", "2 'mg' * 3 'mg'",
+                                        "Sum({1 'mg', 2 'g'})"])
+def test_quantities_in_different_units_are_rejected(expression):
+    pytest.importorskip("duckdb")
+
+    with pytest.raises(ValueError, match="unit conversion"):
+        evaluate(expression)
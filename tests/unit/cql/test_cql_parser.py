@@ -0,0 +1,125 @@
+"""
+Unit tests for the CQL parser and the ELM loader.
+"""
+
+from decimal import Decimal
+
+import pytest
+
+from fhir4ds.cql import CQLParseError, library_from_elm, parse_expression, parse_library
+from fhir4ds.cql.nodes import (
+    Binary, Call, DateDifference, IntervalSelector, Literal, Property, QuantityLiteral, Query,
+    Ref, Retrieve, Timing, Unary,
+)
+
+LIBRARY = """
+library Example version '1.0'
+using FHIR version '4.0.1'
+include FHIRHelpers version '4.0.1' called FHIRHelpers
+codesystem "LOINC": 'http://loinc.org'
+valueset "Inpatient": 'http://example.org/vs/inpatient'
+code "HbA1c": '4548-4' from "LOINC" display 'HbA1c'
+parameter "Measurement Period" Interval<DateTime>
+  default Interval[@2024-01-01T00:00:00.0, @2025-01-01T00:00:00.0)
+context Patient
+// Encounters ending in the period
+define "Stays":
+  [Encounter: "Inpatient"] E
+    with [Observation: code ~ "HbA1c"] O such that O.effective 3 days or less after end of E.period
+    where E.period ends during "Measurement Period"
+define "In Population": exists "Stays" and AgeInYearsAt(start of "Measurement Period") >= 18
+"""
+
+
+class TestParser:
+
+    def test_library_declarations(self):
+        library = parse_library(LIBRARY)
+
+        assert (library.name, library.version) == ("Example", "1.0")
+        assert library.includes == {"FHIRHelpers": ("FHIRHelpers", "4.0.1")}
+        assert library.valuesets == {"Inpatient": "http://example.org/vs/inpatient"}
+        assert library.codes["HbA1c"].system == "LOINC"
+        assert library.parameters["Measurement Period"].default == IntervalSelector(
+            Literal("2024-01-01T00:00:00.0", "DateTime"), Literal("2025-01-01T00:00:00.0", "DateTime"),
+            True, False)
+        assert list(library.defines) == ["Stays", "In Population"]
+
+    def test_queries_and_timing_phrases(self):
+        stays = parse_library(LIBRARY).defines["Stays"].expression
+
+        assert isinstance(stays, Query) and stays.alias == "E"
+        assert stays.source == Retrieve("Encounter", None, Ref("Inpatient"))
+        relationship = stays.relationships[0]
+        assert relationship.source == Retrieve("Observation", "code", Ref("HbA1c"), "~")
+        assert relationship.such_that == Timing(
+            "after", Property(Ref("O"), "effective"), Unary("end", Property(Ref("E"), "period")),
+            offset=QuantityLiteral("3", "day"), offset_bound="less")
+        assert stays.where == Timing("includedIn", Property(Ref("E"), "period"), Ref("Measurement Period"),
+                                     left_boundary="end")
+
+    @pytest.mark.parametrize("text, expected", [
+        ("1 + 2 * 3", Binary("+", Literal(1, "Integer"), Binary("*", Literal(2, "Integer"), Literal(3, "Integer")))),
+        ("1.5", Literal(Decimal("1.5"), "Decimal")),
+        ("not exists X", Unary("not", Unary("exists", Ref("X")))),
+        ("A within 1 year of B", Timing("within", Ref("A"), Ref("B"), offset=QuantityLiteral("1", "year"))),
+        ("A starts more than 2 days before B",
+         Timing("before", Ref("A"), Ref("B"), left_boundary="start", offset=QuantityLiteral("2", "day"),
+                offset_bound="more than")),
+        ("A same day or after B", Timing("sameOrAfter", Ref("A"), Ref("B"), precision="day")),
+        ("difference in days between A and B", DateDifference("difference", "day", Ref("A"), Ref("B"))),
+        ("FHIRHelpers.ToDateTime(X)", Call("ToDateTime", [Ref("X")], "FHIRHelpers")),
+        ("X is not null", Unary("is not null", Ref("X"))),
+    ])
+    def test_expressions(self, text, expected):
+        assert parse_expression(text) == expected
+
+    @pytest.mark.parametrize("text", [
+        "define function F(x Integer): x",
+        "define X: [Encounter] E let y: 1 return y",
+        "define X: Tuple { a: 1 }",
+        "define X: (",
+    ])
+    def test_unsupported_cql_is_rejected(self, text):
+        with pytest.raises(CQLParseError):
+            parse_library(text)
+
+
+def test_library_from_elm():
+    elm = {"library": {
+        "identifier": {"id": "Example", "version": "1.0"},
+        "valueSets": {"def": [{"name": "Inpatient", "id": "http://example.org/vs/inpatient"}]},
+        "statements": {"def": [
+            {"name": "Patient", "context": "Patient",
+             "expression": {"type": "SingletonFrom", "operand": {"type": "Retrieve",
+                                                                  "dataType": "{http://hl7.org/fhir}Patient"}}},
+            {"name": "Stays", "context": "Patient", "expression": {
+                "type": "Query",
+                "source": [{"alias": "E", "expression": {
+                    "type": "Retrieve", "dataType": "{http://hl7.org/fhir}Encounter", "codeProperty": "type",
+                    "codes": {"type": "ValueSetRef", "name": "Inpatient"}}}],
+                "where": {"type": "Equal", "operand": [
+                    {"type": "Property", "path": "status", "scope": "E"},
+                    {"type": "Literal", "valueType": "{urn:hl7-org:elm-types:r1}String", "value": "finished"}]}}},
+            {"name": "Adult", "context": "Patient", "expression": {
+                "type": "GreaterOrEqual", "operand": [
+                    {"type": "CalculateAgeAt", "precision": "Year", "operand": [
+                        {"type": "Property", "path": "birthDate",
+                         "source": {"type": "ExpressionRef", "name": "Patient"}},
+                        {"type": "DateTime", "year": {"type": "Literal", "valueType": "{urn:hl7-org:elm-types:r1}Integer",
+                                                      "value": "2024"}}]},
+                    {"type": "Literal", "valueType": "{urn:hl7-org:elm-types:r1}Integer", "value": "18"}]}},
+        ]},
+    }}
+
+    library = library_from_elm(elm)
+
+    assert list(library.defines) == ["Stays", "Adult"]
+    stays = library.defines["Stays"].expression
+    assert stays.source == Retrieve("Encounter", "type", Ref("Inpatient"))
+    assert stays.where == Binary("=", Property(Ref("E"), "status"), Literal("finished", "String"))
+    assert library.defines["Adult"].expression.left == Call(
+        "CalculateAgeInYearsAt", [Property(Ref("Patient"), "birthDate"), Literal("2024", "DateTime")])
+    with pytest.raises(ValueError, match="Unsupported ELM"):
+        library_from_elm({"library": {"statements": {"def": [
+            {"name": "X", "expression": {"type": "Message"}}]}}})
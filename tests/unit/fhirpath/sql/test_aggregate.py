@@ -0,0 +1,170 @@
+"""
+Unit tests for FHIRPathExecutor.aggregate(): population aggregates grouped in SQL.
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.exceptions import FHIRPathExecutionError
+from fhir4ds.fhirpath.sql import CompartmentIndex, FHIRPathExecutor, StorageCatalog
+
+RESOURCES = [
+    {"resourceType": "Patient", "id": "p1", "gender": "female", "birthDate": "1950-06-01"},
+    {"resourceType": "Patient", "id": "p2", "gender": "male", "birthDate": "1984-12-31"},
+    {"resourceType": "Patient", "id": "p3", "gender": "male", "birthDate": "1990-01-01"},
+    {"resourceType": "Patient", "id": "p4", "birthDate": "1955-02-03"},
+    {"resourceType": "Observation", "id": "o1", "status": "final", "subject": {"reference": "Patient/p1"},
+     "effectiveDateTime": "2024-03-05", "code": {"coding": [{"code": "4548-4"}]}, "valueQuantity": {"value": 9.5}},
+    {"resourceType": "Observation", "id": "o2", "status": "final", "subject": {"reference": "Patient/p2"},
+     "effectiveDateTime": "2024-03-20", "code": {"coding": [{"code": "4548-4"}]}, "valueQuantity": {"value": 6.5}},
+    {"resourceType": "Observation", "id": "o3", "status": "amended", "subject": {"reference": "Patient/p2"},
+     "effectiveDateTime": "2024-04-01", "code": {"coding": [{"code": "4548-4"}, {"code": "2345-7"}]},
+     "valueQuantity": {"value": 120}},
+]
+
+CODE = {"name": "code", "path": "code.coding.code", "collection": True}
+AGE = {"name": "age", "path": "birthDate", "bucket": "age", "as_of": "2024-12-30"}
+VALUE = "value.ofType(Quantity).value"
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    source = tmp_path / "export.ndjson"
+    source.write_text("".join(json.dumps(resource) + "\n" for resource in RESOURCES))
+    catalog = StorageCatalog(compartment_index=CompartmentIndex.from_compartment_definition(
+        resource_types=["Patient", "Observation"]))
+    catalog.dialect = DuckDBDialect(database=":memory:")
+    NDJSONLoader(catalog.dialect, catalog=catalog).load(source)
+    return catalog
+
+
+def executor(catalog, resource_type):
+    return FHIRPathExecutor(catalog.dialect, resource_type, catalog=catalog)
+
+
+class TestAggregate:
+
+    def test_group_by_path(self, catalog):
+        assert executor(catalog, "Patient").aggregate({"patients": "count"}, group_by=["gender"]) == [
+            {"gender": "female", "patients": 1},
+            {"gender": "male", "patients": 2},
+            {"gender": None, "patients": 1},
+        ]
+
+    def test_age_bands_with_rollup(self, catalog):
+        rows = executor(catalog, "Patient").aggregate({"n": "count"}, group_by=["gender", AGE], rollup=True)
+
+        assert rows == [
+            {"gender": "female", "age": 70, "n": 1, "grouping": 0},
+            {"gender": "female", "age": None, "n": 1, "grouping": 1},
+            {"gender": "male", "age": 30, "n": 2, "grouping": 0},
+            {"gender": "male", "age": None, "n": 2, "grouping": 1},
+            {"gender": None, "age": 60, "n": 1, "grouping": 0},
+            {"gender": None, "age": None, "n": 1, "grouping": 1},
+            {"gender": None, "age": None, "n": 4, "grouping": 3},
+        ]
+
+    def test_numeric_measures_by_code_and_month(self, catalog):
+        rows = executor(catalog, "Observation").aggregate(
+            {"n": "count", "mean": ("avg", VALUE), "highest": ("max", VALUE)},
+            group_by=[CODE, {"name": "month", "path": "effective.ofType(dateTime)", "bucket": "month"}],
+            where=["status = 'final'"],
+        )
+
+        assert rows == [{"code": "4548-4", "month": "2024-03", "n": 2, "mean": 8.0, "highest": 9.5}]
+
+    def test_multi_valued_dimension_counts_resource_per_value(self, catalog):
+        rows = executor(catalog, "Observation").aggregate(
+            {"n": "count"}, group_by=[CODE, "status"], grouping_sets=[["status"], ["code", "status"], []])
+
+        assert [(row["code"], row["status"], row["n"]) for row in rows] == [
+            ("2345-7", "amended", 1), ("4548-4", "amended", 1), ("4548-4", "final", 2),
+            (None, "amended", 1), (None, "final", 2), (None, None, 3)]
+
+    def test_undeclared_multi_valued_dimension_is_an_error(self, catalog):
+        with pytest.raises(FHIRPathExecutionError, match="execute stage failed"):
+            executor(catalog, "Observation").aggregate({"n": "count"}, group_by=["code.coding.code"])
+
+    def test_restricted_to_patients(self, catalog):
+        rows = executor(catalog, "Observation").aggregate(
+            {"n": "count", "values": ("count", VALUE), "total": ("sum", VALUE)}, patients=["p2"])
+
+        assert rows == [{"n": 2, "values": 2, "total": 126.5}]
+
+    def test_quantiles(self, catalog):
+        rows = executor(catalog, "Observation").aggregate(
+            {"median": ("median", VALUE), "p25": ("quantile", VALUE, 0.25)})
+
+        assert rows == [{"median": 9.5, "p25": 8.0}]
+
+    def test_only_aggregated_rows_are_fetched(self, catalog):
+        sql = executor(catalog, "Patient")._aggregate_query(
+            {"n": "count"}, [("gender", "gender", {})], [], True, None, None)
+
+        assert "GROUP BY ROLLUP (a.d0)" in sql
+        assert sql.count("FROM Patient") == 1
+
+    def test_invalid_specifications(self, catalog):
+        patients = executor(catalog, "Patient")
+
+        with pytest.raises(ValueError, match="unique"):
+            patients.aggregate({"gender": "count"}, group_by=["gender"])
+        with pytest.raises(ValueError, match="Unknown bucket"):
+            patients.aggregate({"n": "count"}, group_by=[{"path": "birthDate", "bucket": "week"}])
+        with pytest.raises(ValueError, match="in no grouping set"):
+            patients.aggregate({"n": "count"}, group_by=["gender", AGE], grouping_sets=[["gender"]])
+        with pytest.raises(ValueError, match="Unknown aggregate"):
+            patients.aggregate({"n": ("mode", "birthDate")})
+        with pytest.raises(ValueError, match="between 0 and 1"):
+            patients.aggregate({"n": ("quantile", "birthDate", 50)})
+        with pytest.raises(ValueError, match="confidence interval keys"):
+            patients.aggregate({"n": "count", "n_ci": "count"}, approximate=True)
+        with pytest.raises(ValueError, match="CompartmentIndex"):
+            FHIRPathExecutor(catalog.dialect, "Patient").aggregate({"n": "count"}, patients=["p1"])
+
+    def test_compilation_error_is_wrapped_with_context(self, catalog):
+        with pytest.raises(FHIRPathExecutionError, match="translate stage failed"):
+            executor(catalog, "Patient").aggregate({"n": "count"}, group_by=["name.given.where("])
+
+
+class TestApproximateAggregate:
+
+    def test_full_sample_matches_exact_result(self, catalog):
+        patients = executor(catalog, "Patient")
+
+        rows = patients.aggregate({"n": "count"}, group_by=["gender"], approximate=True, sample_rate=1.0)
+
+        assert rows == [
+            {"gender": "female", "n": 1, "n_ci": (1.0, 1.0)},
+            {"gender": "male", "n": 2, "n_ci": (2.0, 2.0)},
+            {"gender": None, "n": 1, "n_ci": (1.0, 1.0)},
+        ]
+
+    def test_estimates_are_scaled_with_intervals(self, catalog):
+        observations = executor(catalog, "Observation")
+        measures = {"n": "count", "total": ("sum", VALUE), "mean": ("avg", VALUE), "highest": ("max", VALUE)}
+
+        rows = observations.aggregate(measures, approximate=True, sample_rate=0.5, seed=11)
+        seen = observations.aggregate({"n": "count"}, approximate=True, sample_rate=0.5, seed=11)[0]["n"]
+
+        assert rows == observations.aggregate(measures, approximate=True, sample_rate=0.5, seed=11)
+        [row] = rows
+        assert row["n"] == seen and row["n"] % 2 == 0
+        low, high = row["n_ci"]
+        assert row["n"] / 2 <= low <= row["n"] <= high
+        assert row["highest_ci"] is None
+        if row["mean"] is not None:
+            assert row["total"] == pytest.approx(row["mean"] * row["n"])
+
+    def test_sampled_execution(self, catalog):
+        details = executor(catalog, "Patient").execute_with_details(
+            "gender", approximate=True, sample_rate=0.5, seed=3)
+
+        assert details["sample_rate"] == 0.5
+        assert "TABLESAMPLE" in details["sql"]
+        assert len(details["results"]) <= 4
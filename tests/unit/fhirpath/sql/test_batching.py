@@ -0,0 +1,123 @@
+"""
+Unit tests for MicroBatcher: concurrent per-patient requests coalesced into one query.
+"""
+
+import json
+import threading
+
+import pytest
+
+from fhir4ds.fhirpath.exceptions import FHIRPathExecutionError
+from fhir4ds.fhirpath.sql import CompartmentIndex, FHIRPathExecutor, MicroBatcher, StorageCatalog
+
+RESOURCES = [
+    {"resourceType": "Patient", "id": "p1", "gender": "female"},
+    {"resourceType": "Patient", "id": "p2", "gender": "male"},
+    {"resourceType": "Patient", "id": "p3", "gender": "male"},
+    {"resourceType": "Observation", "id": "o1", "status": "final", "subject": {"reference": "Patient/p1"}},
+    {"resourceType": "Observation", "id": "o2", "status": "final", "subject": {"reference": "Patient/p2"}},
+    {"resourceType": "Observation", "id": "o3", "status": "amended", "subject": {"reference": "Patient/p2"}},
+]
+PATIENTS = ["p1", "p2", "p3"]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    source = tmp_path / "export.ndjson"
+    source.write_text("".join(json.dumps(resource) + "\n" for resource in RESOURCES))
+    catalog = StorageCatalog(compartment_index=CompartmentIndex.from_compartment_definition(
+        resource_types=["Patient", "Observation"]))
+    catalog.dialect = DuckDBDialect(database=":memory:")
+    NDJSONLoader(catalog.dialect, catalog=catalog).load(source)
+    return catalog
+
+
+def batcher(catalog, **options):
+    return MicroBatcher(catalog.dialect, catalog, **options)
+
+
+class TestMicroBatcher:
+
+    def test_concurrent_requests_share_one_query(self, catalog):
+        results = {}
+        with batcher(catalog, window_ms=200) as micro:
+            def request(patient):
+                results[patient] = micro.evaluate("Observation", "status = 'final'", patient)
+
+            threads = [threading.Thread(target=request, args=(patient,)) for patient in PATIENTS]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            statistics = micro.get_statistics()
+
+        assert results == {"p1": {"o1": [True]}, "p2": {"o2": [True], "o3": [False]}, "p3": {}}
+        assert statistics["requests"] == 3
+        assert statistics["batches"] == 1
+        assert statistics["largest_batch"] == 3
+        assert statistics["pending"] == 0
+
+    def test_results_match_per_patient_queries(self, catalog):
+        with batcher(catalog, window_ms=50) as micro:
+            futures = {(resource_type, patient): micro.submit(resource_type, "id", patient)
+                       for resource_type in ("Patient", "Observation") for patient in PATIENTS}
+            batched = {key: future.result(10) for key, future in futures.items()}
+            assert micro.get_statistics()["batches"] == 2
+
+        for (resource_type, patient), result in batched.items():
+            executor = FHIRPathExecutor(catalog.dialect, resource_type, catalog=catalog)
+            expected = {}
+            for row in executor.execute("id", patients=[patient]):
+                expected.setdefault(row[0], []).append(row[-1])
+            assert result == expected
+
+    def test_full_batches_are_split(self, catalog):
+        with batcher(catalog, window_ms=200, max_batch_size=2) as micro:
+            futures = [micro.submit("Patient", "gender", patient) for patient in PATIENTS + ["p1"]]
+            results = [future.result(10) for future in futures]
+            statistics = micro.get_statistics()
+
+        assert results == [{"p1": ["female"]}, {"p2": ["male"]}, {"p3": ["male"]}, {"p1": ["female"]}]
+        assert statistics["batches"] == 2
+        assert statistics["mean_batch_size"] == 2
+
+    def test_errors_reach_every_request_in_the_batch(self, catalog):
+        with batcher(catalog, window_ms=50) as micro:
+            futures = [micro.submit("Observation", "status.unknownFunction()", patient) for patient in PATIENTS]
+            for future in futures:
+                with pytest.raises(FHIRPathExecutionError):
+                    future.result(10)
+            assert micro.get_statistics()["failed_batches"] == 1
+
+            assert micro.evaluate("Patient", "gender", "p2", timeout=10) == {"p2": ["male"]}
+
+    def test_cancelled_requests_are_skipped(self, catalog):
+        with batcher(catalog, window_ms=200) as micro:
+            cancelled = micro.submit("Patient", "gender", "p1")
+            assert cancelled.cancel()
+            future = micro.submit("Patient", "gender", "p3")
+
+            assert future.result(10) == {"p3": ["male"]}
+            assert micro.get_statistics()["largest_batch"] == 1
+
+            lone = micro.submit("Observation", "status", "p1")
+            assert lone.cancel()
+            assert micro.evaluate("Patient", "gender", "p2", timeout=10) == {"p2": ["male"]}
+
+    def test_close_flushes_pending_requests(self, catalog):
+        micro = batcher(catalog, window_ms=60_000)
+        future = micro.submit("Patient", "gender", "p1")
+
+        micro.close()
+
+        assert future.result(0) == {"p1": ["female"]}
+        with pytest.raises(RuntimeError, match="closed"):
+            micro.submit("Patient", "gender", "p1")
+
+    def test_requires_compartment_index(self, catalog):
+        with pytest.raises(ValueError, match="CompartmentIndex"):
+            MicroBatcher(catalog.dialect, StorageCatalog())
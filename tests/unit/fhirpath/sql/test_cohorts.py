@@ -0,0 +1,117 @@
+"""
+Unit tests for cohort bitmaps and the dense patient ordinals they are built over.
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.sql import CohortEngine, CompartmentIndex, StorageCatalog
+from fhir4ds.fhirpath.sql import cohorts
+
+RESOURCES = [
+    {"resourceType": "Patient", "id": "p1", "gender": "female"},
+    {"resourceType": "Patient", "id": "p2", "gender": "male"},
+    {"resourceType": "Patient", "id": "p3", "gender": "male"},
+    {"resourceType": "Patient", "id": "p4", "gender": "female"},
+    {"resourceType": "Observation", "id": "o1", "status": "final", "subject": {"reference": "Patient/p1"}},
+    {"resourceType": "Observation", "id": "o2", "status": "final", "subject": {"reference": "Patient/p3"}},
+    {"resourceType": "Observation", "id": "o3", "status": "amended", "subject": {"reference": "Patient/p2"}},
+    {"resourceType": "Observation", "id": "o4", "status": "final", "subject": {"reference": "Patient/p3"}},
+]
+
+
+@pytest.fixture(params=["pyroaring", "bitset"])
+def engine(request, tmp_path, monkeypatch):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    if request.param == "pyroaring":
+        pytest.importorskip("pyroaring")
+    else:
+        monkeypatch.setattr(cohorts, "PYROARING_AVAILABLE", False)
+    source = tmp_path / "export.ndjson"
+    source.write_text("".join(json.dumps(resource) + "\n" for resource in RESOURCES))
+    dialect = DuckDBDialect(database=":memory:")
+    catalog = StorageCatalog(compartment_index=CompartmentIndex.from_compartment_definition(
+        resource_types=["Patient", "Observation"]))
+    NDJSONLoader(dialect, catalog=catalog).load(source)
+    return CohortEngine(dialect, catalog)
+
+
+class TestCohortEngine:
+
+    def test_loader_assigns_dense_ordinals(self, engine, tmp_path):
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        source = tmp_path / "more.ndjson"
+        source.write_text(json.dumps({"resourceType": "Patient", "id": "p0"}) + "\n"
+                          + json.dumps(RESOURCES[1]) + "\n")
+        NDJSONLoader(engine.dialect, catalog=engine.catalog).load(source)
+
+        assert engine.dialect.execute_query(
+            f"SELECT patient_id, ordinal FROM {engine.index.patient_table} ORDER BY ordinal") == [
+            ("p1", 0), ("p2", 1), ("p3", 2), ("p4", 3), ("p0", 4)]
+
+    def test_set_algebra(self, engine):
+        male = engine.criterion("Patient", "gender = 'male'")
+        final = engine.criterion("Observation", "status = 'final'")
+
+        assert male.patient_ids() == ["p2", "p3"]
+        assert final.patient_ids() == ["p1", "p3"]
+        assert (male & final).patient_ids() == ["p3"]
+        assert (male | final).patient_ids() == ["p1", "p2", "p3"]
+        assert (male - final).patient_ids() == ["p2"]
+        assert (male ^ final).patient_ids() == ["p1", "p2"]
+        assert (~(male | final)).patient_ids() == ["p4"]
+        assert len(final) == 2 and "p3" in final and "p2" not in final and "unknown" not in final
+        assert engine.from_patient_ids(["p3", "p2", "unknown"]) == male
+
+    def test_criteria_are_cached(self, engine):
+        first = engine.criterion("Patient", "gender = 'male'")
+
+        assert engine.criterion("Patient", "gender = 'male'") is first
+        assert engine.get_statistics() == {"cache_size": 1, "cache_hits": 1, "cache_misses": 1}
+
+    def test_cache_evicts_least_recently_used(self, engine):
+        engine._cache_size = 1
+        male = engine.criterion("Patient", "gender = 'male'")
+        engine.criterion("Patient", "gender = 'female'")
+
+        assert engine.criterion("Patient", "gender = 'male'") is not male
+        assert engine.get_statistics()["cache_misses"] == 3
+
+    def test_sample_is_reproducible(self, engine):
+        everyone = engine.patients()
+
+        assert everyone.sample(2, seed=7) == everyone.sample(2, seed=7)
+        assert set(everyone.sample(2, seed=7)) < {"p1", "p2", "p3", "p4"}
+        assert everyone.sample(10) == ["p1", "p2", "p3", "p4"]
+
+    def test_export_to_table(self, engine):
+        cohort = engine.criterion("Observation", "status = 'final'") | engine.from_query("SELECT 'p4'")
+
+        assert cohort.to_table("study_cohort") == 3
+        assert sorted(engine.dialect.execute_query("SELECT patient_id FROM study_cohort")) == [
+            ("p1",), ("p3",), ("p4",)]
+        with pytest.raises(ValueError, match="Invalid table"):
+            cohort.to_table("x; DROP TABLE Patient")
+
+    def test_export_inserts_in_batches(self, engine, monkeypatch):
+        from fhir4ds.fhirpath.sql import cohorts
+
+        monkeypatch.setattr(cohorts, "INSERT_BATCH_SIZE", 2)
+        everyone = engine.patients()
+
+        assert everyone.to_table("everyone") == 4
+        assert (everyone - everyone).to_table("nobody") == 0
+        assert sorted(engine.dialect.execute_query("SELECT patient_id FROM everyone")) == [
+            ("p1",), ("p2",), ("p3",), ("p4",)]
+        assert engine.dialect.execute_query("SELECT COUNT(*) FROM nobody") == [(0,)]
+
+    def test_requires_patient_compartment(self, engine):
+        with pytest.raises(ValueError, match="CompartmentIndex"):
+            CohortEngine(engine.dialect, StorageCatalog())
+        with pytest.raises(ValueError, match="not in the Patient compartment"):
+            engine.criterion("Practitioner", "active")
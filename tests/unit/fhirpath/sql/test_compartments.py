@@ -0,0 +1,141 @@
+"""
+Unit tests for Patient compartment membership and per-patient pruning.
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.sql import CompartmentIndex, FHIRPathExecutor, StorageCatalog
+from fhir4ds.fhirpath.sql.compartments import parse_compartment
+from fhir4ds.fhirpath.sql.cte import CTE, CTEManager
+
+
+@pytest.fixture(scope="module")
+def index():
+    return CompartmentIndex.from_compartment_definition()
+
+
+class TestCompartmentIndex:
+
+    def test_paths_from_compartment_definition(self, index):
+        assert index.paths_for("Observation") == ["performer", "subject"]
+        assert index.paths_for("Patient") == ["link.other"]
+        assert index.paths_for("Group") == ["member.entity"]
+        assert not index.contains("Practitioner")
+
+    def test_members_query_quotes_patient_ids(self, index):
+        assert index.members_query("Observation", ["p1", "o'brien"]) == (
+            "SELECT resource_id FROM fhir4ds_compartments "
+            "WHERE patient_id IN ('p1', 'o''brien') AND resource_type = 'Observation'"
+        )
+
+    def test_members_query_rejects_non_member_types(self, index):
+        with pytest.raises(ValueError, match="not in the Patient compartment"):
+            index.members_query("Practitioner", ["p1"])
+        with pytest.raises(ValueError, match="At least one patient"):
+            index.members_query("Observation", [])
+
+    @pytest.mark.parametrize("compartment, expected", [
+        ("Patient/123", "123"),
+        ("Patient/a-b.c", "a-b.c"),
+    ])
+    def test_parse_compartment(self, compartment, expected):
+        assert parse_compartment(compartment) == expected
+
+    @pytest.mark.parametrize("compartment", ["Encounter/1", "Patient/", "Patient/1' OR '1'='1"])
+    def test_parse_compartment_rejects_other_values(self, compartment):
+        with pytest.raises(ValueError):
+            parse_compartment(compartment)
+
+
+def test_cte_manager_semi_joins_the_source_relation():
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    manager = CTEManager(DuckDBDialect(database=":memory:"))
+    ctes = [CTE(name="cte_1", query="SELECT resource.id, resource FROM resource", depends_on=[])]
+
+    sql = manager.assemble_query(ctes, "SELECT id, resource FROM Observation", "SELECT 'o1'")
+
+    assert "resource AS (\n    SELECT * FROM (SELECT id, resource FROM Observation) AS source " \
+           "WHERE source.id IN (SELECT 'o1')" in sql
+    with pytest.raises(ValueError, match="source query"):
+        manager.assemble_query(ctes, None, "SELECT 'o1'")
+
+
+class TestCompartmentDuckDB:
+    """End to end: loaders maintain memberships and the executor prunes to them."""
+
+    @pytest.fixture
+    def loaded(self, tmp_path, index):
+        pytest.importorskip("duckdb")
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        resources = [
+            {"resourceType": "Patient", "id": "p1", "link": [{"other": {"reference": "Patient/p2"}}]},
+            {"resourceType": "Patient", "id": "p2"},
+            {"resourceType": "Observation", "id": "o1", "status": "final",
+             "subject": {"reference": "Patient/p1"},
+             "performer": [{"reference": "Patient/p1"}, {"reference": "Practitioner/x"}]},
+            {"resourceType": "Observation", "id": "o2", "status": "amended",
+             "subject": {"reference": "Patient/p2"}},
+            {"resourceType": "Observation", "id": "o3", "status": "final",
+             "subject": {"reference": "Group/g1"}},
+        ]
+        source = tmp_path / "export.ndjson"
+        source.write_text("".join(json.dumps(resource) + "\n" for resource in resources))
+
+        dialect = DuckDBDialect(database=":memory:")
+        catalog = StorageCatalog.partitioned(compartment_index=index)
+        NDJSONLoader(dialect, catalog=catalog).load(source)
+        return dialect, catalog
+
+    @staticmethod
+    def _members(dialect):
+        return dialect.execute_query("SELECT * FROM fhir4ds_compartments ORDER BY 1, 2, 3")
+
+    def test_loader_records_memberships(self, loaded):
+        dialect, _ = loaded
+
+        assert self._members(dialect) == [
+            ("p1", "Observation", "o1"),
+            ("p1", "Patient", "p1"),
+            ("p2", "Observation", "o2"),
+            ("p2", "Patient", "p1"),
+            ("p2", "Patient", "p2"),
+        ]
+
+    def test_executor_restricts_to_patients(self, loaded):
+        dialect, catalog = loaded
+        executor = FHIRPathExecutor(dialect, "Observation", catalog=catalog)
+
+        assert [row[0] for row in executor.execute("status", patients=["p1"])] == ["o1"]
+        assert [row[0] for row in executor.execute("status", compartment="Patient/p2")] == ["o2"]
+        assert sorted(row[0] for row in executor.execute("status", patients=["p1", "p2"])) == ["o1", "o2"]
+        assert len(executor.execute("status")) == 3
+
+    def test_incremental_merge_and_rebuild_maintain_memberships(self, loaded):
+        from fhir4ds.pipeline.operations import IncrementalLoader, NDJSONLoader
+
+        dialect, catalog = loaded
+        moved = {"resourceType": "Observation", "id": "o2", "subject": {"reference": "Patient/p1"}}
+
+        IncrementalLoader(dialect, catalog=catalog).merge_resources(
+            [json.dumps(moved).encode()], deletions=[("Observation", "o1")])
+        expected = [("p1", "Observation", "o2"), ("p1", "Patient", "p1"),
+                    ("p2", "Patient", "p1"), ("p2", "Patient", "p2")]
+        assert self._members(dialect) == expected
+
+        dialect.execute_query("DELETE FROM fhir4ds_compartments")
+        NDJSONLoader(dialect, catalog=catalog).rebuild_compartments(["Patient", "Observation"])
+        assert self._members(dialect) == expected
+
+
+def test_restriction_requires_a_compartment_index():
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.fhirpath.exceptions import FHIRPathExecutionError
+
+    executor = FHIRPathExecutor(DuckDBDialect(database=":memory:"), "Observation", catalog=StorageCatalog())
+    with pytest.raises(FHIRPathExecutionError, match="translate"):
+        executor.execute("status", patients=["p1"])
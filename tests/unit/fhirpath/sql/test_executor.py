@@ -108,11 +108,15 @@ class _MockDialect:
     def __init__(self, results: Optional[List[Any]] = None) -> None:
         self._results = results or [(1, "value")]
         self.executed_sql: List[str] = []
+        self.exported: List[Any] = []
 
     def execute_query(self, sql: str) -> List[Any]:
         self.executed_sql.append(sql)
         return self._results
 
+    def export_query(self, sql: str, destination: Any, **options: Any) -> None:
+        self.exported.append((sql, destination, options))
+
 
 def _make_executor(
     *,
@@ -238,3 +242,40 @@ class TestFHIRPathExecutor:
 
         assert excinfo.value.stage == "execute"
         assert isinstance(excinfo.value.original_exception, RuntimeError)
+
+    def test_to_sql_translates_without_executing(self) -> None:
+        executor, dialect, _, _, _ = _make_executor()
+
+        sql = executor.to_sql("Patient.birthDate")
+
+        assert sql == executor.execute_with_details("Patient.birthDate")["sql"]
+        assert dialect.executed_sql == [sql]
+        with pytest.raises(FHIRPathExecutionError):
+            executor.to_sql("")
+
+    def test_export_streams_translated_sql_to_dialect(self) -> None:
+        executor, dialect, _, _, _ = _make_executor()
+
+        details = executor.export(
+            "Patient.birthDate", "/tmp/out", format="parquet", partition_by=["gender"], compression="zstd"
+        )
+
+        assert dialect.executed_sql == []
+        assert dialect.exported == [(
+            details["sql"],
+            "/tmp/out",
+            {"format": "parquet", "partition_by": ["gender"], "row_group_size": None, "compression": "zstd"},
+        )]
+        assert "export" in details["timings_ms"]
+
+    def test_export_error_is_wrapped_with_context(self) -> None:
+        class _FailDialect(_MockDialect):
+            def export_query(self, sql: str, destination: Any, **options: Any) -> None:
+                raise ValueError("unsupported format")
+
+        executor, _, _, _, _ = _make_executor(dialect=_FailDialect())
+
+        with pytest.raises(FHIRPathExecutionError) as excinfo:
+            executor.export("Patient.birthDate", "/tmp/out", format="xml")
+
+        assert excinfo.value.stage == "export"
@@ -0,0 +1,164 @@
+"""
+Unit tests for ingest-time extraction profiles (hot columns and side tables).
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.sql import (ExtractedColumn, ExtractionProfile, FHIRPathExecutor, SideTable,
+                                  StorageCatalog)
+
+
+# Resource element definitions (the shipped ones cover data types only)
+RESOURCE_DEFINITIONS = {
+    "Observation.subject": {"type": "Reference", "is_array": False},
+    "Observation.status": {"type": "code", "is_array": False},
+    "Observation.code": {"type": "CodeableConcept", "is_array": False},
+    "Condition.subject": {"type": "Reference", "is_array": False},
+    "Condition.code": {"type": "CodeableConcept", "is_array": False},
+    "Account.subject": {"type": "Reference", "is_array": True},
+}
+
+
+@pytest.fixture(scope="module")
+def observation_profile():
+    return ExtractionProfile.from_search_parameters(resource_types=["Observation", "Condition"],
+                                                    element_definitions=RESOURCE_DEFINITIONS)
+
+
+class TestExtractionProfile:
+
+    def test_observation_hot_columns(self, observation_profile):
+        columns = {column.name: column for column in observation_profile.columns_for("Observation")}
+
+        assert list(columns) == ["subject_ref", "clinical_date", "status", "last_updated"]
+        assert columns["subject_ref"].paths == ("subject.reference",)
+        assert columns["clinical_date"] == ExtractedColumn(
+            "clinical_date", ("effectiveDateTime", "effectivePeriod.start"), "TIMESTAMP")
+        assert columns["last_updated"].paths == ("meta.lastUpdated",)
+        assert observation_profile.side_tables_for("Observation") == [
+            SideTable("code", "code.coding", (("system", "system"), ("code", "code")))
+        ]
+
+    def test_choice_typed_dates(self, observation_profile):
+        columns = {column.name: column for column in observation_profile.columns_for("Condition")}
+
+        assert columns["onset_date"].paths == ("onsetDateTime", "onsetPeriod.start")
+
+    def test_only_single_path_varchar_columns_are_exact(self, observation_profile):
+        assert observation_profile.column_for_path("Observation", "status") == "status"
+        assert observation_profile.column_for_path("Observation", "effectiveDateTime") is None
+
+    def test_repeating_or_undefined_elements_stay_in_json(self):
+        profile = ExtractionProfile.from_search_parameters(resource_types=["Account"],
+                                                           element_definitions=RESOURCE_DEFINITIONS)
+        shipped = ExtractionProfile.from_search_parameters(resource_types=["Observation"])
+
+        assert "subject_ref" not in [column.name for column in profile.columns_for("Account")]
+        assert [column.name for column in shipped.columns_for("Observation")] == ["clinical_date", "last_updated"]
+
+    def test_conflicting_column_types_are_rejected(self):
+        with pytest.raises(ValueError, match="conflicting types"):
+            ExtractionProfile({
+                "Observation": [ExtractedColumn("onset", ("effectiveDateTime",), "TIMESTAMP")],
+                "Condition": [ExtractedColumn("onset", ("onsetString",))],
+            })
+
+    @pytest.mark.parametrize("args", [
+        ("bad name", ("status",)),
+        ("status", ("status; DROP TABLE x",)),
+        ("status", ("status",), "DATE"),
+    ])
+    def test_invalid_columns_are_rejected(self, args):
+        with pytest.raises(ValueError):
+            ExtractedColumn(*args)
+
+
+def test_catalog_ddl_adds_typed_columns_and_side_tables(observation_profile):
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    catalog = StorageCatalog(profile=observation_profile)
+    statements = catalog.create_statements(DuckDBDialect(database=":memory:"), "Observation")
+
+    assert statements[0] == (
+        "CREATE TABLE IF NOT EXISTS Observation (id VARCHAR, resource JSON, subject_ref VARCHAR, "
+        "clinical_date TIMESTAMP, status VARCHAR, last_updated TIMESTAMP)"
+    )
+    assert "ALTER TABLE Observation ADD COLUMN IF NOT EXISTS clinical_date TIMESTAMP" in statements
+    assert statements[-1] == (
+        "CREATE TABLE IF NOT EXISTS Observation_code (id VARCHAR, system VARCHAR, code VARCHAR)"
+    )
+
+
+class TestExtractionDuckDB:
+    """End to end: loaders keep extracted columns and side tables in sync."""
+
+    @pytest.fixture
+    def loaded(self, tmp_path, observation_profile):
+        pytest.importorskip("duckdb")
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        source = tmp_path / "export.ndjson"
+        lines = [
+            {"resourceType": "Observation", "id": "o1", "status": "final",
+             "subject": {"reference": "Patient/p1"}, "effectiveDateTime": "2024-01-02",
+             "code": {"coding": [{"system": "http://loinc.org", "code": "1234-5"},
+                                 {"system": "local", "code": "A"}]},
+             "meta": {"versionId": "1"}},
+            {"resourceType": "Observation", "id": "o2", "status": "amended",
+             "effectivePeriod": {"start": "2024-02-01T10:00:00"}, "meta": {"versionId": "1"}},
+        ]
+        source.write_text("".join(json.dumps(line) + "\n" for line in lines))
+
+        dialect = DuckDBDialect(database=":memory:")
+        catalog = StorageCatalog.partitioned(profile=observation_profile)
+        NDJSONLoader(dialect, catalog=catalog).load(source)
+        return dialect, catalog, lines
+
+    def test_loader_fills_columns_and_side_table(self, loaded):
+        dialect, _, _ = loaded
+
+        rows = dialect.execute_query(
+            "SELECT id, subject_ref, CAST(clinical_date AS VARCHAR), status FROM fhir_resources ORDER BY id"
+        )
+        codes = dialect.execute_query("SELECT id, system, code FROM fhir_resources_code ORDER BY code")
+
+        assert rows == [("o1", "Patient/p1", "2024-01-02 00:00:00", "final"),
+                        ("o2", None, "2024-02-01 10:00:00", "amended")]
+        assert codes == [("o1", "http://loinc.org", "1234-5"), ("o1", "local", "A")]
+
+    def test_incremental_merge_rewrites_side_rows(self, loaded):
+        from fhir4ds.pipeline.operations import IncrementalLoader
+
+        dialect, catalog, lines = loaded
+        changed = dict(lines[0], status="cancelled", meta={"versionId": "2"},
+                       code={"coding": [{"system": "local", "code": "B"}]})
+
+        IncrementalLoader(dialect, catalog=catalog).merge_resources(
+            [json.dumps(changed).encode()], deletions=[("Observation", "o2")])
+
+        assert dialect.execute_query("SELECT id, status FROM fhir_resources") == [("o1", "cancelled")]
+        assert dialect.execute_query("SELECT id, code FROM fhir_resources_code") == [("o1", "B")]
+
+    def test_translator_reads_extracted_column(self, loaded):
+        dialect, catalog, _ = loaded
+
+        details = FHIRPathExecutor(dialect, "Observation", catalog=catalog).execute_with_details("status")
+
+        assert "resource.status" in details["sql"]
+        assert "'$.status'" not in details["sql"]
+        assert sorted(row[2] for row in details["results"]) == ["amended", "final"]
+
+    def test_backfill_existing_rows(self, loaded, observation_profile):
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        dialect, catalog, _ = loaded
+        dialect.execute_query("UPDATE fhir_resources SET status = NULL")
+        dialect.execute_query("DELETE FROM fhir_resources_code")
+
+        NDJSONLoader(dialect, catalog=catalog).backfill(["Observation"])
+
+        assert dialect.execute_query("SELECT COUNT(status) FROM fhir_resources")[0][0] == 2
+        assert dialect.execute_query("SELECT COUNT(*) FROM fhir_resources_code")[0][0] == 2
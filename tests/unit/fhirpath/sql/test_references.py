@@ -0,0 +1,141 @@
+"""
+Unit tests for the reference edge index and resolve().
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.parser import FHIRPathExpression, FHIRPathParser
+from fhir4ds.fhirpath.sql import ASTToSQLTranslator, ReferenceIndex, ReferencePath, StorageCatalog
+from fhir4ds.fhirpath.sql.catalog import per_type_table
+
+
+@pytest.fixture(scope="module")
+def index():
+    return ReferenceIndex.from_search_parameters(resource_types=["Observation", "Encounter"])
+
+
+def _ast(expression):
+    # Element checks of the semantic validator need resource StructureDefinitions
+    result = FHIRPathParser().enhanced_parser.parse(expression, analyze_complexity=True,
+                                                     find_optimizations=True)
+    return FHIRPathExpression(result).get_ast()
+
+
+class TestReferenceIndex:
+
+    def test_paths_and_targets_from_search_parameters(self, index):
+        assert index.path("Observation", "subject") == ReferencePath(
+            "subject", ("Device", "Group", "Location", "Patient"))
+        assert index.path("Encounter", "participant.individual").targets == (
+            "Practitioner", "PractitionerRole", "RelatedPerson")
+        assert index.path("Observation", "status") is None
+        assert index.paths_for("Patient") == []
+
+    def test_invalid_paths_are_rejected(self):
+        with pytest.raises(ValueError):
+            ReferencePath("subject; DROP TABLE x")
+        with pytest.raises(ValueError):
+            ReferenceIndex(table="refs x")
+
+    def test_reserved_type_names_get_a_suffixed_table(self):
+        assert per_type_table("Group") == "Group_resources"
+        assert StorageCatalog().resolve("Patient").table == "Patient"
+
+
+class TestReferenceIndexDuckDB:
+    """End to end: loaders maintain edges and resolve() joins through them."""
+
+    @pytest.fixture
+    def loaded(self, tmp_path, index):
+        pytest.importorskip("duckdb")
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        resources = [
+            {"resourceType": "Patient", "id": "p1", "gender": "male"},
+            {"resourceType": "Patient", "id": "p2", "gender": "female"},
+            {"resourceType": "Observation", "id": "o1", "subject": {"reference": "Patient/p1"},
+             "hasMember": [{"reference": "Observation/o2"}, {"reference": "#contained"}]},
+            {"resourceType": "Observation", "id": "o2",
+             "subject": {"reference": "http://example.org/fhir/Patient/p2/_history/3"}},
+            {"resourceType": "Encounter", "id": "e1",
+             "participant": [{"individual": {"reference": "Practitioner/pr1"}},
+                             {"individual": {"reference": "Practitioner/pr2"}}]},
+        ]
+        source = tmp_path / "export.ndjson"
+        source.write_text("".join(json.dumps(resource) + "\n" for resource in resources))
+
+        dialect = DuckDBDialect(database=":memory:")
+        catalog = StorageCatalog(reference_index=index)
+        NDJSONLoader(dialect, catalog=catalog).load(source)
+        return dialect, catalog
+
+    @staticmethod
+    def _edges(dialect):
+        return dialect.execute_query(
+            "SELECT source_id, path, target_type, target_id FROM fhir4ds_references ORDER BY 1, 2, 4")
+
+    def test_loader_indexes_literal_references(self, loaded):
+        dialect, _ = loaded
+
+        assert self._edges(dialect) == [
+            ("e1", "participant.individual", "Practitioner", "pr1"),
+            ("e1", "participant.individual", "Practitioner", "pr2"),
+            ("o1", "hasMember", "Observation", "o2"),
+            ("o1", "subject", "Patient", "p1"),
+            ("o2", "subject", "Patient", "p2"),
+        ]
+
+    def test_incremental_merge_maintains_edges(self, loaded):
+        from fhir4ds.pipeline.operations import IncrementalLoader
+
+        dialect, catalog = loaded
+        changed = {"resourceType": "Observation", "id": "o1", "subject": {"reference": "Patient/p2"}}
+
+        IncrementalLoader(dialect, catalog=catalog).merge_resources(
+            [json.dumps(changed).encode()], deletions=[("Encounter", "e1")])
+
+        assert self._edges(dialect) == [
+            ("o1", "subject", "Patient", "p2"),
+            ("o2", "subject", "Patient", "p2"),
+        ]
+
+    def test_rebuild_restores_edges(self, loaded):
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        dialect, catalog = loaded
+        expected = self._edges(dialect)
+        dialect.execute_query("DELETE FROM fhir4ds_references")
+
+        NDJSONLoader(dialect, catalog=catalog).rebuild_references(["Observation", "Encounter"])
+
+        assert self._edges(dialect) == expected
+
+    @pytest.mark.parametrize("expression, expected", [
+        ("Observation.subject.resolve().gender", [["male"], ["female"]]),
+        ("Observation.hasMember.resolve().subject.reference",
+         [["http://example.org/fhir/Patient/p2/_history/3"]]),
+        ("Observation.subject.resolve().count()", [1, 1]),
+    ])
+    def test_resolve_joins_through_the_index(self, loaded, expression, expected):
+        dialect, catalog = loaded
+
+        sql = ASTToSQLTranslator(dialect, "Observation", catalog=catalog).translate_to_sql(_ast(expression))
+        rows = dialect.execute_query(sql.rstrip(";"))
+
+        assert "fhir4ds_references" in sql
+        values = [json.loads(row[2]) if isinstance(row[2], str) else row[2] for row in sorted(rows)]
+        assert values == expected
+
+
+def test_resolve_requires_an_indexed_reference(index):
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=":memory:")
+    with pytest.raises(ValueError, match="ReferenceIndex"):
+        ASTToSQLTranslator(dialect, "Observation").translate(_ast("Observation.subject.resolve()"))
+    with pytest.raises(ValueError, match="not indexed"):
+        ASTToSQLTranslator(dialect, "Observation", catalog=StorageCatalog(reference_index=index)).translate(
+            _ast("Observation.status.resolve()"))
@@ -0,0 +1,101 @@
+"""
+Unit tests for FHIRPathRouter: closures for resources in hand, SQL for populations.
+"""
+
+import json
+from decimal import Decimal
+
+import pytest
+
+from fhir4ds.fhirpath.closures import ClosureEvaluator
+from fhir4ds.fhirpath.exceptions import FHIRPathExecutionError, FHIRPathRuntimeError
+from fhir4ds.fhirpath.sql import FHIRPathRouter, StorageCatalog
+
+RESOURCES = [
+    {"resourceType": "Observation", "id": "o1", "status": "final", "valueQuantity": {"value": 9.5}},
+    {"resourceType": "Observation", "id": "o2", "status": "amended", "valueQuantity": {"value": 120}},
+    {"resourceType": "Observation", "id": "o3", "status": "final"},
+]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    source = tmp_path / "export.ndjson"
+    source.write_text("".join(json.dumps(resource) + "\n" for resource in RESOURCES))
+    catalog = StorageCatalog()
+    catalog.dialect = DuckDBDialect(database=":memory:")
+    NDJSONLoader(catalog.dialect, catalog=catalog).load(source)
+    return catalog
+
+
+def router(catalog, **options):
+    return FHIRPathRouter(catalog.dialect, "Observation", catalog=catalog, **options)
+
+
+class TestRouter:
+
+    def test_resources_in_hand_use_closures(self, catalog):
+        evaluator = ClosureEvaluator("Observation")
+
+        results = router(catalog, evaluator=evaluator).evaluate("status = 'final'", RESOURCES[:2])
+
+        assert results == {"o1": [True], "o2": [False]}
+        assert evaluator.get_statistics()["cache_misses"] == 1
+
+    def test_population_uses_sql(self, catalog):
+        evaluator = ClosureEvaluator("Observation")
+
+        results = router(catalog, evaluator=evaluator).evaluate("status = 'final'")
+
+        assert results == {"o1": [True], "o2": [False], "o3": [True]}
+        assert evaluator.get_statistics()["cache_misses"] == 0
+
+    def test_large_batches_are_loaded_into_a_scratch_table(self, catalog):
+        batch = [{**resource, "id": resource["id"] + "-new"} for resource in RESOURCES]
+
+        results = router(catalog, max_closure_resources=1).evaluate("status = 'final'", batch)
+
+        assert results == {"o1-new": [True], "o2-new": [False], "o3-new": [True]}
+        assert catalog.dialect.execute_query("SELECT COUNT(*) FROM Observation") == [(3,)]
+        assert not catalog.dialect.execute_query(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = 'fhir4ds_router_scratch'")
+
+    def test_unsupported_expressions_fall_back_to_sql(self, catalog):
+        results = router(catalog).evaluate("1.type().name", RESOURCES[:1])
+
+        assert results == {"o1": ["Integer"]}
+
+    def test_closure_results_match_sql(self, catalog):
+        expression = "value.ofType(Quantity).value > 10"
+
+        closures = router(catalog).evaluate(expression, RESOURCES)
+        sql = router(catalog, max_closure_resources=0).evaluate(expression, RESOURCES)
+
+        assert closures == {"o1": [False], "o2": [True], "o3": []}
+        assert sql == closures
+
+    def test_sql_values_match_closure_values(self, catalog):
+        batch = [{"resourceType": "Observation", "id": "o4", "status": "final",
+                  "valueQuantity": {"value": 9.5, "unit": "mg"}, "issued": "2020-01-02T10:00:00Z"}]
+        for expression in ("status", "value.ofType(Quantity).value", "valueQuantity", "@2020-01-01", "issued"):
+            closures = router(catalog).evaluate(expression, batch)
+            sql = router(catalog, max_closure_resources=0).evaluate(expression, batch)
+
+            assert sql == closures, expression
+
+        assert router(catalog).evaluate("value.ofType(Quantity).value", batch) == {"o4": [Decimal("9.5")]}
+
+    def test_both_paths_raise_execution_errors(self, catalog):
+        for max_closure_resources in (100, 0):
+            with pytest.raises(FHIRPathExecutionError) as error:
+                router(catalog, max_closure_resources=max_closure_resources).evaluate("status.where(", RESOURCES)
+            assert error.value.stage == "parse"
+
+        with pytest.raises(FHIRPathExecutionError) as error:
+            router(catalog).evaluate("status + 1", RESOURCES)
+        assert error.value.stage == "execute"
+        assert isinstance(error.value.original_exception, FHIRPathRuntimeError)
@@ -0,0 +1,158 @@
+"""
+Unit tests for the search parameter index and the search URL compiler.
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.sql import IndexedParameter, SearchIndex, StorageCatalog
+from fhir4ds.fhirpath.sql.search import parse_search
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SearchIndex.from_search_parameters(resource_types=["Observation", "Patient"])
+
+
+class TestSearchIndex:
+
+    def test_parameters_from_search_parameter_definitions(self, index):
+        assert index.parameter("Observation", "date").paths == ("effectiveDateTime", "effectivePeriod")
+        assert index.parameter("Observation", "value-quantity").type == "quantity"
+        assert index.parameter("Patient", "phone").paths == ("telecom.where(system='phone')",)
+        # where(resolve() is Patient) narrows the declared targets
+        assert index.parameter("Observation", "patient").targets == ("Patient",)
+        # Resource parameters apply to every type
+        assert index.parameter("Patient", "_lastUpdated").paths == ("meta.lastUpdated",)
+        # Composite parameters are not indexed
+        assert index.parameter("Observation", "code-value-quantity") is None
+
+    def test_parse_search(self):
+        assert parse_search("http://example.org/fhir/Observation?code=a%7Cb&date=ge2020") == (
+            "Observation", [("code", "a|b"), ("date", "ge2020")])
+        with pytest.raises(ValueError, match="resource type"):
+            parse_search("?code=x")
+
+    def test_search_conditions(self, index):
+        assert index.search_conditions("Observation", [("code", "http://loinc.org|1234-5,\\,x")]) == [
+            "id IN (SELECT resource_id FROM fhir4ds_search_token WHERE resource_type = 'Observation' "
+            "AND param = 'code' AND ((system = 'http://loinc.org' AND code = '1234-5') OR code = ',x'))"
+        ]
+
+    @pytest.mark.parametrize("parameters, message", [
+        ([("unknown", "x")], "Unknown search parameter"),
+        ([("_sort", "date")], "Unsupported search result parameter"),
+        ([("code:text", "x")], "Unsupported modifier"),
+        ([("date", "2020-13x")], "Invalid date"),
+        ([("status.name", "x")], "Only reference parameters"),
+        ([("subject:Patient", "Group/g1")], "does not point to a Patient"),
+    ])
+    def test_unsupported_searches_are_rejected(self, index, parameters, message):
+        with pytest.raises(ValueError, match=message):
+            index.search_conditions("Observation", parameters)
+
+    def test_invalid_parameters_are_rejected(self):
+        with pytest.raises(ValueError):
+            IndexedParameter("code", "composite", ("code",))
+        with pytest.raises(ValueError):
+            IndexedParameter("code", "token", ("code.where(resolve())",))
+
+
+class TestSearchDuckDB:
+    """End to end: loaders fill the index tables and search URLs read them."""
+
+    @pytest.fixture
+    def loaded(self, tmp_path, index):
+        pytest.importorskip("duckdb")
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+        from fhir4ds.pipeline.operations import NDJSONLoader
+
+        resources = [
+            {"resourceType": "Patient", "id": "p1", "name": [{"family": "Smith", "given": ["Ann"]}],
+             "birthDate": "1980-05", "telecom": [{"system": "phone", "value": "555"},
+                                                 {"system": "email", "value": "ann@example.org"}]},
+            {"resourceType": "Patient", "id": "p2", "name": [{"family": "Jones"}], "birthDate": "1990-01-02"},
+            {"resourceType": "Observation", "id": "o1", "status": "final",
+             "meta": {"lastUpdated": "2024-01-01T10:00:00Z"},
+             "code": {"coding": [{"system": "http://loinc.org", "code": "1234-5"}]},
+             "subject": {"reference": "Patient/p1"}, "effectiveDateTime": "2021-03-04",
+             "valueQuantity": {"value": 5.4, "system": "http://unitsofmeasure.org", "code": "mmol/L"}},
+            {"resourceType": "Observation", "id": "o2", "status": "amended",
+             "code": {"coding": [{"system": "http://loinc.org", "code": "9999-9"}]},
+             "subject": {"reference": "Patient/p2"},
+             "effectivePeriod": {"start": "2019-12-30", "end": "2020-01-02T10:00:00"},
+             "valueQuantity": {"value": 120, "unit": "mg"}},
+            {"resourceType": "Observation", "id": "o3", "status": "final", "code": {"text": "Glucose"},
+             "subject": {"reference": "Group/g1"}, "effectivePeriod": {"start": "2022-01-01"}},
+        ]
+        source = tmp_path / "export.ndjson"
+        source.write_text("".join(json.dumps(resource) + "\n" for resource in resources))
+
+        dialect = DuckDBDialect(database=":memory:")
+        catalog = StorageCatalog(search_index=index)
+        NDJSONLoader(dialect, catalog=catalog).load(source)
+        return dialect, catalog
+
+    @staticmethod
+    def _search(dialect, catalog, url):
+        return sorted(row[0] for row in dialect.execute_query(catalog.search_index.search_query(dialect, catalog, url)))
+
+    @pytest.mark.parametrize("url, expected", [
+        ("Observation?code=http://loinc.org|1234-5", ["o1"]),
+        ("Observation?code=9999-9,1234-5", ["o1", "o2"]),
+        ("Observation?code:not=1234-5", ["o2", "o3"]),
+        ("Observation?status=final&code=http://loinc.org|", ["o1"]),
+        ("Observation?date=2021", ["o1"]),
+        ("Observation?date=ge2020", ["o1", "o2", "o3"]),
+        ("Observation?date=lt2020", ["o2"]),
+        ("Observation?date=2020-01-01", []),
+        ("Observation?date=gt2021-06", ["o3"]),
+        ("Observation?_lastUpdated=gt2023", ["o1"]),
+        ("Observation?subject=Patient/p1", ["o1"]),
+        ("Observation?patient=p2", ["o2"]),
+        ("Observation?subject.name=smi", ["o1"]),
+        ("Observation?subject:Patient.family:exact=Jones", ["o2"]),
+        ("Observation?value-quantity=5.4", ["o1"]),
+        ("Observation?value-quantity=gt100||mg", ["o2"]),
+        ("Observation?value-quantity=5.4|http://unitsofmeasure.org|mmol/L", ["o1"]),
+        ("Observation?value-quantity:missing=true", ["o3"]),
+        ("Observation?_count=1", ["o1"]),
+        ("Patient?name=ann", ["p1"]),
+        ("Patient?family:exact=smith", []),
+        ("Patient?name:contains=ON", ["p2"]),
+        ("Patient?birthdate=1980", ["p1"]),
+        ("Patient?birthdate=le1985", ["p1"]),
+        ("Patient?phone=555", ["p1"]),
+        ("Patient?email=555", []),
+        ("Patient?_id=p2", ["p2"]),
+    ])
+    def test_search(self, loaded, url, expected):
+        dialect, catalog = loaded
+
+        assert self._search(dialect, catalog, url) == expected
+
+    def test_incremental_merge_and_rebuild_maintain_the_index(self, loaded):
+        from fhir4ds.pipeline.operations import IncrementalLoader, NDJSONLoader
+
+        dialect, catalog = loaded
+        changed = {"resourceType": "Observation", "id": "o2", "status": "final",
+                   "code": {"coding": [{"system": "http://loinc.org", "code": "1234-5"}]}}
+
+        IncrementalLoader(dialect, catalog=catalog).merge_resources(
+            [json.dumps(changed).encode()], deletions=[("Observation", "o1")])
+        assert self._search(dialect, catalog, "Observation?code=1234-5") == ["o2"]
+        assert self._search(dialect, catalog, "Observation?date=lt2020") == []
+
+        dialect.execute_query("DELETE FROM fhir4ds_search_token")
+        NDJSONLoader(dialect, catalog=catalog).rebuild_search_index(["Observation"])
+        assert self._search(dialect, catalog, "Observation?code=1234-5") == ["o2"]
+
+
+def test_search_requires_a_search_index():
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    loader = NDJSONLoader(DuckDBDialect(database=":memory:"), catalog=StorageCatalog())
+    with pytest.raises(ValueError, match="no search index"):
+        loader.rebuild_search_index(["Observation"])
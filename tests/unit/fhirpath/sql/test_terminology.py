@@ -0,0 +1,174 @@
+"""
+Unit tests for the terminology store and memberOf(), subsumes() and translate().
+"""
+
+import json
+
+import pytest
+
+from fhir4ds.fhirpath.parser import FHIRPathExpression, FHIRPathParser
+from fhir4ds.fhirpath.sql import (
+    ASTToSQLTranslator, ExtractionProfile, StorageCatalog, TerminologyStore,
+)
+from fhir4ds.fhirpath.sql.terminology import load_terminology_resources
+
+SYSTEM = "http://example.org/codes"
+
+CODE_SYSTEM = {
+    "resourceType": "CodeSystem", "url": SYSTEM,
+    "concept": [
+        {"code": "A", "concept": [{"code": "A1"}, {"code": "A2", "concept": [{"code": "A2x"}]}]},
+        {"code": "B", "property": [{"code": "parent", "valueCode": "A"}]},
+    ],
+}
+EXPANDED = {
+    "resourceType": "ValueSet", "url": "http://example.org/vs/expanded",
+    "expansion": {"contains": [{"system": SYSTEM, "code": "A1"},
+                               {"system": "http://loinc.org", "code": "1234-5"}]},
+}
+COMPOSED = {
+    "resourceType": "ValueSet", "url": "http://example.org/vs/composed",
+    "compose": {
+        "include": [{"system": SYSTEM, "filter": [{"property": "concept", "op": "is-a", "value": "A2"}]}],
+        "exclude": [{"system": SYSTEM, "concept": [{"code": "A2x"}]}],
+    },
+}
+STATUSES = {
+    "resourceType": "ValueSet", "url": "http://example.org/vs/statuses",
+    "compose": {"include": [{"system": "http://hl7.org/fhir/observation-status", "concept": [{"code": "final"}]}]},
+}
+CONCEPT_MAP = {
+    "resourceType": "ConceptMap", "url": "http://example.org/cm",
+    "group": [{"source": SYSTEM, "target": "http://example.org/other", "element": [
+        {"code": "A1", "target": [{"code": "X1", "equivalence": "equivalent"}]},
+        {"code": "A2", "target": [{"code": "X2", "equivalence": "disjoint"}]},
+    ]}],
+}
+
+
+def _ast(expression):
+    # Element checks of the semantic validator need resource StructureDefinitions
+    result = FHIRPathParser().enhanced_parser.parse(expression, analyze_complexity=True,
+                                                     find_optimizations=True)
+    return FHIRPathExpression(result).get_ast()
+
+
+class TestTerminologyStore:
+
+    def test_resources_are_ordered_for_loading(self):
+        importing = {"resourceType": "ValueSet", "url": "http://example.org/vs/importing",
+                     "compose": {"include": [{"valueSet": ["http://example.org/vs/composed|1"]}]}}
+        bundle = {"resourceType": "Bundle", "entry": [{"resource": resource} for resource in
+                                                      (CONCEPT_MAP, importing, COMPOSED, CODE_SYSTEM)]}
+
+        ordered = load_terminology_resources([bundle, {"resourceType": "Patient"}])
+
+        assert [resource["url"] for resource in ordered] == [
+            SYSTEM, "http://example.org/vs/composed", "http://example.org/vs/importing", "http://example.org/cm"]
+
+    def test_unsupported_resources_and_filters_are_rejected(self):
+        store = TerminologyStore()
+        with pytest.raises(ValueError, match="Not a terminology resource"):
+            store.load_statements({"resourceType": "Patient"})
+        with pytest.raises(ValueError, match="needs an expansion"):
+            store.load_statements({"resourceType": "ValueSet", "url": "u", "compose": {"include": [
+                {"system": SYSTEM, "filter": [{"property": "status", "op": "=", "value": "x"}]}]}})
+        with pytest.raises(ValueError):
+            TerminologyStore(prefix="bad prefix")
+
+    def test_member_ids_query_joins_the_side_table(self):
+        assert TerminologyStore().side_table_member_ids_query(
+            "fhir_resources_code", "id", "http://example.org/vs|2", type_column="resource_type",
+            resource_type="Observation",
+        ) == (
+            "SELECT side.id FROM fhir_resources_code AS side JOIN fhir4ds_valueset_codes AS member "
+            "ON member.system = side.system AND member.code = side.code "
+            "WHERE member.valueset = 'http://example.org/vs' AND side.resource_type = 'Observation'"
+        )
+
+
+class TestTerminologyDuckDB:
+    """End to end: the loader fills the tables and the translator joins them."""
+
+    @pytest.fixture(params=["per_type", "side_table"])
+    def loaded(self, request, tmp_path):
+        pytest.importorskip("duckdb")
+        from fhir4ds.dialects.duckdb import DuckDBDialect
+        from fhir4ds.pipeline.operations import NDJSONLoader, TerminologyLoader
+
+        dialect = DuckDBDialect(database=":memory:")
+        store = TerminologyStore()
+        terminology = tmp_path / "terminology.ndjson"
+        terminology.write_text("".join(json.dumps(resource) + "\n" for resource in
+                                       (CONCEPT_MAP, STATUSES, COMPOSED, EXPANDED, CODE_SYSTEM)))
+        TerminologyLoader(dialect, store).load(terminology)
+
+        observations = [
+            {"resourceType": "Observation", "id": "o1", "status": "final",
+             "code": {"coding": [{"system": SYSTEM, "code": "A1"}]}},
+            {"resourceType": "Observation", "id": "o2", "status": "amended",
+             "code": {"coding": [{"system": SYSTEM, "code": "A2"}, {"system": SYSTEM, "code": "A2x"}]}},
+            {"resourceType": "Observation", "id": "o3", "status": "final",
+             "code": {"coding": [{"system": "http://loinc.org", "code": "1234-5"}]}},
+        ]
+        source = tmp_path / "export.ndjson"
+        source.write_text("".join(json.dumps(resource) + "\n" for resource in observations))
+        if request.param == "side_table":
+            catalog = StorageCatalog.partitioned(
+                profile=ExtractionProfile.from_search_parameters(resource_types=["Observation"]),
+                terminology=store)
+        else:
+            catalog = StorageCatalog(terminology=store)
+        NDJSONLoader(dialect, catalog=catalog).load(source)
+        return dialect, catalog
+
+    def test_loader_expands_value_sets_and_closures(self, loaded):
+        dialect, _ = loaded
+
+        assert dialect.execute_query("SELECT * FROM fhir4ds_valueset_codes ORDER BY 1, 2, 3") == [
+            ("http://example.org/vs/composed", SYSTEM, "A2"),
+            ("http://example.org/vs/expanded", SYSTEM, "A1"),
+            ("http://example.org/vs/expanded", "http://loinc.org", "1234-5"),
+            ("http://example.org/vs/statuses", "http://hl7.org/fhir/observation-status", "final"),
+        ]
+        assert dialect.execute_query(
+            "SELECT ancestor FROM fhir4ds_code_closure WHERE descendant = 'A2x' ORDER BY 1"
+        ) == [("A",), ("A2",), ("A2x",)]
+
+    @pytest.mark.parametrize("expression, expected", [
+        ("Observation.code.memberOf('http://example.org/vs/expanded')", {"o1": True, "o2": False, "o3": True}),
+        ("Observation.code.memberOf('http://example.org/vs/composed|1.0')", {"o1": False, "o2": True, "o3": False}),
+        ("status.memberOf('http://example.org/vs/statuses')", {"o1": True, "o2": False, "o3": True}),
+        ("Observation.code.subsumes('A2x')", {"o1": False, "o2": True, "o3": False}),
+        ("Observation.code.subsumedBy('A')", {"o1": True, "o2": True, "o3": False}),
+        ("Observation.code.subsumes(Observation.code.coding)", {"o1": True, "o2": True, "o3": False}),
+        ("Observation.code.translate('http://example.org/cm').code", {"o1": ["X1"]}),
+    ])
+    def test_functions_join_the_terminology_tables(self, loaded, expression, expected):
+        dialect, catalog = loaded
+
+        sql = ASTToSQLTranslator(dialect, "Observation", catalog=catalog).translate_to_sql(_ast(expression))
+        rows = dialect.execute_query(sql.rstrip(";"))
+
+        assert {row[0]: json.loads(row[-1]) if isinstance(row[-1], str) else row[-1] for row in rows} == expected
+
+    def test_fhir_concept_maps_load(self, loaded):
+        from fhir4ds.pipeline.operations import TerminologyLoader
+
+        dialect, _ = loaded
+        assert TerminologyLoader(dialect).load_fhir_concept_maps() > 0
+        assert ("H",) in dialect.execute_query(
+            "SELECT target_code FROM fhir4ds_concept_maps WHERE source_system = "
+            "'http://hl7.org/fhir/contact-point-use' AND source_code = 'home'"
+        )
+
+
+def test_terminology_functions_require_a_store():
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+
+    dialect = DuckDBDialect(database=":memory:")
+    with pytest.raises(ValueError, match="TerminologyStore"):
+        ASTToSQLTranslator(dialect, "Observation").translate(_ast("Observation.code.memberOf('http://x')"))
+    with pytest.raises(ValueError, match="not a coded element"):
+        ASTToSQLTranslator(dialect, "Observation", catalog=StorageCatalog(terminology=TerminologyStore())).translate(
+            _ast("Observation.effectiveDateTime.memberOf('http://x')"))
@@ -0,0 +1,185 @@
+"""
+Unit tests for ClosureEvaluator: FHIRPath compiled to closures over one resource.
+"""
+
+from decimal import Decimal
+
+import pytest
+
+from fhir4ds.fhirpath.closures import ClosureEvaluator
+from fhir4ds.fhirpath.exceptions import FHIRPathRuntimeError, FHIRPathTranslationError
+
+PATIENT = {
+    "resourceType": "Patient",
+    "id": "p1",
+    "gender": "male",
+    "birthDate": "1974-12-25",
+    "name": [
+        {"use": "official", "family": "Chalmers", "given": ["Peter", "James"]},
+        {"use": "usual", "given": ["Jim"]},
+    ],
+    "telecom": [{"system": "phone", "value": "(03) 5555 6473"}],
+}
+
+OBSERVATION = {
+    "resourceType": "Observation",
+    "id": "o1",
+    "status": "final",
+    "effectiveDateTime": "2024-03-05T10:30:00Z",
+    "valueQuantity": {"value": 185.5, "unit": "lbs", "code": "[lb_av]"},
+    "extension": [{"url": "http://example.org/age", "valueAge": {"value": 41, "code": "a"}}],
+}
+
+
+@pytest.fixture
+def evaluator():
+    return ClosureEvaluator()
+
+
+class TestNavigation:
+
+    @pytest.mark.parametrize("expression, expected", [
+        ("gender", ["male"]),
+        ("ofType(Patient).gender", ["male"]),
+        ("name.given", ["Peter", "James", "Jim"]),
+        ("name[1].given", ["Jim"]),
+        ("name.where(use = 'official').given.first()", ["Peter"]),
+        ("name.select(given.first())", ["Peter", "Jim"]),
+        ("name.given.count()", [3]),
+        ("deceased.exists()", [False]),
+        ("telecom.where(value.startsWith('(03)')).system", ["phone"]),
+    ])
+    def test_paths(self, evaluator, expression, expected):
+        assert evaluator.evaluate(expression, PATIENT) == expected
+
+    def test_choice_elements_and_decimals(self, evaluator):
+        assert evaluator.evaluate("value.value", OBSERVATION) == [Decimal("185.5")]
+        assert evaluator.evaluate("value.ofType(Quantity).unit", OBSERVATION) == ["lbs"]
+        assert evaluator.evaluate("value is Quantity", OBSERVATION) == [True]
+        assert evaluator.evaluate("value.as(Period)", OBSERVATION) == []
+        assert evaluator.evaluate("extension('http://example.org/age').value is Duration", OBSERVATION) == [False]
+
+    def test_variables(self, evaluator):
+        assert evaluator.evaluate("%resource.id", PATIENT) == ["p1"]
+        assert evaluator.evaluate("gender = %expected", PATIENT, {"expected": "male"}) == [True]
+        assert evaluator.evaluate("%codes.count()", PATIENT, {"codes": ["a", "b"]}) == [2]
+        with pytest.raises(FHIRPathRuntimeError, match="Undefined variable"):
+            evaluator.evaluate("%missing", PATIENT)
+
+
+class TestOperators:
+
+    @pytest.mark.parametrize("expression, expected", [
+        ("1 + 2 * 3", [7]),
+        ("7 / 2", [Decimal("3.5")]),
+        ("7 div 2 = 3 and 7 mod 2 = 1", [True]),
+        ("1 / 0", []),
+        ("'a' & {} & 'b'", ["ab"]),
+        ("(1 | 2 | 2).count()", [2]),
+        ("2 in (1 | 2)", [True]),
+        ("{} = 1", []),
+        ("true or {}", [True]),
+        ("false and {}", [False]),
+        ("{} implies false", []),
+        ("'Abc  def' ~ 'abc def'", [True]),
+        ("1.2 ~ 1.24", [True]),
+        ("4 'g' ~ 4040 'mg'", [True]),
+        ("1 'kg' > 900 'g'", [True]),
+        ("1 year = 1 'a'", []),
+    ])
+    def test_operators(self, evaluator, expression, expected):
+        assert evaluator.evaluate(expression, PATIENT) == expected
+
+    def test_operators_need_single_items(self, evaluator):
+        with pytest.raises(FHIRPathRuntimeError, match="single item"):
+            evaluator.evaluate("name.given + 'x'", PATIENT)
+
+    def test_incompatible_comparison(self, evaluator):
+        with pytest.raises(FHIRPathRuntimeError, match="Cannot compare"):
+            evaluator.evaluate("1 < 'a'", PATIENT)
+
+
+class TestDatesAndTimes:
+
+    @pytest.mark.parametrize("expression, expected", [
+        ("birthDate < @2000-01-01", [True]),
+        ("birthDate = @1974-12-25", [True]),
+        ("birthDate = @1974-12", []),
+        ("@2012-04-15T15:00:00Z = @2012-04-15T10:00:00-05:00", [True]),
+        ("@2012-04-15 + 1 month", ["2012-05-15"]),
+        ("@2012-01-31 + 1 month", ["2012-02-29"]),
+        ("@2012-04-15T10:00:00 - 90 minutes", ["2012-04-15T08:30:00"]),
+        ("@T10:30 + 45 minutes", ["11:15"]),
+        ("effective > @2024-03-05T10:00:00Z", [True]),
+    ])
+    def test_temporal(self, evaluator, expression, expected):
+        resource = OBSERVATION if "effective" in expression else PATIENT
+        assert evaluator.evaluate(expression, resource) == expected
+
+    def test_today(self, evaluator):
+        assert evaluator.evaluate("birthDate <= today()", PATIENT) == [True]
+
+
+class TestFunctions:
+
+    @pytest.mark.parametrize("expression, expected", [
+        ("name.given.distinct().count()", [3]),
+        ("name.given.skip(1).take(1)", ["James"]),
+        ("name.all(given.exists())", [True]),
+        ("name.exists(use = 'nickname')", [False]),
+        ("(1 | 2 | 3).aggregate($this + $total, 0)", [6]),
+        ("(3 | 1 | 2).sort(-$this)", [3, 2, 1]),
+        ("name.sort(family).first().use", ["usual"]),
+        ("iif(gender = 'male', 'm', 'f')", ["m"]),
+        ("name.given.select($index)", [0, 1, 2]),
+        ("'peter'.upper().substring(1, 3)", ["ETE"]),
+        ("'a,b'.split(',').join('|')", ["a|b"]),
+        ("'abc'.replaceMatches('b', 'x')", ["axc"]),
+        ("'aGVsbG8='.decode('base64')", ["hello"]),
+        ("2.5.round()", [Decimal("3")]),
+        ("16.sqrt()", [Decimal("4")]),
+        ("'12'.toInteger() + 1", [13]),
+        ("'5 mg'.convertsToQuantity()", [False]),
+        ("'5 \\'mg\\''.toQuantity()", [{"value": Decimal("5"), "unit": "mg"}]),
+        ("'2024-01'.toDate()", ["2024-01"]),
+        ("1.58700.precision()", [5]),
+    ])
+    def test_functions(self, evaluator, expression, expected):
+        assert evaluator.evaluate(expression, PATIENT) == expected
+
+    def test_single(self, evaluator):
+        with pytest.raises(FHIRPathRuntimeError, match="single"):
+            evaluator.evaluate("name.single()", PATIENT)
+
+
+class TestCompilation:
+
+    @pytest.mark.parametrize("expression", [
+        "subject.resolve()",
+        "code.memberOf('http://hl7.org/fhir/ValueSet/x')",
+        "gender.is(code)",
+        "1.type().name",
+    ])
+    def test_unsupported_constructs_fail_at_compile_time(self, evaluator, expression):
+        assert not evaluator.supports(expression)
+        with pytest.raises(FHIRPathTranslationError):
+            evaluator.compile(expression)
+
+    def test_compiled_expressions_are_cached(self):
+        evaluator = ClosureEvaluator("Patient", cache_size=1)
+
+        first = evaluator.compile("gender")
+        assert evaluator.compile("gender") is first
+        evaluator.compile("birthDate")
+        assert evaluator.compile("gender") is not first
+        assert evaluator.get_statistics() == {"cache_size": 1, "cache_hits": 1, "cache_misses": 3}
+
+        evaluator.clear_cache()
+        assert evaluator.get_statistics()["cache_size"] == 0
+
+    def test_compiled_expression_is_reusable(self):
+        compiled = ClosureEvaluator("Patient").compile("gender = 'male'")
+
+        assert compiled(PATIENT) == [True]
+        assert compiled({**PATIENT, "gender": "female"}) == [False]
+        assert compiled({"resourceType": "Patient"}) == []
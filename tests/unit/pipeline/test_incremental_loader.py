@@ -0,0 +1,196 @@
+"""
+Unit tests for incremental (upsert/CDC) loading on DuckDB.
+"""
+
+import json
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.fhirpath.sql import StorageCatalog
+from fhir4ds.pipeline.operations import IncrementalLoader
+
+
+def _patient(index, version=None, last_updated=None, **fields):
+    meta = {}
+    if version is not None:
+        meta["versionId"] = str(version)
+    if last_updated is not None:
+        meta["lastUpdated"] = last_updated
+    resource = {"resourceType": "Patient", "id": f"p{index}", **fields}
+    if meta:
+        resource["meta"] = meta
+    return resource
+
+
+def _lines(*resources):
+    return [json.dumps(resource).encode() for resource in resources]
+
+
+@pytest.fixture
+def dialect():
+    return DuckDBDialect(database=":memory:")
+
+
+def _stored(dialect, table="Patient"):
+    return {
+        row[0]: row[1] for row in dialect.execute_query(
+            f"SELECT id, json_extract_string(resource, '$.meta.versionId') FROM {table}"
+        )
+    }
+
+
+class TestUpsert:
+
+    def test_first_merge_inserts(self, dialect):
+        result = IncrementalLoader(dialect).merge_resources(_lines(
+            _patient(1, 1, "2024-01-01T00:00:00Z"), _patient(2, 1, "2024-01-01T00:00:00Z"),
+        ))
+
+        assert (result.inserted, result.updated, result.stale) == (2, 0, 0)
+        assert _stored(dialect) == {"p1": "1", "p2": "1"}
+
+    def test_newer_versions_replace_and_older_are_stale(self, dialect):
+        loader = IncrementalLoader(dialect)
+        loader.merge_resources(_lines(_patient(1, 2, "2024-01-02T00:00:00Z"), _patient(2, 2)))
+
+        result = loader.merge_resources(_lines(
+            _patient(1, 3, "2024-01-03T00:00:00Z"),   # newer
+            _patient(2, 1),                           # older replay
+            _patient(3, 1),                           # new resource
+        ))
+
+        assert (result.inserted, result.updated, result.stale) == (1, 1, 1)
+        assert _stored(dialect) == {"p1": "3", "p2": "2", "p3": "1"}
+
+    def test_versions_compare_as_integers(self, dialect):
+        loader = IncrementalLoader(dialect)
+        loader.merge_resources(_lines(_patient(1, 9)))
+
+        loader.merge_resources(_lines(_patient(1, 10)))
+
+        assert _stored(dialect) == {"p1": "10"}
+
+    def test_equal_versions_fall_back_to_last_updated(self, dialect):
+        loader = IncrementalLoader(dialect)
+        loader.merge_resources(_lines(_patient(1, 1, "2024-01-02T00:00:00Z", gender="male")))
+
+        stale = loader.merge_resources(_lines(_patient(1, 1, "2024-01-01T00:00:00Z", gender="female")))
+        newer = loader.merge_resources(_lines(_patient(1, 1, "2024-01-03T00:00:00Z", gender="other")))
+
+        assert (stale.stale, newer.updated) == (1, 1)
+        assert dialect.execute_query(
+            "SELECT json_extract_string(resource, '$.gender') FROM Patient"
+        ) == [("other",)]
+
+    def test_unversioned_resources_take_the_latest_delivery(self, dialect):
+        loader = IncrementalLoader(dialect)
+        loader.merge_resources(_lines(_patient(1, gender="male")))
+
+        result = loader.merge_resources(_lines(_patient(1, gender="female")))
+
+        assert result.updated == 1
+        assert dialect.execute_query(
+            "SELECT json_extract_string(resource, '$.gender') FROM Patient"
+        ) == [("female",)]
+
+    def test_batch_keeps_newest_version_of_each_id(self, dialect):
+        result = IncrementalLoader(dialect).merge_resources(_lines(
+            _patient(1, 2), _patient(1, 5), _patient(1, 3),
+        ))
+
+        assert (result.inserted, result.stale) == (1, 2)
+        assert _stored(dialect) == {"p1": "5"}
+
+    def test_replaying_a_batch_changes_nothing(self, dialect):
+        loader = IncrementalLoader(dialect)
+        batch = _lines(_patient(1, 1), _patient(2, 4))
+        loader.merge_resources(batch)
+
+        result = loader.merge_resources(batch)
+
+        assert (result.inserted, result.updated, result.stale) == (0, 0, 2)
+        assert dialect.execute_query("SELECT COUNT(*) FROM Patient") == [(2,)]
+
+
+class TestHistoryAndDeletes:
+
+    def test_superseded_and_deleted_rows_go_to_history(self, dialect, tmp_path):
+        loader = IncrementalLoader(dialect, history=True)
+        loader.merge_resources(_lines(_patient(1, 1), _patient(2, 1)))
+        loader.merge_resources(_lines(_patient(1, 2)))
+        deleted = tmp_path / "deleted.ndjson"
+        deleted.write_text(json.dumps({
+            "resourceType": "Bundle", "type": "transaction",
+            "entry": [{"request": {"method": "DELETE", "url": "https://example.org/fhir/Patient/p2"}}],
+        }) + "\n")
+
+        result = loader.merge(deleted=deleted)
+
+        assert result.deleted == 1
+        assert _stored(dialect) == {"p1": "2"}
+        assert dialect.execute_query(
+            "SELECT id, version_id, operation FROM fhir4ds_resource_history ORDER BY id"
+        ) == [("p1", "1", "update"), ("p2", "1", "delete")]
+
+    def test_delete_by_id_and_unknown_ids(self, dialect):
+        loader = IncrementalLoader(dialect)
+        loader.merge_resources(_lines(_patient(1), _patient(2)))
+
+        result = loader.delete("Patient", ["p1", "missing"])
+
+        assert result.deleted == 1
+        assert _stored(dialect) == {"p2": None}
+
+    def test_deletes_apply_after_upserts_of_the_batch(self, dialect):
+        result = IncrementalLoader(dialect).merge_resources(_lines(_patient(1, 1)), [("Patient", "p1")])
+
+        assert (result.inserted, result.deleted) == (1, 1)
+        assert _stored(dialect) == {}
+
+    def test_recreation_in_the_next_batch_survives_the_delete(self, dialect):
+        loader = IncrementalLoader(dialect)
+        loader.merge_resources(_lines(_patient(1, 1)), [("Patient", "p1")])
+
+        loader.merge_resources(_lines(_patient(1, 2)))
+
+        assert _stored(dialect) == {"p1": "2"}
+
+    def test_invalid_deletions_are_rejected(self, dialect):
+        with pytest.raises(ValueError, match="Invalid deletion"):
+            IncrementalLoader(dialect).delete("Patient", ["p1'; DROP TABLE Patient; --"])
+
+
+class TestWatermarks:
+
+    def test_high_water_mark_only_moves_forward(self, dialect):
+        loader = IncrementalLoader(dialect)
+        first = loader.merge_resources(_lines(
+            _patient(1, 1, "2024-01-05T00:00:00Z"), _patient(2, 1, "2024-01-03T00:00:00Z"),
+        ))
+        loader.merge_resources(_lines(_patient(3, 1, "2024-01-04T00:00:00Z")))
+
+        assert first.watermarks == {"Patient": "2024-01-05T00:00:00Z"}
+        assert loader.watermark("Patient") == "2024-01-05T00:00:00Z"
+        assert loader.watermark("Observation") is None
+
+        loader.merge_resources(_lines(_patient(4, 1, "2024-01-06T00:00:00Z")))
+        assert loader.watermarks() == {"Patient": "2024-01-06T00:00:00Z"}
+
+
+def test_merge_into_partitioned_catalog(dialect):
+    catalog = StorageCatalog.partitioned(key_columns={"subject_ref": "subject.reference"})
+    loader = IncrementalLoader(dialect, catalog=catalog)
+    observation = {"resourceType": "Observation", "id": "p1", "meta": {"versionId": "1"},
+                   "subject": {"reference": "Patient/p1"}}
+    loader.merge_resources(_lines(_patient(1, 1), observation))
+
+    result = loader.merge_resources(_lines(_patient(1, 2)))
+
+    assert result.updated == 1
+    assert sorted(dialect.execute_query(
+        "SELECT resource_type, id, json_extract_string(resource, '$.meta.versionId'), subject_ref "
+        "FROM fhir_resources"
+    )) == [("Observation", "p1", "1", "Patient/p1"), ("Patient", "p1", "2", None)]
@@ -0,0 +1,89 @@
+"""
+Unit tests for the NDJSON bulk loader on DuckDB.
+"""
+
+import gzip
+import json
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.pipeline.operations import NDJSONLoader
+from fhir4ds.sql import SQLGenerator
+
+
+def _write_ndjson(path, resources, compress=False):
+    payload = "".join(json.dumps(resource) + "\n" for resource in resources)
+    if compress:
+        with gzip.open(path, "wt") as handle:
+            handle.write(payload)
+    else:
+        path.write_text(payload)
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    _write_ndjson(tmp_path / "Patient.ndjson", [
+        {"resourceType": "Patient", "id": "p1", "gender": "female"},
+        {"resourceType": "Patient", "id": "p2", "gender": "male"},
+    ])
+    # Mixed file: routing is by resourceType, not by file name
+    _write_ndjson(tmp_path / "mixed.ndjson.gz", [
+        {"resourceType": "Observation", "id": "o1", "subject": {"reference": "Patient/p1"}},
+        {"resourceType": "Patient", "id": "p3"},
+        {"id": "no-type"},
+    ], compress=True)
+    (tmp_path / "README.txt").write_text("not ndjson")
+    return tmp_path
+
+
+@pytest.fixture
+def dialect():
+    return DuckDBDialect(database=":memory:")
+
+
+class TestNDJSONLoader:
+    """Directory loads routed into per-type tables."""
+
+    def test_routes_by_resource_type(self, dialect, export_dir):
+        result = NDJSONLoader(dialect).load(export_dir)
+
+        assert len(result.files) == 2
+        assert result.rows_by_type == {"Patient": 3, "Observation": 1}
+        assert result.skipped == 1
+        assert result.rows_per_second > 0
+        assert sorted(dialect.execute_query("SELECT id FROM Patient")) == [("p1",), ("p2",), ("p3",)]
+        assert not dialect.execute_query(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = 'fhir4ds_ndjson_staging'"
+        )
+
+    def test_loaded_tables_feed_view_definitions(self, dialect, export_dir):
+        NDJSONLoader(dialect).load(export_dir)
+
+        sql = SQLGenerator(dialect).generate_sql({
+            "resource": "Patient",
+            "select": [{"column": [{"name": "id", "path": "id"}, {"name": "gender", "path": "gender"}]}],
+        })
+        assert sorted(dialect.execute_query(sql), key=str) == [("p1", "female"), ("p2", "male"), ("p3", None)]
+
+    def test_resource_type_filter_and_replace(self, dialect, export_dir):
+        loader = NDJSONLoader(dialect)
+        loader.load(export_dir / "Patient.ndjson")
+        result = loader.load(export_dir, resource_types=["Patient"], replace=True)
+
+        assert result.rows_by_type == {"Patient": 3}
+        assert result.skipped == 2
+        assert dialect.execute_query("SELECT COUNT(*) FROM Patient") == [(3,)]
+
+    def test_appends_by_default(self, dialect, export_dir):
+        loader = NDJSONLoader(dialect)
+        loader.load(export_dir / "Patient.ndjson")
+        loader.load(export_dir / "Patient.ndjson")
+
+        assert dialect.execute_query("SELECT COUNT(*) FROM Patient") == [(4,)]
+
+    def test_missing_source(self, dialect, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            NDJSONLoader(dialect).load(tmp_path / "absent.ndjson")
@@ -0,0 +1,108 @@
+"""
+Unit tests for the hive-partitioned Parquet resource store on DuckDB.
+"""
+
+import json
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.fhirpath.sql import FHIRPathExecutor
+from fhir4ds.pipeline.operations import ParquetStore
+from fhir4ds.sql import SQLGenerator
+
+RESOURCES = [
+    {"resourceType": "Patient", "id": "p1", "meta": {"lastUpdated": "2024-01-01T00:00:00Z"}},
+    {"resourceType": "Patient", "id": "p2"},
+    {"resourceType": "Observation", "id": "o1", "status": "final", "subject": {"reference": "Patient/p1"}},
+    {"resourceType": "Observation", "id": "o2", "status": "final", "subject": {"reference": "Patient/p2"}},
+    {"id": "no-type"},
+]
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    path = tmp_path / "export.ndjson"
+    path.write_text("".join(json.dumps(resource) + "\n" for resource in RESOURCES))
+    return path
+
+
+@pytest.fixture
+def dialect():
+    return DuckDBDialect(database=":memory:")
+
+
+@pytest.fixture
+def store(tmp_path, dialect, export_file):
+    store = ParquetStore(tmp_path / "lake", dialect)
+    store.convert(export_file, ingest_date="2024-05-01")
+    return store
+
+
+class TestConvert:
+
+    def test_writes_hive_layout(self, tmp_path, dialect, export_file):
+        store = ParquetStore(tmp_path / "lake", dialect)
+
+        result = store.convert(export_file, ingest_date="2024-05-01")
+
+        assert result.rows_by_type == {"Patient": 2, "Observation": 2}
+        assert result.skipped == 1
+        assert store.resource_types() == ["Observation", "Patient"]
+        assert len(list((tmp_path / "lake" / "resource_type=Patient" / "ingest_date=2024-05-01").glob("*.parquet"))) == 1
+
+    def test_files_hold_raw_json_and_key_columns(self, tmp_path, store):
+        rows = store.dialect.execute_query(
+            f"SELECT id, subject_ref, last_updated, json_extract_string(resource, '$.status') "
+            f"FROM read_parquet('{tmp_path}/lake/resource_type=Observation/*/*.parquet') ORDER BY id"
+        )
+
+        assert rows == [("o1", "Patient/p1", None, "final"), ("o2", "Patient/p2", None, "final")]
+
+    def test_converting_again_appends_a_partition(self, tmp_path, store, export_file):
+        store.convert(export_file, ingest_date="2024-05-02", resource_types=["Observation"])
+
+        catalog = store.catalog()
+        assert store.dialect.execute_query(f"SELECT COUNT(*) FROM {catalog.relation('Observation', store.dialect)}") == [(4,)]
+        latest = store.catalog(ingest_dates=["2024-05-02"])
+        assert store.dialect.execute_query(f"SELECT COUNT(*) FROM {latest.relation('Observation', store.dialect)}") == [(2,)]
+        with pytest.raises(ValueError):
+            latest.resolve("Patient")
+
+    def test_rejects_malformed_ingest_date(self, store, export_file):
+        with pytest.raises(ValueError, match="YYYY-MM-DD"):
+            store.convert(export_file, ingest_date="May 1")
+
+    def test_rejects_invalid_key_columns(self, tmp_path, dialect):
+        with pytest.raises(ValueError):
+            ParquetStore(tmp_path, dialect, key_columns={"code": "code.coding[0]"})
+
+
+class TestQueryInPlace:
+
+    def test_executor_reads_only_its_type(self, store):
+        details = FHIRPathExecutor(store.dialect, "Observation", catalog=store.catalog()).execute_with_details("id")
+
+        assert sorted(row[0] for row in details["results"]) == ["o1", "o2"]
+        assert "resource_type=Observation" in details["sql"]
+        assert "resource_type=Patient" not in details["sql"]
+
+    def test_unreferenced_key_columns_are_not_projected(self, store):
+        details = FHIRPathExecutor(store.dialect, "Observation", catalog=store.catalog()).execute_with_details("id")
+
+        assert "SELECT id, resource FROM read_parquet(" in details["sql"]
+
+    def test_view_over_parquet(self, store):
+        sql = SQLGenerator(store.dialect, catalog=store.catalog()).generate_sql({
+            "resource": "Observation",
+            "select": [{"column": [{"name": "id", "path": "id"},
+                                   {"name": "subject", "path": "subject.reference"}]}],
+        })
+
+        assert sorted(store.dialect.execute_query(sql)) == [("o1", "Patient/p1"), ("o2", "Patient/p2")]
+
+    def test_parquet_storage_is_read_only_for_loaders(self, store):
+        with pytest.raises(ValueError, match="Parquet"):
+            store.catalog().create_statements(store.dialect, "Patient")
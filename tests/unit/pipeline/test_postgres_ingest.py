@@ -0,0 +1,125 @@
+"""
+Unit tests for the PostgreSQL ingestor's binary COPY framing.
+"""
+
+import json
+import os
+import struct
+
+import pytest
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.pipeline.operations.postgres_ingest import (
+    PostgreSQLIngestor,
+    _binary_copy_payload,
+    _numbered_batches,
+)
+
+CONN_STRING = os.environ.get("FHIR4DS_POSTGRESQL_CONN_STRING")
+SCHEMA = "fhir4ds_ingest_test"
+
+
+@pytest.fixture
+def postgresql():
+    """PostgreSQL dialect working in a scratch schema, dropped afterwards."""
+    if not CONN_STRING:
+        pytest.skip("FHIR4DS_POSTGRESQL_CONN_STRING is not set")
+    pytest.importorskip("psycopg2")
+    from fhir4ds.dialects.postgresql import PostgreSQLDialect
+
+    admin = PostgreSQLDialect(CONN_STRING, pool_size=1)
+    admin.execute_query(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    admin.execute_query(f"CREATE SCHEMA {SCHEMA}")
+    separator = "&" if "?" in CONN_STRING else "?"
+    dialect = PostgreSQLDialect(f"{CONN_STRING}{separator}options=-csearch_path%3D{SCHEMA}", pool_size=2)
+    yield dialect
+    dialect.close_all_connections()
+    admin.execute_query(f"DROP SCHEMA {SCHEMA} CASCADE")
+    admin.close_all_connections()
+
+
+def _lines(*resources):
+    return [json.dumps(resource).encode() for resource in resources]
+
+
+def test_binary_copy_payload_layout():
+    payload = _binary_copy_payload([(7, b'{"id":"a"}')])
+
+    assert payload.startswith(b"PGCOPY\n\xff\r\n\x00" + b"\x00" * 8)
+    assert payload.endswith(b"\xff\xff")
+    body = payload[19:-2]
+    field_count, seq_length, seq, json_length = struct.unpack(">hiqi", body[:18])
+    assert (field_count, seq_length, seq) == (2, 8, 7)
+    # jsonb binary input is a version byte followed by the JSON text
+    assert body[18:] == b'\x01{"id":"a"}'
+    assert json_length == len(body[18:])
+
+
+def test_numbered_batches_skip_blank_lines_and_keep_order():
+    lines = [b'{"a":1}\n', b"\n", b'{"a":2}\n', b'{"a":3}']
+
+    assert list(_numbered_batches(lines, 2)) == [
+        [(0, b'{"a":1}'), (2, b'{"a":2}')],
+        [(3, b'{"a":3}')],
+    ]
+
+
+def test_requires_postgresql_dialect():
+    pytest.importorskip("duckdb")
+    with pytest.raises(ValueError):
+        PostgreSQLIngestor(DuckDBDialect(database=":memory:"))
+
+
+def test_reserved_type_names_use_the_catalog_table(postgresql):
+    group = {"resourceType": "Group", "id": "g1", "type": "person", "actual": True}
+
+    result = PostgreSQLIngestor(postgresql, workers=2).ingest_lines(_lines(group))
+
+    assert result.rows_by_type == {"Group": 1}
+    assert postgresql.execute_query("SELECT id FROM Group_resources") == [("g1",)]
+
+
+def _observation(status, code, subject="Patient/p1"):
+    return {"resourceType": "Observation", "id": "o1", "status": status, "subject": {"reference": subject},
+            "code": {"coding": [{"system": "http://loinc.org", "code": code}]}}
+
+
+def test_catalog_columns_side_tables_and_indexes_follow_reingest(postgresql):
+    from fhir4ds.fhirpath.sql import (
+        CompartmentIndex, ExtractedColumn, ExtractionProfile, SideTable, StorageCatalog,
+    )
+
+    catalog = StorageCatalog(
+        profile=ExtractionProfile(
+            columns={"Observation": [ExtractedColumn("status", ("status",))]},
+            side_tables={"Observation": [SideTable("coding", "code.coding", (("system", "system"), ("code", "code")))]},
+        ),
+        compartment_index=CompartmentIndex.from_compartment_definition(resource_types=["Patient", "Observation"]),
+    )
+    ingestor = PostgreSQLIngestor(postgresql, workers=2, catalog=catalog)
+    patients = [{"resourceType": "Patient", "id": "p1"}, {"resourceType": "Patient", "id": "p2"}]
+
+    ingestor.ingest_lines(_lines(*patients, _observation("preliminary", "1234-5")))
+    ingestor.ingest_lines(_lines(_observation("final", "2345-7", subject="Patient/p2")))
+
+    assert postgresql.execute_query("SELECT id, status FROM Observation") == [("o1", "final")]
+    assert postgresql.execute_query("SELECT id, code FROM Observation_coding") == [("o1", "2345-7")]
+    assert postgresql.execute_query(
+        "SELECT patient_id FROM fhir4ds_compartments WHERE resource_type = 'Observation'") == [("p2",)]
+
+
+def test_partitioned_catalog(postgresql):
+    from fhir4ds.fhirpath.sql import StorageCatalog
+
+    catalog = StorageCatalog.partitioned()
+    ingestor = PostgreSQLIngestor(postgresql, workers=2, catalog=catalog)
+    mapping = catalog.resolve("Observation")
+
+    ingestor.ingest_lines(_lines({"resourceType": "Patient", "id": "o1"}, _observation("preliminary", "1234-5")))
+    result = ingestor.ingest_lines(_lines(_observation("final", "1234-5")))
+
+    assert result.rows_by_type == {"Observation": 1}
+    rows = postgresql.execute_query(
+        f"SELECT {mapping.type_column}, {mapping.id_column}, {mapping.resource_column}->>'status' "
+        f"FROM {mapping.table} ORDER BY 1")
+    assert rows == [("Observation", "o1", "final"), ("Patient", "o1", None)]
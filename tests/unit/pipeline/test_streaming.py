@@ -0,0 +1,101 @@
+"""
+Unit tests for the streaming Bundle/NDJSON readers.
+"""
+
+import gzip
+import io
+import json
+
+import pytest
+
+from fhir4ds.pipeline.fhir import BundleFormatError, iter_bundle_resources, iter_resources
+
+
+RESOURCES = [
+    {"resourceType": "Patient", "id": "p1", "name": [{"family": "O'Brien \"Jr\" [x] {y}"}]},
+    {"resourceType": "Observation", "id": "o1", "note": [{"text": "a\\\\b\\\"c\\n"}], "valueBoolean": True},
+    {"resourceType": "Patient", "id": "p2", "text": {"div": "ü" * 500}},
+]
+
+BUNDLE = {
+    "resourceType": "Bundle",
+    "type": "collection",
+    "meta": {"tag": [{"code": "entry"}]},
+    "entry": [
+        {"fullUrl": "urn:uuid:1", "resource": RESOURCES[0]},
+        {"request": {"method": "DELETE", "url": "Patient/p0"}},
+        {"resource": RESOURCES[1], "search": {"mode": "match"}},
+        {"resource": RESOURCES[2]},
+    ],
+    "total": 3,
+}
+
+
+class _CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_bundle_resources_match_json_load(chunk_size, indent):
+    data = json.dumps(BUNDLE, indent=indent, ensure_ascii=False).encode("utf-8")
+
+    raw = list(iter_bundle_resources(io.BytesIO(data), chunk_size))
+
+    assert [json.loads(resource) for resource in raw] == RESOURCES
+    assert all(b"\n" not in resource for resource in raw)
+
+
+def test_memory_is_bounded_by_entries():
+    entries = [{"resource": {"resourceType": "Patient", "id": str(i), "pad": "x" * 1000}} for i in range(1000)]
+    stream = _CountingStream(json.dumps({"resourceType": "Bundle", "entry": entries}).encode())
+
+    first = next(iter_bundle_resources(stream, chunk_size=4096))
+
+    assert json.loads(first)["id"] == "0"
+    assert stream.bytes_read <= 2 * 4096
+
+
+@pytest.mark.parametrize("data", [
+    b'["not", "a", "bundle"]',
+    b'{"resourceType": "Bundle", "entry": [{"resource": {"id": "x"',
+    b'{"resourceType": "Bundle", "entry": [{"resource": {"id": "x}}]}',
+])
+def test_malformed_bundles_raise(data):
+    with pytest.raises(BundleFormatError):
+        list(iter_bundle_resources(io.BytesIO(data), 8))
+
+
+def test_iter_resources_dispatches_on_suffix(tmp_path):
+    bundle = tmp_path / "bundle.json.gz"
+    with gzip.open(bundle, "wb") as handle:
+        handle.write(json.dumps(BUNDLE).encode())
+    ndjson = tmp_path / "resources.ndjson"
+    ndjson.write_text("\n".join(json.dumps(r) for r in RESOURCES) + "\n\n")
+
+    assert [json.loads(r) for r in iter_resources(bundle)] == RESOURCES
+    assert [json.loads(r) for r in iter_resources(ndjson)] == RESOURCES
+
+
+def test_streamed_resources_load_into_duckdb(tmp_path):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    bundle = tmp_path / "bundle.json"
+    bundle.write_text(json.dumps(BUNDLE, indent=2))
+    dialect = DuckDBDialect(database=":memory:")
+
+    result = NDJSONLoader(dialect).load_resources(iter_resources(bundle))
+
+    assert result.rows_by_type == {"Patient": 2, "Observation": 1}
+    assert dialect.execute_query(
+        "SELECT json_extract_string(resource, '$.note[0].text') FROM Observation"
+    ) == [(RESOURCES[1]["note"][0]["text"],)]
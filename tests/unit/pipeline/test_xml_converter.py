@@ -0,0 +1,280 @@
+"""
+Unit tests for the streaming FHIR XML to JSON converter.
+"""
+
+import gzip
+import io
+import json
+import tracemalloc
+from decimal import Decimal
+
+import pytest
+
+from fhir4ds.fhirpath.types.structure_loader import StructureDefinitionLoader
+from fhir4ds.pipeline.converters import ElementIndex, XMLToJSONConverter
+from fhir4ds.pipeline.converters.xml_to_json import DEFAULT_DEFINITIONS_PATH
+
+
+def _definition(path, type_code, max_card="1"):
+    return {"path": path, "type": type_code, "max": max_card, "is_array": max_card == "*",
+            "content_reference": None}
+
+
+# Resource-level definitions on top of the shipped datatype definitions
+RESOURCE_DEFINITIONS = [
+    _definition("Patient.active", "boolean"),
+    _definition("Patient.name", "HumanName", "*"),
+    _definition("Patient.birthDate", "date"),
+    _definition("Patient.multipleBirth[x]", "boolean"),
+    _definition("Patient.contact", "BackboneElement", "*"),
+    _definition("Patient.contact.name", "HumanName"),
+    _definition("Organization.name", "string"),
+    _definition("Observation.value[x]", "Quantity"),
+    _definition("Observation.component", "BackboneElement", "*"),
+    _definition("Observation.component.value[x]", "Quantity"),
+    _definition("Bundle.total", "unsignedInt"),
+    _definition("Bundle.entry", "BackboneElement", "*"),
+    _definition("Bundle.entry.resource", "Resource"),
+]
+
+
+@pytest.fixture(scope="module")
+def converter():
+    loader = StructureDefinitionLoader(DEFAULT_DEFINITIONS_PATH)
+    loader.load_all_definitions()
+    definitions = loader.extract_element_definitions()
+    definitions.update({definition["path"]: definition for definition in RESOURCE_DEFINITIONS})
+    return XMLToJSONConverter(index=ElementIndex(definitions))
+
+
+def _xml(body):
+    return io.BytesIO(f'<?xml version="1.0" encoding="UTF-8"?>{body}'.encode("utf-8"))
+
+
+def _convert(converter, body):
+    return json.loads(converter.convert(_xml(body)))
+
+
+PATIENT = """
+<Patient xmlns="http://hl7.org/fhir">
+  <id value="p1"/>
+  <extension url="http://example.org/ext">
+    <valueInteger value="7"/>
+  </extension>
+  <active value="true"/>
+  <name>
+    <family value="O'Brien &quot;Jr&quot;"/>
+    <given value="Peter"/>
+  </name>
+  <birthDate value="1974-12-25">
+    <extension url="http://hl7.org/fhir/StructureDefinition/patient-birthTime">
+      <valueDateTime value="1974-12-25T14:35:45-05:00"/>
+    </extension>
+  </birthDate>
+  <multipleBirthBoolean value="false"/>
+  <contact>
+    <name><text value="Bénédicte"/></name>
+  </contact>
+</Patient>
+"""
+
+
+class TestTyping:
+    """Cardinality and primitive typing from the element index."""
+
+    def test_patient(self, converter):
+        assert _convert(converter, PATIENT) == {
+            "resourceType": "Patient",
+            "id": "p1",
+            "extension": [{"url": "http://example.org/ext", "valueInteger": 7}],
+            "active": True,
+            "name": [{"family": "O'Brien \"Jr\"", "given": ["Peter"]}],
+            "birthDate": "1974-12-25",
+            "_birthDate": {"extension": [{
+                "url": "http://hl7.org/fhir/StructureDefinition/patient-birthTime",
+                "valueDateTime": "1974-12-25T14:35:45-05:00",
+            }]},
+            "multipleBirthBoolean": False,
+            "contact": [{"name": {"text": "Bénédicte"}}],
+        }
+
+    def test_resource_type_comes_first(self, converter):
+        assert converter.convert(_xml(PATIENT)).startswith(b'{"resourceType":"Patient",')
+
+    def test_decimal_keeps_lexical_precision(self, converter):
+        raw = converter.convert(_xml(
+            '<Observation xmlns="http://hl7.org/fhir"><valueQuantity>'
+            '<value value="185.50"/><unit value="lbs"/></valueQuantity></Observation>'
+        ))
+
+        resource = json.loads(raw, parse_float=Decimal)
+        assert resource["valueQuantity"] == {"value": Decimal("185.50"), "unit": "lbs"}
+        assert str(resource["valueQuantity"]["value"]) == "185.50"
+
+    def test_invalid_numbers_stay_strings(self, converter):
+        resource = _convert(converter, (
+            '<Observation xmlns="http://hl7.org/fhir"><valueQuantity>'
+            '<value value="1,5"/></valueQuantity></Observation>'
+        ))
+
+        assert resource["valueQuantity"] == {"value": "1,5"}
+
+    def test_primitive_array_extensions_are_aligned(self, converter):
+        resource = _convert(converter, (
+            '<Patient xmlns="http://hl7.org/fhir"><name>'
+            '<given value="A"/>'
+            '<given id="g2"><extension url="http://example.org/absent"><valueCode value="masked"/></extension></given>'
+            '<given value="C"/>'
+            '</name></Patient>'
+        ))
+
+        assert resource["name"] == [{
+            "given": ["A", None, "C"],
+            "_given": [None, {"id": "g2", "extension": [
+                {"url": "http://example.org/absent", "valueCode": "masked"}
+            ]}, None],
+        }]
+
+    def test_undescribed_resources_are_rejected(self, converter):
+        with pytest.raises(ValueError, match="no definitions for 'Basic'"):
+            _convert(converter, '<Basic xmlns="http://hl7.org/fhir"><flag value="true"/></Basic>')
+
+    def test_unknown_elements_follow_xml_shape(self, converter, caplog):
+        lenient = XMLToJSONConverter(index=converter.index, strict=False)
+        resource = _convert(lenient, (
+            '<Basic xmlns="http://hl7.org/fhir">'
+            '<code><text value="x"/></code>'
+            '<note><text value="a"/></note><note><text value="b"/></note>'
+            '<flag value="true"/>'
+            '</Basic>'
+        ))
+
+        assert resource == {
+            "resourceType": "Basic",
+            "code": {"text": "x"},
+            "note": [{"text": "a"}, {"text": "b"}],
+            "flag": "true",
+        }
+        assert "no definitions for 'Basic'" in caplog.text
+        assert "No definition for element 'flag'" in caplog.text
+
+
+class TestStructure:
+    """Narrative, contained resources and Bundles."""
+
+    def test_narrative_div_is_serialized(self, converter):
+        resource = _convert(converter, (
+            '<Patient xmlns="http://hl7.org/fhir"><text><status value="generated"/>'
+            '<div xmlns="http://www.w3.org/1999/xhtml"><p class="x">A &amp; <b>B</b> &lt;c&gt;</p></div>'
+            '</text><active value="true"/></Patient>'
+        ))
+
+        assert resource["text"] == {
+            "status": "generated",
+            "div": '<div xmlns="http://www.w3.org/1999/xhtml"><p class="x">A &amp; <b>B</b> &lt;c&gt;</p></div>',
+        }
+        assert resource["active"] is True
+
+    def test_contained_resources(self, converter):
+        resource = _convert(converter, (
+            '<Patient xmlns="http://hl7.org/fhir">'
+            '<contained><Organization><id value="org"/><name value="Acme"/></Organization></contained>'
+            '<active value="false"/></Patient>'
+        ))
+
+        assert resource["contained"] == [{"resourceType": "Organization", "id": "org", "name": "Acme"}]
+        assert resource["active"] is False
+
+    def test_bundle_is_unbundled(self, converter):
+        bundle = _xml(
+            '<Bundle xmlns="http://hl7.org/fhir"><type value="collection"/>'
+            '<entry><fullUrl value="urn:uuid:1"/><resource><Patient><id value="p1"/></Patient></resource></entry>'
+            '<entry><request><method value="DELETE"/></request></entry>'
+            '<entry><resource><Bundle><type value="batch"/></Bundle></resource></entry>'
+            '</Bundle>'
+        )
+
+        resources = [json.loads(raw) for raw in converter.iter_resources(bundle)]
+
+        assert resources == [
+            {"resourceType": "Patient", "id": "p1"},
+            {"resourceType": "Bundle", "type": "batch"},
+        ]
+
+    def test_bundle_kept_whole_without_unbundling(self, converter):
+        bundle = converter.convert(_xml(
+            '<Bundle xmlns="http://hl7.org/fhir"><type value="collection"/><total value="1"/>'
+            '<entry><resource><Patient><id value="p1"/></Patient></resource></entry></Bundle>'
+        ))
+
+        assert json.loads(bundle) == {
+            "resourceType": "Bundle",
+            "type": "collection",
+            "total": 1,
+            "entry": [{"resource": {"resourceType": "Patient", "id": "p1"}}],
+        }
+
+    def test_memory_is_bounded_by_resources(self, converter):
+        entry = '<entry><resource><Patient><id value="{}"/><name><family value="{}"/></name></Patient></resource></entry>'
+        body = "".join(entry.format(i, "x" * 200) for i in range(5000))
+        bundle = _xml(f'<Bundle xmlns="http://hl7.org/fhir">{body}</Bundle>')
+
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in converter.iter_resources(bundle))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        assert count == 5000
+        assert peak < 1 << 20
+
+    def test_gzip_file_to_ndjson(self, converter, tmp_path):
+        source = tmp_path / "patient.xml.gz"
+        with gzip.open(source, "wb") as handle:
+            handle.write(_xml(PATIENT).getvalue())
+
+        assert converter.convert_file(source, tmp_path / "patient.ndjson") == 1
+        lines = (tmp_path / "patient.ndjson").read_bytes().splitlines()
+        assert json.loads(lines[0])["id"] == "p1"
+
+
+def test_shipped_definitions_type_datatypes():
+    index = ElementIndex.load()
+
+    assert index.child("HumanName", "given").is_array is True
+    assert index.child("Quantity", "value").type_code == "decimal"
+    assert index.child("Extension", "valueBoolean").type_code == "boolean"
+    assert index.child("Timing", "repeat").context == "Timing.repeat"
+
+
+SHIPS_RESOURCE_DEFINITIONS = (DEFAULT_DEFINITIONS_PATH / "profiles-resources.json").exists()
+
+
+@pytest.mark.skipif(not SHIPS_RESOURCE_DEFINITIONS, reason="profiles-resources.json is not installed")
+def test_default_index_types_resource_elements():
+    resource = json.loads(XMLToJSONConverter().convert(_xml(PATIENT)))
+
+    assert resource["name"] == [{"family": "O'Brien \"Jr\"", "given": ["Peter"]}]
+    assert resource["active"] is True
+
+
+@pytest.mark.skipif(SHIPS_RESOURCE_DEFINITIONS, reason="profiles-resources.json is installed")
+def test_default_index_rejects_resources_without_definitions():
+    with pytest.raises(ValueError, match="profiles-resources.json"):
+        XMLToJSONConverter().convert(_xml(PATIENT))
+
+
+def test_load_into_duckdb(converter):
+    pytest.importorskip("duckdb")
+    from fhir4ds.dialects.duckdb import DuckDBDialect
+    from fhir4ds.pipeline.operations import NDJSONLoader
+
+    dialect = DuckDBDialect(database=":memory:")
+    result = NDJSONLoader(dialect).load_resources(converter.iter_resources(_xml(PATIENT)))
+
+    assert result.rows_by_type == {"Patient": 1}
+    assert dialect.execute_query(
+        "SELECT json_extract_string(resource, '$.name[0].given[0]'), "
+        "json_extract(resource, '$.active') FROM Patient"
+    ) == [("Peter", "true")]
@@ -0,0 +1,77 @@
+"""
+Unit tests for COPY-based export of ViewDefinition results on DuckDB.
+"""
+
+import json
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.sql import SQLGenerator
+from fhir4ds.sql.exceptions import SQLGenerationError
+
+
+VIEW = {
+    "resource": "Patient",
+    "select": [{"column": [
+        {"name": "id", "path": "id"},
+        {"name": "gender", "path": "gender"},
+    ]}],
+}
+
+
+@pytest.fixture
+def dialect():
+    dialect = DuckDBDialect(database=":memory:")
+    dialect.connection.execute("CREATE TABLE Patient (resource JSON)")
+    for pid, gender in [("p1", "female"), ("p2", "male"), ("p3", "female")]:
+        dialect.connection.execute(
+            "INSERT INTO Patient VALUES (?)",
+            [json.dumps({"resourceType": "Patient", "id": pid, "gender": gender})],
+        )
+    return dialect
+
+
+class TestExport:
+    """Round trips through the exported files."""
+
+    def test_partitioned_parquet(self, dialect, tmp_path):
+        destination = str(tmp_path / "patients")
+        SQLGenerator(dialect).export(
+            VIEW, destination, partition_by=["gender"], row_group_size=1000, compression="zstd"
+        )
+
+        assert sorted(p.name for p in (tmp_path / "patients").iterdir()) == ["gender=female", "gender=male"]
+        rows = dialect.execute_query(
+            f"SELECT id, gender FROM read_parquet('{destination}/*/*.parquet', hive_partitioning = true) ORDER BY id"
+        )
+        assert rows == [("p1", "female"), ("p2", "male"), ("p3", "female")]
+
+    def test_csv(self, dialect, tmp_path):
+        destination = str(tmp_path / "patients.csv")
+        SQLGenerator(dialect).export(VIEW, destination, format="csv")
+
+        assert (tmp_path / "patients.csv").read_text().splitlines()[0] == "id,gender"
+        assert len(dialect.execute_query(f"SELECT * FROM read_csv('{destination}')")) == 3
+
+    def test_gzipped_ndjson(self, dialect, tmp_path):
+        destination = str(tmp_path / "patients.ndjson.gz")
+        SQLGenerator(dialect).export(VIEW, destination, format="ndjson", compression="gzip")
+
+        rows = dialect.execute_query(f"SELECT id FROM read_json('{destination}') ORDER BY id")
+        assert rows == [("p1",), ("p2",), ("p3",)]
+
+    def test_unknown_partition_column(self, dialect, tmp_path):
+        with pytest.raises(SQLGenerationError):
+            SQLGenerator(dialect).export(VIEW, str(tmp_path / "out"), partition_by=["birthDate"])
+
+    @pytest.mark.parametrize("options", [
+        {"format": "xlsx"},
+        {"format": "csv", "row_group_size": 10},
+        {"compression": "gzip; DROP TABLE Patient"},
+    ])
+    def test_invalid_options(self, dialect, tmp_path, options):
+        with pytest.raises(ValueError):
+            SQLGenerator(dialect).export(VIEW, str(tmp_path / "out"), **options)
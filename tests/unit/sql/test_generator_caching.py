@@ -0,0 +1,132 @@
+"""
+Unit tests for SQLGenerator component reuse and the generated SQL cache.
+"""
+
+import copy
+
+import pytest
+
+from fhir4ds.sql.generator import SQLGenerator
+
+
+def _view(path="id"):
+    return {
+        "resource": "Patient",
+        "select": [
+            {"column": [{"name": "value", "path": path}]},
+            {"forEach": "name", "column": [{"name": "family", "path": "family"}]},
+        ],
+    }
+
+
+class TestSQLCache:
+    """Tests for the canonical-hash LRU cache of generated SQL."""
+
+    def test_repeated_view_hits_cache(self):
+        generator = SQLGenerator()
+        first = generator.generate_sql(_view())
+        second = generator.generate_sql(_view())
+
+        assert first == second
+        stats = generator.get_statistics()
+        assert stats["cache_hits"] == 1
+        assert stats["cache_misses"] == 1
+        assert stats["generation_count"] == 2
+
+    def test_key_ignores_dict_ordering(self):
+        generator = SQLGenerator()
+        view = _view()
+        reordered = {"select": copy.deepcopy(view["select"]), "resource": "Patient"}
+        reordered["select"][0]["column"][0] = {"path": "id", "name": "value"}
+
+        generator.generate_sql(view)
+        generator.generate_sql(reordered)
+
+        assert generator.get_statistics()["cache_hits"] == 1
+
+    def test_different_views_do_not_collide(self):
+        generator = SQLGenerator()
+        assert generator.generate_sql(_view("id")) != generator.generate_sql(_view("gender"))
+        assert generator.get_statistics()["cache_hits"] == 0
+
+    def test_constants_are_part_of_key(self):
+        generator = SQLGenerator()
+        view = _view("identifier.where(system = %SYS).value")
+        a = dict(view, constant=[{"name": "SYS", "valueString": "a"}])
+        b = dict(view, constant=[{"name": "SYS", "valueString": "b"}])
+
+        assert generator.generate_sql(a) != generator.generate_sql(b)
+
+    def test_lru_eviction(self):
+        generator = SQLGenerator(cache_size=2)
+        generator.generate_sql(_view("id"))
+        generator.generate_sql(_view("gender"))
+        generator.generate_sql(_view("id"))          # refresh "id"
+        generator.generate_sql(_view("birthDate"))   # evicts "gender"
+
+        assert generator.get_statistics()["cache_size"] == 2
+        generator.generate_sql(_view("id"))
+        assert generator.get_statistics()["cache_hits"] == 2
+        generator.generate_sql(_view("gender"))
+        assert generator.get_statistics()["cache_hits"] == 2
+
+    def test_cache_disabled(self):
+        generator = SQLGenerator(cache_size=0)
+        generator.generate_sql(_view())
+        generator.generate_sql(_view())
+
+        stats = generator.get_statistics()
+        assert stats["cache_size"] == 0
+        assert stats["cache_hits"] == 0
+
+    def test_cache_hits_with_catalog_skip_validation(self, monkeypatch):
+        from fhir4ds.fhirpath.sql import StorageCatalog
+        from fhir4ds.sql import generator as generator_module
+
+        catalog = StorageCatalog()
+        catalog.add_table("Patient", "patients_2024")
+        generator = SQLGenerator(catalog=catalog)
+        first = generator.generate_sql(_view())
+        calls = []
+        original = generator_module.ViewDefinition.from_dict
+        monkeypatch.setattr(generator_module.ViewDefinition, "from_dict",
+                            lambda data: calls.append(data) or original(data))
+
+        assert generator.generate_sql(_view()) == first
+        assert "patients_2024" in first
+        assert calls == []
+
+    def test_errors_are_not_cached(self):
+        generator = SQLGenerator()
+        with pytest.raises(Exception):
+            generator.generate_sql({"resource": "Patient", "select": [{"column": []}]})
+        assert generator.get_statistics()["cache_size"] == 0
+
+
+class TestComponentReuse:
+    """The FHIRPath parser is shared across paths."""
+
+    def test_view_compiler_shares_parser(self):
+        generator = SQLGenerator()
+        generator.generate_sql(_view("name.where(use = 'official').family"))
+
+        assert generator._get_view_compiler().parser is generator._get_fhirpath_parser()
+
+    def test_repeated_paths_parsed_once(self, monkeypatch):
+        generator = SQLGenerator()
+        parser = generator._get_fhirpath_parser()
+        calls = []
+        original = parser.parse
+
+        def counting_parse(expression, context=None):
+            calls.append(expression)
+            return original(expression, context)
+
+        monkeypatch.setattr(parser, "parse", counting_parse)
+        path = "name.where(use = 'official').family"
+        generator.generate_sql({
+            "resource": "Patient",
+            "select": [{"column": [{"name": f"c{i}", "path": path} for i in range(20)]}],
+        })
+
+        assert calls.count(path) == 1
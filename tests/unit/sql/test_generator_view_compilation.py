@@ -0,0 +1,195 @@
+"""
+Unit tests for compiling full ViewDefinitions into a single SQL statement.
+
+Each view is generated for DuckDB and executed against a small in-memory
+table so that forEach, forEachOrNull, unionAll and nested select semantics
+are verified on actual rows rather than on SQL text.
+"""
+
+import json
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.sql.generator import SQLGenerator
+
+
+PATIENTS = [
+    {
+        "resourceType": "Patient",
+        "id": "pt1",
+        "active": True,
+        "name": [
+            {"family": "F1", "given": ["G1a", "G1b"]},
+            {"family": "F2"},
+        ],
+        "telecom": [{"system": "phone", "value": "555"}],
+        "managingOrganization": {"reference": "Organization/org1"},
+    },
+    {
+        "resourceType": "Patient",
+        "id": "pt2",
+        "active": False,
+        "address": [{"city": "Springfield"}],
+    },
+]
+
+
+@pytest.fixture
+def conn():
+    connection = duckdb.connect(":memory:")
+    connection.execute("CREATE TABLE Patient (resource JSON)")
+    for patient in PATIENTS:
+        connection.execute("INSERT INTO Patient VALUES (?)", [json.dumps(patient)])
+    yield connection
+    connection.close()
+
+
+def _run(conn, select, **extra):
+    view = {"resource": "Patient", "select": select}
+    view.update(extra)
+    sql = SQLGenerator("duckdb").generate_sql(view)
+    return sorted(conn.execute(sql).fetchall(), key=lambda row: tuple(str(v) for v in row))
+
+
+class TestSingleStatement:
+    """The generated SQL scans the resource table exactly once."""
+
+    def test_nested_view_is_one_select(self):
+        sql = SQLGenerator("duckdb").generate_sql({
+            "resource": "Patient",
+            "select": [
+                {"column": [{"name": "id", "path": "id"}]},
+                {"forEach": "name", "column": [{"name": "family", "path": "family"}],
+                 "select": [{"forEachOrNull": "given", "column": [{"name": "given", "path": "$this"}]}]},
+            ],
+        })
+        assert sql.count("FROM Patient") == 1
+        assert "WITH" not in sql
+
+
+class TestIteration:
+    """forEach / forEachOrNull row multiplication."""
+
+    def test_for_each_drops_resources_without_elements(self, conn):
+        rows = _run(conn, [
+            {"column": [{"name": "id", "path": "id"}]},
+            {"forEach": "name", "column": [{"name": "family", "path": "family"}]},
+        ])
+        assert rows == [("pt1", "F1"), ("pt1", "F2")]
+
+    def test_for_each_or_null_keeps_resources(self, conn):
+        rows = _run(conn, [
+            {"column": [{"name": "id", "path": "id"}]},
+            {"forEachOrNull": "name", "column": [{"name": "family", "path": "family"}]},
+        ])
+        assert rows == [("pt1", "F1"), ("pt1", "F2"), ("pt2", None)]
+
+    def test_nested_for_each(self, conn):
+        rows = _run(conn, [
+            {"forEach": "name", "column": [{"name": "family", "path": "family"}],
+             "select": [{"forEach": "given", "column": [{"name": "given", "path": "$this"}]}]},
+        ])
+        assert rows == [("F1", "G1a"), ("F1", "G1b")]
+
+    def test_collection_column(self, conn):
+        rows = _run(conn, [
+            {"column": [
+                {"name": "id", "path": "id"},
+                {"name": "given", "path": "name.given", "collection": True},
+            ]},
+        ])
+        assert rows[0][0] == "pt1"
+        assert list(rows[0][1]) == ["G1a", "G1b"]
+
+
+class TestUnionAll:
+    """unionAll branches are concatenated per resource."""
+
+    def test_union_all(self, conn):
+        rows = _run(conn, [
+            {"column": [{"name": "id", "path": "id"}]},
+            {"unionAll": [
+                {"forEach": "telecom", "column": [{"name": "value", "path": "value"}]},
+                {"forEach": "address", "column": [{"name": "value", "path": "city"}]},
+            ]},
+        ])
+        assert rows == [("pt1", "555"), ("pt2", "Springfield")]
+
+
+class TestFunctions:
+    """Functions compiled by the view path compiler."""
+
+    def test_where_exists_and_join(self, conn):
+        rows = _run(conn, [{"column": [
+            {"name": "id", "path": "id"},
+            {"name": "has_f2", "path": "name.where(family = 'F2').exists()", "type": "boolean"},
+            {"name": "given", "path": "name.given.join(',')"},
+        ]}])
+        assert rows == [("pt1", True, "G1a,G1b"), ("pt2", False, "")]
+
+    def test_resource_and_reference_keys(self, conn):
+        rows = _run(conn, [{"column": [
+            {"name": "key", "path": "getResourceKey()"},
+            {"name": "org", "path": "managingOrganization.getReferenceKey(Organization)"},
+        ]}])
+        assert rows == [("pt1", "org1"), ("pt2", None)]
+
+    def test_collection_in_single_column_errors(self, conn):
+        with pytest.raises(Exception):
+            _run(conn, [{"column": [{"name": "family", "path": "name.family"}]}])
+
+
+class TestWhere:
+    """where paths compile to predicates on the main scan."""
+
+    def test_inline_predicate(self, conn):
+        rows = _run(conn, [{"column": [{"name": "id", "path": "id"}]}], where=[{"path": "active"}])
+        assert rows == [("pt1",)]
+
+    def test_collection_filter_is_semi_join(self, conn):
+        view = {
+            "resource": "Patient",
+            "select": [{"column": [{"name": "id", "path": "id"}]}],
+            "where": [
+                {"path": "name.where(family = 'F2').exists()"},
+                {"path": "telecom.where(system = 'email').empty()"},
+            ],
+        }
+        sql = SQLGenerator("duckdb").generate_sql(view)
+
+        assert "INTERSECT" not in sql and " IN (" not in sql
+        assert sql.count("EXISTS (") == 2
+        assert sql.count("FROM Patient") == 1
+        assert conn.execute(sql).fetchall() == [("pt1",)]
+
+    def test_where_applies_before_for_each_or_null(self, conn):
+        rows = _run(conn, [
+            {"column": [{"name": "id", "path": "id"}]},
+            {"forEachOrNull": "name", "column": [{"name": "family", "path": "family"}]},
+        ], where=[{"path": "active = false"}])
+        assert rows == [("pt2", None)]
+
+    def test_non_boolean_literal_rejected(self):
+        with pytest.raises(Exception):
+            SQLGenerator("duckdb").generate_sql({
+                "resource": "Patient",
+                "select": [{"column": [{"name": "id", "path": "id"}]}],
+                "where": [{"path": "'yes'"}],
+            })
+
+    def test_non_boolean_path_errors_at_runtime(self, conn):
+        with pytest.raises(duckdb.Error):
+            _run(conn, [{"column": [{"name": "id", "path": "id"}]}], where=[{"path": "id"}])
+
+
+class TestLegacyFastPath:
+    """Simple root paths keep the direct JSON extraction."""
+
+    def test_first_path_uses_direct_extraction(self):
+        sql = SQLGenerator("duckdb").generate_sql({
+            "resource": "Patient",
+            "select": [{"column": [{"name": "family", "path": "name.family.first()"}]}],
+        })
+        assert "$.name[0].family" in sql
@@ -0,0 +1,152 @@
+"""
+Unit tests for incremental ViewDefinition materialization on DuckDB.
+"""
+
+import json
+
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from fhir4ds.dialects.duckdb import DuckDBDialect
+from fhir4ds.sql import SQLGenerator, ViewMaterializer
+
+
+VIEW = {
+    "resource": "Patient",
+    "select": [
+        {"column": [{"name": "id", "path": "id"}]},
+        {"forEach": "name", "column": [{"name": "family", "path": "family"}]},
+    ],
+}
+
+
+def _patient(pid, families, version="1", updated="2024-01-01T00:00:00Z"):
+    return {
+        "resourceType": "Patient",
+        "id": pid,
+        "meta": {"versionId": version, "lastUpdated": updated},
+        "name": [{"family": family} for family in families],
+    }
+
+
+@pytest.fixture
+def dialect():
+    dialect = DuckDBDialect(database=":memory:")
+    dialect.connection.execute("CREATE TABLE Patient (resource JSON)")
+    for patient in [_patient("p1", ["A"]), _patient("p2", ["B", "C"])]:
+        _insert(dialect, patient)
+    return dialect
+
+
+def _insert(dialect, patient):
+    dialect.connection.execute("INSERT INTO Patient VALUES (?)", [json.dumps(patient)])
+
+
+def _update(dialect, patient):
+    dialect.connection.execute(
+        "DELETE FROM Patient WHERE json_extract_string(resource, '$.id') = ?", [patient["id"]]
+    )
+    _insert(dialect, patient)
+
+
+def _rows(dialect, table="patient_names"):
+    return sorted(dialect.execute_query(f"SELECT _resource_id, _version_id, id, family FROM {table}"))
+
+
+class TestViewMaterializer:
+    """Full builds and incremental refreshes."""
+
+    def test_materialize_persists_rows_with_lineage(self, dialect):
+        result = ViewMaterializer(dialect).materialize(VIEW, "patient_names")
+
+        assert result.mode == "full"
+        assert result.watermark == "2024-01-01T00:00:00Z"
+        assert _rows(dialect) == [
+            ("p1", "1", "p1", "A"), ("p2", "1", "p2", "B"), ("p2", "1", "p2", "C"),
+        ]
+
+    def test_refresh_without_state_builds_fully(self, dialect):
+        assert ViewMaterializer(dialect).refresh(VIEW, "patient_names").mode == "full"
+
+    def test_refresh_reevaluates_only_changed_resources(self, dialect):
+        materializer = ViewMaterializer(dialect)
+        materializer.materialize(VIEW, "patient_names")
+
+        _update(dialect, _patient("p2", ["D"], version="2", updated="2024-01-02T00:00:00Z"))
+        # Later as text but earlier in time than p2's update
+        _insert(dialect, _patient("p3", ["E"], updated="2024-01-02T01:00:00+02:00"))
+        result = materializer.refresh(VIEW, "patient_names")
+
+        assert result.mode == "incremental"
+        assert result.resources_evaluated == 2
+        assert result.watermark == "2024-01-02T00:00:00Z"
+        assert _rows(dialect) == [
+            ("p1", "1", "p1", "A"), ("p2", "2", "p2", "D"), ("p3", "1", "p3", "E"),
+        ]
+
+    def test_unchanged_refresh_is_noop(self, dialect):
+        materializer = ViewMaterializer(dialect)
+        materializer.materialize(VIEW, "patient_names")
+
+        result = materializer.refresh(VIEW, "patient_names")
+
+        assert result.resources_evaluated == 0
+        assert len(_rows(dialect)) == 3
+
+    def test_refresh_removes_deleted_resources(self, dialect):
+        materializer = ViewMaterializer(dialect)
+        materializer.materialize(VIEW, "patient_names")
+
+        dialect.connection.execute("DELETE FROM Patient WHERE json_extract_string(resource, '$.id') = 'p2'")
+        result = materializer.refresh(VIEW, "patient_names")
+
+        assert result.resources_evaluated == 0
+        assert _rows(dialect) == [("p1", "1", "p1", "A")]
+        assert dialect.execute_query("SELECT resource_id FROM patient_names__lineage") == [("p1",)]
+
+    def test_resources_without_id_do_not_block_deletions(self, dialect):
+        materializer = ViewMaterializer(dialect)
+        materializer.materialize(VIEW, "patient_names")
+
+        dialect.connection.execute("DELETE FROM Patient WHERE json_extract_string(resource, '$.id') = 'p2'")
+        _insert(dialect, {"resourceType": "Patient", "meta": {"lastUpdated": "2024-01-02T00:00:00Z"}})
+        materializer.refresh(VIEW, "patient_names")
+
+        assert [row for row in _rows(dialect) if row[0] is not None] == [("p1", "1", "p1", "A")]
+
+    def test_changed_view_definition_rebuilds(self, dialect):
+        materializer = ViewMaterializer(dialect)
+        materializer.materialize(VIEW, "patient_names")
+
+        changed = dict(VIEW, select=[{"column": [{"name": "id", "path": "id"}]}])
+        result = materializer.refresh(changed, "patient_names")
+
+        assert result.mode == "full"
+        assert sorted(dialect.execute_query("SELECT id FROM patient_names")) == [("p1",), ("p2",)]
+
+    def test_failed_refresh_rolls_back(self, dialect):
+        materializer = ViewMaterializer(dialect)
+        materializer.materialize(VIEW, "patient_names")
+        _update(dialect, _patient("p1", ["Z"], version="2", updated="2024-02-01T00:00:00Z"))
+
+        dialect.connection.execute("DROP TABLE patient_names__lineage")
+        with pytest.raises(Exception):
+            materializer.refresh(VIEW, "patient_names")
+
+        assert ("p1", "1", "p1", "A") in _rows(dialect)
+
+
+class TestGeneratorLineage:
+    """SQLGenerator options used by the materializer."""
+
+    def test_lineage_and_source(self, dialect):
+        generator = SQLGenerator(dialect)
+        sql = generator.generate_sql(
+            VIEW,
+            source="(SELECT resource FROM Patient WHERE json_extract_string(resource, '$.id') = 'p1')",
+            lineage=True,
+        )
+
+        assert generator.dialect == "duckdb"
+        assert dialect.execute_query(sql) == [("p1", "1", "p1", "A")]
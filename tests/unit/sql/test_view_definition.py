@@ -0,0 +1,122 @@
+"""
+Unit tests for ViewDefinition parsing and structural validation.
+"""
+
+import pytest
+
+from fhir4ds.sql.exceptions import SQLGenerationError
+from fhir4ds.sql.view_definition import ViewDefinition
+
+
+def _view(**overrides):
+    view = {
+        "resource": "Patient",
+        "select": [{"column": [{"name": "id", "path": "id"}]}],
+    }
+    view.update(overrides)
+    return view
+
+
+class TestViewDefinitionParsing:
+    """Tests for building the ViewDefinition model."""
+
+    def test_parses_nested_structure(self):
+        view = ViewDefinition.from_dict(_view(select=[
+            {"column": [{"name": "id", "path": "id", "type": "id"}]},
+            {
+                "forEach": "name",
+                "column": [{"name": "family", "path": "family"}],
+                "select": [{"forEachOrNull": "given", "column": [{"name": "given", "path": "$this"}]}],
+            },
+        ], where=[{"path": "active"}]))
+
+        assert view.resource == "Patient"
+        assert view.where == ["active"]
+        assert view.selects[1].for_each == "name"
+        assert view.selects[1].selects[0].for_each_or_null == "given"
+        assert view.selects[1].selects[0].iteration_path == "given"
+        assert view.column_names() == ["id", "family", "given"]
+
+    def test_column_order_is_column_select_union(self):
+        view = ViewDefinition.from_dict(_view(select=[{
+            "unionAll": [
+                {"column": [{"name": "u", "path": "id"}]},
+                {"column": [{"name": "u", "path": "gender"}]},
+            ],
+            "select": [{"column": [{"name": "nested", "path": "id"}]}],
+            "column": [{"name": "own", "path": "id"}],
+        }]))
+
+        assert view.column_names() == ["own", "nested", "u"]
+
+    def test_collection_flag(self):
+        view = ViewDefinition.from_dict(_view(select=[
+            {"column": [{"name": "given", "path": "name.given", "collection": True}]}
+        ]))
+        assert view.selects[0].columns[0].collection is True
+
+
+class TestViewDefinitionValidation:
+    """Tests for rejecting structurally invalid ViewDefinitions."""
+
+    @pytest.mark.parametrize("data", [None, {}])
+    def test_empty_view(self, data):
+        with pytest.raises(SQLGenerationError, match="empty"):
+            ViewDefinition.from_dict(data)
+
+    def test_missing_resource(self):
+        with pytest.raises(SQLGenerationError, match="resource"):
+            ViewDefinition.from_dict({"select": [{"column": [{"name": "id", "path": "id"}]}]})
+
+    def test_missing_select(self):
+        with pytest.raises(SQLGenerationError, match="select"):
+            ViewDefinition.from_dict({"resource": "Patient"})
+
+    def test_no_columns(self):
+        with pytest.raises(SQLGenerationError, match="column"):
+            ViewDefinition.from_dict(_view(select=[{"column": []}]))
+
+    @pytest.mark.parametrize("for_each", [1, "", None])
+    def test_invalid_for_each(self, for_each):
+        with pytest.raises(SQLGenerationError, match="forEach"):
+            ViewDefinition.from_dict(_view(select=[{"forEach": for_each}]))
+
+    def test_for_each_and_for_each_or_null(self):
+        with pytest.raises(SQLGenerationError, match="both"):
+            ViewDefinition.from_dict(_view(select=[{
+                "forEach": "name",
+                "forEachOrNull": "name",
+                "column": [{"name": "family", "path": "family"}],
+            }]))
+
+    @pytest.mark.parametrize("column", [
+        {"path": "id"},
+        {"name": "id"},
+        {"name": "1id", "path": "id"},
+        {"name": "id-x", "path": "id"},
+    ])
+    def test_invalid_column(self, column):
+        with pytest.raises(SQLGenerationError):
+            ViewDefinition.from_dict(_view(select=[{"column": [column]}]))
+
+    def test_duplicate_column_names(self):
+        with pytest.raises(SQLGenerationError, match="Duplicate"):
+            ViewDefinition.from_dict(_view(select=[
+                {"column": [{"name": "id", "path": "id"}]},
+                {"forEach": "name", "column": [{"name": "id", "path": "family"}]},
+            ]))
+
+    @pytest.mark.parametrize("second", [
+        [{"name": "b", "path": "id"}],
+        [{"name": "b", "path": "id"}, {"name": "a", "path": "id"}],
+    ])
+    def test_union_all_column_mismatch(self, second):
+        with pytest.raises(SQLGenerationError, match="unionAll"):
+            ViewDefinition.from_dict(_view(select=[{"unionAll": [
+                {"column": [{"name": "a", "path": "id"}, {"name": "b", "path": "id"}]},
+                {"column": second},
+            ]}]))
+
+    def test_where_without_path(self):
+        with pytest.raises(SQLGenerationError, match="Where"):
+            ViewDefinition.from_dict(_view(where=[{"description": "no path"}]))
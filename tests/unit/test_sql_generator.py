@@ -224,18 +224,3 @@ class TestSQLGenerator:
 
         # Should generate $.name[0]
         assert "$.name[0]" in sql
-
-    def test_needs_fhirpath_translation_logic(self):
-        """Test that simple .first() doesn't trigger FHIRPath translator."""
-        generator = SQLGenerator(dialect="duckdb")
-
-        # Simple .first() at end should NOT need translation
-        assert not generator._needs_fhirpath_translation("name.family.first()")
-        assert not generator._needs_fhirpath_translation("name.first()")
-
-        # Complex functions should need translation
-        assert generator._needs_fhirpath_translation("name.where(use='official')")
-        assert generator._needs_fhirpath_translation("extension.ofType(Extension)")
-
-        # .first() in the middle should need translation
-        assert generator._needs_fhirpath_translation("name.first().family")